@@ -1,12 +1,214 @@
-"""Audit log clienti — helper condiviso (estratto da server.py, refactoring fase 2)."""
+"""Audit log clienti — helper condiviso (estratto da server.py, refactoring fase 2).
+
+NEW (ott 2026): le scritture di audit (`clienti_logs`, `lead_history`) passano da
+`AuditSink`, un buffer asincrono che accumula le entry e le scrive con `insert_many`
+al raggiungimento di una soglia di dimensione o di tempo. Le azioni critiche possono
+richiedere la modalità sincrona (`durable=True`): la entry viene scritta prima di
+ritornare, insieme a quelle già in coda per la stessa collection.
+"""
+import asyncio
 import logging
+import os
+import time
 import uuid
 from datetime import datetime, timezone
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, List, Set
+
+from pymongo.errors import BulkWriteError
 
 from database import db
 from models import ClienteLogAction, User
 
+AUDIT_SINK_BATCH_SIZE = int(os.environ.get("AUDIT_SINK_BATCH_SIZE", "200"))
+AUDIT_SINK_FLUSH_INTERVAL = float(os.environ.get("AUDIT_SINK_FLUSH_INTERVAL", "1.0"))
+# Oltre questa soglia le entry vengono scritte inline (backpressure): evita crescita
+# illimitata della memoria se Mongo è lento o irraggiungibile.
+AUDIT_SINK_MAX_PENDING = int(os.environ.get("AUDIT_SINK_MAX_PENDING", "10000"))
+
+
+class AuditSink:
+    """Buffer asincrono per le collection di audit, con flush a soglia e drain allo shutdown."""
+
+    def __init__(
+        self,
+        database,
+        batch_size: int = AUDIT_SINK_BATCH_SIZE,
+        flush_interval: float = AUDIT_SINK_FLUSH_INTERVAL,
+        max_pending: int = AUDIT_SINK_MAX_PENDING,
+    ):
+        self.db = database
+        self.batch_size = max(1, batch_size)
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self._buffers: Dict[str, List[Dict[str, Any]]] = {}
+        # monotonic() dell'entry più vecchia in coda per collection (per la metrica di lag)
+        self._oldest: Dict[str, float] = {}
+        self._locks: Dict[str, asyncio.Lock] = {}
+        self._flusher: Optional[asyncio.Task] = None
+        self._closed = False
+        # id() delle entry già rimesse in coda una volta dopo un flush fallito
+        self._retried: Set[int] = set()
+        self._stats: Dict[str, Dict[str, Any]] = {}
+
+    def _collection_stats(self, collection: str) -> Dict[str, Any]:
+        return self._stats.setdefault(collection, {
+            "enqueued": 0,
+            "written": 0,
+            "flushes": 0,
+            "failed_flushes": 0,
+            "dropped": 0,
+            "last_flush_at": None,
+            "last_flush_ms": None,
+            "max_lag_ms": 0.0,
+        })
+
+    def _lock(self, collection: str) -> asyncio.Lock:
+        lock = self._locks.get(collection)
+        if lock is None:
+            lock = self._locks[collection] = asyncio.Lock()
+        return lock
+
+    def pending(self, collection: Optional[str] = None) -> int:
+        if collection is not None:
+            return len(self._buffers.get(collection, []))
+        return sum(len(b) for b in self._buffers.values())
+
+    def start(self):
+        """Avvia il task di flush periodico (idempotente)."""
+        self._closed = False
+        if self._flusher is None or self._flusher.done():
+            self._flusher = asyncio.create_task(self._flush_loop())
+
+    async def _flush_loop(self):
+        while not self._closed:
+            try:
+                await asyncio.sleep(self.flush_interval)
+                await self.flush()
+            except asyncio.CancelledError:
+                break
+            except Exception as e:
+                logging.error(f"[AUDIT-SINK] flush loop error: {e}")
+
+    async def write(self, collection: str, entry: Dict[str, Any], durable: bool = False):
+        """Accoda una entry di audit. Con `durable=True` la scrive prima di ritornare."""
+        entry.pop("_id", None)
+        stats = self._collection_stats(collection)
+        stats["enqueued"] += 1
+
+        buffer = self._buffers.setdefault(collection, [])
+        if not buffer:
+            self._oldest[collection] = time.monotonic()
+        buffer.append(entry)
+
+        # Senza flusher attivo (es. script, test, shutdown già avvenuto) si scrive subito
+        flusher_running = self._flusher is not None and not self._flusher.done()
+        if (
+            durable
+            or not flusher_running
+            or len(buffer) >= self.batch_size
+            or self.pending() >= self.max_pending
+        ):
+            await self.flush(collection)
+
+    async def flush(self, collection: Optional[str] = None) -> int:
+        """Scrive le entry in coda (di una collection o di tutte). Ritorna il numero scritto."""
+        collections = [collection] if collection is not None else list(self._buffers.keys())
+        written = 0
+        for name in collections:
+            async with self._lock(name):
+                batch = self._buffers.get(name) or []
+                if not batch:
+                    continue
+                self._buffers[name] = []
+                oldest = self._oldest.pop(name, time.monotonic())
+                stats = self._collection_stats(name)
+                started = time.monotonic()
+                failed: List[Dict[str, Any]] = []
+                try:
+                    # ordered=False: una entry malformata non blocca il resto del batch
+                    await self.db[name].insert_many(batch, ordered=False)
+                except Exception as e:
+                    # Il logging di audit non deve mai interrompere l'operazione principale
+                    stats["failed_flushes"] += 1
+                    failed = self._not_inserted(batch, e)
+                    logging.error(f"[AUDIT-SINK] insert_many on {name} failed "
+                                  f"({len(failed)}/{len(batch)} entries not written): {e}")
+                failed_ids = {id(entry) for entry in failed}
+                requeue = []
+                for entry in batch:
+                    key = id(entry)
+                    if key not in failed_ids:
+                        self._retried.discard(key)
+                    elif key in self._retried:
+                        # seconda volta: persa
+                        self._retried.discard(key)
+                        stats["dropped"] += 1
+                    else:
+                        self._retried.add(key)
+                        requeue.append(entry)
+                ok = len(batch) - len(failed)
+                written += ok
+                stats["written"] += ok
+                if requeue:
+                    # un solo nuovo tentativo, al prossimo flush, davanti alle entry più recenti
+                    self._buffers[name] = requeue + self._buffers.get(name, [])
+                    self._oldest[name] = oldest
+                finished = time.monotonic()
+                stats["flushes"] += 1
+                stats["last_flush_at"] = datetime.now(timezone.utc).isoformat()
+                stats["last_flush_ms"] = round((finished - started) * 1000, 2)
+                stats["max_lag_ms"] = max(stats["max_lag_ms"], round((finished - oldest) * 1000, 2))
+        return written
+
+    @staticmethod
+    def _not_inserted(batch: List[Dict[str, Any]], error: Exception) -> List[Dict[str, Any]]:
+        """Entry del batch non scritte dopo un insert_many fallito."""
+        if isinstance(error, BulkWriteError):
+            details = getattr(error, "details", None) or {}
+            # E11000 = già presente (ritentativo di una entry scritta prima di un timeout)
+            return [batch[err["index"]] for err in details.get("writeErrors", []) if err.get("code") != 11000]
+        # esito ignoto (rete, timeout, OperationFailure con details=None): tutto da ritentare;
+        # l'_id assegnato da insert_many rende il ritentativo idempotente
+        return list(batch)
+
+    async def drain(self):
+        """Ferma il flush periodico e scrive tutto ciò che è ancora in coda (shutdown)."""
+        self._closed = True
+        if self._flusher is not None:
+            self._flusher.cancel()
+            try:
+                await self._flusher
+            except (asyncio.CancelledError, Exception):
+                pass
+            self._flusher = None
+        written = await self.flush()
+        if written:
+            logging.info(f"[AUDIT-SINK] drained {written} pending audit entries")
+        return written
+
+    def metrics(self) -> Dict[str, Any]:
+        """Metriche di lag e throughput per collection."""
+        now = time.monotonic()
+        collections = {}
+        for name in set(self._stats) | set(self._buffers):
+            stats = dict(self._collection_stats(name))
+            oldest = self._oldest.get(name)
+            stats["pending"] = self.pending(name)
+            stats["current_lag_ms"] = round((now - oldest) * 1000, 2) if oldest is not None and stats["pending"] else 0.0
+            collections[name] = stats
+        return {
+            "running": self._flusher is not None and not self._flusher.done(),
+            "batch_size": self.batch_size,
+            "flush_interval_seconds": self.flush_interval,
+            "max_pending": self.max_pending,
+            "pending_total": self.pending(),
+            "collections": collections,
+        }
+
+
+audit_sink = AuditSink(db)
+
+
 async def log_client_action(
     cliente_id: str,
     action: ClienteLogAction,
@@ -15,9 +217,13 @@ async def log_client_action(
     old_value: Optional[str] = None,
     new_value: Optional[str] = None,
     metadata: Optional[Dict[str, Any]] = None,
-    ip_address: Optional[str] = None
+    ip_address: Optional[str] = None,
+    durable: bool = False,
 ):
-    """Registra un'azione nel log di audit del cliente"""
+    """Registra un'azione nel log di audit del cliente.
+
+    `durable=True` per le azioni critiche (es. eliminazione): la entry è su Mongo al ritorno.
+    """
     try:
         log_entry = {
             "id": str(uuid.uuid4()),
@@ -33,15 +239,34 @@ async def log_client_action(
             "timestamp": datetime.now(timezone.utc),
             "ip_address": ip_address
         }
-        
-        # Rimuovi _id se presente per evitare conflitti MongoDB
-        if '_id' in log_entry:
-            del log_entry['_id']
-            
-        await db.clienti_logs.insert_one(log_entry)
+
+        await audit_sink.write("clienti_logs", log_entry, durable=durable)
         logging.info(f"📝 CLIENT LOG: {action.value} for cliente {cliente_id} by {user.username} ({user.email})")
-        
+
     except Exception as e:
         logging.error(f"Error logging client action: {e}")
         # Non interrompere l'operazione principale se il logging fallisce
 
+
+async def log_lead_history(
+    lead_id: str,
+    user: User,
+    changes: Dict[str, Any],
+    action: str = "update",
+    durable: bool = False,
+):
+    """Registra una entry nello storico modifiche del lead (`lead_history`)."""
+    try:
+        history_entry = {
+            "id": str(uuid.uuid4()),
+            "lead_id": lead_id,
+            "user_id": user.id,
+            "username": user.username,
+            "action": action,
+            "changes": changes,
+            "timestamp": datetime.now(timezone.utc)
+        }
+        await audit_sink.write("lead_history", history_entry, durable=durable)
+        logging.info(f"[LEAD_HISTORY] Logged changes for lead {lead_id} by user {user.username}")
+    except Exception as e:
+        logging.error(f"Error logging lead history: {e}")
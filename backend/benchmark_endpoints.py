@@ -0,0 +1,227 @@
+#!/usr/bin/env python3
+"""
+Benchmark in-process degli endpoint principali del CRM (NEW ott 2026).
+
+Carica l'app FastAPI di `server.py` nello stesso processo (httpx + ASGITransport, nessun
+server HTTP né URL live) contro un mongod locale popolato con `synthetic_dataset.py`, e per
+ogni scenario misura latenza p50/p95/p99 e numero di comandi MongoDB per richiesta
+(contatori del listener di `metrics.py`). Il risultato è un baseline JSON; con `--compare`
+il run viene confrontato con un baseline precedente e lo script esce con codice 1 se un
+endpoint peggiora oltre `--max-regression`.
+
+Uso:
+    cd /app/backend
+    python synthetic_dataset.py --db-name crm_bench --scale small --drop
+    python benchmark_endpoints.py --db-name crm_bench --iterations 30 --output bench_baseline.json
+    python benchmark_endpoints.py --db-name crm_bench --compare bench_baseline.json
+"""
+
+import argparse
+import asyncio
+import json
+import math
+import os
+import statistics
+import sys
+import time
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
+
+ROOT_DIR = Path(__file__).parent
+
+# Ruolo con cui viene eseguito ogni scenario (gli utenti sono quelli del dataset sintetico)
+SCENARIOS: List[Dict[str, Any]] = [
+    {"name": "clienti_list_admin", "method": "GET", "path": "/api/clienti", "role": "admin",
+     "params": {"page": 1, "page_size": 50}},
+    {"name": "clienti_list_bo_sub_agenzia", "method": "GET", "path": "/api/clienti", "role": "backoffice_sub_agenzia",
+     "params": {"page": 1, "page_size": 50}},
+    {"name": "clienti_search", "method": "GET", "path": "/api/clienti", "role": "admin",
+     "params": {"search": "Rossi", "page": 1, "page_size": 50}},
+    {"name": "leads_list_admin", "method": "GET", "path": "/api/leads", "role": "admin",
+     "params": {"page": 1, "page_size": 50}},
+    {"name": "leads_list_agente", "method": "GET", "path": "/api/leads", "role": "agente",
+     "params": {"page": 1, "page_size": 50}},
+    {"name": "analytics_pivot", "method": "GET", "path": "/api/analytics/pivot", "role": "admin", "params": {}},
+    {"name": "dashboard_stats", "method": "GET", "path": "/api/dashboard/stats", "role": "admin", "params": {}},
+    {"name": "clienti_export_excel", "method": "GET", "path": "/api/clienti/export/excel", "role": "responsabile_commessa",
+     "params": {}, "iterations": 3},
+    {"name": "leads_export", "method": "GET", "path": "/api/leads/export", "role": "admin",
+     "params": {"date_from": "2026-09-01"}, "iterations": 3},
+    {"name": "webhook_lead", "method": "POST", "path": "/api/webhook/lead", "role": None, "body": "lead_webhook"},
+    {"name": "spoki_webhook", "method": "POST", "path": "/api/spoki/webhook", "role": None, "body": "spoki_webhook"},
+]
+
+
+def percentile(values: List[float], pct: float) -> float:
+    """Percentile con interpolazione lineare (come numpy 'linear')."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    k = (len(ordered) - 1) * pct / 100
+    lo, hi = math.floor(k), math.ceil(k)
+    if lo == hi:
+        return ordered[int(k)]
+    return ordered[lo] + (ordered[hi] - ordered[lo]) * (k - lo)
+
+
+def summarize(latencies_ms: List[float], queries: List[int], statuses: List[int]) -> Dict[str, Any]:
+    status_counts: Dict[str, int] = {}
+    for s in statuses:
+        status_counts[str(s)] = status_counts.get(str(s), 0) + 1
+    return {
+        "requests": len(latencies_ms),
+        "p50_ms": round(percentile(latencies_ms, 50), 2),
+        "p95_ms": round(percentile(latencies_ms, 95), 2),
+        "p99_ms": round(percentile(latencies_ms, 99), 2),
+        "mean_ms": round(statistics.fmean(latencies_ms), 2) if latencies_ms else 0.0,
+        "max_ms": round(max(latencies_ms), 2) if latencies_ms else 0.0,
+        "queries_per_request": {
+            "p50": percentile(queries, 50),
+            "mean": round(statistics.fmean(queries), 2) if queries else 0.0,
+            "max": max(queries) if queries else 0,
+        },
+        "status_codes": status_counts,
+    }
+
+
+def compare_baselines(current: Dict[str, Any], baseline: Dict[str, Any], max_regression: float) -> List[str]:
+    """Ritorna le regressioni (p95 o query/richiesta oltre la soglia relativa) rispetto al baseline."""
+    regressions = []
+    for name, cur in current.get("endpoints", {}).items():
+        base = baseline.get("endpoints", {}).get(name)
+        if not base:
+            continue
+        if base["p95_ms"] > 0 and cur["p95_ms"] > base["p95_ms"] * (1 + max_regression):
+            regressions.append(f"{name}: p95 {base['p95_ms']}ms → {cur['p95_ms']}ms")
+        base_q = base["queries_per_request"]["mean"]
+        cur_q = cur["queries_per_request"]["mean"]
+        if cur_q > base_q * (1 + max_regression) and cur_q - base_q >= 1:
+            regressions.append(f"{name}: query/richiesta {base_q} → {cur_q}")
+    return regressions
+
+
+class _BodyFactory:
+    """Payload per gli scenari POST: usa dati reali del dataset (telefono di un lead esistente, unit)."""
+
+    def __init__(self, sample_lead: Dict[str, Any], unit_name: Optional[str]):
+        self.sample_lead = sample_lead
+        self.unit_name = unit_name
+        self.counter = 0
+
+    def lead_webhook(self) -> Dict[str, Any]:
+        self.counter += 1
+        return {
+            "nome": "Bench", "cognome": f"Lead{self.counter}", "telefono": f"+39 39{time.time_ns() % 10**8:08d}",
+            "email": f"bench{self.counter}@example.it", "provincia": "Milano", "campagna": "Fibra Casa",
+            "gruppo": self.unit_name, "privacy_consent": True,
+        }
+
+    def spoki_webhook(self) -> Dict[str, Any]:
+        self.counter += 1
+        return {
+            "version": 1, "event": "message.inbound",
+            "data": {"uuid": f"bench-{time.time_ns()}", "from_phone": self.sample_lead.get("telefono"),
+                     "text": "Sì, mi richiami pure", "direction": "inbound"},
+        }
+
+
+async def run(args) -> Dict[str, Any]:
+    # La connessione Mongo viene letta all'import di database.py: l'env va impostato prima
+    os.environ["MONGO_URL"] = args.mongo_url
+    os.environ["DB_NAME"] = args.db_name
+    sys.path.insert(0, str(ROOT_DIR))
+    import httpx
+    from server import app  # noqa: E402
+    from database import db
+    from security import create_access_token
+    from metrics import MONGO_COMMANDS
+
+    meta = await db.bench_metadata.find_one({"id": "synthetic_dataset"}, {"_id": 0})
+    if not meta:
+        print("⚠️  bench_metadata non trovato: il DB non sembra generato da synthetic_dataset.py")
+
+    tokens: Dict[str, str] = {}
+    for scenario in SCENARIOS:
+        role = scenario["role"]
+        if role and role not in tokens:
+            user = await db.users.find_one({"role": role, "is_active": True}, {"_id": 0, "username": 1})
+            if not user:
+                raise SystemExit(f"❌ Nessun utente con ruolo {role} nel dataset")
+            tokens[role] = create_access_token({"sub": user["username"]}, expires_delta=timedelta(hours=4))
+
+    sample_lead = await db.leads.find_one({}, {"_id": 0, "telefono": 1}) or {}
+    unit = await db.units.find_one({}, {"_id": 0, "nome": 1}) or {}
+    bodies = _BodyFactory(sample_lead, unit.get("nome"))
+
+    selected = [s for s in SCENARIOS if not args.only or s["name"] in args.only]
+    results: Dict[str, Any] = {}
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=600) as client:
+        for scenario in selected:
+            iterations = min(args.iterations, scenario.get("iterations", args.iterations))
+            headers = {"Authorization": f"Bearer {tokens[scenario['role']]}"} if scenario["role"] else {}
+            body_factory: Optional[Callable] = getattr(bodies, scenario["body"]) if scenario.get("body") else None
+            latencies, queries, statuses = [], [], []
+            for i in range(args.warmup + iterations):
+                before = MONGO_COMMANDS.total()
+                started = time.perf_counter()
+                resp = await client.request(
+                    scenario["method"], scenario["path"], params=scenario.get("params"), headers=headers,
+                    json=body_factory() if body_factory else None,
+                )
+                elapsed_ms = (time.perf_counter() - started) * 1000
+                # I task in background (audit sink, workflow) possono aggiungere comandi: si lasciano girare
+                await asyncio.sleep(0)
+                if i < args.warmup:
+                    continue
+                latencies.append(elapsed_ms)
+                queries.append(int(MONGO_COMMANDS.total() - before))
+                statuses.append(resp.status_code)
+            results[scenario["name"]] = summarize(latencies, queries, statuses)
+            r = results[scenario["name"]]
+            print(f"  {scenario['name']:<30} p50 {r['p50_ms']:>9.1f}ms  p95 {r['p95_ms']:>9.1f}ms  "
+                  f"p99 {r['p99_ms']:>9.1f}ms  query/req {r['queries_per_request']['mean']:>7.1f}  {r['status_codes']}")
+
+    return {
+        "generated_at": datetime.now(timezone.utc).isoformat(),
+        "db_name": args.db_name,
+        "dataset": (meta or {}).get("counts"),
+        "iterations": args.iterations,
+        "endpoints": results,
+    }
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark in-process degli endpoint del CRM.")
+    parser.add_argument("--mongo-url", default="mongodb://localhost:27017")
+    parser.add_argument("--db-name", required=True, help="Database generato con synthetic_dataset.py")
+    parser.add_argument("--iterations", type=int, default=30)
+    parser.add_argument("--warmup", type=int, default=2)
+    parser.add_argument("--only", nargs="*", help="Esegue solo gli scenari indicati")
+    parser.add_argument("--output", help="Default: bench_baseline.json (bench_current.json con --compare)")
+    parser.add_argument("--compare", help="Baseline JSON precedente da confrontare")
+    parser.add_argument("--max-regression", type=float, default=0.25, help="Peggioramento relativo tollerato (0.25 = +25%%)")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    print(f"⏱️  Benchmark endpoint su {args.db_name} ({args.iterations} iterazioni, warmup {args.warmup})")
+    baseline = json.loads(Path(args.compare).read_text()) if args.compare else None
+    output = args.output or ("bench_current.json" if args.compare else "bench_baseline.json")
+    report = asyncio.run(run(args))
+    Path(output).write_text(json.dumps(report, indent=2, default=str))
+    print(f"✅ Risultati scritti in {output}")
+    if baseline is not None:
+        regressions = compare_baselines(report, baseline, args.max_regression)
+        if regressions:
+            print("❌ Regressioni rispetto al baseline:")
+            for r in regressions:
+                print(f"   - {r}")
+            sys.exit(1)
+        print("✅ Nessuna regressione rispetto al baseline")
+
+
+if __name__ == "__main__":
+    main()
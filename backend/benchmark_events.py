@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+"""
+Benchmark del fan-out del bus eventi SSE (NEW ott 2026).
+
+Simula `--subscribers` connessioni SSE (utenti di `--units` Unit, un admin ogni 20
+iscritti su `conversations:*`, tutti su `cliente_locks`) che consumano le proprie code
+mentre vengono pubblicati `--events` eventi misti (messaggi per Unit, lock, lead
+assegnati). Nessun DB né HTTP: misura solo `events.EventBus`.
+
+Riporta tempo di `publish` (p50/p95/max, in µs), latenza pubblicazione -> consumo
+(p50/p95/p99, in ms), consegne al secondo ed eventuali code andate in `resync`.
+
+Uso:
+    cd /app/backend
+    python benchmark_events.py --subscribers 2000 --events 5000
+"""
+
+import argparse
+import asyncio
+import json
+import random
+import statistics
+import time
+from typing import Any, Dict, List
+
+from benchmark_endpoints import percentile
+from events import (
+    ALL_CONVERSATIONS_TOPIC, LOCKS_TOPIC, EventBus, conversation_topic, user_leads_topic,
+)
+
+
+def subscriber_topics(index: int, units: int) -> List[str]:
+    topics = [LOCKS_TOPIC, user_leads_topic(f"user-{index}")]
+    if index % 20 == 0:
+        topics.append(ALL_CONVERSATIONS_TOPIC)
+    else:
+        topics.append(conversation_topic(f"unit-{index % units}"))
+    return topics
+
+
+async def _consume(sub, expected: int, latencies: List[float]):
+    received = 0
+    while received < expected:
+        event = await sub.get()
+        if event["type"] == "resync":
+            return
+        latencies.append((time.time() - event["ts"]) * 1000)
+        received += 1
+
+
+async def run(subscribers: int, events: int, units: int = 10, queue_size: int = 256,
+              batch: int = 50, seed: int = 42) -> Dict[str, Any]:
+    rng = random.Random(seed)
+    bus = EventBus(queue_size=queue_size)
+    subs = [bus.subscribe(subscriber_topics(i, units)) for i in range(subscribers)]
+
+    plan = []
+    for n in range(events):
+        kind = rng.random()
+        if kind < 0.7:
+            plan.append(((conversation_topic(f"unit-{rng.randrange(units)}"), ALL_CONVERSATIONS_TOPIC),
+                         "conversation.message"))
+        elif kind < 0.9:
+            plan.append(((LOCKS_TOPIC,), "lock.acquired"))
+        else:
+            plan.append(((user_leads_topic(f"user-{rng.randrange(subscribers)}"),), "lead.assigned"))
+    expected = {id(s): 0 for s in subs}
+    for topics, _ in plan:
+        for s in set().union(*(bus._by_topic.get(t, set()) for t in topics)):
+            expected[id(s)] += 1
+
+    latencies: List[float] = []
+    consumers = [asyncio.ensure_future(_consume(s, expected[id(s)], latencies)) for s in subs]
+    publish_us: List[float] = []
+    deliveries = 0
+    started = time.perf_counter()
+    for n, (topics, event_type) in enumerate(plan):
+        t0 = time.perf_counter()
+        deliveries += bus.publish(topics, event_type, {"n": n})
+        publish_us.append((time.perf_counter() - t0) * 1e6)
+        if n % batch == batch - 1:
+            await asyncio.sleep(0)  # i consumer girano tra un burst e l'altro, come con le richieste reali
+    await asyncio.gather(*consumers)
+    elapsed = time.perf_counter() - started
+    for s in subs:
+        bus.unsubscribe(s)
+
+    return {
+        "subscribers": subscribers,
+        "events": events,
+        "deliveries": deliveries,
+        "deliveries_per_second": round(deliveries / elapsed) if elapsed else 0,
+        "publish_us": {
+            "p50": round(statistics.median(publish_us), 1),
+            "p95": round(percentile(publish_us, 95), 1),
+            "max": round(max(publish_us), 1),
+        },
+        "latency_ms": {
+            "p50": round(percentile(latencies, 50), 2),
+            "p95": round(percentile(latencies, 95), 2),
+            "p99": round(percentile(latencies, 99), 2),
+        },
+        "resyncs": sum(s.dropped for s in subs),
+        "elapsed_s": round(elapsed, 3),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--subscribers", type=int, default=1000)
+    parser.add_argument("--events", type=int, default=2000)
+    parser.add_argument("--units", type=int, default=10)
+    parser.add_argument("--queue-size", type=int, default=256)
+    parser.add_argument("--batch", type=int, default=50, help="Eventi pubblicati tra due cicli dei consumer")
+    args = parser.parse_args()
+    result = asyncio.run(run(args.subscribers, args.events, args.units, args.queue_size, args.batch))
+    print(json.dumps(result, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmark della serializzazione delle liste (NEW ott 2026).
+
+Confronta, su una pagina di clienti/lead generata con `synthetic_dataset.py` (nessun DB):
+
+- validated: `Model(**doc)` + ri-validazione del response_model + json stdlib
+  (esattamente `fastapi.routing.serialize_response` + `JSONResponse.render`);
+- fast:      righe da `fast_response.model_projection(...)` + orjson (percorso attuale).
+
+Verifica anche che il percorso veloce produca lo stesso JSON del percorso validato.
+
+Uso:
+    cd /app/backend
+    python benchmark_serialization.py --rows 200 --iterations 50
+"""
+
+import argparse
+import asyncio
+import json
+import statistics
+import time
+from typing import Any, Callable, Dict, List
+
+from fastapi.responses import JSONResponse
+from fastapi.routing import serialize_response
+from fastapi.utils import create_response_field
+
+from fast_response import FastJSONResponse, model_projection
+from models import Cliente, ClientiPaginatedResponse, Lead, LeadsPaginatedResponse
+from synthetic_dataset import SCALES, SyntheticDataset
+
+PAGES = {
+    "clienti": (Cliente, ClientiPaginatedResponse, "clienti"),
+    "leads": (Lead, LeadsPaginatedResponse, "leads"),
+}
+
+
+def sample_docs(kind: str, rows: int, seed: int = 42) -> List[Dict[str, Any]]:
+    ds = SyntheticDataset(SCALES["tiny"], seed=seed)
+    ds.build_structure()
+    batches = ds.iter_clienti(rows) if kind == "clienti" else ds.iter_leads(rows)
+    return list(next(batches)[0])
+
+
+def _envelope(key: str, items: List[Any]) -> Dict[str, Any]:
+    return {key: items, "total": len(items), "page": 1, "page_size": len(items), "total_pages": 1}
+
+
+def build_paths(kind: str) -> Dict[str, Callable[[List[Dict[str, Any]]], bytes]]:
+    model, page_model, key = PAGES[kind]
+    field = create_response_field(name="Response_bench", type_=page_model)
+    projection = model_projection(model)
+    loop = asyncio.new_event_loop()
+
+    def validated(docs):
+        content = page_model(**_envelope(key, [model(**d) for d in docs]))
+        encoded = loop.run_until_complete(serialize_response(field=field, response_content=content))
+        return JSONResponse(encoded).body
+
+    def fast(docs):
+        return FastJSONResponse(_envelope(key, projection.rows(docs))).body
+
+    return {"validated": validated, "fast": fast}
+
+
+def timeit(fn: Callable[[List[Dict[str, Any]]], bytes], docs: List[Dict[str, Any]], iterations: int) -> Dict[str, float]:
+    samples = []
+    for _ in range(iterations):
+        batch = [dict(d) for d in docs]  # ogni richiesta legge documenti "freschi" dal DB
+        started = time.perf_counter()
+        fn(batch)
+        samples.append((time.perf_counter() - started) * 1000)
+    return {"median_ms": round(statistics.median(samples), 2), "min_ms": round(min(samples), 2)}
+
+
+def run(kind: str, rows: int, iterations: int) -> Dict[str, Any]:
+    docs = sample_docs(kind, rows)
+    paths = build_paths(kind)
+    same = json.loads(paths["validated"]([dict(d) for d in docs])) == json.loads(paths["fast"]([dict(d) for d in docs]))
+    results = {name: timeit(fn, docs, iterations) for name, fn in paths.items()}
+    base = results["validated"]["median_ms"]
+    for r in results.values():
+        r["speedup"] = round(base / r["median_ms"], 1) if r["median_ms"] else 0.0
+    return {"rows": len(docs), "same_output": same, "paths": results}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Micro-benchmark serializzazione liste (validated vs fast).")
+    parser.add_argument("--rows", type=int, default=200)
+    parser.add_argument("--iterations", type=int, default=30)
+    parser.add_argument("--kind", choices=sorted(PAGES), nargs="*", default=sorted(PAGES))
+    parser.add_argument("--json", help="Scrive i risultati in JSON")
+    args = parser.parse_args(argv)
+
+    report = {}
+    for kind in args.kind:
+        report[kind] = run(kind, args.rows, args.iterations)
+        r = report[kind]
+        print(f"📦 {kind}: {r['rows']} righe, output identico: {'✅' if r['same_output'] else '❌'}")
+        for name, stats in r["paths"].items():
+            print(f"   {name:<10} median {stats['median_ms']:>8.2f}ms  min {stats['min_ms']:>8.2f}ms  x{stats['speedup']}")
+    if args.json:
+        with open(args.json, "w") as fh:
+            json.dump(report, fh, indent=2)
+
+
+if __name__ == "__main__":
+    main()
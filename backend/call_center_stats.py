@@ -0,0 +1,99 @@
+"""Metriche della dashboard call center in una sola aggregazione (NEW ott 2026).
+
+`/call-center/analytics/dashboard` faceva cinque `count_documents` (chiamate attive,
+agenti disponibili, chiamate/risposte/abbandonate di oggi) più un'aggregazione per
+l'attesa media a ogni refresh, e il wallboard si aggiorna ogni pochi secondi da
+più postazioni.
+
+Ora un solo `aggregate` su `calls`: le chiamate di oggi (mezzanotte Europe/Rome) e
+quelle ancora attive, con gli agenti disponibili uniti via `$unionWith`, e un `$facet`
+che produce tutti i contatori. Il risultato è condiviso fra tutti i viewer per
+`CALL_CENTER_DASHBOARD_TTL_SECONDS` con refresh single-flight (`lead_analytics.cached`):
+N wallboard aperti costano una query ogni TTL.
+"""
+import os
+from datetime import datetime, timezone
+from typing import Any, Dict, Optional
+
+import lead_analytics
+from helpers import APP_TIMEZONE, rome_date_to_utc_range
+
+CALL_CENTER_DASHBOARD_TTL_SECONDS = float(os.environ.get("CALL_CENTER_DASHBOARD_TTL_SECONDS", "5"))
+ACTIVE_CALL_STATUSES = ["queued", "ringing", "in-progress"]
+
+
+def _today_start(now: datetime) -> datetime:
+    return rome_date_to_utc_range(now.astimezone(APP_TIMEZONE).strftime("%Y-%m-%d"))[0]
+
+
+def dashboard_pipeline(today_start: datetime, unit_id: Optional[str] = None):
+    unit = {"unit_id": unit_id} if unit_id else {}
+    return [
+        {"$match": {**unit, "$or": [
+            {"created_at": {"$gte": today_start}},
+            {"status": {"$in": ACTIVE_CALL_STATUSES}},
+        ]}},
+        {"$project": {"_id": 0, "kind": {"$literal": "call"}, "status": 1, "created_at": 1, "answered_at": 1}},
+        {"$unionWith": {"coll": "agent_call_center", "pipeline": [
+            {"$match": {**unit, "status": "available"}},
+            {"$project": {"_id": 0, "kind": {"$literal": "agent"}}},
+        ]}},
+        {"$facet": {
+            "active": [
+                {"$match": {"kind": "call", "status": {"$in": ACTIVE_CALL_STATUSES}}},
+                {"$count": "n"},
+            ],
+            "agents": [{"$match": {"kind": "agent"}}, {"$count": "n"}],
+            "today": [
+                {"$match": {"kind": "call", "created_at": {"$gte": today_start}}},
+                {"$group": {
+                    "_id": None,
+                    "calls": {"$sum": 1},
+                    "answered": {"$sum": {"$cond": [{"$eq": ["$status", "completed"]}, 1, 0]}},
+                    "abandoned": {"$sum": {"$cond": [{"$eq": ["$status", "abandoned"]}, 1, 0]}},
+                    # $avg ignora i null: solo chiamate con risposta
+                    "avg_wait_ms": {"$avg": {"$cond": [
+                        {"$eq": [{"$ifNull": ["$answered_at", None]}, None]},
+                        None,
+                        {"$subtract": ["$answered_at", "$created_at"]},
+                    ]}},
+                }},
+            ],
+        }},
+    ]
+
+
+async def compute_dashboard(db, unit_id: Optional[str] = None) -> Dict[str, Any]:
+    current_time = datetime.now(timezone.utc)
+    facets: Dict[str, Any] = {}
+    async for row in db.calls.aggregate(dashboard_pipeline(_today_start(current_time), unit_id)):
+        facets = row
+
+    def count(facet: str) -> int:
+        rows = facets.get(facet) or []
+        return rows[0]["n"] if rows else 0
+
+    today = (facets.get("today") or [{}])[0]
+    calls_today = today.get("calls", 0)
+    answered_today = today.get("answered", 0)
+    abandoned_today = today.get("abandoned", 0)
+    avg_wait_time = (today.get("avg_wait_ms") or 0) / 1000  # Convert to seconds
+    return {
+        "timestamp": current_time.isoformat(),
+        "active_calls": count("active"),
+        "available_agents": count("agents"),
+        "calls_today": calls_today,
+        "answered_today": answered_today,
+        "abandoned_today": abandoned_today,
+        "answer_rate": (answered_today / calls_today * 100) if calls_today > 0 else 0,
+        "abandonment_rate": (abandoned_today / calls_today * 100) if calls_today > 0 else 0,
+        "avg_wait_time": round(avg_wait_time, 2),
+    }
+
+
+async def get_dashboard(db, unit_id: Optional[str] = None) -> Dict[str, Any]:
+    """Dashboard condivisa fra i viewer (TTL breve, un solo calcolo alla volta)."""
+    return await lead_analytics.cached(
+        ("call_center_dashboard", unit_id), lambda: compute_dashboard(db, unit_id),
+        ttl=CALL_CENTER_DASHBOARD_TTL_SECONDS,
+    )
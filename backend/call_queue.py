@@ -0,0 +1,183 @@
+"""Coda ACD persistente e indice di disponibilità degli agenti (NEW ott 2026).
+
+`ACDService.call_queues` era un dict di liste nel processo (`pop(0)`): le chiamate in
+coda sparivano al riavvio ed erano invisibili agli altri worker; anche gli stati agente
+e le chiamate attive di `CallCenterService` erano cache locali. Il call center non
+poteva girare su più di un worker.
+
+Ora:
+
+    call_queue: { id, call_sid, unit_id, priority, skills_required, queued_at,
+                  status: waiting|dispatching|dispatched|abandoned, claimed_by,
+                  claimed_at, agent_id, dispatched_at }
+
+- ordine di servizio: priorità decrescente, poi attesa (indice
+  `unit_id, status, priority -1, queued_at 1`);
+- `claim_next` prende la prima chiamata con `find_one_and_update` (un solo worker la
+  ottiene); un claim di un worker morto scade dopo `CALL_QUEUE_CLAIM_LEASE_SECONDS`;
+- `reserve_agent` prenota atomicamente l'agente disponibile meno carico della Unit con
+  le skill richieste (`agent_call_center.unit_id` denormalizzato da `users`, indice
+  `unit_id, status, skills, calls_in_progress`): nessun agente riceve due chiamate;
+- `dispatch` abbina chiamate e agenti finché ci sono entrambi; viene invocato dagli
+  eventi (chiamata accodata, agente tornato disponibile), non più a mano. Un agente
+  liberato mentre un altro worker teneva reclamata la chiamata non la vede: le chiamate
+  senza agente adatto vengono saltate (non bloccano quelle con altre skill) e riprovate
+  con un secondo giro; lo scheduler esegue comunque un giro su tutte le Unit ogni
+  `CALL_QUEUE_SWEEP_INTERVAL_SECONDS`.
+"""
+import logging
+import os
+import uuid
+from datetime import datetime, timedelta, timezone
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from pymongo import ReturnDocument
+
+logger = logging.getLogger(__name__)
+
+CALL_QUEUE_COLLECTION = "call_queue"
+CALL_QUEUE_CLAIM_LEASE_SECONDS = float(os.environ.get("CALL_QUEUE_CLAIM_LEASE_SECONDS", "30"))
+CALL_QUEUE_SWEEP_INTERVAL_SECONDS = int(os.environ.get("CALL_QUEUE_SWEEP_INTERVAL_SECONDS", "30"))
+AGENT_UNIT_MARKER_ID = "agent_call_center_unit_v1"
+
+WORKER_ID = f"{os.getpid()}-{uuid.uuid4().hex[:8]}"
+_QUEUE_ORDER = [("priority", -1), ("queued_at", 1)]
+
+
+def _unit_filter(unit_id: Optional[str]) -> Dict[str, Any]:
+    return {"unit_id": unit_id} if unit_id else {}
+
+
+async def enqueue(db, call_sid: str, unit_id: Optional[str], priority: int = 1,
+                  skills_required: Optional[List[str]] = None) -> Dict[str, Any]:
+    now = datetime.now(timezone.utc)
+    entry = {
+        "id": str(uuid.uuid4()), "call_sid": call_sid, "unit_id": unit_id, "priority": priority,
+        "skills_required": skills_required or [], "queued_at": now, "status": "waiting",
+        "claimed_by": None, "claimed_at": None, "agent_id": None, "dispatched_at": None,
+    }
+    # idempotente sul call_sid (webhook Twilio ripetuti)
+    await db[CALL_QUEUE_COLLECTION].update_one({"call_sid": call_sid}, {"$setOnInsert": entry}, upsert=True)
+    return entry
+
+
+async def claim_next(db, unit_id: Optional[str], exclude_ids: Optional[List[str]] = None) -> Optional[Dict[str, Any]]:
+    """Reclama la prossima chiamata in ordine di servizio, saltando `exclude_ids`."""
+    now = datetime.now(timezone.utc)
+    return await db[CALL_QUEUE_COLLECTION].find_one_and_update(
+        {
+            **_unit_filter(unit_id),
+            **({"id": {"$nin": list(exclude_ids)}} if exclude_ids else {}),
+            "$or": [
+                {"status": "waiting"},
+                {"status": "dispatching", "claimed_at": {"$lt": now - timedelta(seconds=CALL_QUEUE_CLAIM_LEASE_SECONDS)}},
+            ],
+        },
+        {"$set": {"status": "dispatching", "claimed_by": WORKER_ID, "claimed_at": now}},
+        sort=_QUEUE_ORDER,
+        projection={"_id": 0},
+        return_document=ReturnDocument.AFTER,
+    )
+
+
+async def release_claim(db, entry: Dict[str, Any]):
+    """Nessun agente per la chiamata reclamata: torna in attesa con la stessa anzianità."""
+    await db[CALL_QUEUE_COLLECTION].update_one(
+        {"id": entry["id"], "claimed_by": WORKER_ID, "status": "dispatching"},
+        {"$set": {"status": "waiting", "claimed_by": None, "claimed_at": None}},
+    )
+
+
+async def mark_dispatched(db, entry: Dict[str, Any], agent_id: str):
+    await db[CALL_QUEUE_COLLECTION].update_one(
+        {"id": entry["id"]},
+        {"$set": {"status": "dispatched", "agent_id": agent_id, "dispatched_at": datetime.now(timezone.utc)}},
+    )
+
+
+async def remove(db, call_sid: str) -> bool:
+    """Chiamata chiusa mentre era ancora in coda (il chiamante ha riagganciato)."""
+    res = await db[CALL_QUEUE_COLLECTION].update_one(
+        {"call_sid": call_sid, "status": {"$in": ["waiting", "dispatching"]}},
+        {"$set": {"status": "abandoned", "claimed_by": None}},
+    )
+    return bool(res.modified_count)
+
+
+async def reserve_agent(db, unit_id: Optional[str], skills_required: Optional[List[str]] = None,
+                        available: str = "available", busy: str = "busy") -> Optional[Dict[str, Any]]:
+    """Prenota (disponibile -> occupato) l'agente meno carico della Unit con le skill richieste."""
+    query: Dict[str, Any] = {**_unit_filter(unit_id), "status": available}
+    if skills_required:
+        query["skills"] = {"$all": list(skills_required)}
+    now = datetime.now(timezone.utc)
+    return await db.agent_call_center.find_one_and_update(
+        query,
+        {"$set": {"status": busy, "last_activity": now, "updated_at": now}, "$inc": {"calls_in_progress": 1}},
+        sort=[("calls_in_progress", 1), ("last_activity", 1)],
+        projection={"_id": 0},
+        return_document=ReturnDocument.AFTER,
+    )
+
+
+async def dispatch(db, unit_id: Optional[str],
+                   assign: Callable[[str, Dict[str, Any]], Awaitable[Any]]) -> List[Tuple[str, str]]:
+    """Abbina chiamate in coda (priorità, attesa) e agenti disponibili della Unit finché
+    ci sono entrambi. `assign(call_sid, agent)` aggiorna la chiamata. Ritorna le coppie
+    (call_sid, agent_id) assegnate."""
+    assigned: List[Tuple[str, str]] = []
+    # chiamate senza agente adatto in questo giro: saltate, così quelle dopo (altre skill)
+    # non restano bloccate dietro la prima
+    skipped: List[str] = []
+    retried = False
+    while True:
+        entry = await claim_next(db, unit_id, skipped)
+        if entry is None:
+            # un agente liberato mentre una chiamata era reclamata ha trovato la coda vuota:
+            # un secondo giro sulle chiamate saltate lo recupera
+            if not skipped or retried:
+                break
+            retried = True
+            skipped = []
+            continue
+        agent = await reserve_agent(db, entry.get("unit_id"), entry.get("skills_required"))
+        if agent is None:
+            await release_claim(db, entry)
+            skipped.append(entry["id"])
+            continue
+        await mark_dispatched(db, entry, agent["user_id"])
+        try:
+            await assign(entry["call_sid"], agent)
+        except Exception as e:
+            logger.error(f"[ACD] assign {entry['call_sid']} -> {agent['user_id']} failed: {e}")
+        assigned.append((entry["call_sid"], agent["user_id"]))
+    return assigned
+
+
+async def queue_snapshot(db, unit_id: Optional[str] = None) -> Dict[str, Any]:
+    """Chiamate in attesa per Unit con l'attesa più lunga (vista supervisore)."""
+    pipeline = [
+        {"$match": {**_unit_filter(unit_id), "status": {"$in": ["waiting", "dispatching"]}}},
+        {"$group": {"_id": "$unit_id", "waiting": {"$sum": 1}, "oldest_queued_at": {"$min": "$queued_at"}}},
+    ]
+    return {row["_id"]: {"waiting": row["waiting"], "oldest_queued_at": row["oldest_queued_at"]}
+            async for row in db[CALL_QUEUE_COLLECTION].aggregate(pipeline)}
+
+
+async def ensure_call_queue_indexes(db):
+    await db[CALL_QUEUE_COLLECTION].create_index("call_sid", unique=True)
+    await db[CALL_QUEUE_COLLECTION].create_index([("unit_id", 1), ("status", 1), ("priority", -1), ("queued_at", 1)])
+    await db.agent_call_center.create_index([("unit_id", 1), ("status", 1), ("skills", 1), ("calls_in_progress", 1)])
+    # Una tantum: unit_id degli agenti creati prima dell'indice
+    if await db.system_migrations.find_one({"id": AGENT_UNIT_MARKER_ID}):
+        return
+    updated = 0
+    async for agent in db.agent_call_center.find({"unit_id": {"$exists": False}}, {"_id": 0, "user_id": 1}):
+        user = await db.users.find_one({"id": agent["user_id"]}, {"_id": 0, "unit_id": 1})
+        await db.agent_call_center.update_one(
+            {"user_id": agent["user_id"]}, {"$set": {"unit_id": (user or {}).get("unit_id")}}
+        )
+        updated += 1
+    await db.system_migrations.insert_one({
+        "id": AGENT_UNIT_MARKER_ID, "completed_at": datetime.now(timezone.utc), "agents": updated,
+    })
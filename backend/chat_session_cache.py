@@ -0,0 +1,147 @@
+"""Cache LRU/TTL delle sessioni del ChatBot interno (NEW ott 2026).
+
+`ChatBotService.active_chats` teneva un `LlmChat` per `session_id` in un dict senza
+limiti: ogni sessione (con tutta la storia accumulata dalla libreria) restava in
+memoria per la vita del processo e si perdeva al riavvio.
+
+`ChatSessionCache` limita le sessioni per numero (`CHAT_SESSION_MAX_ENTRIES`), inattività
+(`CHAT_SESSION_TTL_SECONDS`) e memoria stimata (`CHAT_SESSION_MAX_BYTES`, somma dei testi
+passati per ogni sessione); le sessioni meno usate di recente escono per prime. Dopo
+un'eviction o un riavvio la sessione viene ricostruita dagli ultimi
+`CHAT_SESSION_HISTORY_MESSAGES` messaggi di `chat_messages` (vedi services.ChatBotService).
+
+Metriche: `crm_chat_session_cache_total{event}` (hit/miss/rehydrated),
+`crm_chat_session_evictions_total{reason}` (entries/ttl/bytes) e i gauge di occupazione;
+statistiche anche su /api/admin/chat-sessions/stats.
+"""
+import os
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional
+
+from metrics import registry
+
+CHAT_SESSION_MAX_ENTRIES = int(os.environ.get("CHAT_SESSION_MAX_ENTRIES", "500"))
+CHAT_SESSION_TTL_SECONDS = float(os.environ.get("CHAT_SESSION_TTL_SECONDS", str(30 * 60)))
+CHAT_SESSION_MAX_BYTES = int(os.environ.get("CHAT_SESSION_MAX_BYTES", str(64 * 1024 * 1024)))
+CHAT_SESSION_HISTORY_MESSAGES = int(os.environ.get("CHAT_SESSION_HISTORY_MESSAGES", "20"))
+
+CHAT_SESSION_EVENTS = registry.counter(
+    "crm_chat_session_cache_total", "Accessi alla cache delle sessioni ChatBot per esito.", ("event",))
+CHAT_SESSION_EVICTIONS = registry.counter(
+    "crm_chat_session_evictions_total", "Sessioni ChatBot rimosse dalla cache per motivo.", ("reason",))
+CHAT_SESSION_ENTRIES = registry.gauge(
+    "crm_chat_session_cache_entries", "Sessioni ChatBot in memoria.")
+CHAT_SESSION_BYTES = registry.gauge(
+    "crm_chat_session_cache_bytes", "Memoria stimata (testo) delle sessioni ChatBot in memoria.")
+
+
+class ChatSessionEntry:
+    """Sessione in memoria: chat della libreria LLM + storia da re-iniettare dopo un miss."""
+
+    __slots__ = ("chat", "unit_id", "bytes", "last_used", "pending_history")
+
+    def __init__(self, chat: Any, unit_id: str, size: int = 0, pending_history: Optional[List[Dict[str, str]]] = None):
+        self.chat = chat
+        self.unit_id = unit_id
+        self.bytes = size
+        self.last_used = time.monotonic()
+        self.pending_history = pending_history or []
+
+
+class ChatSessionCache:
+    """LRU per numero di sessioni e byte stimati, con scadenza per inattività."""
+
+    def __init__(
+        self,
+        max_entries: int = CHAT_SESSION_MAX_ENTRIES,
+        ttl_seconds: float = CHAT_SESSION_TTL_SECONDS,
+        max_bytes: int = CHAT_SESSION_MAX_BYTES,
+    ):
+        self.max_entries = max(1, max_entries)
+        self.ttl_seconds = ttl_seconds
+        self.max_bytes = max_bytes
+        self._sessions: "OrderedDict[str, ChatSessionEntry]" = OrderedDict()
+        self._total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.rehydrated = 0
+        self.evictions: Dict[str, int] = {"entries": 0, "ttl": 0, "bytes": 0}
+
+    def __len__(self) -> int:
+        return len(self._sessions)
+
+    def __contains__(self, session_id: str) -> bool:
+        return session_id in self._sessions
+
+    def get(self, session_id: str) -> Optional[ChatSessionEntry]:
+        now = time.monotonic()
+        session = self._sessions.get(session_id)
+        if session is not None and self.ttl_seconds > 0 and now - session.last_used > self.ttl_seconds:
+            self._evict(session_id, "ttl")
+            session = None
+        if session is None:
+            self.misses += 1
+            CHAT_SESSION_EVENTS.inc(event="miss")
+            return None
+        self.hits += 1
+        CHAT_SESSION_EVENTS.inc(event="hit")
+        session.last_used = now
+        self._sessions.move_to_end(session_id)
+        return session
+
+    def put(self, session_id: str, session: ChatSessionEntry):
+        if session_id in self._sessions:
+            self._total_bytes -= self._sessions.pop(session_id).bytes
+        self._sessions[session_id] = session
+        self._total_bytes += session.bytes
+        if session.pending_history:
+            self.rehydrated += 1
+            CHAT_SESSION_EVENTS.inc(event="rehydrated")
+        self._enforce()
+
+    def add_bytes(self, session_id: str, size: int):
+        """Registra il testo aggiunto alla storia della sessione (la libreria lo conserva)."""
+        session = self._sessions.get(session_id)
+        if session is None:
+            return
+        session.bytes += size
+        self._total_bytes += size
+        self._sessions.move_to_end(session_id)
+        self._enforce()
+
+    def _evict(self, session_id: str, reason: str):
+        session = self._sessions.pop(session_id)
+        self._total_bytes -= session.bytes
+        self.evictions[reason] += 1
+        CHAT_SESSION_EVICTIONS.inc(reason=reason)
+
+    def _enforce(self):
+        now = time.monotonic()
+        if self.ttl_seconds > 0:
+            # l'ordine LRU è anche l'ordine di ultimo uso: basta guardare la testa
+            while self._sessions:
+                oldest_id, oldest = next(iter(self._sessions.items()))
+                if now - oldest.last_used <= self.ttl_seconds:
+                    break
+                self._evict(oldest_id, "ttl")
+        while len(self._sessions) > self.max_entries:
+            self._evict(next(iter(self._sessions)), "entries")
+        # la sessione appena usata è in coda e resta anche se da sola supera il limite
+        while self._total_bytes > self.max_bytes and len(self._sessions) > 1:
+            self._evict(next(iter(self._sessions)), "bytes")
+        CHAT_SESSION_ENTRIES.set(len(self._sessions))
+        CHAT_SESSION_BYTES.set(self._total_bytes)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "entries": len(self._sessions),
+            "max_entries": self.max_entries,
+            "bytes": self._total_bytes,
+            "max_bytes": self.max_bytes,
+            "ttl_seconds": self.ttl_seconds,
+            "hits": self.hits,
+            "misses": self.misses,
+            "rehydrated": self.rehydrated,
+            "evictions": dict(self.evictions),
+        }
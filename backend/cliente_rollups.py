@@ -0,0 +1,243 @@
+"""Rollup giornalieri dei clienti per sub agenzia (NEW ott 2026).
+
+`/analytics/sub-agenzie` caricava per ogni sub agenzia visibile tutti i clienti con
+`to_list(length=None)`, risolveva i nomi utente con un `find_one` ciascuno e faceva un
+`count_documents` per ogni giorno dell'intervallo (trend): migliaia di query per 90
+giorni su 40 sub agenzie.
+
+Ora la collection `clienti_daily_rollups` contiene un documento per combinazione
+
+    { sub_agenzia_id, day (mezzanotte Europe/Rome, `$dateTrunc`), commessa_id,
+      servizio_id, status, tipologia_contratto, assigned, count }
+
+calcolata con un solo `$group` su `clienti`. L'endpoint legge solo i rollup (un
+`$facet` per status / tipologia / assegnatario / giorno).
+
+Aggiornamento:
+- eventi cliente (creazione, import, modifica, cambio stato/assegnazione, ripristino,
+  eliminazione definitiva): `refresh_for()` ricalcola solo i bucket (sub agenzia,
+  giorno) dei clienti toccati — query sull'indice (sub_agenzia_id, created_at);
+- job `clienti_rollups_rebuild` dello scheduler: ricostruzione completa alla prima
+  pianificazione e poi ogni `CLIENTI_ROLLUP_RECONCILE_INTERVAL_SECONDS`, per
+  le scritture che non passano dagli eventi (script, update massivi).
+"""
+import logging
+import os
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+try:
+    from zoneinfo import ZoneInfo
+except ImportError:  # pragma: no cover
+    from backports.zoneinfo import ZoneInfo  # type: ignore
+
+from pymongo import UpdateOne
+
+logger = logging.getLogger(__name__)
+
+ROLLUP_COLLECTION = "clienti_daily_rollups"
+ROLLUP_MARKER_ID = "clienti_daily_rollups_v1"
+CLIENTI_ROLLUP_RECONCILE_INTERVAL_SECONDS = int(
+    os.environ.get("CLIENTI_ROLLUP_RECONCILE_INTERVAL_SECONDS", str(6 * 3600))
+)
+NOT_SPECIFIED = "Non specificato"
+# stesso fuso di helpers.APP_TIMEZONE (non importato: helpers usa questo modulo negli import)
+APP_TIMEZONE = ZoneInfo("Europe/Rome")
+
+DIMENSIONS = ("sub_agenzia_id", "day", "commessa_id", "servizio_id", "status", "tipologia_contratto", "assigned")
+
+# created_at può essere stringa ISO nei dati legacy: $convert evita errori di $dateTrunc
+_DAY_EXPR = {"$dateTrunc": {
+    "date": {"$convert": {"input": "$created_at", "to": "date", "onError": None, "onNull": None}},
+    "unit": "day",
+    "timezone": APP_TIMEZONE.key,
+}}
+# assigned_to, altrimenti created_by (come la vecchia classifica "top assigned")
+_ASSIGNED_EXPR = {"$cond": [
+    {"$eq": [{"$ifNull": ["$assigned_to", ""]}, ""]},
+    {"$ifNull": ["$created_by", None]},
+    "$assigned_to",
+]}
+_GROUP_STAGE = {"$group": {
+    "_id": {
+        "sub_agenzia_id": "$sub_agenzia_id",
+        "day": _DAY_EXPR,
+        "commessa_id": {"$ifNull": ["$commessa_id", None]},
+        "servizio_id": {"$ifNull": ["$servizio_id", None]},
+        "status": {"$ifNull": ["$status", NOT_SPECIFIED]},
+        "tipologia_contratto": {"$ifNull": ["$tipologia_contratto", NOT_SPECIFIED]},
+        "assigned": _ASSIGNED_EXPR,
+    },
+    "count": {"$sum": 1},
+}}
+
+
+def _as_utc(value: Any) -> Optional[datetime]:
+    if isinstance(value, str):
+        try:
+            value = datetime.fromisoformat(value.replace("Z", "+00:00"))
+        except ValueError:
+            return None
+    if not isinstance(value, datetime):
+        return None
+    return value.replace(tzinfo=timezone.utc) if value.tzinfo is None else value.astimezone(timezone.utc)
+
+
+def day_start(value: Any) -> Optional[datetime]:
+    """Mezzanotte Europe/Rome (in UTC, naive come i datetime letti da Mongo) del giorno di `value`."""
+    ts = _as_utc(value)
+    if ts is None:
+        return None
+    local = ts.astimezone(APP_TIMEZONE)
+    midnight = local.replace(hour=0, minute=0, second=0, microsecond=0)
+    return midnight.astimezone(timezone.utc).replace(tzinfo=None)
+
+
+def day_label(day: Optional[datetime]) -> Optional[str]:
+    ts = _as_utc(day)
+    return ts.astimezone(APP_TIMEZONE).strftime("%Y-%m-%d") if ts else None
+
+
+def _next_day(day: datetime) -> datetime:
+    # +36h e poi di nuovo a mezzanotte: gestisce i giorni da 23/25 ore (ora legale)
+    return day_start(day + timedelta(hours=36))
+
+
+def _row_key(dims: Dict[str, Any]) -> str:
+    day = dims.get("day")
+    return "|".join("" if dims.get(d) is None else (day.isoformat() if d == "day" else str(dims[d])) for d in DIMENSIONS)
+
+
+ROLLUP_WRITE_CHUNK_SIZE = 1000
+
+
+async def _upsert_rows(db, rows: List[Dict[str, Any]], now: datetime) -> List[str]:
+    """Upsert (bulk, non ordinato) delle righe `$group`; ritorna le chiavi scritte."""
+    keys, ops = [], []
+    for row in rows:
+        dims = {d: row["_id"].get(d) for d in DIMENSIONS}
+        key = _row_key(dims)
+        keys.append(key)
+        ops.append(UpdateOne({"key": key}, {"$set": {**dims, "count": row["count"], "refreshed_at": now}}, upsert=True))
+    for start in range(0, len(ops), ROLLUP_WRITE_CHUNK_SIZE):
+        await db[ROLLUP_COLLECTION].bulk_write(ops[start:start + ROLLUP_WRITE_CHUNK_SIZE], ordered=False)
+    return keys
+
+
+async def refresh_bucket(db, sub_agenzia_id: Optional[str], day: Optional[datetime]) -> int:
+    """Ricalcola i rollup di una sub agenzia in un giorno (day=None: created_at non valido)."""
+    not_a_date = {"created_at": {"$not": {"$type": "date"}}}
+    if day is None:
+        created = not_a_date
+    else:
+        created = {"$or": [{"created_at": {"$gte": day, "$lt": _next_day(day)}}, not_a_date]}
+    pipeline = [
+        {"$match": {"sub_agenzia_id": sub_agenzia_id, **created}},
+        _GROUP_STAGE,
+        {"$match": {"_id.day": day}},
+    ]
+    rows = [r async for r in db.clienti.aggregate(pipeline)]
+    keys = await _upsert_rows(db, rows, datetime.now(timezone.utc))
+    # combinazioni sparite dal bucket (es. cambio stato: la vecchia riga va a zero)
+    await db[ROLLUP_COLLECTION].delete_many({"sub_agenzia_id": sub_agenzia_id, "day": day, "key": {"$nin": keys}})
+    return len(rows)
+
+
+def _buckets(docs: Iterable[Optional[Dict[str, Any]]]) -> Set[Tuple[Optional[str], Optional[datetime]]]:
+    return {(d.get("sub_agenzia_id"), day_start(d.get("created_at"))) for d in docs if d}
+
+
+async def refresh_for(db, docs: Iterable[Optional[Dict[str, Any]]]):
+    """Evento cliente: ricalcola i bucket dei documenti indicati (stato prima e/o dopo
+    la modifica). Non solleva: i rollup non devono mai far fallire la scrittura."""
+    try:
+        for sub_agenzia_id, day in _buckets(docs):
+            await refresh_bucket(db, sub_agenzia_id, day)
+    except Exception as e:
+        logger.warning(f"[CLIENTI-ROLLUP] refresh failed: {e}")
+
+
+async def refresh_ids(db, cliente_ids: Iterable[str]):
+    """Come `refresh_for`, leggendo sub agenzia e data di creazione dei clienti indicati."""
+    ids = [cid for cid in cliente_ids if cid]
+    if not ids:
+        return
+    try:
+        docs = [d async for d in db.clienti.find({"id": {"$in": ids}}, {"_id": 0, "sub_agenzia_id": 1, "created_at": 1})]
+    except Exception as e:
+        logger.warning(f"[CLIENTI-ROLLUP] refresh lookup failed: {e}")
+        return
+    await refresh_for(db, docs)
+
+
+async def rebuild(db) -> int:
+    """Ricostruzione completa con un solo `$group` su tutti i clienti."""
+    started = datetime.now(timezone.utc)
+    rows = [r async for r in db.clienti.aggregate([_GROUP_STAGE], allowDiskUse=True)]
+    await _upsert_rows(db, rows, started)
+    # righe non toccate da questa ricostruzione (né da refresh concorrenti) sono obsolete
+    await db[ROLLUP_COLLECTION].delete_many({"refreshed_at": {"$lt": started}})
+    await db.system_migrations.update_one(
+        {"id": ROLLUP_MARKER_ID}, {"$set": {"last_rebuilt_at": started, "rows": len(rows)}}, upsert=True
+    )
+    return len(rows)
+
+
+async def ensure_rollup_indexes(db):
+    await db[ROLLUP_COLLECTION].create_index("key", unique=True)
+    await db[ROLLUP_COLLECTION].create_index([("sub_agenzia_id", 1), ("day", 1)])
+    await db.clienti.create_index([("sub_agenzia_id", 1), ("created_at", 1)])
+
+
+async def rebuild_job(db) -> int:
+    """Job "clienti_rollups_rebuild" dello scheduler (scheduler.py), ricorrente ogni
+    `CLIENTI_ROLLUP_RECONCILE_INTERVAL_SECONDS` e alla prima pianificazione subito."""
+    await ensure_rollup_indexes(db)
+    return await rebuild(db)
+
+
+async def read_sub_agenzie_rollups(
+    db,
+    sub_agenzia_ids: List[str],
+    day_from: Optional[datetime] = None,
+    day_to: Optional[datetime] = None,
+    commessa_ids: Optional[List[str]] = None,
+    servizio_ids: Optional[List[str]] = None,
+) -> Dict[str, Dict[str, Any]]:
+    """sub_agenzia_id -> {total, status, tipologia, assigned, days} dai rollup.
+    `day_from`/`day_to` sono mezzanotti Europe/Rome inclusive."""
+    match: Dict[str, Any] = {"sub_agenzia_id": {"$in": sub_agenzia_ids}}
+    if day_from or day_to:
+        match["day"] = {}
+        if day_from:
+            match["day"]["$gte"] = day_from
+        if day_to:
+            match["day"]["$lte"] = day_to
+    if commessa_ids:
+        match["commessa_id"] = {"$in": commessa_ids}
+    if servizio_ids:
+        match["servizio_id"] = {"$in": servizio_ids}
+
+    def by(field):
+        return [{"$group": {"_id": {"sa": "$sub_agenzia_id", "v": f"${field}"}, "count": {"$sum": "$count"}}}]
+
+    pipeline = [
+        {"$match": match},
+        {"$facet": {"status": by("status"), "tipologia": by("tipologia_contratto"),
+                    "assigned": by("assigned"), "days": by("day")}},
+    ]
+    out: Dict[str, Dict[str, Any]] = {
+        sa: {"total": 0, "status": {}, "tipologia": {}, "assigned": {}, "days": {}} for sa in sub_agenzia_ids
+    }
+    async for facets in db[ROLLUP_COLLECTION].aggregate(pipeline):
+        for facet, rows in facets.items():
+            for row in rows:
+                target = out.get(row["_id"].get("sa"))
+                if target is None:
+                    continue
+                value = row["_id"].get("v")
+                if facet == "days":
+                    value = day_label(value)
+                    target["total"] += row["count"]
+                target[facet][value] = target[facet].get(value, 0) + row["count"]
+    return out
@@ -0,0 +1,155 @@
+"""Riepiloghi materializzati delle conversazioni WhatsApp per lead (NEW ott 2026).
+
+L'inbox (`GET /spoki/conversations`) ordinava tutta `spoki_messages` per `created_at`
+e raggruppava per `lead_id` a ogni apertura, filtrando poi le Unit visibili in Python;
+`/spoki/conversations/unhandled-count` scandiva tutti i messaggi `needs_attention`.
+Con ~1M messaggi servivano diversi secondi.
+
+Ora la collection `conversation_summaries`
+
+    { lead_id, unit_id, last_message: {id, body, template_name, direction, sender,
+      status, created_at}, last_message_at, messages_count, unhandled_count,
+      updated_at }
+
+è aggiornata con un solo upsert atomico ogni volta che un messaggio viene registrato
+(webhook Spoki, benvenuto, risposte bot/admin, `_log_spoki_msg` dei workflow), e
+`unhandled_count` segue i flag "da gestire" (`flag_unhandled` / `clear_unhandled`).
+L'inbox è una lettura paginata sull'indice `unit_id, last_message_at` con lo scope
+dell'utente nella query.
+
+`rebuild()` ricalcola tutto da `spoki_messages` (`$merge`) con il job
+`conversation_summaries_rebuild` dello scheduler: subito alla prima pianificazione
+(backfill) e poi periodicamente, per correggere eventuali derive.
+"""
+import logging
+import os
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+CONVERSATION_SUMMARIES_COLLECTION = "conversation_summaries"
+CONVERSATION_SUMMARIES_MARKER_ID = "conversation_summaries_v1"
+CONVERSATION_SUMMARIES_RECONCILE_INTERVAL_SECONDS = int(
+    os.environ.get("CONVERSATION_SUMMARIES_RECONCILE_INTERVAL_SECONDS", str(24 * 3600))
+)
+
+_PREVIEW_FIELDS = ("id", "body", "template_name", "direction", "sender", "status", "created_at")
+
+
+def message_preview(msg: Dict[str, Any]) -> Dict[str, Any]:
+    return {k: msg.get(k) for k in _PREVIEW_FIELDS}
+
+
+async def record_message(db, msg: Dict[str, Any], needs_attention: bool = False):
+    """Aggiorna il riepilogo del lead di `msg` (documento appena inserito in spoki_messages).
+    L'ultimo messaggio cambia solo se `msg` non è più vecchio di quello registrato."""
+    lead_id = msg.get("lead_id")
+    if not lead_id:
+        return
+    created_at = msg.get("created_at") or datetime.now(timezone.utc)
+    is_latest = {"$gte": [{"$literal": created_at}, {"$ifNull": ["$last_message_at", datetime.min]}]}
+    # update a pipeline: $literal perché i testi dei messaggi possono iniziare con "$"
+    await db[CONVERSATION_SUMMARIES_COLLECTION].update_one(
+        {"lead_id": lead_id},
+        [{"$set": {
+            "unit_id": {"$cond": [is_latest, {"$literal": msg.get("unit_id")}, "$unit_id"]},
+            "last_message": {"$cond": [is_latest, {"$literal": message_preview(msg)}, "$last_message"]},
+            "last_message_at": {"$max": ["$last_message_at", {"$literal": created_at}]},
+            "messages_count": {"$add": [{"$ifNull": ["$messages_count", 0]}, 1]},
+            "unhandled_count": {"$add": [{"$ifNull": ["$unhandled_count", 0]}, 1 if needs_attention else 0]},
+            "updated_at": {"$literal": datetime.now(timezone.utc)},
+        }}],
+        upsert=True,
+    )
+
+
+async def flag_unhandled(db, lead_id: Optional[str], count: int = 1):
+    """Messaggi del lead segnati "da gestire" (bot in pausa/non attivato)."""
+    if not lead_id or count <= 0:
+        return
+    await db[CONVERSATION_SUMMARIES_COLLECTION].update_one(
+        {"lead_id": lead_id},
+        {"$inc": {"unhandled_count": count}, "$set": {"updated_at": datetime.now(timezone.utc)}},
+    )
+
+
+async def clear_unhandled(db, lead_id: Optional[str]):
+    if not lead_id:
+        return
+    await db[CONVERSATION_SUMMARIES_COLLECTION].update_one(
+        {"lead_id": lead_id, "unhandled_count": {"$gt": 0}},
+        {"$set": {"unhandled_count": 0, "updated_at": datetime.now(timezone.utc)}},
+    )
+
+
+def scope_filter(unit_ids: Optional[List[str]]) -> Dict[str, Any]:
+    """None = tutte le Unit (admin)."""
+    return {} if unit_ids is None else {"unit_id": {"$in": unit_ids}}
+
+
+async def list_summaries(db, unit_ids: Optional[List[str]], skip: int = 0, limit: int = 200) -> List[Dict[str, Any]]:
+    cursor = db[CONVERSATION_SUMMARIES_COLLECTION].find(scope_filter(unit_ids), {"_id": 0})
+    return await cursor.sort("last_message_at", -1).skip(skip).limit(limit).to_list(length=limit)
+
+
+async def count_unhandled(db, unit_ids: Optional[List[str]]) -> int:
+    """Lead con almeno un messaggio "da gestire" nelle Unit visibili."""
+    return await db[CONVERSATION_SUMMARIES_COLLECTION].count_documents(
+        {**scope_filter(unit_ids), "unhandled_count": {"$gt": 0}}
+    )
+
+
+async def rebuild(db) -> int:
+    """Ricalcolo completo da spoki_messages; ritorna il numero di riepiloghi."""
+    now = datetime.now(timezone.utc)
+    pipeline = [
+        # anche i messaggi archiviati da data_retention.py: i conteggi restano completi
+        {"$unionWith": "spoki_messages_archive"},
+        {"$match": {"lead_id": {"$ne": None}}},
+        {"$sort": {"created_at": -1}},
+        {"$group": {
+            "_id": "$lead_id",
+            "last": {"$first": "$$ROOT"},
+            "messages_count": {"$sum": 1},
+            "unhandled_count": {"$sum": {"$cond": [{"$eq": ["$needs_attention", True]}, 1, 0]}},
+        }},
+        {"$project": {
+            "_id": 0,
+            "lead_id": "$_id",
+            "unit_id": "$last.unit_id",
+            "last_message": {k: f"$last.{k}" for k in _PREVIEW_FIELDS},
+            "last_message_at": "$last.created_at",
+            "messages_count": 1,
+            "unhandled_count": 1,
+            "updated_at": {"$literal": now},
+        }},
+        {"$merge": {"into": CONVERSATION_SUMMARIES_COLLECTION, "on": "lead_id",
+                    "whenMatched": "replace", "whenNotMatched": "insert"}},
+    ]
+    async for _ in db.spoki_messages.aggregate(pipeline, allowDiskUse=True):
+        pass
+    total = await db[CONVERSATION_SUMMARIES_COLLECTION].count_documents({})
+    await db.system_migrations.update_one(
+        {"id": CONVERSATION_SUMMARIES_MARKER_ID},
+        {"$set": {"last_rebuilt_at": now, "conversations": total}},
+        upsert=True,
+    )
+    return total
+
+
+async def ensure_conversation_summary_indexes(db):
+    await db[CONVERSATION_SUMMARIES_COLLECTION].create_index("lead_id", unique=True)  # richiesto da $merge
+    await db[CONVERSATION_SUMMARIES_COLLECTION].create_index([("unit_id", 1), ("last_message_at", -1)])
+    await db[CONVERSATION_SUMMARIES_COLLECTION].create_index([("last_message_at", -1)])
+    await db[CONVERSATION_SUMMARIES_COLLECTION].create_index([("unit_id", 1), ("unhandled_count", 1)])
+
+
+async def rebuild_job(db) -> int:
+    """Job "conversation_summaries_rebuild" dello scheduler (scheduler.py), ricorrente ogni
+    `CONVERSATION_SUMMARIES_RECONCILE_INTERVAL_SECONDS` e alla prima pianificazione subito
+    (backfill dei riepiloghi al primo avvio dopo il deploy)."""
+    await ensure_conversation_summary_indexes(db)
+    total = await rebuild(db)
+    logger.info(f"[CONVERSATIONS] riepiloghi ricalcolati: {total} conversazioni")
+    return total
@@ -0,0 +1,228 @@
+"""Ciclo di vita dei log ad alto volume: archivio e scadenza (NEW ott 2026).
+
+`spoki_messages`, `workflow_executions_v2`, `clienti_logs`, `lead_history`,
+`lead_notifications`, `chat_messages` e `lead_whatsapp_validations` crescevano senza
+limite: con gli anni di storico gli indici "caldi" non stavano più in RAM.
+
+Ogni collection ha una `RetentionPolicy`:
+
+- `archive`: i documenti più vecchi di `days` giorni vengono spostati in
+  `<collection>_archive` (stessi documenti, stesso `_id`);
+- `delete`: i dati di debug/servizio più vecchi di `days` giorni vengono eliminati.
+
+I giorni si cambiano con `RETENTION_DAYS_<COLLECTION>` (es. `RETENTION_DAYS_SPOKI_MESSAGES=730`,
+0 = policy disattivata). Il job `data_retention` dello scheduler applica le policy a
+lotti (`DATA_RETENTION_BATCH_SIZE`, al massimo `DATA_RETENTION_MAX_BATCHES` per policy e
+per run, con una pausa tra i lotti); se resta lavoro si ripianifica a breve. Lo
+spostamento è idempotente: un run interrotto tra insert e delete viene completato dal
+successivo (gli `_id` già archiviati sono ignorati). L'avanzamento per collection è in
+`data_retention_status` (GET /api/admin/data-retention).
+
+Le letture dello storico (`GET /clienti/{id}/logs`, `GET /leads/{id}/history`,
+`GET /leads/{id}/notifications`) con `include_archive=true` completano i risultati
+dall'archivio (`find_with_archive`); il thread WhatsApp di un lead
+(`GET /spoki/conversations/{lead_id}`) lo legge sempre.
+"""
+import asyncio
+import logging
+import os
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional, Tuple
+
+from pymongo.errors import BulkWriteError
+
+logger = logging.getLogger(__name__)
+
+ARCHIVE_SUFFIX = "_archive"
+RETENTION_STATUS_COLLECTION = "data_retention_status"
+DATA_RETENTION_INTERVAL_SECONDS = int(os.environ.get("DATA_RETENTION_INTERVAL_SECONDS", str(24 * 3600)))
+DATA_RETENTION_BATCH_SIZE = int(os.environ.get("DATA_RETENTION_BATCH_SIZE", "1000"))
+DATA_RETENTION_MAX_BATCHES = int(os.environ.get("DATA_RETENTION_MAX_BATCHES", "50"))
+DATA_RETENTION_BATCH_PAUSE_SECONDS = float(os.environ.get("DATA_RETENTION_BATCH_PAUSE_SECONDS", "0.2"))
+DATA_RETENTION_CONTINUE_DELAY_SECONDS = int(os.environ.get("DATA_RETENTION_CONTINUE_DELAY_SECONDS", "60"))
+
+
+@dataclass(frozen=True)
+class RetentionPolicy:
+    collection: str
+    time_field: str
+    days: int
+    action: str  # "archive" | "delete"
+    extra_filter: Dict[str, Any] = field(default_factory=dict)
+    # indice dell'archivio per le letture dello storico
+    archive_index: Optional[Tuple[Tuple[str, int], ...]] = None
+
+    @property
+    def archive_collection(self) -> str:
+        return f"{self.collection}{ARCHIVE_SUFFIX}"
+
+    @property
+    def enabled(self) -> bool:
+        return self.days > 0
+
+
+DEFAULT_POLICIES: Tuple[RetentionPolicy, ...] = (
+    RetentionPolicy("spoki_messages", "created_at", 365, "archive",
+                    archive_index=(("lead_id", 1), ("created_at", 1))),
+    # solo esecuzioni concluse: quelle in attesa/in corso restano sempre calde
+    RetentionPolicy("workflow_executions_v2", "updated_at", 180, "archive",
+                    extra_filter={"status": {"$nin": ["running", "waiting"]}},
+                    archive_index=(("lead_id", 1), ("updated_at", -1))),
+    RetentionPolicy("clienti_logs", "timestamp", 365, "archive",
+                    archive_index=(("cliente_id", 1), ("timestamp", -1))),
+    RetentionPolicy("lead_history", "timestamp", 365, "archive",
+                    archive_index=(("lead_id", 1), ("timestamp", -1))),
+    RetentionPolicy("chat_messages", "created_at", 180, "archive",
+                    archive_index=(("session_id", 1), ("created_at", -1))),
+    # storico notifiche visibile in GET /leads/{id}/notifications: archiviato, non cancellato
+    RetentionPolicy("lead_notifications", "sent_at", 90, "archive",
+                    archive_index=(("lead_id", 1), ("sent_at", -1))),
+    # cache delle validazioni WhatsApp: ricalcolabile
+    RetentionPolicy("lead_whatsapp_validations", "created_at", 180, "delete"),
+)
+
+
+def load_policies() -> List[RetentionPolicy]:
+    """Policy di default con i giorni sovrascritti da RETENTION_DAYS_<COLLECTION>."""
+    out = []
+    for policy in DEFAULT_POLICIES:
+        days = os.environ.get(f"RETENTION_DAYS_{policy.collection.upper()}")
+        if days is not None:
+            policy = RetentionPolicy(policy.collection, policy.time_field, int(days), policy.action,
+                                     policy.extra_filter, policy.archive_index)
+        out.append(policy)
+    return out
+
+
+def policy_for(collection: str) -> Optional[RetentionPolicy]:
+    return next((p for p in load_policies() if p.collection == collection), None)
+
+
+async def _set_status(db, policy: RetentionPolicy, fields: Dict[str, Any], inc: Optional[Dict[str, int]] = None):
+    update: Dict[str, Any] = {"$set": {"action": policy.action, "days": policy.days, **fields}}
+    if inc:
+        update["$inc"] = inc
+    await db[RETENTION_STATUS_COLLECTION].update_one({"collection": policy.collection}, update, upsert=True)
+
+
+async def apply_policy(db, policy: RetentionPolicy, now: Optional[datetime] = None,
+                       batch_size: Optional[int] = None, max_batches: Optional[int] = None,
+                       pause: Optional[float] = None) -> Dict[str, Any]:
+    """Sposta in archivio (o elimina) a lotti i documenti oltre la retention, dal più vecchio.
+    Ritorna {collection, processed, batches, done}; done=False se resta lavoro."""
+    batch_size = DATA_RETENTION_BATCH_SIZE if batch_size is None else batch_size
+    max_batches = DATA_RETENTION_MAX_BATCHES if max_batches is None else max_batches
+    pause = DATA_RETENTION_BATCH_PAUSE_SECONDS if pause is None else pause
+    now = now or datetime.now(timezone.utc)
+    cutoff = now - timedelta(days=policy.days)
+    query = {**policy.extra_filter, policy.time_field: {"$lt": cutoff}}
+    projection = None if policy.action == "archive" else {"_id": 1}
+    await _set_status(db, policy, {"state": "running", "cutoff": cutoff, "last_run_started_at": now,
+                                   "processed_last_run": 0, "batches_last_run": 0, "last_error": None})
+    processed = batches = 0
+    done = False
+    while batches < max_batches:
+        docs = await db[policy.collection].find(query, projection).sort(policy.time_field, 1).limit(
+            batch_size).to_list(length=batch_size)
+        if not docs:
+            done = True
+            break
+        if policy.action == "archive":
+            try:
+                await db[policy.archive_collection].insert_many(docs, ordered=False)
+            except BulkWriteError as bwe:
+                # _id già in archivio: run precedente interrotto prima della delete
+                if any(err.get("code") != 11000 for err in bwe.details.get("writeErrors", [])):
+                    raise
+        res = await db[policy.collection].delete_many({"_id": {"$in": [d["_id"] for d in docs]}})
+        processed += res.deleted_count
+        batches += 1
+        await _set_status(db, policy, {
+            "processed_last_run": processed, "batches_last_run": batches,
+            "last_batch_at": datetime.now(timezone.utc),
+        }, inc={"processed_total": res.deleted_count})
+        if len(docs) < batch_size:
+            done = True
+            break
+        await asyncio.sleep(pause)
+    await _set_status(db, policy, {"state": "idle" if done else "partial",
+                                   "last_run_finished_at": datetime.now(timezone.utc)})
+    return {"collection": policy.collection, "action": policy.action, "processed": processed,
+            "batches": batches, "done": done}
+
+
+async def run_retention(db, policies: Optional[List[RetentionPolicy]] = None, **kwargs) -> List[Dict[str, Any]]:
+    """Applica tutte le policy attive; un errore su una collection non ferma le altre."""
+    results = []
+    for policy in policies if policies is not None else load_policies():
+        if not policy.enabled:
+            continue
+        try:
+            results.append(await apply_policy(db, policy, **kwargs))
+        except Exception as e:
+            logger.error(f"[RETENTION] {policy.collection}: {e}")
+            await _set_status(db, policy, {"state": "failed", "last_error": str(e)[:500],
+                                           "last_run_finished_at": datetime.now(timezone.utc)})
+            results.append({"collection": policy.collection, "action": policy.action, "error": str(e),
+                            "done": True})
+    return results
+
+
+async def ensure_retention_indexes(db, policies: Optional[List[RetentionPolicy]] = None):
+    await db[RETENTION_STATUS_COLLECTION].create_index("collection", unique=True)
+    for policy in policies if policies is not None else load_policies():
+        if not policy.enabled:
+            continue
+        await db[policy.collection].create_index(policy.time_field)
+        if policy.action == "archive":
+            await db[policy.archive_collection].create_index(policy.time_field)
+            if policy.archive_index:
+                await db[policy.archive_collection].create_index(list(policy.archive_index))
+
+
+async def retention_job(db, scheduler=None) -> List[Dict[str, Any]]:
+    """Job "data_retention" dello scheduler (scheduler.py), ricorrente ogni
+    `DATA_RETENTION_INTERVAL_SECONDS`; se un run si ferma al limite di lotti
+    ripianifica una continuazione dopo `DATA_RETENTION_CONTINUE_DELAY_SECONDS`."""
+    await ensure_retention_indexes(db)
+    results = await run_retention(db)
+    moved = {r["collection"]: r["processed"] for r in results if r.get("processed")}
+    if moved:
+        logger.info(f"[RETENTION] {moved}")
+    if scheduler is not None and not all(r["done"] for r in results):
+        await scheduler.schedule_once(
+            "data_retention",
+            run_at=datetime.now(timezone.utc) + timedelta(seconds=DATA_RETENTION_CONTINUE_DELAY_SECONDS),
+            key="data_retention_continue",
+        )
+    return results
+
+
+async def retention_overview(db) -> List[Dict[str, Any]]:
+    status = {s["collection"]: s async for s in db[RETENTION_STATUS_COLLECTION].find({}, {"_id": 0})}
+    return [{
+        "collection": p.collection,
+        "action": p.action,
+        "days": p.days,
+        "enabled": p.enabled,
+        "time_field": p.time_field,
+        "archive_collection": p.archive_collection if p.action == "archive" else None,
+        "status": status.get(p.collection),
+    } for p in load_policies()]
+
+
+async def find_with_archive(db, collection: str, query: Dict[str, Any], sort_field: str, limit: int,
+                            include_archive: bool = False,
+                            projection: Optional[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
+    """Documenti più recenti prima; con `include_archive` i posti rimasti fino a `limit`
+    vengono riempiti dall'archivio (che contiene solo documenti più vecchi di quelli caldi)."""
+    docs = await db[collection].find(query, projection).sort(sort_field, -1).limit(limit).to_list(length=limit)
+    if include_archive and len(docs) < limit:
+        remaining = limit - len(docs)
+        archived = await db[f"{collection}{ARCHIVE_SUFFIX}"].find(query, projection).sort(
+            sort_field, -1).limit(remaining).to_list(length=remaining)
+        for doc in archived:
+            doc["archived"] = True
+        docs.extend(archived)
+    return docs
@@ -6,6 +6,9 @@ from pathlib import Path
 from dotenv import load_dotenv
 from motor.motor_asyncio import AsyncIOMotorClient
 
+from metrics import mongo_command_metrics
+from slow_queries import slow_query_recorder
+
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
 
@@ -22,7 +25,9 @@ try:
     logging.info(f"🔗 Connecting to MongoDB: {mongo_url[:50]}...")
     logging.info(f"📊 Database: {db_name}")
     
-    client = AsyncIOMotorClient(mongo_url)
+    # I listener alimentano le metriche per collection/operazione esposte su /api/metrics
+    # e la cattura delle query lente (capped collection `slow_queries`)
+    client = AsyncIOMotorClient(mongo_url, event_listeners=[mongo_command_metrics, slow_query_recorder])
     db = client[db_name]
     
     logging.info("✅ MongoDB client initialized successfully")
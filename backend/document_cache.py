@@ -0,0 +1,285 @@
+"""Proxy streaming documenti Nextcloud/Aruba Drive + cache locale su disco (LRU).
+
+I documenti vengono inoltrati al browser a blocchi, senza mai caricare l'intero file in
+memoria, con supporto a `Range` (206) e `If-None-Match` (304). Le risposte complete vengono
+salvate in una cache su disco limitata in dimensione, con chiave (percorso cloud, ETag):
+le riaperture dello stesso PDF non ripassano da Aruba Drive finché l'ETag non cambia.
+"""
+import hashlib
+import logging
+import os
+import re
+import time
+import uuid
+from collections import OrderedDict
+from typing import Optional, Tuple, Dict, Any
+
+import aiofiles
+from fastapi import HTTPException, Request
+from fastapi.responses import Response, StreamingResponse
+
+DOCUMENT_CACHE_DIR = os.environ.get("DOCUMENT_CACHE_DIR", "./cache/documents")
+DOCUMENT_CACHE_MAX_BYTES = int(os.environ.get("DOCUMENT_CACHE_MAX_BYTES", str(2 * 1024 * 1024 * 1024)))
+# File più grandi di questa soglia vengono solo inoltrati, non salvati in cache
+DOCUMENT_CACHE_MAX_ENTRY_BYTES = int(os.environ.get("DOCUMENT_CACHE_MAX_ENTRY_BYTES", str(200 * 1024 * 1024)))
+STREAM_CHUNK_SIZE = 256 * 1024
+
+_RANGE_RE = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+
+class DocumentBlobCache:
+    """Cache LRU su disco, limitata in byte, con chiave (percorso cloud, ETag)."""
+
+    def __init__(self, directory: str = DOCUMENT_CACHE_DIR, max_bytes: int = DOCUMENT_CACHE_MAX_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._index: "OrderedDict[str, int]" = OrderedDict()
+        self._total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        os.makedirs(self.directory, exist_ok=True)
+        self._load()
+
+    def _load(self):
+        """Ricostruisce l'indice dal contenuto della directory (ordine LRU = mtime)."""
+        entries = []
+        for name in os.listdir(self.directory):
+            path = os.path.join(self.directory, name)
+            if name.endswith(".part"):
+                # Scrittura interrotta (crash/restart): non è un blob valido
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+                continue
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            entries.append((st.st_mtime, name, st.st_size))
+        for _, name, size in sorted(entries):
+            self._index[name] = size
+            self._total_bytes += size
+        self._evict()
+
+    @staticmethod
+    def key(cloud_ref: str, etag: str) -> str:
+        return hashlib.sha256(f"{cloud_ref}\n{etag}".encode("utf-8")).hexdigest()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, key)
+
+    def get(self, cloud_ref: str, etag: str) -> Optional[str]:
+        """Path del blob in cache (aggiornando l'ordine LRU) o None."""
+        key = self.key(cloud_ref, etag)
+        if key not in self._index or not os.path.exists(self._path(key)):
+            self._drop(key)
+            self.misses += 1
+            return None
+        self._index.move_to_end(key)
+        try:
+            os.utime(self._path(key))
+        except OSError:
+            pass
+        self.hits += 1
+        return self._path(key)
+
+    def temp_path(self) -> str:
+        return os.path.join(self.directory, f"{uuid.uuid4().hex}.part")
+
+    def commit(self, cloud_ref: str, etag: str, temp_path: str):
+        """Promuove un file temporaneo completo a blob in cache ed applica il limite di dimensione."""
+        key = self.key(cloud_ref, etag)
+        size = os.path.getsize(temp_path)
+        self._drop(key)
+        os.replace(temp_path, self._path(key))
+        self._index[key] = size
+        self._total_bytes += size
+        self._evict()
+
+    def _drop(self, key: str):
+        size = self._index.pop(key, None)
+        if size is not None:
+            self._total_bytes -= size
+
+    def _evict(self):
+        while self._total_bytes > self.max_bytes and self._index:
+            key, size = self._index.popitem(last=False)
+            self._total_bytes -= size
+            self.evictions += 1
+            try:
+                os.remove(self._path(key))
+            except OSError:
+                pass
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "entries": len(self._index),
+            "bytes": self._total_bytes,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
+
+
+_document_cache: Optional[DocumentBlobCache] = None
+
+
+def get_document_cache() -> DocumentBlobCache:
+    global _document_cache
+    if _document_cache is None:
+        _document_cache = DocumentBlobCache()
+    return _document_cache
+
+
+def parse_range_header(range_header: Optional[str], size: Optional[int]) -> Optional[Tuple[int, int]]:
+    """Parsa un singolo range `bytes=start-end` → (start, end) inclusivi.
+
+    Ritorna None se il range è assente o non gestito (multi-range, size ignota): in quel caso
+    si risponde con il file intero, come consentito da RFC 9110.
+    Solleva 416 se il range non è soddisfacibile.
+    """
+    if not range_header or size is None:
+        return None
+    match = _RANGE_RE.match(range_header.strip())
+    if not match:
+        return None
+    start_s, end_s = match.groups()
+    if not start_s and not end_s:
+        return None
+    if not start_s:
+        # Suffix range: ultimi N byte
+        length = int(end_s)
+        if length == 0:
+            raise HTTPException(status_code=416, detail="Range non soddisfacibile", headers={"Content-Range": f"bytes */{size}"})
+        return max(0, size - length), size - 1
+    start = int(start_s)
+    end = int(end_s) if end_s else size - 1
+    if start >= size or end < start:
+        raise HTTPException(status_code=416, detail="Range non soddisfacibile", headers={"Content-Range": f"bytes */{size}"})
+    return start, min(end, size - 1)
+
+
+def _etag_matches(if_none_match: Optional[str], etag: Optional[str]) -> bool:
+    if not if_none_match or not etag:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    normalize = lambda t: t.strip().removeprefix("W/")
+    return normalize(etag) in {normalize(t) for t in if_none_match.split(",")}
+
+
+async def _iter_local_file(path: str, start: int, length: int):
+    async with aiofiles.open(path, "rb") as f:
+        await f.seek(start)
+        remaining = length
+        while remaining > 0:
+            chunk = await f.read(min(STREAM_CHUNK_SIZE, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
+
+
+def _local_blob_response(path: str, size: int, byte_range, media_type: str, headers: Dict[str, str]) -> Response:
+    if byte_range:
+        start, end = byte_range
+        length = end - start + 1
+        return StreamingResponse(
+            _iter_local_file(path, start, length),
+            status_code=206,
+            media_type=media_type,
+            headers={**headers, "Content-Range": f"bytes {start}-{end}/{size}", "Content-Length": str(length)},
+        )
+    return StreamingResponse(
+        _iter_local_file(path, 0, size),
+        media_type=media_type,
+        headers={**headers, "Content-Length": str(size)},
+    )
+
+
+async def _iter_upstream(resp, cache: Optional[DocumentBlobCache] = None, cloud_ref: str = "", etag: str = "",
+                         expected_size: Optional[int] = None):
+    """Inoltra i chunk WebDAV al client; se `cache` è passata, li salva anche su disco
+    e promuove il blob solo se il download è completo."""
+    temp_path = cache.temp_path() if cache else None
+    temp_file = None
+    written = 0
+    completed = False
+    try:
+        if temp_path:
+            temp_file = await aiofiles.open(temp_path, "wb")
+        async for chunk in resp.content.iter_chunked(STREAM_CHUNK_SIZE):
+            if temp_file:
+                await temp_file.write(chunk)
+            written += len(chunk)
+            yield chunk
+        completed = expected_size is None or written == expected_size
+    finally:
+        resp.release()
+        if temp_file:
+            await temp_file.close()
+            try:
+                if completed:
+                    cache.commit(cloud_ref, etag, temp_path)
+                else:
+                    os.remove(temp_path)
+            except OSError as e:
+                logging.warning(f"[DOC-CACHE] could not finalize cache entry: {e}")
+
+
+async def nextcloud_document_response(
+    nextcloud,
+    filename: str,
+    request: Request,
+    media_type: str,
+    content_disposition: str,
+) -> Response:
+    """Risposta streaming per un documento su Nextcloud, con Range/If-None-Match e cache LRU."""
+    started = time.monotonic()
+    stat = await nextcloud.stat_file(filename)
+    if not stat:
+        raise HTTPException(status_code=404, detail="File non trovato su Nextcloud")
+
+    etag = stat.get("etag")
+    size = stat.get("size")
+    headers = {"Content-Disposition": content_disposition, "Accept-Ranges": "bytes", "Cache-Control": "private, max-age=0"}
+    if etag:
+        headers["ETag"] = etag
+
+    if _etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+
+    byte_range = parse_range_header(request.headers.get("range"), size)
+    cloud_ref = nextcloud.file_url(filename)
+    cache = get_document_cache()
+
+    cached_path = cache.get(cloud_ref, etag) if etag else None
+    if cached_path:
+        logging.info(f"📦 Document cache hit: {filename} ({(time.monotonic() - started) * 1000:.0f}ms)")
+        return _local_blob_response(cached_path, os.path.getsize(cached_path), byte_range, media_type, headers)
+
+    range_header = f"bytes={byte_range[0]}-{byte_range[1]}" if byte_range else None
+    resp = await nextcloud.open_file_stream(filename, range_header)
+    if resp.status not in (200, 206):
+        resp.release()
+        logging.error(f"❌ Download failed: {resp.status}")
+        raise HTTPException(status_code=404, detail="File non trovato su Nextcloud")
+
+    if resp.status == 206:
+        # Range inoltrato al server: risposta parziale, non salvata in cache
+        for h in ("Content-Range", "Content-Length"):
+            if resp.headers.get(h):
+                headers[h] = resp.headers[h]
+        return StreamingResponse(_iter_upstream(resp), status_code=206, media_type=media_type, headers=headers)
+
+    if size is not None:
+        headers["Content-Length"] = str(size)
+    cacheable = bool(etag) and size is not None and size <= DOCUMENT_CACHE_MAX_ENTRY_BYTES
+    return StreamingResponse(
+        _iter_upstream(resp, cache if cacheable else None, cloud_ref, etag or "", size),
+        media_type=media_type,
+        headers=headers,
+    )
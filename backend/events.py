@@ -0,0 +1,172 @@
+"""Pub/sub nel processo per il canale SSE `/api/events/stream` (NEW ott 2026).
+
+Il frontend interrogava a intervalli `/spoki/conversations/unhandled-count`,
+`/spoki/conversations`, lo stato dei lock cliente e le dashboard: gran parte delle
+richieste (e delle aggregazioni) non portava alcuna informazione nuova.
+
+Ora i percorsi di scrittura pubblicano un evento sul `event_bus` e il canale SSE lo
+inoltra ai client iscritti al topic:
+
+    conversations:{unit_id} / conversations:*   messaggi WhatsApp in/out, letture
+    cliente_locks                               acquisizione/rilascio lock anagrafica
+    leads:user:{user_id}                        lead assegnato all'utente
+    dashboard                                   variazioni chiamate/agenti del call center
+
+`publish` non blocca mai chi scrive: ogni iscritto ha una coda limitata
+(`EVENTS_SUBSCRIBER_QUEUE_SIZE`); se un client lento la riempie la coda viene
+svuotata e riceve un solo evento `resync` (rilegge lo stato con le GET esistenti).
+
+Il bus è per processo: con più worker uvicorn un client riceve gli eventi delle
+scritture servite dal proprio worker (il `resync` alla riconnessione e le GET
+restano la fonte di verità).
+"""
+import asyncio
+import itertools
+import os
+import time
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterable, Optional, Set
+
+from fast_response import dumps
+from metrics import registry
+
+EVENTS_SUBSCRIBER_QUEUE_SIZE = int(os.environ.get("EVENTS_SUBSCRIBER_QUEUE_SIZE", "256"))
+SSE_HEARTBEAT_SECONDS = float(os.environ.get("SSE_HEARTBEAT_SECONDS", "15"))
+
+LOCKS_TOPIC = "cliente_locks"
+DASHBOARD_TOPIC = "dashboard"
+ALL_CONVERSATIONS_TOPIC = "conversations:*"
+
+EVENTS_PUBLISHED = registry.counter(
+    "crm_events_published_total", "Eventi pubblicati sul bus SSE per tipo.", ("type",))
+EVENTS_DELIVERED = registry.counter(
+    "crm_events_delivered_total", "Eventi consegnati alle code degli iscritti SSE.")
+EVENTS_DROPPED = registry.counter(
+    "crm_events_dropped_total", "Code SSE piene svuotate (client lento -> resync).")
+EVENTS_SUBSCRIBERS = registry.gauge(
+    "crm_events_subscribers", "Connessioni SSE aperte.")
+
+
+def conversation_topic(unit_id: Optional[str]) -> str:
+    return f"conversations:{unit_id or ''}"
+
+
+def user_leads_topic(user_id: str) -> str:
+    return f"leads:user:{user_id}"
+
+
+class Subscription:
+    """Coda di un client SSE iscritto a un insieme di topic."""
+
+    def __init__(self, topics: Set[str], maxsize: int):
+        self.topics = topics
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=maxsize)
+        self.dropped = 0
+
+    def offer(self, event: Dict[str, Any]):
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            # meglio un resync che bloccare chi scrive o crescere senza limite
+            while not self.queue.empty():
+                self.queue.get_nowait()
+            self.dropped += 1
+            EVENTS_DROPPED.inc()
+            self.queue.put_nowait({"id": event["id"], "type": "resync", "data": {}})
+
+    async def get(self, timeout: Optional[float] = None) -> Optional[Dict[str, Any]]:
+        """Prossimo evento; None se entro `timeout` non arriva nulla (heartbeat)."""
+        try:
+            return await asyncio.wait_for(self.queue.get(), timeout=timeout)
+        except asyncio.TimeoutError:
+            return None
+
+
+class EventBus:
+    def __init__(self, queue_size: int = EVENTS_SUBSCRIBER_QUEUE_SIZE):
+        self.queue_size = queue_size
+        self._by_topic: Dict[str, Set[Subscription]] = {}
+        self._ids = itertools.count(1)
+        self.published = 0
+
+    def subscribe(self, topics: Iterable[str]) -> Subscription:
+        sub = Subscription(set(topics), self.queue_size)
+        for topic in sub.topics:
+            self._by_topic.setdefault(topic, set()).add(sub)
+        EVENTS_SUBSCRIBERS.inc()
+        return sub
+
+    def unsubscribe(self, sub: Subscription):
+        for topic in sub.topics:
+            subs = self._by_topic.get(topic)
+            if subs is not None:
+                subs.discard(sub)
+                if not subs:
+                    del self._by_topic[topic]
+        EVENTS_SUBSCRIBERS.dec()
+
+    def publish(self, topics: Iterable[str], event_type: str, data: Dict[str, Any]) -> int:
+        """Consegna l'evento agli iscritti di almeno uno dei `topics` (una volta sola
+        per iscritto). Sincrono e non bloccante. Ritorna il numero di destinatari."""
+        event = {"id": next(self._ids), "type": event_type, "data": data, "ts": time.time()}
+        targets: Set[Subscription] = set()
+        for topic in topics:
+            targets.update(self._by_topic.get(topic, ()))
+        for sub in targets:
+            sub.offer(event)
+        self.published += 1
+        EVENTS_PUBLISHED.inc(type=event_type)
+        EVENTS_DELIVERED.inc(len(targets))
+        return len(targets)
+
+    def stats(self) -> Dict[str, Any]:
+        subscribers = set().union(*self._by_topic.values()) if self._by_topic else set()
+        return {
+            "subscribers": len(subscribers),
+            "topics": {topic: len(subs) for topic, subs in sorted(self._by_topic.items())},
+            "published": self.published,
+            "queue_size": self.queue_size,
+        }
+
+
+event_bus = EventBus()
+
+
+def sse_format(event: Dict[str, Any]) -> bytes:
+    return b"id: %d\nevent: %s\ndata: %s\n\n" % (event["id"], event["type"].encode(), dumps(event["data"]))
+
+
+# ---- eventi pubblicati dai percorsi di scrittura ----
+
+def publish_conversation(unit_id: Optional[str], lead_id: Optional[str], event_type: str, **data: Any) -> int:
+    return event_bus.publish(
+        (conversation_topic(unit_id), ALL_CONVERSATIONS_TOPIC), event_type,
+        {"unit_id": unit_id, "lead_id": lead_id, **data},
+    )
+
+
+def publish_lock(cliente_id: str, lock: Optional[Dict[str, Any]]) -> int:
+    """`lock` None = rilasciato."""
+    if lock is None:
+        return event_bus.publish((LOCKS_TOPIC,), "lock.released", {"cliente_id": cliente_id})
+    return event_bus.publish((LOCKS_TOPIC,), "lock.acquired", {
+        "cliente_id": cliente_id,
+        "user_id": lock.get("user_id"),
+        "username": lock.get("username"),
+        "locked_at": lock.get("locked_at"),
+        "expires_at": lock.get("expires_at"),
+    })
+
+
+def publish_lead_assigned(user_id: str, lead: Dict[str, Any]) -> int:
+    return event_bus.publish((user_leads_topic(user_id),), "lead.assigned", {
+        "lead_id": lead.get("id"),
+        "unit_id": lead.get("unit_id"),
+        "nome": lead.get("nome"),
+        "cognome": lead.get("cognome"),
+        "assigned_at": datetime.now(timezone.utc),
+    })
+
+
+def publish_call_center(unit_id: Optional[str], **data: Any) -> int:
+    return event_bus.publish((DASHBOARD_TOPIC,), "call_center.changed", {"unit_id": unit_id, **data})
@@ -0,0 +1,117 @@
+"""Serializzazione veloce per le liste grandi (NEW ott 2026).
+
+Gli endpoint lista (`/clienti`, `/leads`, `/users`, `/workflows`) costruivano un modello
+Pydantic per ogni documento (`Cliente` ha ~100 campi), FastAPI li ri-validava contro il
+`response_model` e poi li codificava con il json della stdlib: su pagine da 200 righe è la
+parte principale della CPU della richiesta.
+
+Per dati già validati in scrittura e letti dal nostro DB:
+
+- `model_projection(Model).projection` proietta in Mongo solo i campi del modello;
+- `.rows(docs)` produce dict con la stessa forma di `Model(**doc).model_dump()` (campi in
+  ordine, default riempiti, campi extra scartati, validator `before` del modello applicati)
+  senza validazione;
+- `FastJSONResponse` codifica con orjson e, essendo una Response, salta la ri-validazione
+  del `response_model` (che resta dichiarato per OpenAPI).
+
+`FAST_LIST_RESPONSES=false` riporta gli endpoint al percorso validato.
+Benchmark: `python benchmark_serialization.py`.
+"""
+import json
+import os
+from datetime import date, datetime
+from enum import Enum
+from functools import lru_cache
+from typing import Any, Callable, Dict, Iterable, List, Tuple, Type
+
+from fastapi.responses import JSONResponse
+from pydantic import BaseModel
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - orjson è in requirements.txt
+    orjson = None
+
+FAST_LIST_RESPONSES = os.environ.get("FAST_LIST_RESPONSES", "true").lower() in ("1", "true", "yes")
+
+
+def _default(obj: Any) -> Any:
+    """Tipi non nativi per orjson (ObjectId, Decimal128, set, modelli annidati)."""
+    if isinstance(obj, BaseModel):
+        return obj.model_dump(mode="json")
+    if isinstance(obj, (set, frozenset, tuple)):
+        return list(obj)
+    return str(obj)
+
+
+def _json_default(obj: Any) -> Any:
+    if isinstance(obj, datetime):
+        return obj.isoformat().replace("+00:00", "Z")
+    if isinstance(obj, date):
+        return obj.isoformat()
+    if isinstance(obj, Enum):
+        return obj.value
+    return _default(obj)
+
+
+def dumps(content: Any) -> bytes:
+    if orjson is not None:
+        # OPT_UTC_Z: datetime UTC come "...Z", identico all'output di Pydantic
+        return orjson.dumps(content, default=_default, option=orjson.OPT_NON_STR_KEYS | orjson.OPT_UTC_Z)
+    return json.dumps(content, default=_json_default, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+class FastJSONResponse(JSONResponse):
+    """JSONResponse codificata con orjson (fallback stdlib se orjson non è installato)."""
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
+
+
+class ModelProjection:
+    """Proiezione Mongo + costruzione righe senza validazione per un modello Pydantic."""
+
+    def __init__(self, model: Type[BaseModel]):
+        self.model = model
+        self.fields: Tuple[str, ...] = tuple(model.model_fields)
+        self.projection: Dict[str, int] = {"_id": 0, **{name: 1 for name in self.fields}}
+        self._defaults: Dict[str, Any] = {}
+        self._factories: Dict[str, Callable[[], Any]] = {}
+        for name, info in model.model_fields.items():
+            if info.default_factory is not None:
+                self._factories[name] = info.default_factory
+            elif not info.is_required():
+                self._defaults[name] = info.default
+        # Validator `mode='before'` (es. Cliente: "" -> None sui campi enum) girano anche qui
+        self._before: List[Callable[[Any], Any]] = [
+            dec.func for dec in model.__pydantic_decorators__.model_validators.values() if dec.info.mode == "before"
+        ]
+
+    def row(self, doc: Dict[str, Any]) -> Dict[str, Any]:
+        for hook in self._before:
+            doc = hook(doc)
+        out = {}
+        for name in self.fields:
+            if name in doc:
+                out[name] = doc[name]
+            elif name in self._defaults:
+                out[name] = self._defaults[name]
+            elif name in self._factories:
+                out[name] = self._factories[name]()
+            else:
+                # Campo obbligatorio assente: il percorso validato darebbe 500, qui resta null
+                out[name] = None
+        return out
+
+    def rows(self, docs: Iterable[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        row = self.row
+        return [row(doc) for doc in docs]
+
+    def construct(self, doc: Dict[str, Any]) -> BaseModel:
+        """Istanza del modello senza validazione (per il codice che vuole attributi, non dict)."""
+        return self.model.model_construct(**self.row(doc))
+
+
+@lru_cache(maxsize=None)
+def model_projection(model: Type[BaseModel]) -> ModelProjection:
+    return ModelProjection(model)
@@ -38,16 +38,24 @@ def rome_date_to_utc_range(date_str: str, tz_name: Optional[str] = None) -> Tupl
     return start_rome.astimezone(timezone.utc), end_rome.astimezone(timezone.utc)
 
 
-import pandas as pd
-import openpyxl
 import tempfile
-from openpyxl.styles import Font, PatternFill, Alignment
+from lazy_imports import lazy_attr, lazy_import
 from notifications import notify_agent_new_lead
+from events import publish_lead_assigned
 from fastapi import HTTPException, UploadFile
+from pymongo.errors import BulkWriteError
+import cliente_rollups
 
 from database import db
 from models import *  # noqa: F401,F403
 
+# pandas/openpyxl servono solo per import/export Excel: caricati al primo uso
+pd = lazy_import("pandas")
+openpyxl = lazy_import("openpyxl")
+Font = lazy_attr("openpyxl.styles", "Font")
+PatternFill = lazy_attr("openpyxl.styles", "PatternFill")
+Alignment = lazy_attr("openpyxl.styles", "Alignment")
+
 # Italian Provinces (111 provinces)
 ITALIAN_PROVINCES = [
     "Agrigento", "Alessandria", "Ancona", "Aosta", "Arezzo", "Ascoli Piceno", "Asti", "Avellino", "Bari", 
@@ -222,103 +230,184 @@ def validate_cliente_data(data: dict, config: ImportConfiguration) -> tuple[bool
     
     return len(errors) == 0, "; ".join(errors)
 
+IMPORT_INSERT_CHUNK_SIZE = 1000
+
+
+def _read_import_dataframe(file_content: bytes, filename: str) -> "pd.DataFrame":
+    """Legge l'intero file di import (CSV/Excel) in un DataFrame con colonne ripulite."""
+    file_extension = filename.lower().split('.')[-1]
+
+    if file_extension == 'csv':
+        # Try different encodings for CSV
+        for encoding in ['utf-8', 'latin-1', 'cp1252']:
+            try:
+                # dtype=str: i telefoni non devono diventare float (es. 3331234567.0)
+                df = pd.read_csv(io.BytesIO(file_content), encoding=encoding, dtype=str)
+                break
+            except UnicodeDecodeError:
+                continue
+        else:
+            raise ValueError("Unable to decode CSV file")
+
+    elif file_extension in ['xls', 'xlsx']:
+        df = pd.read_excel(io.BytesIO(file_content), dtype=str)
+    else:
+        raise ValueError(f"Unsupported file type: {file_extension}")
+
+    # Clean column names
+    df.columns = df.columns.astype(str).str.strip()
+    return df
+
+
+def validate_cliente_frame(df: "pd.DataFrame", config: ImportConfiguration) -> "pd.Series":
+    """Versione vettoriale di `validate_cliente_data` su un DataFrame già mappato sui campi cliente.
+
+    Ritorna una Series di messaggi di errore ("" per le righe valide), con lo stesso
+    testo prodotto dalla validazione riga per riga.
+    """
+    def col(name):
+        if name in df.columns:
+            return df[name]
+        return pd.Series("", index=df.index)
+
+    nome, cognome, telefono, email = col('nome'), col('cognome'), col('telefono'), col('email')
+
+    checks = [
+        (nome == "", pd.Series("Nome is required", index=df.index)),
+        (cognome == "", pd.Series("Cognome is required", index=df.index)),
+        (telefono == "", pd.Series("Telefono is required", index=df.index)),
+    ]
+    if config.validate_phone:
+        digits = telefono.str.replace(r'\D', '', regex=True).str.len()
+        bad_phone = (telefono != "") & ((digits < 9) | (digits > 15))
+        checks.append((bad_phone, "Invalid phone format: " + telefono))
+    if config.validate_email:
+        # Equivale a: '@' in email and '.' in email.split('@')[1]
+        bad_email = (email != "") & ~email.str.contains(r'^[^@]*@[^@]*\.', regex=True)
+        checks.append((bad_email, "Invalid email format: " + email))
+
+    errors = pd.Series("", index=df.index)
+    for mask, message in checks:
+        errors = errors.mask(mask, errors.where(errors == "", errors + "; ") + message)
+    return errors
+
+
+async def _load_existing_phones(phones: List[str], commessa_id: str, sub_agenzia_id: str) -> set:
+    """Precarica con una query `$in` i telefoni già presenti per (commessa, sub agenzia)."""
+    existing = set()
+    for i in range(0, len(phones), 10000):
+        chunk = phones[i:i + 10000]
+        async for doc in db.clienti.find(
+            {"telefono": {"$in": chunk}, "commessa_id": commessa_id, "sub_agenzia_id": sub_agenzia_id},
+            {"_id": 0, "telefono": 1},
+        ):
+            existing.add(doc.get("telefono"))
+    return existing
+
+
 async def process_import_batch(
     file_content: bytes,
     filename: str,
     config: ImportConfiguration,
-    created_by: str
+    created_by: str,
+    progress_callback=None,
 ) -> ImportResult:
-    """Process full import batch"""
+    """Process full import batch.
+
+    Pipeline bulk: mappatura e validazione vettoriale con pandas, un'unica query per i
+    duplicati (telefono, commessa, sub agenzia) e `insert_many` non ordinato a blocchi.
+    `progress_callback(processed, total)` (async, opzionale) viene chiamato dopo ogni blocco.
+    """
     try:
-        # Parse file
-        file_extension = filename.lower().split('.')[-1]
-        
-        if file_extension == 'csv':
-            # Try different encodings for CSV
-            for encoding in ['utf-8', 'latin-1', 'cp1252']:
-                try:
-                    df = pd.read_csv(io.BytesIO(file_content), encoding=encoding)
-                    break
-                except UnicodeDecodeError:
-                    continue
-            else:
-                raise ValueError("Unable to decode CSV file")
-                
-        elif file_extension in ['xls', 'xlsx']:
-            df = pd.read_excel(io.BytesIO(file_content))
-        else:
-            raise ValueError(f"Unsupported file type: {file_extension}")
-        
-        # Clean column names
-        df.columns = df.columns.astype(str).str.strip()
-        
+        df = _read_import_dataframe(file_content, filename)
+
         # Skip header if configured
         if config.skip_header:
             df = df.iloc[1:]
-        
+
         # Create field mapping dictionary
-        field_map = {fm.csv_field: fm.client_field for fm in config.field_mappings}
-        
+        field_map = {fm.csv_field: fm.client_field for fm in config.field_mappings if fm.csv_field in df.columns}
+
         results = ImportResult(
-            total_processed=0,
+            total_processed=len(df),
             successful=0,
             failed=0,
             errors=[],
             created_client_ids=[]
         )
-        
-        # Process each row
-        for index, row in df.iterrows():
-            try:
-                results.total_processed += 1
-                
-                # Map fields
-                cliente_data = {}
-                for csv_field, client_field in field_map.items():
-                    if csv_field in df.columns:
-                        value = row[csv_field]
-                        if pd.notna(value) and str(value).strip():
-                            cliente_data[client_field] = str(value).strip()
-                
+        if df.empty:
+            return results
+
+        # Map fields (vettoriale): valori ripuliti, "" per celle vuote/NaN
+        mapped = pd.DataFrame(index=df.index)
+        for csv_field, client_field in field_map.items():
+            mapped[client_field] = df[csv_field].fillna("").astype(str).str.strip()
+
+        row_errors = validate_cliente_frame(mapped, config)
+
+        # Check for duplicates if configured: DB esistente + righe ripetute nello stesso file
+        if config.skip_duplicates and 'telefono' in mapped.columns:
+            valid = row_errors == ""
+            phones = mapped.loc[valid, 'telefono'].unique().tolist()
+            existing_phones = await _load_existing_phones(phones, config.commessa_id, config.sub_agenzia_id)
+            repeated_in_file = mapped['telefono'].where(valid).duplicated(keep='first')
+            duplicate = valid & (mapped['telefono'].isin(existing_phones) | repeated_in_file)
+            row_errors = row_errors.mask(duplicate, "Duplicate phone number " + mapped['telefono'])
+
+        total = len(df)
+        for index, error_msg in row_errors[row_errors != ""].items():
+            results.failed += 1
+            results.errors.append(f"Row {index + 1}: {error_msg}")
+
+        valid_rows = mapped[row_errors == ""]
+        records = valid_rows.to_dict(orient="records")
+        row_indexes = valid_rows.index.tolist()
+
+        for start in range(0, len(records), IMPORT_INSERT_CHUNK_SIZE):
+            docs = []
+            doc_rows = []
+            for index, cliente_data in zip(
+                row_indexes[start:start + IMPORT_INSERT_CHUNK_SIZE],
+                records[start:start + IMPORT_INSERT_CHUNK_SIZE],
+            ):
+                cliente_data = {k: v for k, v in cliente_data.items() if v}
                 # Add required fields
                 cliente_data['commessa_id'] = config.commessa_id
                 cliente_data['sub_agenzia_id'] = config.sub_agenzia_id
-                
-                # Validate data
-                is_valid, error_msg = validate_cliente_data(cliente_data, config)
-                if not is_valid:
+                try:
+                    cliente = Cliente(**cliente_data, created_by=created_by)
+                except Exception as e:
                     results.failed += 1
-                    results.errors.append(f"Row {index + 1}: {error_msg}")
+                    results.errors.append(f"Row {index + 1}: {str(e)}")
                     continue
-                
-                # Check for duplicates if configured
-                if config.skip_duplicates:
-                    existing = await db.clienti.find_one({
-                        "telefono": cliente_data.get('telefono'),
-                        "commessa_id": config.commessa_id,
-                        "sub_agenzia_id": config.sub_agenzia_id
-                    })
-                    if existing:
+                docs.append(cliente.dict())
+                doc_rows.append(index)
+
+            if docs:
+                failed_positions = {}
+                try:
+                    await db.clienti.insert_many(docs, ordered=False)
+                except BulkWriteError as bwe:
+                    for err in bwe.details.get("writeErrors", []):
+                        failed_positions[err["index"]] = err.get("errmsg", "insert failed")
+                for pos, doc in enumerate(docs):
+                    if pos in failed_positions:
                         results.failed += 1
-                        results.errors.append(f"Row {index + 1}: Duplicate phone number {cliente_data.get('telefono')}")
-                        continue
-                
-                # Create cliente
-                cliente = Cliente(
-                    **cliente_data,
-                    created_by=created_by
-                )
-                
-                await db.clienti.insert_one(cliente.dict())
-                results.successful += 1
-                results.created_client_ids.append(cliente.id)
-                
-            except Exception as e:
-                results.failed += 1
-                results.errors.append(f"Row {index + 1}: {str(e)}")
-        
+                        results.errors.append(f"Row {doc_rows[pos] + 1}: {failed_positions[pos]}")
+                    else:
+                        results.successful += 1
+                        results.created_client_ids.append(doc["id"])
+                # Rollup analytics sub agenzie: un refresh per (sub agenzia, giorno) del chunk
+                await cliente_rollups.refresh_for(db, docs)
+
+            if progress_callback:
+                await progress_callback(results.successful + results.failed, total)
+
+        if progress_callback and not records:
+            await progress_callback(results.failed, total)
+
         return results
-        
+
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Import processing error: {str(e)}")
 
@@ -384,6 +473,7 @@ async def assign_lead_to_agent(lead: Lead):
                 
                 # Send email notification
                 asyncio.create_task(notify_agent_new_lead(assignee_id, lead.dict()))
+                publish_lead_assigned(assignee_id, lead.dict())
                 
                 return assignee_id
             else:
@@ -543,6 +633,7 @@ async def assign_lead_to_agent(lead: Lead):
     
     # Send email notification to agent (async task)
     asyncio.create_task(notify_agent_new_lead(selected_agent_id, lead.dict()))
+    publish_lead_assigned(selected_agent_id, lead.dict())
     
     return selected_agent_id
 
@@ -762,90 +853,161 @@ def get_user_ip(request) -> Optional[str]:
     client_host = getattr(request, 'client', None)
     return getattr(client_host, 'host', None) if client_host else None
 
-async def detect_client_changes(old_client: Cliente, update_data: dict) -> List[Dict[str, str]]:
-    """Rileva i cambiamenti nei dati del cliente e genera descrizioni leggibili.
-    Risolve gli ID delle entità (Sub Agenzia, Commessa, Servizio, Segmento, Utente)
-    nei loro nomi per una migliore leggibilità nella cronologia."""
-    changes = []
-    
-    # Mappa dei campi con nomi user-friendly
-    field_names = {
-        "nome": "Nome",
-        "cognome": "Cognome", 
-        "email": "Email",
-        "telefono": "Telefono",
-        "indirizzo": "Indirizzo",
-        "citta": "Città",
-        "provincia": "Provincia",
-        "cap": "CAP",
-        "codice_fiscale": "Codice Fiscale",
-        "partita_iva": "Partita IVA",
-        "commessa_id": "Commessa",
-        "sub_agenzia_id": "Sub Agenzia",
-        "servizio_id": "Servizio",
-        "tipologia_contratto": "Tipologia Contratto",
-        "tipologia_contratto_id": "Tipologia Contratto",
-        "segmento": "Segmento",
-        "status": "Status",
-        "note": "Note",
-        "assigned_to": "Assegnato a",
-    }
+# Campi del cliente il cui valore è un id da risolvere nel nome leggibile:
+# campo → (collection, campo nome). Il segmento è risolto solo se è un UUID.
+ENTITY_NAME_FIELDS = {
+    "sub_agenzia_id": ("sub_agenzie", "nome"),
+    "commessa_id": ("commesse", "nome"),
+    "servizio_id": ("servizi", "nome"),
+    "tipologia_contratto_id": ("tipologie_contratto", "nome"),
+    "segmento": ("segmenti", "nome"),
+    "assigned_to": ("users", "username"),
+}
 
-    # Helper interno per risolvere id → nome leggibile
-    async def _resolve_value(field: str, value: str) -> str:
-        if not value:
-            return ""
-        v = str(value)
+# Cache condivisa id → nome (per collection), con TTL breve: i rename sono rari e
+# per la cronologia modifiche qualche minuto di ritardo è accettabile.
+ENTITY_NAME_CACHE_TTL_SECONDS = 300
+ENTITY_NAME_CACHE_MAX_ENTRIES = 5000
+_entity_name_cache: Dict[Tuple[str, str], Tuple[float, str]] = {}
+
+CLIENT_CHANGE_FIELD_NAMES = {
+    "nome": "Nome",
+    "cognome": "Cognome",
+    "email": "Email",
+    "telefono": "Telefono",
+    "indirizzo": "Indirizzo",
+    "citta": "Città",
+    "provincia": "Provincia",
+    "cap": "CAP",
+    "codice_fiscale": "Codice Fiscale",
+    "partita_iva": "Partita IVA",
+    "commessa_id": "Commessa",
+    "sub_agenzia_id": "Sub Agenzia",
+    "servizio_id": "Servizio",
+    "tipologia_contratto": "Tipologia Contratto",
+    "tipologia_contratto_id": "Tipologia Contratto",
+    "segmento": "Segmento",
+    "status": "Status",
+    "note": "Note",
+    "assigned_to": "Assegnato a",
+}
+
+
+def _needs_name_lookup(field: str, value: str) -> bool:
+    if field not in ENTITY_NAME_FIELDS or not value:
+        return False
+    if field == "segmento":
+        return len(value) > 20  # probabile UUID
+    return True
+
+
+async def resolve_entity_names(ids_by_field: Dict[str, set]) -> Dict[Tuple[str, str], str]:
+    """Risolve in blocco gli id → nome leggibile: una query `$in` per collection.
+
+    Ritorna una mappa (campo, id) → nome; gli id non trovati sono assenti dalla mappa.
+    """
+    now = datetime.now(timezone.utc).timestamp()
+    resolved: Dict[Tuple[str, str], str] = {}
+    missing_by_collection: Dict[str, set] = {}
+
+    for field, ids in ids_by_field.items():
+        collection, _ = ENTITY_NAME_FIELDS[field]
+        for v in ids:
+            cached = _entity_name_cache.get((collection, v))
+            if cached and cached[0] > now:
+                resolved[(field, v)] = cached[1]
+            else:
+                missing_by_collection.setdefault(collection, set()).add(v)
+
+    names_by_collection: Dict[str, Dict[str, str]] = {}
+    for collection, ids in missing_by_collection.items():
+        name_field = next(nf for c, nf in ENTITY_NAME_FIELDS.values() if c == collection)
+        names: Dict[str, str] = {}
         try:
-            if field == "sub_agenzia_id":
-                doc = await db.sub_agenzie.find_one({"id": v}, {"_id": 0, "nome": 1})
-                return doc.get("nome") if doc and doc.get("nome") else v
-            if field == "commessa_id":
-                doc = await db.commesse.find_one({"id": v}, {"_id": 0, "nome": 1})
-                return doc.get("nome") if doc and doc.get("nome") else v
-            if field == "servizio_id":
-                doc = await db.servizi.find_one({"id": v}, {"_id": 0, "nome": 1})
-                return doc.get("nome") if doc and doc.get("nome") else v
-            if field == "tipologia_contratto_id":
-                doc = await db.tipologie_contratto.find_one({"id": v}, {"_id": 0, "nome": 1})
-                return doc.get("nome") if doc and doc.get("nome") else v
-            if field == "segmento":
-                # Può essere UUID, tipo lowercase, o già nome leggibile
-                if len(v) > 20:  # probabile UUID
-                    doc = await db.segmenti.find_one({"id": v}, {"_id": 0, "nome": 1})
-                    return doc.get("nome") if doc and doc.get("nome") else v
-                # Se è una stringa breve, usala direttamente con prima lettera maiuscola
-                return v[0].upper() + v[1:] if v else v
-            if field == "assigned_to":
-                doc = await db.users.find_one({"id": v}, {"_id": 0, "username": 1})
-                return doc.get("username") if doc and doc.get("username") else v
-        except Exception:
-            return v
-        return v
+            async for doc in db[collection].find(
+                {"id": {"$in": list(ids)}}, {"_id": 0, "id": 1, name_field: 1}
+            ):
+                if doc.get(name_field):
+                    names[doc["id"]] = doc[name_field]
+        except Exception as e:
+            logging.warning(f"resolve_entity_names: lookup on {collection} failed: {e}")
+        names_by_collection[collection] = names
 
+    if len(_entity_name_cache) > ENTITY_NAME_CACHE_MAX_ENTRIES:
+        _entity_name_cache.clear()
+    expires_at = now + ENTITY_NAME_CACHE_TTL_SECONDS
+    for collection, names in names_by_collection.items():
+        for v, name in names.items():
+            _entity_name_cache[(collection, v)] = (expires_at, name)
+
+    for field, ids in ids_by_field.items():
+        collection, _ = ENTITY_NAME_FIELDS[field]
+        names = names_by_collection.get(collection, {})
+        for v in ids:
+            if v in names:
+                resolved[(field, v)] = names[v]
+    return resolved
+
+
+def _diff_client_fields(old_client, update_data: dict) -> List[Tuple[str, str, str]]:
+    """Confronta i campi aggiornati con il cliente esistente (oggetto Cliente o dict)."""
+    diffs = []
     for field, new_value in update_data.items():
         if field in ["updated_at", "dati_aggiuntivi"]:  # Skip meta fields
             continue
-            
-        old_value = getattr(old_client, field, None)
-        
+
+        if isinstance(old_client, dict):
+            old_value = old_client.get(field)
+        else:
+            old_value = getattr(old_client, field, None)
+
         # Convert values to string for comparison
         old_str = str(old_value) if old_value is not None else ""
         new_str = str(new_value) if new_value is not None else ""
-        
+
         if old_str != new_str:
-            field_display = field_names.get(field, field.title())
-            # Risolvi i valori in nomi leggibili (per i campi mappati)
-            old_display = await _resolve_value(field, old_str) if old_str else ""
-            new_display = await _resolve_value(field, new_str) if new_str else ""
-            changes.append({
-                "field": field,
-                "field_display": field_display,
-                "old_value": old_display,
-                "new_value": new_display,
-                "description": f"{field_display} modificato da '{old_display}' a '{new_display}'"
-            })
-    
+            diffs.append((field, old_str, new_str))
+    return diffs
+
+
+def _display_value(field: str, value: str, names: Dict[Tuple[str, str], str]) -> str:
+    if not value:
+        return ""
+    if field == "segmento" and not _needs_name_lookup(field, value):
+        # Se è una stringa breve (tipo), usala direttamente con prima lettera maiuscola
+        return value[0].upper() + value[1:]
+    return names.get((field, value), value)
+
+
+async def detect_client_changes(old_client: Cliente, update_data: dict) -> List[Dict[str, str]]:
+    """Rileva i cambiamenti nei dati del cliente e genera descrizioni leggibili.
+    Risolve gli ID delle entità (Sub Agenzia, Commessa, Servizio, Segmento, Utente)
+    nei loro nomi per una migliore leggibilità nella cronologia.
+
+    Gli id vengono risolti in blocco (una query `$in` per collection, con cache condivisa)
+    invece di un `find_one` per valore vecchio/nuovo di ogni campo."""
+    diffs = _diff_client_fields(old_client, update_data)
+
+    ids_by_field: Dict[str, set] = {}
+    for field, old_str, new_str in diffs:
+        for v in (old_str, new_str):
+            if _needs_name_lookup(field, v):
+                ids_by_field.setdefault(field, set()).add(v)
+
+    names = await resolve_entity_names(ids_by_field) if ids_by_field else {}
+
+    changes = []
+    for field, old_str, new_str in diffs:
+        field_display = CLIENT_CHANGE_FIELD_NAMES.get(field, field.title())
+        old_display = _display_value(field, old_str, names)
+        new_display = _display_value(field, new_str, names)
+        changes.append({
+            "field": field,
+            "field_display": field_display,
+            "old_value": old_display,
+            "new_value": new_display,
+            "description": f"{field_display} modificato da '{old_display}' a '{new_display}'"
+        })
     return changes
 
 
@@ -0,0 +1,208 @@
+"""Caricamento lazy dei sottosistemi pesanti (NEW ott 2026).
+
+All'avvio `server.py` importava subito pandas/openpyxl, Playwright, Twilio, openai ed
+emergentintegrations (litellm) anche se servono solo per export, PDF, chiamate o chatbot:
+secondi di cold-start prima che /api/health risponda. Qui ci sono facade senza costo
+all'import:
+
+- `lazy_import("pandas")`: proxy di modulo, importato al primo accesso ad un attributo;
+- `lazy_attr("twilio.rest", "Client")`: proxy di `from x import Y` (chiamabile);
+- `lazy_singleton(TwilioService, "twilio_service")`: istanza creata al primo uso.
+
+Ogni import lazy viene cronometrato (`stats()`, esposto su /api/admin/lazy-imports) e
+`warm_up()` (avviato in background dallo startup, dopo che l'app è già pronta) pre-carica
+i moduli registrati in un thread, così la prima richiesta reale non paga l'import.
+"""
+import asyncio
+import importlib
+import logging
+import os
+import sys
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+LAZY_WARMUP_ENABLED = os.environ.get("LAZY_WARMUP_ENABLED", "true").lower() in ("1", "true", "yes")
+LAZY_WARMUP_DELAY_SECONDS = float(os.environ.get("LAZY_WARMUP_DELAY_SECONDS", "5"))
+
+_lock = threading.RLock()
+_registered: Dict[str, None] = {}  # moduli da pre-caricare (ordine di registrazione)
+_load_ms: Dict[str, float] = {}  # modulo/singleton -> ms spesi al primo caricamento
+_errors: Dict[str, str] = {}
+_warmup: Dict[str, Any] = {"state": "idle", "started_at": None, "finished_at": None}
+
+
+def _import(name: str):
+    module = sys.modules.get(name)
+    if module is not None:
+        return module
+    # Nessun lock globale attorno all'import: il lock per-modulo di importlib basta, e un
+    # import del warm-up (thread) non deve bloccare quelli di altri moduli sull'event loop
+    started = time.perf_counter()
+    try:
+        module = importlib.import_module(name)
+    except Exception as e:
+        _errors[name] = f"{type(e).__name__}: {e}"
+        raise
+    elapsed = round((time.perf_counter() - started) * 1000, 1)
+    with _lock:
+        _errors.pop(name, None)
+        _load_ms.setdefault(name, elapsed)
+    logger.info(f"[LAZY] import {name} in {elapsed}ms")
+    return module
+
+
+class LazyModule:
+    """Proxy di modulo: l'import avviene al primo accesso (lettura o scrittura) di un attributo."""
+
+    __slots__ = ("_lazy_name", "_lazy_module")
+
+    def __init__(self, name: str):
+        object.__setattr__(self, "_lazy_name", name)
+        object.__setattr__(self, "_lazy_module", None)
+
+    def _load(self):
+        module = self._lazy_module
+        if module is None:
+            module = _import(self._lazy_name)
+            object.__setattr__(self, "_lazy_module", module)
+        return module
+
+    def __getattr__(self, attr: str):
+        return getattr(self._load(), attr)
+
+    def __setattr__(self, attr: str, value: Any):
+        setattr(self._load(), attr, value)
+
+    def __repr__(self):
+        state = "loaded" if self._lazy_module is not None else "not loaded"
+        return f"<lazy module {self._lazy_name!r} ({state})>"
+
+
+class LazyAttr:
+    """Proxy di `from module import attr`: si risolve alla prima chiamata o accesso."""
+
+    __slots__ = ("_lazy_module", "_lazy_attr", "_lazy_target")
+
+    def __init__(self, module: LazyModule, attr: str):
+        object.__setattr__(self, "_lazy_module", module)
+        object.__setattr__(self, "_lazy_attr", attr)
+        object.__setattr__(self, "_lazy_target", None)
+
+    def resolve(self):
+        target = self._lazy_target
+        if target is None:
+            target = getattr(self._lazy_module._load(), self._lazy_attr)
+            object.__setattr__(self, "_lazy_target", target)
+        return target
+
+    def __call__(self, *args, **kwargs):
+        return self.resolve()(*args, **kwargs)
+
+    def __getattr__(self, attr: str):
+        return getattr(self.resolve(), attr)
+
+    def __repr__(self):
+        return f"<lazy attr {self._lazy_module._lazy_name}.{self._lazy_attr}>"
+
+
+class LazySingleton:
+    """Istanza di servizio costruita al primo accesso (es. TwilioService crea il client REST)."""
+
+    __slots__ = ("_lazy_factory", "_lazy_name", "_lazy_instance")
+
+    def __init__(self, factory: Callable[[], Any], name: str):
+        object.__setattr__(self, "_lazy_factory", factory)
+        object.__setattr__(self, "_lazy_name", name)
+        object.__setattr__(self, "_lazy_instance", None)
+
+    def _get(self):
+        instance = self._lazy_instance
+        if instance is None:
+            with _lock:
+                instance = self._lazy_instance
+                if instance is None:
+                    started = time.perf_counter()
+                    instance = self._lazy_factory()
+                    _load_ms[f"singleton:{self._lazy_name}"] = round((time.perf_counter() - started) * 1000, 1)
+                    object.__setattr__(self, "_lazy_instance", instance)
+        return instance
+
+    def __getattr__(self, attr: str):
+        return getattr(self._get(), attr)
+
+    def __setattr__(self, attr: str, value: Any):
+        setattr(self._get(), attr, value)
+
+    def __repr__(self):
+        state = "ready" if self._lazy_instance is not None else "not created"
+        return f"<lazy singleton {self._lazy_name!r} ({state})>"
+
+
+def lazy_import(name: str, warm: bool = True) -> LazyModule:
+    """Ritorna un proxy del modulo; con `warm=True` il modulo viene pre-caricato da `warm_up()`."""
+    if warm:
+        _registered.setdefault(name, None)
+    return LazyModule(name)
+
+
+def lazy_attr(module: str, attr: str, warm: bool = True) -> LazyAttr:
+    return LazyAttr(lazy_import(module, warm=warm), attr)
+
+
+def lazy_singleton(factory: Callable[[], Any], name: str) -> LazySingleton:
+    return LazySingleton(factory, name)
+
+
+def is_loaded(name: str) -> bool:
+    return name in sys.modules
+
+
+async def warm_up(delay: Optional[float] = None) -> List[str]:
+    """Pre-carica in un thread i moduli registrati non ancora importati.
+
+    Gira dopo lo startup: /api/health risponde subito e gli import pesanti avvengono
+    mentre l'app è già in servizio. Gli errori (dipendenza opzionale assente) non
+    sono fatali: il modulo verrà ritentato al primo uso reale.
+    """
+    if _warmup["state"] == "running":
+        return []
+    _warmup.update(state="running", started_at=time.time(), finished_at=None)
+    await asyncio.sleep(LAZY_WARMUP_DELAY_SECONDS if delay is None else delay)
+    loaded = []
+    for name in list(_registered):
+        if is_loaded(name):
+            continue
+        try:
+            await asyncio.to_thread(_import, name)
+            loaded.append(name)
+        except Exception as e:
+            logger.warning(f"[LAZY] warm-up {name} fallito: {e}")
+    _warmup.update(state="done", finished_at=time.time())
+    return loaded
+
+
+def start_warm_up() -> Optional[asyncio.Task]:
+    if not LAZY_WARMUP_ENABLED:
+        _warmup["state"] = "disabled"
+        return None
+    return asyncio.create_task(warm_up())
+
+
+def warmup_status() -> Dict[str, Any]:
+    pending = [name for name in _registered if not is_loaded(name)]
+    return {"state": _warmup["state"], "pending": pending, "errors": dict(_errors)}
+
+
+def stats() -> Dict[str, Any]:
+    with _lock:
+        load_ms = dict(_load_ms)
+    return {
+        **warmup_status(),
+        "registered": list(_registered),
+        "load_ms": dict(sorted(load_ms.items(), key=lambda kv: kv[1], reverse=True)),
+        "started_at": _warmup["started_at"],
+        "finished_at": _warmup["finished_at"],
+    }
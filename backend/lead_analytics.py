@@ -0,0 +1,108 @@
+"""Aggregazione a passata singola per le analytics supervisor/referente (NEW ott 2026).
+
+`/analytics/supervisor/unit` e `/analytics/referente/{id}` facevano due
+`count_documents` + un `$group` per esito per ogni agente (e altri due count per
+referente): ~400 query a pagina per un supervisor con 3 Unit e 120 agenti.
+
+Ora un solo `$group` su `leads` per (assigned_agent_id, esito[, in_unit]) produce una
+`LeadOutcomeTable`; totali, contattati e breakdown per esito di agenti, referenti e
+Unit sono somme in memoria su quella tabella. Le risposte sono tenute in cache per
+`ANALYTICS_CACHE_TTL_SECONDS` per (scope utente, intervallo date).
+
+`cached()` è anche single-flight: richieste concorrenti sulla stessa chiave scaduta
+attendono un solo calcolo (usato anche dalla dashboard call center, vedi
+call_center_stats.py).
+"""
+import asyncio
+import os
+import time
+from typing import Any, Callable, Dict, Hashable, Iterable, List, Optional, Tuple
+
+ANALYTICS_CACHE_TTL_SECONDS = float(os.environ.get("ANALYTICS_CACHE_TTL_SECONDS", "30"))
+ANALYTICS_CACHE_MAX_ENTRIES = 500
+
+# Esiti che contano come "non contattato" (campo assente/null, stringa vuota, "Nuovo")
+NOT_CONTACTED_ESITI = (None, "", "Nuovo")
+
+_analytics_cache: Dict[Hashable, Tuple[float, Any]] = {}
+_analytics_inflight: Dict[Hashable, "asyncio.Future"] = {}
+
+
+def contact_rate(contacted: int, total: int) -> float:
+    return round((contacted / total * 100) if total > 0 else 0, 2)
+
+
+class LeadOutcomeTable:
+    """Conteggi lead per (agente, esito, dentro/fuori dalle Unit dello scope)."""
+
+    def __init__(self, rows: Iterable[Dict[str, Any]]):
+        self.rows = [(r.get("agent"), r.get("esito"), r.get("in_unit", True), r["count"]) for r in rows]
+
+    def summary(self, agent_ids: Optional[Iterable[str]] = None, in_unit_only: bool = False) -> Dict[str, Any]:
+        """{total_leads, contacted_leads, contact_rate, outcomes} per un insieme di agenti
+        (None = tutti). Gli esiti vuoti confluiscono in "Nuovo"; outcomes per count desc."""
+        wanted = set(agent_ids) if agent_ids is not None else None
+        total = contacted = 0
+        outcomes: Dict[str, int] = {}
+        for agent, esito, in_unit, count in self.rows:
+            if (wanted is not None and agent not in wanted) or (in_unit_only and not in_unit):
+                continue
+            total += count
+            if esito not in NOT_CONTACTED_ESITI:
+                contacted += count
+            key = esito if esito else "Nuovo"
+            outcomes[key] = outcomes.get(key, 0) + count
+        return {
+            "total_leads": total,
+            "contacted_leads": contacted,
+            "contact_rate": contact_rate(contacted, total),
+            "outcomes": dict(sorted(outcomes.items(), key=lambda kv: -kv[1])),
+        }
+
+    def unassigned(self, in_unit_only: bool = True) -> int:
+        return sum(c for agent, _, in_unit, c in self.rows if agent is None and (in_unit or not in_unit_only))
+
+
+async def load_outcome_table(db, match: Dict[str, Any], unit_ids: Optional[List[str]] = None) -> LeadOutcomeTable:
+    """Un solo `$group` sui lead di `match`. Con `unit_ids` ogni riga indica anche se i
+    lead appartengono alle Unit dello scope (statistiche di Unit vs. per agente)."""
+    group_id: Dict[str, Any] = {"agent": "$assigned_agent_id", "esito": "$esito"}
+    if unit_ids is not None:
+        group_id["in_unit"] = {"$in": ["$unit_id", list(unit_ids)]}
+    pipeline = [
+        {"$match": match},
+        {"$group": {"_id": group_id, "count": {"$sum": 1}}},
+    ]
+    rows = []
+    async for item in db.leads.aggregate(pipeline):
+        rows.append({**item["_id"], "count": item["count"]})
+    return LeadOutcomeTable(rows)
+
+
+async def cached(key: Hashable, compute: Callable[[], Any], ttl: float = None):
+    """Risultato di `compute()` (coroutine function) tenuto in cache per `ttl` secondi.
+    Un solo calcolo per chiave alla volta: gli altri chiamanti ne attendono il risultato."""
+    ttl = ANALYTICS_CACHE_TTL_SECONDS if ttl is None else ttl
+    hit = _analytics_cache.get(key)
+    if hit and hit[0] > time.monotonic():
+        return hit[1]
+    pending = _analytics_inflight.get(key)
+    if pending is not None:
+        return await asyncio.shield(pending)
+    task = asyncio.ensure_future(compute())
+    _analytics_inflight[key] = task
+    try:
+        value = await asyncio.shield(task)
+    finally:
+        if _analytics_inflight.get(key) is task:
+            del _analytics_inflight[key]
+    now = time.monotonic()
+    if ttl > 0:
+        if len(_analytics_cache) >= ANALYTICS_CACHE_MAX_ENTRIES:
+            _analytics_cache.clear()
+        _analytics_cache[key] = (now + ttl, value)
+    return value
+
+
+def clear_cache():
+    _analytics_cache.clear()
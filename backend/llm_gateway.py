@@ -0,0 +1,243 @@
+"""Gateway verso i modelli LLM del chatbot Spoki e degli Assistant OpenAI (NEW ott 2026).
+
+Dopo un invio massivo di template centinaia di risposte in arrivo chiamavano il modello
+tutte insieme: rate limit del provider e risposte in ritardo di minuti. Inoltre ogni
+chiamata creava un nuovo `AsyncOpenAI` (nuovo pool HTTP) e gli Assistant usavano
+`runs.create_and_poll` senza limite di tempo.
+
+`LlmGateway` (singleton `llm_gateway`):
+- client `AsyncOpenAI` condivisi per API key (`openai_client`);
+- al massimo `LLM_UNIT_CONCURRENCY` chiamate in corso per Unit e
+  `LLM_GLOBAL_CONCURRENCY` in tutto il processo; chi attende uno slot oltre
+  `LLM_QUEUE_TIMEOUT_SECONDS` riceve `LlmQueueTimeout` (il chiamante risponde con il
+  messaggio di cortesia invece di accumulare ritardo);
+- richieste identiche già in corso (stessa `key`, es. lead + testo del messaggio:
+  webhook ripetuti, workflow e inbound sullo stesso messaggio) condividono la stessa
+  chiamata al modello;
+- ogni chiamata ha una scadenza (`LLM_CALL_TIMEOUT_SECONDS`); i run degli Assistant
+  sono interrogati con `poll_assistant_run` entro `LLM_ASSISTANT_RUN_TIMEOUT_SECONDS`
+  e annullati lato OpenAI alla scadenza;
+- metriche: richieste per backend/esito, latenza, attesa in coda, token (quando il
+  provider li riporta), chiamate in corso/in attesa; `stats()` su /api/admin/llm-gateway.
+"""
+import asyncio
+import hashlib
+import logging
+import os
+import time
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from lazy_imports import lazy_attr
+from metrics import registry
+
+AsyncOpenAI = lazy_attr("openai", "AsyncOpenAI")
+
+logger = logging.getLogger(__name__)
+
+LLM_GLOBAL_CONCURRENCY = int(os.environ.get("LLM_GLOBAL_CONCURRENCY", "16"))
+LLM_UNIT_CONCURRENCY = int(os.environ.get("LLM_UNIT_CONCURRENCY", "4"))
+LLM_QUEUE_TIMEOUT_SECONDS = float(os.environ.get("LLM_QUEUE_TIMEOUT_SECONDS", "30"))
+LLM_CALL_TIMEOUT_SECONDS = float(os.environ.get("LLM_CALL_TIMEOUT_SECONDS", "60"))
+# Minore di LLM_CALL_TIMEOUT_SECONDS: il run va annullato prima che scada la chiamata
+LLM_ASSISTANT_RUN_TIMEOUT_SECONDS = float(os.environ.get("LLM_ASSISTANT_RUN_TIMEOUT_SECONDS", "45"))
+LLM_ASSISTANT_POLL_INTERVAL_SECONDS = float(os.environ.get("LLM_ASSISTANT_POLL_INTERVAL_SECONDS", "0.5"))
+
+LLM_REQUESTS = registry.counter(
+    "crm_llm_requests_total", "Chiamate ai modelli LLM per backend ed esito.", ("backend", "outcome"))
+LLM_LATENCY = registry.histogram(
+    "crm_llm_request_duration_seconds", "Durata delle chiamate ai modelli LLM.", ("backend",),
+    (0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 20.0, 30.0, 60.0))
+LLM_QUEUE_WAIT = registry.histogram(
+    "crm_llm_queue_wait_seconds", "Attesa di uno slot del gateway LLM.", ("backend",))
+LLM_TOKENS = registry.counter(
+    "crm_llm_tokens_total", "Token consumati (quando riportati dal provider).", ("backend", "kind"))
+LLM_IN_FLIGHT = registry.gauge(
+    "crm_llm_requests_in_flight", "Chiamate LLM in corso.")
+LLM_WAITING = registry.gauge(
+    "crm_llm_requests_waiting", "Chiamate LLM in attesa di uno slot.")
+
+ASSISTANT_TERMINAL_STATUSES = ("completed", "failed", "cancelled", "expired", "incomplete", "requires_action")
+
+
+class LlmGatewayError(RuntimeError):
+    pass
+
+
+class LlmQueueTimeout(LlmGatewayError):
+    """Nessuno slot libero entro LLM_QUEUE_TIMEOUT_SECONDS."""
+
+
+class LlmDeadlineExceeded(LlmGatewayError):
+    """La chiamata al modello ha superato la sua scadenza."""
+
+
+def request_key(kind: str, scope: Optional[str], text: str) -> Optional[str]:
+    """Chiave di coalescenza: stesso tipo, stesso lead/thread e stesso testo."""
+    if not scope:
+        return None
+    return f"{kind}:{scope}:{hashlib.sha1((text or '').encode('utf-8')).hexdigest()}"
+
+
+class LlmGateway:
+    def __init__(
+        self,
+        global_concurrency: int = LLM_GLOBAL_CONCURRENCY,
+        unit_concurrency: int = LLM_UNIT_CONCURRENCY,
+        queue_timeout: float = LLM_QUEUE_TIMEOUT_SECONDS,
+        call_timeout: float = LLM_CALL_TIMEOUT_SECONDS,
+    ):
+        self.global_concurrency = max(1, global_concurrency)
+        self.unit_concurrency = max(1, unit_concurrency)
+        self.queue_timeout = queue_timeout
+        self.call_timeout = call_timeout
+        self._global: Optional[asyncio.Semaphore] = None
+        self._units: Dict[str, asyncio.Semaphore] = {}
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self._clients: Dict[str, Any] = {}
+        self.in_flight = 0
+        self.waiting = 0
+        self.counts: Dict[str, int] = {"ok": 0, "error": 0, "timeout": 0, "queue_timeout": 0, "coalesced": 0}
+
+    # ---- client condivisi ----
+
+    def openai_client(self, api_key: Optional[str] = None):
+        key = api_key if api_key is not None else os.environ.get("OPENAI_API_KEY", "")
+        if not key:
+            return None
+        client = self._clients.get(key)
+        if client is None:
+            client = self._clients[key] = AsyncOpenAI(api_key=key)
+        return client
+
+    # ---- concorrenza ----
+
+    def _unit_semaphore(self, unit_id: Optional[str]) -> asyncio.Semaphore:
+        name = unit_id or "_none"
+        sem = self._units.get(name)
+        if sem is None:
+            sem = self._units[name] = asyncio.Semaphore(self.unit_concurrency)
+        return sem
+
+    async def _acquire(self, unit_sem: asyncio.Semaphore, backend: str):
+        if self._global is None:
+            self._global = asyncio.Semaphore(self.global_concurrency)
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.queue_timeout
+        started = time.perf_counter()
+        self.waiting += 1
+        LLM_WAITING.set(self.waiting)
+        try:
+            await asyncio.wait_for(unit_sem.acquire(), timeout=self.queue_timeout)
+            try:
+                await asyncio.wait_for(self._global.acquire(), timeout=max(0.0, deadline - loop.time()))
+            except BaseException:
+                unit_sem.release()
+                raise
+        except asyncio.TimeoutError:
+            raise LlmQueueTimeout(f"nessuno slot LLM libero entro {self.queue_timeout}s")
+        finally:
+            self.waiting -= 1
+            LLM_WAITING.set(self.waiting)
+            LLM_QUEUE_WAIT.observe(time.perf_counter() - started, backend=backend)
+
+    def _record(self, backend: str, outcome: str):
+        self.counts[outcome] += 1
+        LLM_REQUESTS.inc(backend=backend, outcome=outcome)
+
+    async def _governed(self, fn: Callable[[], Awaitable[Any]], unit_id: Optional[str], backend: str,
+                        timeout: Optional[float]) -> Any:
+        unit_sem = self._unit_semaphore(unit_id)
+        try:
+            await self._acquire(unit_sem, backend)
+        except LlmQueueTimeout:
+            self._record(backend, "queue_timeout")
+            raise
+        self.in_flight += 1
+        LLM_IN_FLIGHT.set(self.in_flight)
+        started = time.perf_counter()
+        outcome = "error"
+        try:
+            result = await asyncio.wait_for(fn(), timeout=timeout or self.call_timeout)
+            outcome = "ok"
+            return result
+        except asyncio.TimeoutError:
+            outcome = "timeout"
+            raise LlmDeadlineExceeded(f"chiamata {backend} oltre {timeout or self.call_timeout}s")
+        except LlmDeadlineExceeded:  # es. run Assistant annullato da poll_assistant_run
+            outcome = "timeout"
+            raise
+        finally:
+            self._global.release()
+            unit_sem.release()
+            self.in_flight -= 1
+            LLM_IN_FLIGHT.set(self.in_flight)
+            LLM_LATENCY.observe(time.perf_counter() - started, backend=backend)
+            self._record(backend, outcome)
+
+    async def call(self, fn: Callable[[], Awaitable[Any]], *, unit_id: Optional[str] = None,
+                   key: Optional[str] = None, backend: str = "chatbot", timeout: Optional[float] = None) -> Any:
+        """Esegue `fn()` (una chiamata al modello) entro i limiti di concorrenza della Unit e
+        globali. Con `key` una richiesta identica già in corso viene riusata."""
+        if key is not None:
+            shared = self._inflight.get(key)
+            if shared is not None:
+                self._record(backend, "coalesced")
+                return await asyncio.shield(shared)
+        task = asyncio.ensure_future(self._governed(fn, unit_id, backend, timeout))
+        task.add_done_callback(self._forget(key))
+        if key is not None:
+            self._inflight[key] = task
+        # shield: se il primo chiamante viene cancellato la chiamata resta valida per gli altri
+        return await asyncio.shield(task)
+
+    def _forget(self, key: Optional[str]):
+        def done(task: asyncio.Future):
+            if key is not None and self._inflight.get(key) is task:
+                del self._inflight[key]
+            if not task.cancelled():
+                task.exception()  # già propagata ai chiamanti: evita il warning "never retrieved"
+        return done
+
+    # ---- token / assistant ----
+
+    def record_usage(self, backend: str, usage: Any):
+        if usage is None:
+            return
+        for kind in ("prompt_tokens", "completion_tokens"):
+            value = usage.get(kind) if isinstance(usage, dict) else getattr(usage, kind, None)
+            if value:
+                LLM_TOKENS.inc(value, backend=backend, kind=kind.split("_")[0])
+
+    async def poll_assistant_run(self, client, thread_id: str, run: Any,
+                                 timeout: float = None, interval: float = None) -> Any:
+        """Attende la fine di un run Assistant entro `timeout`; alla scadenza lo annulla."""
+        timeout = LLM_ASSISTANT_RUN_TIMEOUT_SECONDS if timeout is None else timeout
+        interval = LLM_ASSISTANT_POLL_INTERVAL_SECONDS if interval is None else interval
+        deadline = time.monotonic() + timeout
+        while run.status not in ASSISTANT_TERMINAL_STATUSES:
+            if time.monotonic() >= deadline:
+                try:
+                    await client.beta.threads.runs.cancel(thread_id=thread_id, run_id=run.id)
+                except Exception as e:
+                    logger.warning(f"[LLM] cancel run {run.id} failed: {e}")
+                raise LlmDeadlineExceeded(f"run Assistant {run.id} oltre {timeout}s (status={run.status})")
+            await asyncio.sleep(min(interval, max(0.0, deadline - time.monotonic())))
+            run = await client.beta.threads.runs.retrieve(thread_id=thread_id, run_id=run.id)
+        self.record_usage("assistant", getattr(run, "usage", None))
+        return run
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "global_concurrency": self.global_concurrency,
+            "unit_concurrency": self.unit_concurrency,
+            "queue_timeout_seconds": self.queue_timeout,
+            "call_timeout_seconds": self.call_timeout,
+            "in_flight": self.in_flight,
+            "waiting": self.waiting,
+            "coalescing": len(self._inflight),
+            "counts": dict(self.counts),
+            "pooled_clients": len(self._clients),
+        }
+
+
+llm_gateway = LlmGateway()
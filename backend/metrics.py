@@ -0,0 +1,323 @@
+"""Metriche applicative in formato testo Prometheus (NEW ott 2026).
+
+Tre sorgenti alimentano il registro condiviso `registry`:
+- `MetricsMiddleware`: latenza per route (template FastAPI, non il path concreto) e
+  richieste in corso;
+- `MongoCommandMetrics`: listener PyMongo con conteggi, durata e documenti ritornati per
+  collection/operazione, registrato sul client Motor in `database.py`;
+- contatori dei loop in background (reminder, timeout workflow) e delle chiamate Spoki.
+
+Il registro è volutamente minimale (nessuna dipendenza esterna): i listener PyMongo
+vengono invocati dai thread di Motor, quindi ogni metrica è protetta da un lock.
+L'esposizione avviene su `GET /api/metrics` (vedi server.py).
+"""
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+from pymongo import monitoring
+
+DEFAULT_LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+MONGO_LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: Optional[Tuple[str, str]] = None) -> str:
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(f'{extra[0]}="{extra[1]}"')
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class _Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, str]) -> Tuple[str, ...]:
+        return tuple(str(labels.get(n, "")) for n in self.labelnames)
+
+    def _header(self) -> List[str]:
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels) -> float:
+        with self._lock:
+            return self._values.get(self._key(labels), 0)
+
+    def total(self) -> float:
+        """Somma su tutte le combinazioni di label."""
+        with self._lock:
+            return sum(self._values.values())
+
+    def render(self) -> List[str]:
+        with self._lock:
+            items = sorted(self._values.items())
+        return self._header() + [
+            f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(v)}" for key, v in items
+        ]
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def dec(self, amount: float = 1, **labels):
+        self.inc(-amount, **labels)
+
+    def set(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = (),
+                 buckets: Sequence[float] = DEFAULT_LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # key → [conteggi per bucket (non cumulativi) + overflow, somma, count]
+        self._series: Dict[Tuple[str, ...], list] = {}
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def count(self, **labels) -> int:
+        with self._lock:
+            series = self._series.get(self._key(labels))
+            return series[2] if series else 0
+
+    def render(self) -> List[str]:
+        with self._lock:
+            items = sorted((k, ([*s[0]], s[1], s[2])) for k, s in self._series.items())
+        lines = self._header()
+        for key, (counts, total, count) in items:
+            cumulative = 0
+            for bound, n in zip((*self.buckets, float("inf")), counts):
+                cumulative += n
+                labels = _format_labels(self.labelnames, key, ("le", "+Inf" if bound == float("inf") else repr(float(bound))))
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(total)}")
+            lines.append(f"{self.name}_count{labels} {count}")
+        return lines
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+        self._lock = threading.Lock()
+
+    def _register(self, metric: _Metric) -> _Metric:
+        with self._lock:
+            existing = self._metrics.get(metric.name)
+            if existing is not None:
+                return existing
+            self._metrics[metric.name] = metric
+            return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Iterable[str] = ()) -> Counter:
+        return self._register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name: str, documentation: str, labelnames: Iterable[str] = ()) -> Gauge:
+        return self._register(Gauge(name, documentation, labelnames))
+
+    def histogram(self, name: str, documentation: str, labelnames: Iterable[str] = (),
+                  buckets: Sequence[float] = DEFAULT_LATENCY_BUCKETS) -> Histogram:
+        return self._register(Histogram(name, documentation, labelnames, buckets))
+
+    def render(self) -> str:
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines: List[str] = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+registry = MetricsRegistry()
+
+HTTP_REQUESTS = registry.counter(
+    "crm_http_requests_total", "Richieste HTTP per route, metodo e status.", ("method", "route", "status"))
+HTTP_LATENCY = registry.histogram(
+    "crm_http_request_duration_seconds", "Latenza delle richieste HTTP per route.", ("method", "route"))
+HTTP_IN_FLIGHT = registry.gauge(
+    "crm_http_requests_in_flight", "Richieste HTTP in corso.", ("method",))
+
+MONGO_COMMANDS = registry.counter(
+    "crm_mongo_commands_total", "Comandi MongoDB per collection, operazione ed esito.", ("collection", "op", "outcome"))
+MONGO_LATENCY = registry.histogram(
+    "crm_mongo_command_duration_seconds", "Durata dei comandi MongoDB.", ("collection", "op"), MONGO_LATENCY_BUCKETS)
+MONGO_DOCUMENTS = registry.counter(
+    "crm_mongo_documents_returned_total", "Documenti ritornati (find/aggregate/getMore) o toccati (write).",
+    ("collection", "op"))
+
+BACKGROUND_LOOP_RUNS = registry.counter(
+    "crm_background_loop_runs_total", "Iterazioni dei loop in background per esito.", ("loop", "outcome"))
+BACKGROUND_LOOP_DURATION = registry.histogram(
+    "crm_background_loop_duration_seconds", "Durata di una iterazione dei loop in background.", ("loop",))
+BACKGROUND_LOOP_ITEMS = registry.counter(
+    "crm_background_loop_items_total", "Elementi processati dai loop in background.", ("loop",))
+
+SPOKI_REQUESTS = registry.counter(
+    "crm_spoki_requests_total", "Chiamate verso l'API Spoki per endpoint ed esito.", ("method", "path", "outcome"))
+SPOKI_LATENCY = registry.histogram(
+    "crm_spoki_request_duration_seconds", "Latenza delle chiamate verso l'API Spoki.", ("method", "path"))
+
+
+@contextmanager
+def observe_loop(loop: str):
+    """Misura una iterazione di un loop in background (durata + esito)."""
+    started = time.perf_counter()
+    outcome = "ok"
+    try:
+        yield
+    except BaseException:
+        outcome = "error"
+        raise
+    finally:
+        BACKGROUND_LOOP_RUNS.inc(loop=loop, outcome=outcome)
+        BACKGROUND_LOOP_DURATION.observe(time.perf_counter() - started, loop=loop)
+
+
+def route_label(scope) -> str:
+    """Template della route FastAPI (es. /api/clienti/{cliente_id}) per limitare la cardinalità."""
+    route = scope.get("route")
+    path = getattr(route, "path", None)
+    return path or "unmatched"
+
+
+class MetricsMiddleware:
+    """Middleware ASGI: latenza per route e richieste in corso."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        method = scope.get("method", "GET")
+        status_holder = {"status": 500}
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status_holder["status"] = message["status"]
+            await send(message)
+
+        started = time.perf_counter()
+        HTTP_IN_FLIGHT.inc(method=method)
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            HTTP_IN_FLIGHT.dec(method=method)
+            route = route_label(scope)
+            HTTP_LATENCY.observe(time.perf_counter() - started, method=method, route=route)
+            HTTP_REQUESTS.inc(method=method, route=route, status=str(status_holder["status"]))
+
+
+def _command_collection(command_name: str, command) -> str:
+    if command_name == "getMore":
+        target = command.get("collection")
+    else:
+        target = command.get(command_name)
+    return target if isinstance(target, str) else "-"
+
+
+def _returned_documents(command_name: str, reply) -> int:
+    if not isinstance(reply, dict):
+        return 0
+    cursor = reply.get("cursor")
+    if isinstance(cursor, dict):
+        batch = cursor.get("firstBatch", cursor.get("nextBatch"))
+        return len(batch) if isinstance(batch, list) else 0
+    if command_name in ("insert", "update", "delete"):
+        return int(reply.get("n", 0) or 0)
+    if command_name == "findAndModify":
+        return 1 if reply.get("value") else 0
+    return 0
+
+
+class MongoCommandMetrics(monitoring.CommandListener):
+    """Listener PyMongo: conteggi, durata e documenti per collection/operazione."""
+
+    # Comandi di handshake/heartbeat che sporcherebbero le metriche senza informazione utile
+    IGNORED_COMMANDS = frozenset({"hello", "isMaster", "ismaster", "ping", "saslStart", "saslContinue", "endSessions"})
+
+    def __init__(self):
+        self._pending: Dict[Tuple, str] = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _event_key(event) -> Tuple:
+        return (event.request_id, event.connection_id, getattr(event, "operation_id", None))
+
+    def started(self, event):
+        if event.command_name in self.IGNORED_COMMANDS:
+            return
+        collection = _command_collection(event.command_name, event.command)
+        with self._lock:
+            self._pending[self._event_key(event)] = collection
+
+    def _pop_collection(self, event) -> Optional[str]:
+        with self._lock:
+            return self._pending.pop(self._event_key(event), None)
+
+    def succeeded(self, event):
+        if event.command_name in self.IGNORED_COMMANDS:
+            return
+        collection = self._pop_collection(event) or "-"
+        op = event.command_name
+        MONGO_COMMANDS.inc(collection=collection, op=op, outcome="ok")
+        MONGO_LATENCY.observe(event.duration_micros / 1_000_000, collection=collection, op=op)
+        returned = _returned_documents(op, event.reply)
+        if returned:
+            MONGO_DOCUMENTS.inc(returned, collection=collection, op=op)
+
+    def failed(self, event):
+        if event.command_name in self.IGNORED_COMMANDS:
+            return
+        collection = self._pop_collection(event) or "-"
+        op = event.command_name
+        MONGO_COMMANDS.inc(collection=collection, op=op, outcome="error")
+        MONGO_LATENCY.observe(event.duration_micros / 1_000_000, collection=collection, op=op)
+
+
+mongo_command_metrics = MongoCommandMetrics()
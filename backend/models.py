@@ -788,6 +788,7 @@ class Call(BaseModel):
     updated_at: Optional[datetime] = None
 
 class CallCreate(BaseModel):
+    call_sid: Optional[str] = None  # Twilio Call SID, valorizzato dopo la creazione su Twilio
     direction: CallDirection
     from_number: str
     to_number: str
@@ -804,6 +805,7 @@ class CallUpdate(BaseModel):
 class AgentCallCenter(BaseModel):
     id: str = Field(default_factory=lambda: str(uuid.uuid4()))
     user_id: str  # Reference to existing User model
+    unit_id: Optional[str] = None  # copia di users.unit_id (indice disponibilità ACD)
     status: AgentStatus = AgentStatus.OFFLINE
     skills: List[str] = []  # e.g., ["sales", "support", "italian", "english"]
     languages: List[str] = ["italian"]
@@ -547,28 +547,13 @@ async def check_and_send_lead_reminders():
         logging.error(f"[REMINDER] Error in check_and_send_lead_reminders: {str(e)}")
         return None
 
-# Background scheduler for reminders
-reminder_scheduler_running = False
-
-async def start_reminder_scheduler():
-    """Start background scheduler for lead reminders - runs every hour"""
-    global reminder_scheduler_running
-    
-    if reminder_scheduler_running:
-        logging.info("[SCHEDULER] Reminder scheduler already running")
-        return
-    
-    reminder_scheduler_running = True
-    logging.info("[SCHEDULER] Starting lead reminder scheduler (runs every hour)")
-    
-    while reminder_scheduler_running:
-        try:
-            # Run reminder check
-            await check_and_send_lead_reminders()
-        except Exception as e:
-            logging.error(f"[SCHEDULER] Error in reminder scheduler: {str(e)}")
-        
-        # Wait 1 hour before next check
-        await asyncio.sleep(3600)  # 3600 seconds = 1 hour
+# Job "lead_reminders" dello scheduler unificato (scheduler.py, cron orario registrato
+# allo startup in server.py): sostituisce il vecchio loop asyncio.sleep(3600).
+async def run_lead_reminders_job(payload: Optional[Dict[str, Any]] = None) -> int:
+    """Esegue un controllo reminder; solleva in caso di errore (retry dello scheduler)."""
+    result = await check_and_send_lead_reminders()
+    if result is None:
+        raise RuntimeError("reminder check failed")
+    return result["reminders_3_days"] + result["reminders_7_days"]
 
 
@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+"""
+Report del tempo di import del backend (NEW ott 2026).
+
+Esegue `python -X importtime -c "import server"` in un sottoprocesso pulito e riassume
+il risultato: tempo totale, import diretti di `server.py` più costosi e moduli più lenti
+in assoluto (tempo "self"). Serve a tenere d'occhio il cold-start dopo il passaggio agli
+import lazy (lazy_imports.py): con `--budget-ms` esce con codice 1 se il totale supera
+la soglia, così può girare in CI; `--forbid` fallisce se un SDK pesante torna eager.
+
+Uso:
+    cd /app/backend
+    python profile_imports.py
+    python profile_imports.py --json import_profile.json --budget-ms 2500
+    python profile_imports.py --forbid pandas openpyxl twilio openai playwright litellm
+"""
+
+import argparse
+import json
+import os
+import re
+import subprocess
+import sys
+from pathlib import Path
+from typing import Any, Dict, List
+
+ROOT_DIR = Path(__file__).parent
+
+_LINE = re.compile(r"^import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)$")
+
+
+def parse_importtime(stderr: str) -> List[Dict[str, Any]]:
+    """Righe di -X importtime -> [{module, self_ms, cumulative_ms, depth}] in ordine di output."""
+    rows = []
+    for line in stderr.splitlines():
+        m = _LINE.match(line)
+        if not m:
+            continue
+        self_us, cum_us, indent, name = m.groups()
+        rows.append({
+            "module": name,
+            "self_ms": round(int(self_us) / 1000, 1),
+            "cumulative_ms": round(int(cum_us) / 1000, 1),
+            "depth": (len(indent) - 1) // 2,
+        })
+    return rows
+
+
+def summarize_profile(rows: List[Dict[str, Any]], target: str, top: int = 15) -> Dict[str, Any]:
+    # -X importtime stampa i figli prima del genitore: i figli diretti del target sono le
+    # righe a profondità 1 che precedono la riga (profondità 0) del target stesso
+    target_idx = next((i for i, r in enumerate(rows) if r["module"] == target and r["depth"] == 0), None)
+    if target_idx is None:
+        raise ValueError(f"modulo {target} non trovato nell'output di importtime")
+    start = max((i for i in range(target_idx) if rows[i]["depth"] == 0), default=-1) + 1
+    direct = [r for r in rows[start:target_idx] if r["depth"] == 1]
+    loaded = {r["module"] for r in rows}
+    return {
+        "target": target,
+        "total_ms": rows[target_idx]["cumulative_ms"],
+        "modules_imported": len(rows),
+        "top_direct_imports": sorted(direct, key=lambda r: r["cumulative_ms"], reverse=True)[:top],
+        "top_self": sorted(rows, key=lambda r: r["self_ms"], reverse=True)[:top],
+        "top_level_packages": sorted({r["module"].split(".")[0] for r in rows}),
+        "_loaded": loaded,
+    }
+
+
+def run_importtime(target: str, python: str = sys.executable) -> str:
+    env = {**os.environ, "PYTHONDONTWRITEBYTECODE": "1"}
+    proc = subprocess.run(
+        [python, "-X", "importtime", "-c", f"import {target}"],
+        cwd=ROOT_DIR, env=env, capture_output=True, text=True,
+    )
+    if proc.returncode != 0:
+        raise SystemExit(f"❌ import {target} fallito:\n{proc.stderr[-2000:]}")
+    return proc.stderr
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Profilo del tempo di import del backend.")
+    parser.add_argument("--target", default="server")
+    parser.add_argument("--top", type=int, default=15)
+    parser.add_argument("--json", help="Scrive il report completo in JSON")
+    parser.add_argument("--budget-ms", type=float, help="Esce con 1 se l'import supera la soglia")
+    parser.add_argument("--forbid", nargs="*", default=[], help="Pacchetti che non devono essere importati all'avvio")
+    args = parser.parse_args(argv)
+
+    report = summarize_profile(parse_importtime(run_importtime(args.target)), args.target, args.top)
+    loaded = report.pop("_loaded")
+
+    print(f"⏱️  import {args.target}: {report['total_ms']:.0f}ms ({report['modules_imported']} moduli)")
+    print("\nImport diretti più costosi (cumulativo):")
+    for r in report["top_direct_imports"]:
+        print(f"  {r['cumulative_ms']:>9.1f}ms  {r['module']}")
+    print("\nModuli più lenti (self):")
+    for r in report["top_self"]:
+        print(f"  {r['self_ms']:>9.1f}ms  {r['module']}")
+
+    eager = [pkg for pkg in args.forbid if pkg in loaded or any(m.startswith(pkg + ".") for m in loaded)]
+    report["forbidden_loaded"] = eager
+    if args.json:
+        Path(args.json).write_text(json.dumps(report, indent=2))
+        print(f"\n✅ Report scritto in {args.json}")
+
+    failed = False
+    if eager:
+        print(f"\n❌ Importati all'avvio ma dovrebbero essere lazy: {', '.join(eager)}")
+        failed = True
+    if args.budget_ms is not None and report["total_ms"] > args.budget_ms:
+        print(f"\n❌ Import oltre il budget: {report['total_ms']:.0f}ms > {args.budget_ms:.0f}ms")
+        failed = True
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -38,12 +38,19 @@ from services import (
 from notifications import notify_agent_new_lead, send_email_notification
 from audit import log_client_action
 from models import *  # noqa: F401,F403
-import openpyxl
-from openpyxl.styles import Font, PatternFill, Alignment
+from lazy_imports import lazy_attr, lazy_import
+import lead_analytics
+import cliente_rollups
 
 router = APIRouter()
 logger = logging.getLogger(__name__)
 
+# openpyxl caricato al primo export Excel
+openpyxl = lazy_import("openpyxl")
+Font = lazy_attr("openpyxl.styles", "Font")
+PatternFill = lazy_attr("openpyxl.styles", "PatternFill")
+Alignment = lazy_attr("openpyxl.styles", "Alignment")
+
 @router.get("/analytics/agent/{agent_id}")
 async def get_agent_analytics(
     agent_id: str, 
@@ -185,20 +192,6 @@ async def get_supervisor_unit_analytics(
     else:
         raise HTTPException(status_code=403, detail="Solo Supervisor può accedere a questo endpoint")
     
-    # Get all Units info
-    units_info = await db.units.find({"id": {"$in": supervisor_units}}).to_list(length=None)
-    unit_names = {u["id"]: u.get("nome", u["id"]) for u in units_info}
-    
-    # Get all agents and referenti in these Units
-    users_in_units = await db.users.find({
-        "unit_id": {"$in": supervisor_units},
-        "role": {"$in": ["agente", "referente"]},
-        "is_active": True
-    }).to_list(length=None)
-    
-    agents = [u for u in users_in_units if u.get("role") == "agente"]
-    referenti = [u for u in users_in_units if u.get("role") == "referente"]
-    
     # Build date filters
     date_filter = {}
     if date_from:
@@ -213,64 +206,44 @@ async def get_supervisor_unit_analytics(
             date_filter["$lte"] = date_to_obj
         except ValueError:
             raise HTTPException(status_code=400, detail="Invalid date_to format. Use YYYY-MM-DD")
+
+    cache_key = ("supervisor_unit", tuple(sorted(supervisor_units)), date_from, date_to, current_user.timezone)
+    return await lead_analytics.cached(
+        cache_key, lambda: _compute_supervisor_unit_analytics(supervisor_units, date_filter))
+
+
+async def _compute_supervisor_unit_analytics(supervisor_units: List[str], date_filter: Dict[str, Any]):
+    # Get all Units info
+    units_info = await db.units.find({"id": {"$in": supervisor_units}}).to_list(length=None)
+    unit_names = {u["id"]: u.get("nome", u["id"]) for u in units_info}
     
-    # Base query for leads in supervisor's units
-    base_query = {"unit_id": {"$in": supervisor_units}}
-    if date_filter:
-        base_query["created_at"] = date_filter
+    # Get all agents and referenti in these Units
+    users_in_units = await db.users.find({
+        "unit_id": {"$in": supervisor_units},
+        "role": {"$in": ["agente", "referente"]},
+        "is_active": True
+    }).to_list(length=None)
     
-    # Unit-level stats
-    total_leads = await db.leads.count_documents(base_query)
+    agents = [u for u in users_in_units if u.get("role") == "agente"]
+    referenti = [u for u in users_in_units if u.get("role") == "referente"]
     
-    # Contacted leads
-    contacted_query = {**base_query, "$and": [
-        {"esito": {"$exists": True}},
-        {"esito": {"$ne": None}},
-        {"esito": {"$ne": ""}},
-        {"esito": {"$ne": "Nuovo"}}
+    # NEW (ott 2026): un solo $group per (agente, esito, lead nelle Unit del supervisor).
+    # Le stats di Unit contano i lead delle Unit; quelle per agente/referente tutti i
+    # lead assegnati (anche in altre Unit), come le vecchie query per agente.
+    scope_query = {"$or": [
+        {"unit_id": {"$in": supervisor_units}},
+        {"assigned_agent_id": {"$in": [u["id"] for u in users_in_units]}},
     ]}
-    contacted_leads = await db.leads.count_documents(contacted_query)
+    if date_filter:
+        scope_query["created_at"] = date_filter
+    table = await lead_analytics.load_outcome_table(db, scope_query, unit_ids=supervisor_units)
     
-    # Unassigned leads
-    unassigned_query = {**base_query, "$or": [
-        {"assigned_agent_id": None},
-        {"assigned_agent_id": {"$exists": False}}
-    ]}
-    unassigned_leads = await db.leads.count_documents(unassigned_query)
+    unit_summary = table.summary(in_unit_only=True)
     
     # Per-agent stats
     agent_stats = []
-    all_outcomes = set()  # Collect all unique outcomes
-    
     for agent in agents:
-        agent_query = {"assigned_agent_id": agent["id"]}
-        if date_filter:
-            agent_query["created_at"] = date_filter
-        
-        agent_total = await db.leads.count_documents(agent_query)
-        agent_contacted_query = {**agent_query, "$and": [
-            {"esito": {"$exists": True}},
-            {"esito": {"$ne": None}},
-            {"esito": {"$ne": ""}},
-            {"esito": {"$ne": "Nuovo"}}
-        ]}
-        agent_contacted = await db.leads.count_documents(agent_contacted_query)
-        
-        # Get outcomes breakdown for this agent
-        agent_outcomes = {}
-        outcome_pipeline = [
-            {"$match": agent_query},
-            {"$group": {"_id": "$esito", "count": {"$sum": 1}}},
-            {"$sort": {"count": -1}}
-        ]
-        outcome_results = await db.leads.aggregate(outcome_pipeline).to_list(length=None)
-        for item in outcome_results:
-            esito = item["_id"] if item["_id"] else "Nuovo"
-            if esito == "" or esito is None:
-                esito = "Nuovo"
-            agent_outcomes[esito] = item["count"]
-            all_outcomes.add(esito)
-        
+        agent_summary = table.summary([agent["id"]])
         agent_stats.append({
             "id": agent["id"],
             "username": agent.get("username"),
@@ -278,10 +251,7 @@ async def get_supervisor_unit_analytics(
             "referente_id": agent.get("referente_id"),
             "unit_id": agent.get("unit_id"),
             "unit_nome": unit_names.get(agent.get("unit_id"), "N/A"),
-            "total_leads": agent_total,
-            "contacted_leads": agent_contacted,
-            "contact_rate": round((agent_contacted / agent_total * 100) if agent_total > 0 else 0, 2),
-            "outcomes": agent_outcomes
+            **agent_summary,
         })
     
     # Calculate total outcomes across all agents
@@ -290,26 +260,11 @@ async def get_supervisor_unit_analytics(
         for esito, count in agent.get("outcomes", {}).items():
             total_outcomes[esito] = total_outcomes.get(esito, 0) + count
     
-    # Per-referente stats
+    # Per-referente stats: agenti della gerarchia + lead propri del referente
     referente_stats = []
     for referente in referenti:
-        # Get agents under this referente
         ref_agents = [a for a in agents if a.get("referente_id") == referente["id"]]
-        ref_agent_ids = [a["id"] for a in ref_agents]
-        ref_agent_ids.append(referente["id"])  # Include referente's own leads
-        
-        ref_query = {"assigned_agent_id": {"$in": ref_agent_ids}}
-        if date_filter:
-            ref_query["created_at"] = date_filter
-        
-        ref_total = await db.leads.count_documents(ref_query)
-        ref_contacted_query = {**ref_query, "$and": [
-            {"esito": {"$exists": True}},
-            {"esito": {"$ne": None}},
-            {"esito": {"$ne": ""}},
-            {"esito": {"$ne": "Nuovo"}}
-        ]}
-        ref_contacted = await db.leads.count_documents(ref_contacted_query)
+        ref_summary = table.summary([a["id"] for a in ref_agents] + [referente["id"]])
         
         referente_stats.append({
             "id": referente["id"],
@@ -318,18 +273,18 @@ async def get_supervisor_unit_analytics(
             "unit_id": referente.get("unit_id"),
             "unit_nome": unit_names.get(referente.get("unit_id"), "N/A"),
             "agents_count": len(ref_agents),
-            "total_leads": ref_total,
-            "contacted_leads": ref_contacted,
-            "contact_rate": round((ref_contacted / ref_total * 100) if ref_total > 0 else 0, 2)
+            "total_leads": ref_summary["total_leads"],
+            "contacted_leads": ref_summary["contacted_leads"],
+            "contact_rate": ref_summary["contact_rate"]
         })
     
     return {
         "units": [{"id": u_id, "nome": u_name} for u_id, u_name in unit_names.items()],
         "stats": {
-            "total_leads": total_leads,
-            "contacted_leads": contacted_leads,
-            "unassigned_leads": unassigned_leads,
-            "contact_rate": round((contacted_leads / total_leads * 100) if total_leads > 0 else 0, 2),
+            "total_leads": unit_summary["total_leads"],
+            "contacted_leads": unit_summary["contacted_leads"],
+            "unassigned_leads": table.unassigned(),
+            "contact_rate": unit_summary["contact_rate"],
             "total_agents": len(agents),
             "total_referenti": len(referenti),
             "total_units": len(supervisor_units)
@@ -366,6 +321,33 @@ async def get_referente_analytics(
     else:
         raise HTTPException(status_code=403, detail="Not enough permissions")
     
+    # Build date filter
+    date_filter = {}
+    if date_from:
+        try:
+            date_from_obj, _ = __import__("helpers", fromlist=["rome_date_to_utc_range"]).rome_date_to_utc_range(date_from, current_user.timezone)
+            date_filter["$gte"] = date_from_obj
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Invalid date_from format. Use YYYY-MM-DD")
+    if date_to:
+        try:
+            _, date_to_obj = __import__("helpers", fromlist=["rome_date_to_utc_range"]).rome_date_to_utc_range(date_to, current_user.timezone)
+            date_filter["$lte"] = date_to_obj
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Invalid date_to format. Use YYYY-MM-DD")
+    
+    # For Super Referente: also filter by their Unit
+    unit_id = None
+    if current_user.role == UserRole.SUPER_REFERENTE and current_user.unit_id:
+        unit_id = current_user.unit_id
+        logging.info(f"[ANALYTICS] Super Referente {current_user.username} filtering analytics for unit {current_user.unit_id}")
+    
+    cache_key = ("referente", referente_id, unit_id, date_from, date_to, current_user.timezone)
+    return await lead_analytics.cached(
+        cache_key, lambda: _compute_referente_analytics(referente_id, unit_id, date_filter))
+
+
+async def _compute_referente_analytics(referente_id: str, unit_id: Optional[str], date_filter: Dict[str, Any]):
     # Get referente info
     referente = await db.users.find_one({"id": referente_id})
     if not referente:
@@ -373,129 +355,29 @@ async def get_referente_analytics(
     
     # Get all agents under this referente
     agents = await db.users.find({"referente_id": referente_id}).to_list(length=None)
-    agent_ids = [agent["id"] for agent in agents]
     
-    # Build base query with date filters
-    base_query = {"assigned_agent_id": {"$in": agent_ids}}
-    
-    # For Super Referente: also filter by their Unit
-    if current_user.role == UserRole.SUPER_REFERENTE and current_user.unit_id:
-        base_query["unit_id"] = current_user.unit_id
-        logging.info(f"[ANALYTICS] Super Referente {current_user.username} filtering analytics for unit {current_user.unit_id}")
-    
-    # Add date filters if provided
-    if date_from or date_to:
-        date_filter = {}
-        if date_from:
-            try:
-                date_from_obj, _ = __import__("helpers", fromlist=["rome_date_to_utc_range"]).rome_date_to_utc_range(date_from, current_user.timezone)
-                date_filter["$gte"] = date_from_obj
-            except ValueError:
-                raise HTTPException(status_code=400, detail="Invalid date_from format. Use YYYY-MM-DD")
-        if date_to:
-            try:
-                _, date_to_obj = __import__("helpers", fromlist=["rome_date_to_utc_range"]).rome_date_to_utc_range(date_to, current_user.timezone)
-                date_filter["$lte"] = date_to_obj
-            except ValueError:
-                raise HTTPException(status_code=400, detail="Invalid date_to format. Use YYYY-MM-DD")
+    base_query = {"assigned_agent_id": {"$in": [agent["id"] for agent in agents]}}
+    if unit_id:
+        base_query["unit_id"] = unit_id
+    if date_filter:
         base_query["created_at"] = date_filter
     
-    # Aggregate statistics for all agents under referente
-    total_leads = await db.leads.count_documents(base_query)
+    # NEW (ott 2026): un solo $group per (agente, esito); totali e breakdown in memoria
+    table = await lead_analytics.load_outcome_table(db, base_query)
+    total_summary = table.summary()
     
-    # Contacted leads = leads with esito that is NOT "Nuovo" (null, empty, or "Nuovo" string)
-    contacted_query = {**base_query, "$and": [
-        {"esito": {"$exists": True}},
-        {"esito": {"$ne": None}},
-        {"esito": {"$ne": ""}},
-        {"esito": {"$ne": "Nuovo"}}
-    ]}
-    contacted_leads = await db.leads.count_documents(contacted_query)
-    
-    # Per-agent breakdown - respect date filters AND unit filter for Super Referente
     agent_stats = []
     for agent in agents:
-        agent_base_query = {"assigned_agent_id": agent["id"]}
-        
-        # Add unit filter for Super Referente
-        if "unit_id" in base_query:
-            agent_base_query["unit_id"] = base_query["unit_id"]
-        
-        # Add same date filters as parent query
-        if "created_at" in base_query:
-            agent_base_query["created_at"] = base_query["created_at"]
-        
-        agent_leads = await db.leads.count_documents(agent_base_query)
-        
-        # Contacted leads = leads with esito that is NOT "Nuovo"
-        agent_contacted_query = {**agent_base_query, "$and": [
-            {"esito": {"$exists": True}},
-            {"esito": {"$ne": None}},
-            {"esito": {"$ne": ""}},
-            {"esito": {"$ne": "Nuovo"}}
-        ]}
-        agent_contacted = await db.leads.count_documents(agent_contacted_query)
-        
-        # Get outcomes for this agent
-        agent_outcomes = {}
-        agent_pipeline = [
-            {"$match": agent_base_query},
-            {"$group": {
-                "_id": "$esito",
-                "count": {"$sum": 1}
-            }},
-            {"$sort": {"count": -1}}
-        ]
-        
-        agent_esito_counts = await db.leads.aggregate(agent_pipeline).to_list(length=None)
-        
-        for item in agent_esito_counts:
-            esito_value = item["_id"]
-            count = item["count"]
-            
-            # Handle None/empty/Nuovo esito as "Nuovo"
-            if esito_value is None or esito_value == "" or not esito_value or esito_value == "Nuovo":
-                agent_outcomes["Nuovo"] = agent_outcomes.get("Nuovo", 0) + count
-            else:
-                agent_outcomes[esito_value] = count
-        
+        agent_summary = table.summary([agent["id"]])
         agent_stats.append({
             "agent": {
                 "id": agent["id"],
                 "username": agent["username"],
                 "email": agent["email"]
             },
-            "total_leads": agent_leads,
-            "contacted_leads": agent_contacted,
-            "contact_rate": round((agent_contacted / agent_leads * 100) if agent_leads > 0 else 0, 2),
-            "outcomes": agent_outcomes
+            **agent_summary,
         })
     
-    # Leads by outcome - COUNT ALL ACTUAL VALUES IN DATABASE (same as agent analytics)
-    outcomes = {}
-    
-    # Use MongoDB aggregation to get ALL distinct esito values with counts for all agents
-    pipeline = [
-        {"$match": base_query},
-        {"$group": {
-            "_id": "$esito",
-            "count": {"$sum": 1}
-        }},
-        {"$sort": {"count": -1}}
-    ]
-    
-    esito_counts = await db.leads.aggregate(pipeline).to_list(length=None)
-    
-    for item in esito_counts:
-        esito_value = item["_id"]
-        count = item["count"]
-        
-        # Handle None/empty/Nuovo esito as "Nuovo"
-        if esito_value is None or esito_value == "" or not esito_value or esito_value == "Nuovo":
-            outcomes["Nuovo"] = outcomes.get("Nuovo", 0) + count
-        else:
-            outcomes[esito_value] = count
-    
     return {
         "referente": {
             "id": referente["id"],
@@ -504,11 +386,11 @@ async def get_referente_analytics(
         },
         "total_agents": len(agents),
         "total_stats": {
-            "total_leads": total_leads,
-            "contacted_leads": contacted_leads,
-            "contact_rate": round((contacted_leads / total_leads * 100) if total_leads > 0 else 0, 2)
+            "total_leads": total_summary["total_leads"],
+            "contacted_leads": total_summary["contacted_leads"],
+            "contact_rate": total_summary["contact_rate"]
         },
-        "outcomes": outcomes,  # NEW: Distribution of lead outcomes
+        "outcomes": total_summary["outcomes"],  # Distribution of lead outcomes
         "agent_breakdown": agent_stats
     }
 
@@ -966,19 +848,15 @@ async def get_sub_agenzie_analytics(
     data_a: Optional[str] = Query(None),
     current_user: User = Depends(get_current_user)
 ):
-    """Get analytics for each sub agenzia"""
+    """Get analytics for each sub agenzia.
+
+    NEW (ott 2026): legge i rollup giornalieri `clienti_daily_rollups` (vedi
+    cliente_rollups.py) invece di caricare i clienti di ogni sub agenzia; le date
+    sono giorni Europe/Rome."""
     try:
-        # Build base query with date filter
-        base_query = {}
-        
-        if data_da or data_a:
-            date_query = {}
-            if data_da:
-                date_query["$gte"] = datetime.strptime(data_da, "%Y-%m-%d")
-            if data_a:
-                end_date = datetime.strptime(data_a, "%Y-%m-%d") + timedelta(days=1)
-                date_query["$lt"] = end_date
-            base_query["created_at"] = date_query
+        rome_date_to_utc_range = __import__("helpers", fromlist=["rome_date_to_utc_range"]).rome_date_to_utc_range
+        day_from = rome_date_to_utc_range(data_da)[0] if data_da else None
+        day_to = rome_date_to_utc_range(data_a)[0] if data_a else None
         
         # Get all sub agenzie based on user role
         if current_user.role == UserRole.ADMIN:
@@ -1005,89 +883,48 @@ async def get_sub_agenzie_analytics(
             # No access for other roles
             sub_agenzie = []
         
-        result = []
+        # Apply role-based filters - Commessa AND Servizio
+        commessa_ids = servizio_ids = None
+        if current_user.role in [UserRole.RESPONSABILE_COMMESSA, UserRole.BACKOFFICE_COMMESSA, UserRole.AREA_MANAGER,
+                                 UserRole.RESPONSABILE_SUB_AGENZIA, UserRole.BACKOFFICE_SUB_AGENZIA]:
+            commessa_ids = getattr(current_user, "commesse_autorizzate", None) or None
+            servizio_ids = current_user.servizi_autorizzati or None
         
+        rollups = await cliente_rollups.read_sub_agenzie_rollups(
+            db, [sa["id"] for sa in sub_agenzie], day_from, day_to, commessa_ids, servizio_ids)
+        
+        # Top assigned users (not creators): assigned_to, fallback created_by
+        top_by_sa = {
+            sa_id: sorted(((uid, n) for uid, n in r["assigned"].items() if uid), key=lambda x: x[1], reverse=True)[:5]
+            for sa_id, r in rollups.items()
+        }
+        user_ids = list({uid for top in top_by_sa.values() for uid, _ in top})
+        usernames = {
+            u["id"]: u.get("username")
+            async for u in db.users.find({"id": {"$in": user_ids}}, {"_id": 0, "id": 1, "username": 1})
+        } if user_ids else {}
+        
+        # Timeline giornaliera (solo con intervallo completo)
+        timeline_days = []
+        if data_da and data_a:
+            start = datetime.strptime(data_da, "%Y-%m-%d")
+            end = datetime.strptime(data_a, "%Y-%m-%d")
+            timeline_days = [(start + timedelta(days=i)).strftime("%Y-%m-%d") for i in range((end - start).days + 1)]
+        
+        result = []
         for sub_agenzia in sub_agenzie:
             sa_id = sub_agenzia["id"]
-            
-            # Query for this sub agenzia
-            query = base_query.copy()
-            query["sub_agenzia_id"] = sa_id
-            
-            # Apply role-based filters - Sub Agenzia, Commessa AND Servizio
-            if current_user.role in [UserRole.RESPONSABILE_COMMESSA, UserRole.BACKOFFICE_COMMESSA, UserRole.AREA_MANAGER]:
-                if current_user.commesse_autorizzate:
-                    query["commessa_id"] = {"$in": current_user.commesse_autorizzate}
-                if current_user.servizi_autorizzati:
-                    query["servizio_id"] = {"$in": current_user.servizi_autorizzati}
-            elif current_user.role in [UserRole.RESPONSABILE_SUB_AGENZIA, UserRole.BACKOFFICE_SUB_AGENZIA]:
-                if hasattr(current_user, 'commesse_autorizzate') and current_user.commesse_autorizzate:
-                    query["commessa_id"] = {"$in": current_user.commesse_autorizzate}
-                if current_user.servizi_autorizzati:
-                    query["servizio_id"] = {"$in": current_user.servizi_autorizzati}
-            
-            clienti = await db.clienti.find(query).to_list(length=None)
-            
-            # Total clienti
-            total = len(clienti)
-            
-            # Clienti by status
-            status_breakdown = {}
-            for cliente in clienti:
-                status = cliente.get("status", "Non specificato")
-                status_breakdown[status] = status_breakdown.get(status, 0) + 1
-            
-            # Clienti by tipologia contratto
-            tipologia_breakdown = {}
-            for cliente in clienti:
-                tipologia = cliente.get("tipologia_contratto", "Non specificato")
-                tipologia_breakdown[tipologia] = tipologia_breakdown.get(tipologia, 0) + 1
-            
-            # Top assigned users (not creators)
-            assigned_counts = {}
-            for cliente in clienti:
-                # Use assigned_to if present, otherwise fall back to created_by
-                assigned_id = cliente.get("assigned_to") or cliente.get("created_by")
-                if assigned_id:
-                    assigned_counts[assigned_id] = assigned_counts.get(assigned_id, 0) + 1
-            
-            # Enrich assigned user names
-            top_assigned = []
-            for assigned_id, count in sorted(assigned_counts.items(), key=lambda x: x[1], reverse=True)[:5]:
-                user = await db.users.find_one({"id": assigned_id})
-                top_assigned.append({
-                    "name": user.get("username") if user else assigned_id,
-                    "count": count
-                })
-            
-            # Performance over time (last 30 days or date range)
-            timeline = []
-            if data_da and data_a:
-                start = datetime.strptime(data_da, "%Y-%m-%d")
-                end = datetime.strptime(data_a, "%Y-%m-%d")
-                days = (end - start).days + 1
-                
-                for i in range(days):
-                    day = start + timedelta(days=i)
-                    day_end = day + timedelta(days=1)
-                    
-                    day_query = query.copy()
-                    day_query["created_at"] = {"$gte": day, "$lt": day_end}
-                    
-                    count = await db.clienti.count_documents(day_query)
-                    timeline.append({
-                        "date": day.strftime("%Y-%m-%d"),
-                        "count": count
-                    })
-            
+            r = rollups[sa_id]
             result.append({
                 "sub_agenzia_id": sa_id,
                 "sub_agenzia_name": sub_agenzia.get("nome"),
-                "total_clienti": total,
-                "status_breakdown": status_breakdown,
-                "tipologia_breakdown": tipologia_breakdown,
-                "top_assigned": top_assigned,
-                "timeline": timeline
+                "total_clienti": r["total"],
+                "status_breakdown": r["status"],
+                "tipologia_breakdown": r["tipologia"],
+                "top_assigned": [
+                    {"name": usernames.get(uid) or uid, "count": n} for uid, n in top_by_sa[sa_id]
+                ],
+                "timeline": [{"date": d, "count": r["days"].get(d, 0)} for d in timeline_days]
             })
         
         return result
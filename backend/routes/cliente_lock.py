@@ -15,6 +15,7 @@ from fastapi import (
 from fastapi.responses import StreamingResponse, JSONResponse
 
 from database import db
+from events import publish_lock
 from security import (
     get_current_user, get_password_hash, verify_password,
     check_commessa_access, get_user_accessible_commesse, get_user_accessible_sub_agenzie,
@@ -123,6 +124,8 @@ async def acquire_cliente_lock(
         {"$set": lock_doc},
         upsert=True,
     )
+    if not existing:
+        publish_lock(cliente_id, lock_doc)
     return {
         "locked": True,
         "owned_by_me": True,
@@ -146,6 +149,7 @@ async def release_cliente_lock(
     if existing.get("user_id") != current_user.id and current_user.role != UserRole.ADMIN:
         raise HTTPException(status_code=403, detail="Solo il proprietario del lock o un admin può rilasciarlo")
     await db.cliente_locks.delete_one({"cliente_id": cliente_id})
+    publish_lock(cliente_id, None)
     return {"released": True, "cliente_id": cliente_id}
 
 
@@ -209,6 +213,8 @@ async def force_release_cliente_lock(
     if current_user.role != UserRole.ADMIN:
         raise HTTPException(status_code=403, detail="Solo admin può forzare il rilascio del lock")
     result = await db.cliente_locks.delete_one({"cliente_id": cliente_id})
+    if result.deleted_count:
+        publish_lock(cliente_id, None)
     return {"force_released": True, "deleted": result.deleted_count}
 
 
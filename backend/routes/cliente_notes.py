@@ -23,6 +23,7 @@ from security import (
 )
 from models import *  # noqa: F401,F403
 from audit import log_client_action
+import cliente_rollups
 
 router = APIRouter()
 logger = logging.getLogger(__name__)
@@ -286,6 +287,7 @@ async def ripristina_cliente(
                 }
             }
         )
+        await cliente_rollups.refresh_for(db, [cliente_doc])
         
         # Log the restoration
         await log_client_action(
@@ -351,6 +353,7 @@ async def elimina_definitivo_cliente(
         
         if result.deleted_count == 0:
             raise HTTPException(status_code=404, detail="Cliente not found")
+        await cliente_rollups.refresh_for(db, [cliente_doc])
         
         return {
             "success": True,
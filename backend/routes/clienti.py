@@ -36,13 +36,17 @@ from services import (
     aruba_service, validate_uploaded_file, save_temporary_file, create_document_record,
 )
 from notifications import notify_agent_new_lead, send_email_notification
-from audit import log_client_action
+from audit import log_client_action, audit_sink
 from models import *  # noqa: F401,F403
-import pandas as pd
+from fast_response import FAST_LIST_RESPONSES, FastJSONResponse, model_projection
+from lazy_imports import lazy_import
+import cliente_rollups
+from data_retention import find_with_archive
 from helpers import get_hardcoded_tipologie_contratto, should_use_hardcoded_elements
 
 router = APIRouter()
 logger = logging.getLogger(__name__)
+pd = lazy_import("pandas")  # solo per il template Excel di import
 
 @router.post("/clienti", response_model=Cliente)
 async def create_cliente(cliente_data: ClienteCreate, current_user: User = Depends(get_current_user)):
@@ -104,6 +108,7 @@ async def create_cliente(cliente_data: ClienteCreate, current_user: User = Depen
         raise HTTPException(status_code=500, detail=f"Unexpected error: {str(e)}")
     
     await db.clienti.insert_one(cliente.dict())
+    await cliente_rollups.refresh_for(db, [cliente.dict()])
     
     # 📝 LOG: Registra la creazione del cliente
     await log_client_action(
@@ -721,29 +726,43 @@ async def get_clienti(
     total_pages = (total + page_size - 1) // page_size  # Ceiling division
     skip = (page - 1) * page_size
     
-    # Fetch paginated results
-    clienti = await db.clienti.find(query).sort("created_at", -1).skip(skip).limit(page_size).to_list(length=page_size)
+    # Fetch paginated results (solo i campi del modello Cliente)
+    projection = model_projection(Cliente)
+    clienti = await db.clienti.find(query, projection.projection).sort("created_at", -1).skip(skip).limit(page_size).to_list(length=page_size)
     print(f"📊 Returning page {page}/{total_pages} with {len(clienti)} clients for user {current_user.username}")
     
     # Enrich clienti with segmento_nome for display purposes
+    # (una lookup per valore distinto di segmento, non per riga)
+    segmento_nomi: Dict[str, str] = {}
     for cliente in clienti:
         if cliente.get("segmento"):
-            # Try to find segmento by ID or by tipo
-            segmento_doc = await db.segmenti.find_one({
-                "$or": [
-                    {"id": cliente["segmento"]},
-                    {"tipo": cliente["segmento"]}
-                ]
-            }, {"_id": 0})
-            
-            if segmento_doc:
-                cliente["segmento_nome"] = segmento_doc.get("nome", cliente["segmento"])
-            else:
-                # Fallback: capitalize and format the segmento value
-                cliente["segmento_nome"] = cliente["segmento"].capitalize()
+            if cliente["segmento"] not in segmento_nomi:
+                # Try to find segmento by ID or by tipo
+                segmento_doc = await db.segmenti.find_one({
+                    "$or": [
+                        {"id": cliente["segmento"]},
+                        {"tipo": cliente["segmento"]}
+                    ]
+                }, {"_id": 0})
+                
+                if segmento_doc:
+                    segmento_nomi[cliente["segmento"]] = segmento_doc.get("nome", cliente["segmento"])
+                else:
+                    # Fallback: capitalize and format the segmento value
+                    segmento_nomi[cliente["segmento"]] = cliente["segmento"].capitalize()
+            cliente["segmento_nome"] = segmento_nomi[cliente["segmento"]]
         else:
             cliente["segmento_nome"] = "N/A"
     
+    if FAST_LIST_RESPONSES:
+        # Dati già validati in scrittura: niente modelli Pydantic, codifica orjson
+        return FastJSONResponse({
+            "clienti": projection.rows(clienti),
+            "total": total,
+            "page": page,
+            "page_size": page_size,
+            "total_pages": total_pages,
+        })
     return ClientiPaginatedResponse(
         clienti=[Cliente(**c) for c in clienti],
         total=total,
@@ -1752,6 +1771,9 @@ async def update_cliente(
         if result.matched_count == 0:
             raise HTTPException(status_code=404, detail="Cliente not found")
         
+        # Rollup analytics sub agenzie: bucket prima e dopo (status / sub agenzia / assegnazione)
+        await cliente_rollups.refresh_for(db, [cliente_doc, {**cliente_doc, **update_data}])
+        
         # 📝 LOG: Registra i cambiamenti nel log
         if changes:
             # Log generico di aggiornamento
@@ -1907,6 +1929,7 @@ async def assign_cliente(
         
         if result.matched_count == 0:
             raise HTTPException(status_code=404, detail="Cliente not found")
+        await cliente_rollups.refresh_ids(db, [cliente_id])
         
         # Log assignment action
         await log_client_action(
@@ -2040,6 +2063,7 @@ async def get_sub_agenzia_status_changes_audit(
             ts_filter["$lte"] = end_utc
         query["timestamp"] = ts_filter
 
+    await audit_sink.flush("clienti_logs")
     logs = await db.clienti_logs.find(query, {"_id": 0}).sort("timestamp", -1).limit(limit).to_list(length=None)
 
     # Enrichment: cliente nome+cognome, sub agenzia nome
@@ -2087,9 +2111,11 @@ async def get_sub_agenzia_status_changes_audit(
 async def get_cliente_logs(
     cliente_id: str,
     limit: int = 50,
+    include_archive: bool = False,
     current_user: User = Depends(get_current_user)
 ):
-    """Recupera la cronologia completa delle azioni per un cliente"""
+    """Recupera la cronologia completa delle azioni per un cliente.
+    `include_archive`: completa con i log spostati in `clienti_logs_archive` (vedi data_retention.py)"""
     
     # Verifica che l'utente possa accedere a questo cliente
     cliente_doc = await db.clienti.find_one({"id": cliente_id})
@@ -2150,9 +2176,11 @@ async def get_cliente_logs(
         raise HTTPException(status_code=403, detail="No permission to view this cliente's logs")
     
     try:
-        # Recupera i log ordinati per timestamp (più recenti prima)
-        logs_cursor = db.clienti_logs.find({"cliente_id": cliente_id}).sort("timestamp", -1).limit(limit)
-        logs = await logs_cursor.to_list(length=None)
+        # Recupera i log ordinati per timestamp (più recenti prima), incluse le entry ancora in buffer
+        await audit_sink.flush("clienti_logs")
+        logs = await find_with_archive(
+            db, "clienti_logs", {"cliente_id": cliente_id}, "timestamp", limit, include_archive=include_archive,
+        )
         
         # Collect all user_ids from logs to fetch user details
         user_ids_in_logs = set()
@@ -2259,7 +2287,8 @@ async def delete_cliente(
                 "deleted_at": deleted_at.isoformat(),
                 "deleted_by": current_user.id,
                 "deleted_by_username": current_user.username
-            }
+            },
+            durable=True,
         )
         
         return {
@@ -2280,7 +2309,7 @@ async def preview_clienti_import(
 ):
     """Preview clienti import file"""
     # Check permissions
-    if current_user.role not in [UserRole.ADMIN, UserRole.OPERATORE, UserRole.BACKOFFICE_COMMESSA, UserRole.BACKOFFICE_AGENZIA]:
+    if current_user.role not in [UserRole.ADMIN, UserRole.OPERATORE, UserRole.BACKOFFICE_COMMESSA]:
         raise HTTPException(status_code=403, detail="Insufficient permissions for import")
     
     # Validate file type
@@ -2303,34 +2332,52 @@ async def preview_clienti_import(
         logging.error(f"Preview import error: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Error processing file: {str(e)}")
 
+IMPORT_ROLES = [UserRole.ADMIN, UserRole.OPERATORE, UserRole.BACKOFFICE_COMMESSA]
+# Limite errori salvati nel documento job (evita documenti Mongo oltre 16MB su file enormi)
+IMPORT_JOB_MAX_STORED_ERRORS = 5000
+# Job queued/running senza aggiornamenti da oltre questa soglia = task perso (riavvio/crash del worker)
+IMPORT_JOB_STALE_SECONDS = int(os.environ.get("IMPORT_JOB_STALE_SECONDS", "900"))
+IMPORT_JOB_REAPER_INTERVAL_SECONDS = int(os.environ.get("IMPORT_JOB_REAPER_INTERVAL_SECONDS", "300"))
+# Riferimenti forti ai task di import in corso: l'event loop tiene solo weakref,
+# un task non referenziato può essere raccolto dal GC a metà esecuzione
+_IMPORT_JOB_TASKS: set = set()
+
+
+async def _parse_import_config(config: str, current_user: User) -> ImportConfiguration:
+    """Valida configurazione import + accesso a commessa/sub agenzia."""
+    try:
+        import_config = ImportConfiguration(**json.loads(config))
+    except json.JSONDecodeError:
+        raise HTTPException(status_code=400, detail="Invalid configuration format")
+
+    # Verify access to commessa
+    if not await check_commessa_access(current_user, import_config.commessa_id):
+        raise HTTPException(status_code=403, detail="Access denied to this commessa")
+
+    # Verify sub agenzia exists and is authorized for commessa
+    sub_agenzia = await db.sub_agenzie.find_one({"id": import_config.sub_agenzia_id})
+    if not sub_agenzia:
+        raise HTTPException(status_code=404, detail="Sub agenzia not found")
+
+    if import_config.commessa_id not in sub_agenzia.get("commesse_autorizzate", []):
+        raise HTTPException(status_code=400, detail="Sub agenzia not authorized for this commessa")
+
+    return import_config
+
+
 @router.post("/clienti/import/execute", response_model=ImportResult)
 async def execute_clienti_import(
     file: UploadFile = File(...),
     config: str = Form(...),  # JSON string of ImportConfiguration
     current_user: User = Depends(get_current_user)
 ):
-    """Execute clienti import"""
+    """Execute clienti import (sincrono). Per file grandi usare POST /clienti/import/jobs."""
     # Check permissions
-    if current_user.role not in [UserRole.ADMIN, UserRole.OPERATORE, UserRole.BACKOFFICE_COMMESSA, UserRole.BACKOFFICE_AGENZIA]:
+    if current_user.role not in IMPORT_ROLES:
         raise HTTPException(status_code=403, detail="Insufficient permissions for import")
     
     try:
-        # Parse configuration
-        import json
-        config_dict = json.loads(config)
-        import_config = ImportConfiguration(**config_dict)
-        
-        # Verify access to commessa
-        if not await check_commessa_access(current_user, import_config.commessa_id):
-            raise HTTPException(status_code=403, detail="Access denied to this commessa")
-        
-        # Verify sub agenzia exists and is authorized for commessa
-        sub_agenzia = await db.sub_agenzie.find_one({"id": import_config.sub_agenzia_id})
-        if not sub_agenzia:
-            raise HTTPException(status_code=404, detail="Sub agenzia not found")
-        
-        if import_config.commessa_id not in sub_agenzia.get("commesse_autorizzate", []):
-            raise HTTPException(status_code=400, detail="Sub agenzia not authorized for this commessa")
+        import_config = await _parse_import_config(config, current_user)
         
         # Read file content
         content = await file.read()
@@ -2345,12 +2392,123 @@ async def execute_clienti_import(
         
         return result
         
-    except json.JSONDecodeError:
-        raise HTTPException(status_code=400, detail="Invalid configuration format")
+    except HTTPException:
+        raise
     except Exception as e:
         logging.error(f"Execute import error: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Import failed: {str(e)}")
 
+
+async def _run_clienti_import_job(job_id: str, content: bytes, filename: str, import_config: ImportConfiguration, user_id: str):
+    """Esegue l'import in background aggiornando progresso ed esito su `clienti_import_jobs`."""
+    await db.clienti_import_jobs.update_one(
+        {"id": job_id},
+        {"$set": {"status": "running", "started_at": datetime.now(timezone.utc), "updated_at": datetime.now(timezone.utc)}}
+    )
+
+    async def _progress(processed: int, total: int):
+        await db.clienti_import_jobs.update_one(
+            {"id": job_id},
+            {"$set": {"processed": processed, "total_rows": total, "updated_at": datetime.now(timezone.utc)}}
+        )
+
+    try:
+        result = await process_import_batch(content, filename, import_config, user_id, progress_callback=_progress)
+        result_doc = result.dict()
+        errors_total = len(result_doc["errors"])
+        result_doc["errors"] = result_doc["errors"][:IMPORT_JOB_MAX_STORED_ERRORS]
+        await db.clienti_import_jobs.update_one(
+            {"id": job_id},
+            {"$set": {
+                "status": "completed",
+                "processed": result.total_processed,
+                "total_rows": result.total_processed,
+                "successful": result.successful,
+                "failed": result.failed,
+                "errors_total": errors_total,
+                "result": result_doc,
+                "finished_at": datetime.now(timezone.utc),
+            }}
+        )
+        logging.info(f"[IMPORT-JOB] {job_id} completed: {result.successful} ok, {result.failed} failed")
+    except Exception as e:
+        detail = e.detail if isinstance(e, HTTPException) else str(e)
+        logging.error(f"[IMPORT-JOB] {job_id} failed: {detail}")
+        await db.clienti_import_jobs.update_one(
+            {"id": job_id},
+            {"$set": {"status": "failed", "error": detail, "finished_at": datetime.now(timezone.utc)}}
+        )
+
+
+async def fail_stale_import_jobs(now: Optional[datetime] = None) -> int:
+    """Chiude come `failed` i job queued/running fermi da oltre IMPORT_JOB_STALE_SECONDS.
+
+    Il task asyncio dell'import vive nel processo che ha ricevuto la richiesta: se il
+    worker si riavvia il job resterebbe "running" per sempre. Il progresso aggiorna
+    `updated_at` a ogni chunk, quindi un job vivo non supera mai la soglia.
+    """
+    now = now or datetime.now(timezone.utc)
+    result = await db.clienti_import_jobs.update_many(
+        {
+            "status": {"$in": ["queued", "running"]},
+            "updated_at": {"$lt": now - timedelta(seconds=IMPORT_JOB_STALE_SECONDS)},
+        },
+        {"$set": {"status": "failed", "error": "Import interrotto (riavvio del server): ripetere l'importazione",
+                  "finished_at": now}}
+    )
+    if result.modified_count:
+        logging.warning(f"[IMPORT-JOB] {result.modified_count} job interrotti marcati come failed")
+    return result.modified_count
+
+
+@router.post("/clienti/import/jobs")
+async def start_clienti_import_job(
+    file: UploadFile = File(...),
+    config: str = Form(...),  # JSON string of ImportConfiguration
+    current_user: User = Depends(get_current_user)
+):
+    """Avvia l'import clienti in background e ritorna subito il job_id.
+
+    Il progresso si legge da GET /clienti/import/jobs/{job_id}: la richiesta HTTP non
+    resta aperta per tutta la durata dell'import.
+    """
+    if current_user.role not in IMPORT_ROLES:
+        raise HTTPException(status_code=403, detail="Insufficient permissions for import")
+
+    import_config = await _parse_import_config(config, current_user)
+    content = await file.read()
+
+    job_id = str(uuid.uuid4())
+    now = datetime.now(timezone.utc)
+    await db.clienti_import_jobs.insert_one({
+        "id": job_id,
+        "status": "queued",
+        "filename": file.filename,
+        "commessa_id": import_config.commessa_id,
+        "sub_agenzia_id": import_config.sub_agenzia_id,
+        "created_by": current_user.id,
+        "created_at": now,
+        "updated_at": now,
+        "processed": 0,
+        "total_rows": None,
+    })
+    task = asyncio.create_task(_run_clienti_import_job(job_id, content, file.filename, import_config, current_user.id))
+    _IMPORT_JOB_TASKS.add(task)
+    task.add_done_callback(_IMPORT_JOB_TASKS.discard)
+
+    return {"job_id": job_id, "status": "queued"}
+
+
+@router.get("/clienti/import/jobs/{job_id}")
+async def get_clienti_import_job(job_id: str, current_user: User = Depends(get_current_user)):
+    """Stato e progresso di un import clienti in background."""
+    job = await db.clienti_import_jobs.find_one({"id": job_id}, {"_id": 0})
+    if not job:
+        raise HTTPException(status_code=404, detail="Import job not found")
+    if current_user.role != UserRole.ADMIN and job.get("created_by") != current_user.id:
+        raise HTTPException(status_code=403, detail="Not enough permissions")
+    return job
+
 @router.get("/clienti/import/template/{file_type}")
 async def download_import_template(
     file_type: str,
@@ -39,7 +39,7 @@ from notifications import notify_agent_new_lead, send_email_notification
 from audit import log_client_action
 from models import *  # noqa: F401,F403
 from pathlib import Path
-from services import NextcloudClient
+from services import NextcloudClient, spool_upload_to_disk
 
 router = APIRouter()
 logger = logging.getLogger(__name__)
@@ -206,8 +206,9 @@ async def upload_document(
             stem = Path(unique_filename).stem[:190]
             unique_filename = f"{stem}{file_extension}"
         
-        # Read file content
-        content = await file.read()
+        # Spool del file su disco a blocchi: il contenuto non viene mai tenuto tutto in memoria
+        temp_path, file_size = await spool_upload_to_disk(file)
+        add_debug_log(f"💾 Spooled upload to disk: {file_size} bytes")
         
         # Try Nextcloud upload if configured
         upload_success = False
@@ -251,8 +252,8 @@ async def upload_document(
                 
                 add_debug_log(f"📝 Structured filename: {structured_filename}")
                 
-                # Upload file via WebDAV
-                success, cloud_path = await nextcloud.upload_file(content, structured_filename)
+                # Upload file via WebDAV (streaming dal file spool, chunked per file grandi)
+                success, cloud_path = await nextcloud.upload_path(temp_path, structured_filename, file_size)
                 
                 if success:
                     aruba_drive_path = cloud_path
@@ -301,7 +302,7 @@ async def upload_document(
             "file_path": str(file_path) if file_path else None,
             "cloud_path": aruba_drive_path if storage_type == "nextcloud" else None,
             "aruba_drive_path": aruba_drive_path or f"/local/{entity_type}/{entity_id}/{unique_filename}",  # Legacy field
-            "file_size": len(content),
+            "file_size": file_size,
             "file_type": file.content_type or "application/octet-stream",
             "created_by": uploaded_by,
             "created_at": datetime.now(timezone.utc),
@@ -324,7 +325,7 @@ async def upload_document(
                 new_value=unique_filename,
                 metadata={
                     "document_id": document_data["id"],
-                    "file_size": len(content),
+                    "file_size": file_size,
                     "file_type": file.content_type or "application/octet-stream",
                     "aruba_drive_path": document_data["aruba_drive_path"],
                     "original_filename": file.filename
@@ -342,14 +343,14 @@ async def upload_document(
     except HTTPException:
         raise
     except Exception as e:
-        # Clean up temporary file on error
-        if 'temp_path' in locals() and os.path.exists(temp_path):
-            os.remove(temp_path)
-        
         raise HTTPException(
             status_code=500,
             detail=f"Upload failed: {str(e)}"
         )
+    finally:
+        # Clean up spooled temporary file (cloud upload done or failed)
+        if 'temp_path' in locals() and os.path.exists(temp_path):
+            os.remove(temp_path)
 
 @router.get("/documents/lead/{lead_id}")
 async def list_lead_documents(
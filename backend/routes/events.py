@@ -0,0 +1,127 @@
+"""Route: canale Server-Sent Events al posto del polling della UI (NEW ott 2026).
+
+`GET /api/events/stream?topics=conversations,locks,leads,dashboard` apre uno stream
+`text/event-stream` alimentato da `events.event_bus` (vedi events.py). I topic richiesti
+vengono ristretti a quelli che l'utente può vedere (conversazioni delle sue Unit come in
+`/spoki/conversations`, dashboard solo admin). Il primo evento è `ready` con i topic
+concessi: il client legge lo stato iniziale con le GET esistenti e poi applica gli eventi.
+
+EventSource non permette header: il client chiede prima `POST /api/events/token` e passa
+come `?token=` un JWT di breve durata valido solo per lo stream (mai il JWT di sessione,
+che finirebbe negli access log).
+"""
+import logging
+import os
+from datetime import timedelta
+from typing import List, Optional, Set
+
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
+from fastapi.responses import StreamingResponse
+from fastapi.security import HTTPAuthorizationCredentials
+from jose import JWTError, jwt
+
+from database import db
+from events import (
+    ALL_CONVERSATIONS_TOPIC, DASHBOARD_TOPIC, LOCKS_TOPIC, SSE_HEARTBEAT_SECONDS,
+    conversation_topic, event_bus, sse_format, user_leads_topic,
+)
+from security import ALGORITHM, SECRET_KEY, STREAM_TOKEN_SCOPE, create_access_token, get_current_user
+from models import *  # noqa: F401,F403
+
+router = APIRouter()
+logger = logging.getLogger(__name__)
+
+STREAM_TOPICS = ("conversations", "locks", "leads", "dashboard")
+# Basta ad aprire la connessione: alla riconnessione il client ne chiede uno nuovo
+EVENTS_STREAM_TOKEN_TTL_SECONDS = int(os.environ.get("EVENTS_STREAM_TOKEN_TTL_SECONDS", "60"))
+
+
+async def get_stream_user(request: Request, token: Optional[str] = Query(None)) -> User:
+    """Come get_current_user, ma accetta anche `?token=` con un token di stream
+    (POST /events/token): EventSource del browser non permette header personalizzati."""
+    scheme, _, value = (request.headers.get("Authorization") or "").partition(" ")
+    if scheme.lower() == "bearer" and value:
+        return await get_current_user(HTTPAuthorizationCredentials(scheme="Bearer", credentials=value))
+    if not token:
+        raise HTTPException(status_code=401, detail="Not authenticated")
+    try:
+        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+    except JWTError:
+        raise HTTPException(status_code=401, detail="Could not validate credentials")
+    # in query string solo token di stream, mai il JWT di sessione
+    if payload.get("scope") != STREAM_TOKEN_SCOPE or not payload.get("sub"):
+        raise HTTPException(status_code=401, detail="Could not validate credentials")
+    user = await db.users.find_one({"username": payload["sub"]})
+    if user is None:
+        raise HTTPException(status_code=401, detail="Could not validate credentials")
+    return User(**user)
+
+
+@router.post("/events/token")
+async def create_events_stream_token(current_user: User = Depends(get_current_user)):
+    """Token di breve durata, valido solo per aprire `/events/stream?token=`."""
+    token = create_access_token(
+        {"sub": current_user.username, "scope": STREAM_TOKEN_SCOPE},
+        expires_delta=timedelta(seconds=EVENTS_STREAM_TOKEN_TTL_SECONDS),
+    )
+    return {"token": token, "expires_in": EVENTS_STREAM_TOKEN_TTL_SECONDS}
+
+
+def resolve_topics(user: User, requested: List[str]) -> Set[str]:
+    topics: Set[str] = set()
+    for name in requested:
+        if name == "conversations":
+            if user.role == UserRole.ADMIN:
+                topics.add(ALL_CONVERSATIONS_TOPIC)
+                continue
+            if user.role == UserRole.SUPER_REFERENTE and user.unit_id:
+                topics.add(conversation_topic(user.unit_id))
+            topics.update(conversation_topic(c) for c in (user.commesse_autorizzate or []))
+        elif name == "locks":
+            topics.add(LOCKS_TOPIC)
+        elif name == "leads":
+            topics.add(user_leads_topic(user.id))
+        elif name == "dashboard" and user.role == UserRole.ADMIN:
+            topics.add(DASHBOARD_TOPIC)
+    return topics
+
+
+@router.get("/events/stream")
+async def events_stream(
+    request: Request,
+    topics: str = Query(",".join(STREAM_TOPICS)),
+    current_user: User = Depends(get_stream_user),
+):
+    """Stream SSE degli eventi dei topic richiesti (separati da virgola)."""
+    requested = [t.strip() for t in topics.split(",") if t.strip()]
+    unknown = [t for t in requested if t not in STREAM_TOPICS]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Topic non validi: {', '.join(unknown)}")
+    granted = resolve_topics(current_user, requested)
+
+    async def stream():
+        # iscrizione dentro il generatore: se il client chiude prima che il body venga
+        # iterato non resta nessuna Subscription orfana nel bus
+        sub = event_bus.subscribe(granted)
+        try:
+            yield sse_format({"id": 0, "type": "ready", "data": {"topics": sorted(granted)}})
+            while not await request.is_disconnected():
+                event = await sub.get(timeout=SSE_HEARTBEAT_SECONDS)
+                # commento SSE come keepalive per proxy/load balancer
+                yield sse_format(event) if event is not None else b": keepalive\n\n"
+        finally:
+            event_bus.unsubscribe(sub)
+
+    return StreamingResponse(
+        stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@router.get("/admin/events/stats")
+async def events_stats(current_user: User = Depends(get_current_user)):
+    """Connessioni SSE aperte per topic ed eventi pubblicati da questo worker."""
+    if current_user.role != UserRole.ADMIN:
+        raise HTTPException(status_code=403, detail="Solo gli amministratori possono eseguire questa operazione")
+    return event_bus.stats()
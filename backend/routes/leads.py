@@ -36,9 +36,11 @@ from services import (
     aruba_service, validate_uploaded_file, save_temporary_file, create_document_record,
 )
 from notifications import notify_agent_new_lead, send_email_notification
-from audit import log_client_action
+from audit import log_client_action, log_lead_history, audit_sink
+from data_retention import find_with_archive
 from workflow_executor import WorkflowExecutor
 from models import *  # noqa: F401,F403
+from fast_response import FAST_LIST_RESPONSES, FastJSONResponse, model_projection
 from services import lead_qualification_bot
 
 async def trigger_workflows_for_lead(lead_dict, trigger_subtype="lead_created"):
@@ -146,9 +148,10 @@ async def create_lead(lead_data: LeadCreate):
             else:
                 logging.warning(f"[CREATE-LEAD] No referente or agent found for unit {lead_obj.unit_id}. Lead {lead_obj.id} will remain unassigned.")
             
-            # Trigger Spoki welcome message + Workflows V2 (fire-and-forget)
+            # Trigger Spoki welcome message + Workflows V2: accodati sulla coda di dispatch
+            # (attesi qui, così con coda piena la backpressure arriva al chiamante)
             try:
-                asyncio.create_task(trigger_workflows_for_lead(lead_obj.dict(), "lead_created"))
+                await trigger_workflows_for_lead(lead_obj.dict(), "lead_created")
             except Exception as _se:
                 logging.warning(f"[SPOKI/WF] trigger failed: {_se}")
 
@@ -171,9 +174,9 @@ async def create_lead(lead_data: LeadCreate):
         # Unit has auto_assign enabled but no AI - lead remains unassigned until status changes
         logging.info(f"Lead {lead_obj.id} created with status 'Nuovo' - will be assigned when status changes to 'Lead Interessato'")
 
-    # Trigger Spoki welcome message + Workflows V2 (fire-and-forget) — vale per tutti i flussi che cadono qui
+    # Trigger Spoki welcome message + Workflows V2 (accodati, vedi sopra) — vale per tutti i flussi che cadono qui
     try:
-        asyncio.create_task(trigger_workflows_for_lead(lead_obj.dict(), "lead_created"))
+        await trigger_workflows_for_lead(lead_obj.dict(), "lead_created")
     except Exception as _se:
         logging.warning(f"[SPOKI/WF] trigger failed: {_se}")
 
@@ -370,9 +373,9 @@ async def create_lead_webhook_get(
         # Unit has auto_assign enabled but no AI - lead remains unassigned until status changes
         logging.info(f"[WEBHOOK GET] Lead {lead_obj.id} created with status 'Nuovo' - will be assigned when status changes to 'Lead Interessato'")
     
-    # Trigger Spoki welcome message + Workflows V2 (fire-and-forget)
+    # Trigger Spoki welcome message + Workflows V2 (accodati: con coda piena la richiesta attende)
     try:
-        asyncio.create_task(trigger_workflows_for_lead(lead_obj.dict(), "lead_created"))
+        await trigger_workflows_for_lead(lead_obj.dict(), "lead_created")
     except Exception as _se:
         logging.warning(f"[SPOKI/WF] trigger failed: {_se}")
 
@@ -520,9 +523,9 @@ async def create_lead_webhook_post(lead_data: LeadCreate):
         else:
             logging.info(f"[WEBHOOK POST] Lead {lead_obj.id} created without unit_id - will be assigned when status changes to 'Lead Interessato'")
     
-    # Trigger Spoki welcome message + Workflows V2 (fire-and-forget)
+    # Trigger Spoki welcome message + Workflows V2 (accodati: con coda piena la richiesta attende)
     try:
-        asyncio.create_task(trigger_workflows_for_lead(lead_obj.dict(), "lead_created"))
+        await trigger_workflows_for_lead(lead_obj.dict(), "lead_created")
     except Exception as _se:
         logging.warning(f"[SPOKI/WF] trigger failed: {_se}")
 
@@ -721,13 +724,29 @@ async def get_leads(
     skip = (page - 1) * page_size
     total_pages = (total + page_size - 1) // page_size if total > 0 else 1
     
-    # Fetch paginated leads
-    leads = await db["leads"].find(query).sort("created_at", -1).skip(skip).limit(page_size).to_list(length=page_size)
+    # Fetch paginated leads (solo i campi del modello Lead)
+    projection = model_projection(Lead)
+    leads = await db["leads"].find(query, projection.projection).sort("created_at", -1).skip(skip).limit(page_size).to_list(length=page_size)
     
     # Get all units for populating unit_nome
-    units = await db["units"].find().to_list(length=None)
+    units = await db["units"].find({}, {"_id": 0, "id": 1, "nome": 1}).to_list(length=None)
     units_map = {u["id"]: u.get("nome", "N/A") for u in units}
     
+    if FAST_LIST_RESPONSES:
+        # Dati già validati in scrittura: niente modelli Pydantic, codifica orjson
+        for lead_data in leads:
+            if lead_data.get("unit_id"):
+                lead_data["unit_nome"] = units_map.get(lead_data["unit_id"], "Unit sconosciuta")
+            else:
+                lead_data["unit_nome"] = "Non assegnata"
+        return FastJSONResponse({
+            "leads": projection.rows(leads),
+            "total": total,
+            "page": page,
+            "page_size": page_size,
+            "total_pages": total_pages,
+        })
+    
     # Filter out leads with validation errors to prevent crashes
     valid_leads = []
     for lead_data in leads:
@@ -978,24 +997,15 @@ async def update_lead(lead_id: str, lead_update: LeadUpdate, current_user: User
             changes_log[field] = {"old": old_value, "new": new_value}
     
     if changes_log:
-        history_entry = {
-            "id": str(uuid.uuid4()),
-            "lead_id": lead_id,
-            "user_id": current_user.id,
-            "username": current_user.username,
-            "action": "update",
-            "changes": changes_log,
-            "timestamp": datetime.now(timezone.utc)
-        }
-        await db["lead_history"].insert_one(history_entry)
-        logging.info(f"[LEAD_HISTORY] Logged changes for lead {lead_id} by user {current_user.username}")
+        await log_lead_history(lead_id, current_user, changes_log)
     
     updated_lead = await db["leads"].find_one({"id": lead_id})
     return Lead(**updated_lead)
 
 @router.get("/leads/{lead_id}/history")
-async def get_lead_history(lead_id: str, current_user: User = Depends(get_current_user)):
-    """Get the change history for a lead - Admin only"""
+async def get_lead_history(lead_id: str, include_archive: bool = False, current_user: User = Depends(get_current_user)):
+    """Get the change history for a lead - Admin only.
+    `include_archive`: completa con le entry spostate in `lead_history_archive` (vedi data_retention.py)"""
     
     # Only admin can view lead history
     if current_user.role != UserRole.ADMIN:
@@ -1006,10 +1016,13 @@ async def get_lead_history(lead_id: str, current_user: User = Depends(get_curren
     if not lead:
         raise HTTPException(status_code=404, detail="Lead not found")
     
+    # Le entry ancora nel buffer dell'audit sink devono essere visibili subito
+    await audit_sink.flush("lead_history")
+
     # Fetch history entries sorted by timestamp (newest first)
-    history_entries = await db["lead_history"].find(
-        {"lead_id": lead_id}
-    ).sort("timestamp", -1).to_list(length=100)
+    history_entries = await find_with_archive(
+        db, "lead_history", {"lead_id": lead_id}, "timestamp", 100, include_archive=include_archive,
+    )
     
     # Clean up _id from MongoDB
     for entry in history_entries:
@@ -13,6 +13,8 @@ from fastapi import (
     UploadFile, File, Form, status,
 )
 from fastapi.responses import StreamingResponse, JSONResponse
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
 
 from database import db
 from security import (
@@ -22,6 +24,7 @@ from security import (
     can_user_modify_cliente,
 )
 from models import *  # noqa: F401,F403
+import cliente_rollups
 
 router = APIRouter()
 logger = logging.getLogger(__name__)
@@ -78,33 +81,21 @@ _PV_STAGE_TO_CLIENTE_STATUS = {
 VALID_PV_STAGES = {"lavorazione", "attivato", "ko"}
 
 
-async def _apply_pv_stage_to_cliente(cliente_id: str, pv_status_value: str, commessa_id: Optional[str] = None, actor: Optional[User] = None):
-    """Single source of truth to switch a cliente's post-vendita status.
-    Performs:
-      1. Read previous PV state (status, label, stage) BEFORE any mutation.
-      2. Persist new status + label + stage + updated_at + passed_to_post_vendita=True.
-      3. For stage 'attivato' / 'ko' rewrite cliente.status (final outcome). For 'lavorazione' the
-         anagrafica status is left untouched (only the dot signals it).
-      4. Append an immutable history entry in `cliente_post_vendita_history`.
-    Idempotent on stage/label, but always logs the audit when the status value changes.
-    """
-    if not pv_status_value:
-        return
+async def _find_pv_status_config(pv_status_value: str, commessa_id: Optional[str] = None) -> Optional[dict]:
     q = {"value": pv_status_value, "is_active": True}
     if commessa_id:
         q["commessa_id"] = commessa_id
-    cfg = await db.post_vendita_status_config.find_one(q, {"_id": 0, "stage": 1, "label": 1, "color": 1})
-    if not cfg:
-        return
+    return await db.post_vendita_status_config.find_one(q, {"_id": 0, "stage": 1, "label": 1, "color": 1})
+
+
+def _build_pv_transition(cliente_id: str, prev: dict, pv_status_value: str, cfg: dict, actor: Optional[User] = None):
+    """Compute the $set document and the (optional) history entry for a PV status switch.
+    `prev` is the cliente snapshot (post_vendita_status / _stage / _status_label) BEFORE the mutation.
+    Returns (set_doc, history_entry_or_None)."""
     stage = (cfg.get("stage") or "lavorazione").lower()
     label = cfg.get("label") or pv_status_value
     color = cfg.get("color") or None
 
-    # Snapshot previous state
-    prev = await db.clienti.find_one(
-        {"id": cliente_id},
-        {"_id": 0, "post_vendita_status": 1, "post_vendita_stage": 1, "post_vendita_status_label": 1}
-    ) or {}
     prev_status = prev.get("post_vendita_status")
     prev_label = prev.get("post_vendita_status_label")
     prev_stage = prev.get("post_vendita_stage")
@@ -119,13 +110,10 @@ async def _apply_pv_stage_to_cliente(cliente_id: str, pv_status_value: str, comm
     new_cliente_status = _PV_STAGE_TO_CLIENTE_STATUS.get(stage)
     if new_cliente_status:
         set_doc["status"] = new_cliente_status
-    await db.clienti.update_one(
-        {"id": cliente_id},
-        {"$set": set_doc}
-    )
 
     # Append history when the PV status value, stage or label actually changed
     changed = (prev_status != pv_status_value) or (prev_stage != stage) or (prev_label != label)
+    history_entry = None
     if changed:
         history_entry = {
             "id": str(uuid.uuid4()),
@@ -141,7 +129,130 @@ async def _apply_pv_stage_to_cliente(cliente_id: str, pv_status_value: str, comm
             "created_by_id": actor.id if actor else None,
             "created_by_username": actor.username if actor else "system",
         }
+    return set_doc, history_entry
+
+
+_PV_SNAPSHOT_PROJECTION = {
+    "_id": 0, "id": 1, "post_vendita_status": 1, "post_vendita_stage": 1, "post_vendita_status_label": 1,
+    # bucket dei rollup analytics sub agenzie (cliente_rollups) quando lo stage riscrive lo status
+    "sub_agenzia_id": 1, "created_at": 1,
+}
+
+
+async def _apply_pv_stage_to_cliente(cliente_id: str, pv_status_value: str, commessa_id: Optional[str] = None, actor: Optional[User] = None):
+    """Single source of truth to switch a cliente's post-vendita status.
+    Performs:
+      1. Read previous PV state (status, label, stage) BEFORE any mutation.
+      2. Persist new status + label + stage + updated_at + passed_to_post_vendita=True.
+      3. For stage 'attivato' / 'ko' rewrite cliente.status (final outcome). For 'lavorazione' the
+         anagrafica status is left untouched (only the dot signals it).
+      4. Append an immutable history entry in `cliente_post_vendita_history`.
+    Idempotent on stage/label, but always logs the audit when the status value changes.
+    For many clienti at once use `_apply_pv_stage_bulk` (same semantics, batched I/O).
+    """
+    if not pv_status_value:
+        return
+    cfg = await _find_pv_status_config(pv_status_value, commessa_id)
+    if not cfg:
+        return
+
+    # Snapshot previous state
+    prev = await db.clienti.find_one({"id": cliente_id}, _PV_SNAPSHOT_PROJECTION) or {}
+
+    set_doc, history_entry = _build_pv_transition(cliente_id, prev, pv_status_value, cfg, actor)
+    await db.clienti.update_one(
+        {"id": cliente_id},
+        {"$set": set_doc}
+    )
+    if history_entry:
         await db.cliente_post_vendita_history.insert_one(history_entry)
+    if "status" in set_doc:
+        await cliente_rollups.refresh_for(db, [prev])
+
+
+PV_BULK_CHUNK_SIZE = 5000
+
+
+async def _apply_pv_stage_bulk(cliente_ids: List[str], pv_status_value: str, commessa_id: Optional[str] = None, actor: Optional[User] = None):
+    """Bulk variant of `_apply_pv_stage_to_cliente` for imports.
+    Per chunk: one `$in` read of the previous PV state, transitions computed in memory,
+    one unordered `bulk_write` for the clienti and one `insert_many` for the history entries
+    (only for clienti whose update succeeded).
+    Returns (updated_ids, errors) where errors is a list of {cliente_id, error}.
+    Never raises once a chunk has been written: write failures (per cliente or for a whole
+    chunk) end up in `errors` and the next chunks are still applied."""
+    updated_ids: set = set()
+    errors: List[Dict[str, Any]] = []
+    unique_ids = list(dict.fromkeys(cid for cid in cliente_ids if cid))
+    if not unique_ids or not pv_status_value:
+        return updated_ids, errors
+
+    cfg = await _find_pv_status_config(pv_status_value, commessa_id)
+
+    for start in range(0, len(unique_ids), PV_BULK_CHUNK_SIZE):
+        chunk = unique_ids[start:start + PV_BULK_CHUNK_SIZE]
+        try:
+            prev_by_id = {
+                doc["id"]: doc
+                async for doc in db.clienti.find({"id": {"$in": chunk}}, _PV_SNAPSHOT_PROJECTION)
+            }
+        except Exception as e:
+            logger.error(f"Post vendita bulk: lettura chunk fallita: {e}")
+            errors.extend({"cliente_id": cid, "error": str(e)} for cid in chunk)
+            continue
+        existing = [cid for cid in chunk if cid in prev_by_id]
+        if not cfg:
+            # Same as the single-cliente helper: no active config → nothing to apply
+            updated_ids.update(existing)
+            continue
+
+        ops = []
+        history_by_id = {}
+        status_changed = []
+        for cid in existing:
+            set_doc, history_entry = _build_pv_transition(cid, prev_by_id[cid], pv_status_value, cfg, actor)
+            ops.append(UpdateOne({"id": cid}, {"$set": set_doc}))
+            if "status" in set_doc:
+                status_changed.append(cid)
+            if history_entry:
+                history_by_id[cid] = history_entry
+        if not ops:
+            continue
+
+        failed = set()
+        try:
+            await db.clienti.bulk_write(ops, ordered=False)
+        except BulkWriteError as bwe:
+            for err in bwe.details.get("writeErrors", []):
+                cid = existing[err["index"]]
+                failed.add(cid)
+                errors.append({"cliente_id": cid, "error": err.get("errmsg", "update failed")})
+        except Exception as e:
+            # esito del chunk sconosciuto: tutto il chunk riportato come fallito, si prosegue
+            logger.error(f"Post vendita bulk: bulk_write chunk fallito: {e}")
+            errors.extend({"cliente_id": cid, "error": str(e)} for cid in existing)
+            continue
+
+        history_entries = [h for cid, h in history_by_id.items() if cid not in failed]
+        if history_entries:
+            try:
+                await db.cliente_post_vendita_history.insert_many(history_entries, ordered=False)
+            except BulkWriteError as bwe:
+                for err in bwe.details.get("writeErrors", []):
+                    errors.append({"cliente_id": history_entries[err["index"]]["cliente_id"],
+                                   "error": f"storico non salvato: {err.get('errmsg', 'insert failed')}"})
+            except Exception as e:
+                logger.error(f"Post vendita bulk: storico chunk non salvato: {e}")
+                errors.extend({"cliente_id": h["cliente_id"], "error": f"storico non salvato: {e}"}
+                              for h in history_entries)
+        updated_ids.update(cid for cid in existing if cid not in failed)
+        try:
+            await cliente_rollups.refresh_for(db, [prev_by_id[cid] for cid in status_changed if cid not in failed])
+        except Exception as e:
+            # i rollup vengono comunque riallineati dal job clienti_rollups_rebuild
+            logger.warning(f"Post vendita bulk: refresh rollup fallito: {e}")
+
+    return updated_ids, errors
 
 
 def _require_post_vendita_role(current_user: User):
@@ -792,35 +903,17 @@ async def bulk_import_execute(
 
     import_id = str(uuid.uuid4())
     now = datetime.now(timezone.utc)
-    updated_auto = 0
-    updated_manual = 0
-    errors = []
 
-    # Auto-matched: status update via the helper (atomic + audit history)
-    for item in auto_matched:
-        cid = item.get("cliente_id")
-        if not cid:
-            continue
-        try:
-            exists = await db.clienti.count_documents({"id": cid})
-            if exists:
-                await _apply_pv_stage_to_cliente(cid, status_to_set, commessa_id, actor=current_user)
-                updated_auto += 1
-        except Exception as e:
-            errors.append({"cliente_id": cid, "error": str(e)})
-
-    # Manual-matched: per user choice, ONLY update status (do NOT touch codice_account)
-    for item in manual_matched:
-        cid = item.get("cliente_id")
-        if not cid:
-            continue
-        try:
-            exists = await db.clienti.count_documents({"id": cid})
-            if exists:
-                await _apply_pv_stage_to_cliente(cid, status_to_set, commessa_id, actor=current_user)
-                updated_manual += 1
-        except Exception as e:
-            errors.append({"cliente_id": cid, "error": str(e)})
+    # Auto + manual matched: per user choice, ONLY update status (do NOT touch codice_account).
+    # Applied in bulk (one $in read + one bulk_write + one insert_many per chunk), same audit history.
+    auto_ids = [item.get("cliente_id") for item in auto_matched if item.get("cliente_id")]
+    manual_ids = [item.get("cliente_id") for item in manual_matched if item.get("cliente_id")]
+    # Gli errori di scrittura finiscono in `errors`: il record di import viene sempre salvato
+    updated_ids, errors = await _apply_pv_stage_bulk(
+        auto_ids + manual_ids, status_to_set, commessa_id, actor=current_user
+    )
+    updated_auto = sum(1 for cid in auto_ids if cid in updated_ids)
+    updated_manual = sum(1 for cid in manual_ids if cid in updated_ids)
 
     # Log import
     import_record = {
@@ -38,6 +38,7 @@ from services import (
 from notifications import notify_agent_new_lead, send_email_notification
 from audit import log_client_action
 from models import *  # noqa: F401,F403
+from fast_response import FAST_LIST_RESPONSES, FastJSONResponse, model_projection
 
 router = APIRouter()
 logger = logging.getLogger(__name__)
@@ -442,10 +443,15 @@ async def get_users(unit_id: Optional[str] = None, current_user: User = Depends(
         # Other roles can only see themselves
         query["id"] = current_user.id
     
-    users = await db.users.find(query).to_list(length=None)
+    projection = model_projection(User)
+    users = await db.users.find(query, projection.projection).to_list(length=None)
     
     print(f"✅ Found {len(users)} users from database")
     
+    if FAST_LIST_RESPONSES:
+        # Dati già validati in scrittura: niente modelli Pydantic, codifica orjson
+        return FastJSONResponse(projection.rows(u for u in users if "password_hash" in u))
+    
     # Robust user processing with error handling
     valid_users = []
     for user in users:
@@ -663,6 +669,9 @@ async def update_user(user_id: str, user_update: UserUpdate, current_user: User
         {"id": user_id},
         {"$set": update_data}
     )
+    if "unit_id" in update_data:
+        # indice di disponibilità ACD: unit_id denormalizzato sull'agente (vedi call_queue.py)
+        await db.agent_call_center.update_one({"user_id": user_id}, {"$set": {"unit_id": update_data["unit_id"]}})
     
     updated_user = await db.users.find_one({"id": user_id})
     return User(**updated_user)
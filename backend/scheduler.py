@@ -0,0 +1,461 @@
+"""Scheduler unificato e persistente per il lavoro a tempo (NEW ott 2026).
+
+Prima il lavoro in background era distribuito fra tre meccanismi: loop `asyncio.sleep`
+(reminder lead ogni ora, timeout workflow V2 ogni minuto, riconciliazioni), e la
+collection `scheduled_tasks` del bot di qualificazione, svuotata solo a mano da
+`/lead-qualification/process-timeouts`. Ora tutto passa da `JobScheduler`:
+
+    scheduled_jobs: { id, key, handler, kind: once|interval|cron, run_at, payload,
+                      interval_seconds, cron, status: scheduled|running|completed|failed,
+                      attempts, max_attempts, lease_until, locked_by, last_error,
+                      last_started_at, last_finished_at, last_duration_ms, failures,
+                      expire_at, created_at, updated_at }
+
+- i job si registrano per nome di handler (`register`) e si pianificano una tantum
+  (`schedule_once`) o ricorrenti (`schedule_recurring`, intervallo o cron a 5 campi
+  nel fuso Europe/Rome); `key` rende la pianificazione idempotente;
+- il poller dorme fino al `run_at` più vicino (indice `status, run_at`), senza
+  scansioni periodiche; `schedule_*` lo sveglia se il nuovo job è più vicino;
+- claim atomico con `find_one_and_update` + lease (`SCHEDULER_LEASE_SECONDS`),
+  rinnovato durante l'esecuzione: con più processi ogni job gira una volta sola e un
+  job di un processo morto viene ripreso alla scadenza del lease;
+- al massimo `SCHEDULER_CONCURRENCY` job in esecuzione per processo;
+- errori: retry con backoff esponenziale fino a `max_attempts`, poi `failed` (job una
+  tantum) o prossima occorrenza regolare (ricorrenti, con `failures` e `last_error`);
+- i job una tantum completati scadono dopo `SCHEDULER_COMPLETED_RETENTION_SECONDS`
+  (indice TTL su `expire_at`).
+
+Vista admin: `GET /api/admin/scheduler/jobs` (vedi server.py).
+"""
+import asyncio
+import logging
+import os
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Set
+
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+
+from database import db
+from metrics import BACKGROUND_LOOP_ITEMS, observe_loop
+
+try:
+    from zoneinfo import ZoneInfo
+except ImportError:  # pragma: no cover
+    from backports.zoneinfo import ZoneInfo  # type: ignore
+
+logger = logging.getLogger(__name__)
+
+SCHEDULER_ENABLED = os.environ.get("SCHEDULER_ENABLED", "true").lower() in ("1", "true", "yes")
+SCHEDULER_CONCURRENCY = int(os.environ.get("SCHEDULER_CONCURRENCY", "4"))
+SCHEDULER_LEASE_SECONDS = float(os.environ.get("SCHEDULER_LEASE_SECONDS", "300"))
+# Massimo sonno del poller: limite di ritardo per job pianificati da altri processi
+SCHEDULER_MAX_IDLE_SECONDS = float(os.environ.get("SCHEDULER_MAX_IDLE_SECONDS", "30"))
+SCHEDULER_RETRY_BASE_SECONDS = float(os.environ.get("SCHEDULER_RETRY_BASE_SECONDS", "30"))
+SCHEDULER_RETRY_MAX_SECONDS = float(os.environ.get("SCHEDULER_RETRY_MAX_SECONDS", "3600"))
+SCHEDULER_COMPLETED_RETENTION_SECONDS = int(os.environ.get("SCHEDULER_COMPLETED_RETENTION_SECONDS", str(7 * 86400)))
+
+JOBS_COLLECTION = "scheduled_jobs"
+CRON_TIMEZONE = ZoneInfo("Europe/Rome")
+
+Handler = Callable[[Dict[str, Any]], Awaitable[Any]]
+
+
+def _now() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+def _aware(value: datetime) -> datetime:
+    # Motor ritorna datetime naive (UTC)
+    return value.replace(tzinfo=timezone.utc) if value.tzinfo is None else value
+
+
+# ---- cron (minuto ora giorno-mese mese giorno-settimana) ----
+
+_CRON_RANGES = ((0, 59), (0, 23), (1, 31), (1, 12), (0, 6))
+
+
+def _parse_cron_field(field: str, lo: int, hi: int) -> Set[int]:
+    values: Set[int] = set()
+    for part in field.split(","):
+        step = 1
+        if "/" in part:
+            part, step_s = part.split("/", 1)
+            step = int(step_s)
+        if part in ("*", ""):
+            start, end = lo, hi
+        elif "-" in part:
+            start, end = (int(x) for x in part.split("-", 1))
+        else:
+            start = end = int(part)
+            if step > 1:
+                end = hi
+        if start < lo or end > hi or start > end or step < 1:
+            raise ValueError(f"campo cron non valido: {field!r}")
+        values.update(range(start, end + 1, step))
+    return values
+
+
+def parse_cron(expr: str) -> List[Set[int]]:
+    fields = expr.split()
+    if len(fields) != 5:
+        raise ValueError(f"espressione cron non valida (servono 5 campi): {expr!r}")
+    parsed = [_parse_cron_field(f, lo, hi) for f, (lo, hi) in zip(fields, _CRON_RANGES)]
+    parsed[4] = {d % 7 for d in parsed[4]}  # 7 = domenica come 0
+    return parsed
+
+
+def next_cron_run(expr: str, after: datetime) -> datetime:
+    """Prima occorrenza di `expr` (fuso Europe/Rome) strettamente successiva ad `after`."""
+    minutes, hours, days, months, weekdays = parse_cron(expr)
+    dom_any, dow_any = expr.split()[2] == "*", expr.split()[4] == "*"
+    t = _aware(after).astimezone(CRON_TIMEZONE).replace(second=0, microsecond=0, tzinfo=None) + timedelta(minutes=1)
+    limit = t + timedelta(days=366 * 5)
+    while t < limit:
+        if t.month not in months:
+            t = (t.replace(day=1, hour=0, minute=0) + timedelta(days=32)).replace(day=1)
+            continue
+        dom_ok, dow_ok = t.day in days, (t.isoweekday() % 7) in weekdays
+        # semantica cron classica: se entrambi i campi sono ristretti basta uno dei due
+        day_ok = (dom_ok and dow_ok) if (dom_any or dow_any) else (dom_ok or dow_ok)
+        if not day_ok:
+            t = t.replace(hour=0, minute=0) + timedelta(days=1)
+            continue
+        if t.hour not in hours:
+            t = t.replace(minute=0) + timedelta(hours=1)
+            continue
+        if t.minute not in minutes:
+            t += timedelta(minutes=1)
+            continue
+        return t.replace(tzinfo=CRON_TIMEZONE).astimezone(timezone.utc)
+    raise ValueError(f"nessuna occorrenza per {expr!r}")
+
+
+def next_regular_run(job: Dict[str, Any], after: datetime) -> Optional[datetime]:
+    if job.get("kind") == "interval":
+        return after + timedelta(seconds=float(job["interval_seconds"]))
+    if job.get("kind") == "cron":
+        return next_cron_run(job["cron"], after)
+    return None
+
+
+class SchedulerIndexError(RuntimeError):
+    """Indice unico su `key` non creabile: senza, più worker duplicano i job ricorrenti."""
+
+
+class JobScheduler:
+    """Job store su Mongo + poller con claim atomico ed esecutori limitati."""
+
+    def __init__(
+        self,
+        database,
+        concurrency: int = SCHEDULER_CONCURRENCY,
+        lease_seconds: float = SCHEDULER_LEASE_SECONDS,
+        max_idle: float = SCHEDULER_MAX_IDLE_SECONDS,
+    ):
+        self.db = database
+        self.concurrency = max(1, concurrency)
+        self.lease_seconds = lease_seconds
+        self.max_idle = max_idle
+        self.worker_id = f"{os.getpid()}-{uuid.uuid4().hex[:8]}"
+        self._handlers: Dict[str, Dict[str, Any]] = {}
+        self._running: Dict[str, asyncio.Task] = {}
+        self._poller: Optional[asyncio.Task] = None
+        self._wake: Optional[asyncio.Event] = None
+        self._stopping = False
+        self._indexes_ready = False
+        self.executed = 0
+        self.failed = 0
+        self.retried = 0
+
+    # ---- registrazione / pianificazione ----
+
+    def register(self, handler: str, fn: Handler, max_attempts: int = 5,
+                 retry_base_seconds: float = SCHEDULER_RETRY_BASE_SECONDS):
+        """`fn(payload)` coroutine; se ritorna un int viene contato in BACKGROUND_LOOP_ITEMS."""
+        self._handlers[handler] = {"fn": fn, "max_attempts": max_attempts, "retry_base": retry_base_seconds}
+
+    def _notify(self):
+        if self._wake is not None:
+            self._wake.set()
+
+    async def schedule_once(self, handler: str, run_at: Optional[datetime] = None,
+                            payload: Optional[Dict[str, Any]] = None, key: Optional[str] = None,
+                            max_attempts: Optional[int] = None) -> Optional[str]:
+        """Job una tantum. Con `key` ripianifica il job esistente (se non in esecuzione)."""
+        now = _now()
+        fields = {
+            "handler": handler, "kind": "once", "run_at": run_at or now, "payload": payload or {},
+            "status": "scheduled", "attempts": 0,
+            "max_attempts": max_attempts or self._handlers.get(handler, {}).get("max_attempts", 5),
+            "last_error": None, "expire_at": None, "updated_at": now,
+        }
+        job_id = str(uuid.uuid4())
+        if key is None:
+            await self.db[JOBS_COLLECTION].insert_one({"id": job_id, "key": None, "created_at": now, **fields})
+        else:
+            try:
+                await self.db[JOBS_COLLECTION].update_one(
+                    {"key": key, "status": {"$ne": "running"}},
+                    {"$set": fields, "$setOnInsert": {"id": job_id, "key": key, "created_at": now}},
+                    upsert=True,
+                )
+            except DuplicateKeyError:
+                # già in esecuzione in questo momento: la pianificazione corrente resta valida
+                return None
+        self._notify()
+        return job_id
+
+    async def schedule_recurring(self, handler: str, key: str, interval_seconds: Optional[float] = None,
+                                 cron: Optional[str] = None, payload: Optional[Dict[str, Any]] = None,
+                                 first_run_at: Optional[datetime] = None):
+        """Job ricorrente identificato da `key`. La definizione (intervallo/cron/payload) viene
+        aggiornata a ogni avvio, il prossimo `run_at` già pianificato resta invariato."""
+        if (interval_seconds is None) == (cron is None):
+            raise ValueError("indicare interval_seconds oppure cron")
+        if cron:
+            parse_cron(cron)
+        now = _now()
+        kind = "cron" if cron else "interval"
+        if first_run_at is None:
+            first_run_at = next_cron_run(cron, now) if cron else now
+        await self.db[JOBS_COLLECTION].update_one(
+            {"key": key},
+            {
+                "$set": {"handler": handler, "kind": kind, "interval_seconds": interval_seconds, "cron": cron,
+                         "payload": payload or {},
+                         "max_attempts": self._handlers.get(handler, {}).get("max_attempts", 5),
+                         "updated_at": now},
+                "$setOnInsert": {"id": str(uuid.uuid4()), "key": key, "run_at": first_run_at,
+                                 "status": "scheduled", "attempts": 0, "failures": 0, "created_at": now},
+            },
+            upsert=True,
+        )
+        self._notify()
+
+    async def cancel(self, key: str) -> bool:
+        res = await self.db[JOBS_COLLECTION].delete_one({"key": key, "status": {"$ne": "running"}})
+        return bool(res.deleted_count)
+
+    async def retry_now(self, job_id: str) -> bool:
+        """Admin: rimette in coda subito un job fallito o in attesa."""
+        res = await self.db[JOBS_COLLECTION].update_one(
+            {"id": job_id, "status": {"$in": ["failed", "scheduled"]}},
+            {"$set": {"status": "scheduled", "run_at": _now(), "attempts": 0, "expire_at": None, "updated_at": _now()}},
+        )
+        self._notify()
+        return bool(res.modified_count)
+
+    # ---- ciclo di vita ----
+
+    async def ensure_indexes(self):
+        """Da attendere allo startup prima di ogni `schedule_*`: l'indice unico su `key` è ciò
+        che rende gli upsert per chiave sicuri tra worker concorrenti. Se non si può creare
+        (es. chiavi già duplicate) solleva SchedulerIndexError invece di proseguire."""
+        if self._indexes_ready:
+            return
+        coll = self.db[JOBS_COLLECTION]
+        await coll.create_index([("status", 1), ("run_at", 1)])
+        await coll.create_index("id", unique=True)
+        try:
+            await coll.create_index("key", unique=True, partialFilterExpression={"key": {"$type": "string"}})
+        except Exception as e:
+            raise SchedulerIndexError(
+                f"indice unico su {JOBS_COLLECTION}.key non creato ({e}): rimuovere i job duplicati per key"
+            ) from e
+        await coll.create_index("expire_at", expireAfterSeconds=0)
+        self._indexes_ready = True
+
+    def start(self):
+        if not SCHEDULER_ENABLED or (self._poller is not None and not self._poller.done()):
+            return
+        self._stopping = False
+        self._wake = asyncio.Event()
+        self._poller = asyncio.create_task(self._poll_loop())
+
+    async def stop(self, timeout: float = 10.0):
+        """Shutdown: ferma il poller e attende (entro `timeout`) i job in corso; quelli non
+        terminati restano `running` e vengono ripresi da un altro processo alla scadenza del lease."""
+        self._stopping = True
+        self._notify()
+        if self._poller is not None:
+            self._poller.cancel()
+            try:
+                await self._poller
+            except (asyncio.CancelledError, Exception):
+                pass
+            self._poller = None
+        if self._running:
+            await asyncio.wait(list(self._running.values()), timeout=timeout)
+
+    # ---- poller ----
+
+    async def _poll_loop(self):
+        try:
+            await self.ensure_indexes()
+        except Exception as e:
+            logger.error(f"[SCHEDULER] ensure indexes failed: {e}")
+        while not self._stopping:
+            try:
+                await self.run_pending()
+                delay = await self._seconds_until_next()
+            except Exception as e:
+                logger.warning(f"[SCHEDULER] poll error: {e}")
+                delay = self.max_idle
+            self._wake.clear()
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout=delay)
+            except asyncio.TimeoutError:
+                pass
+
+    async def run_pending(self) -> int:
+        """Reclama ed avvia i job scaduti finché ci sono slot liberi. Ritorna i job avviati."""
+        started = 0
+        while len(self._running) < self.concurrency:
+            job = await self._claim()
+            if job is None:
+                break
+            task = asyncio.create_task(self._execute(job))
+            self._running[job["id"]] = task
+            started += 1
+        return started
+
+    async def _seconds_until_next(self) -> float:
+        if len(self._running) >= self.concurrency:
+            return self.max_idle  # risvegliato da _execute alla fine di un job
+        nxt = await self.db[JOBS_COLLECTION].find_one(
+            {"status": "scheduled", "handler": {"$in": list(self._handlers)}},
+            {"_id": 0, "run_at": 1}, sort=[("run_at", 1)],
+        )
+        if not nxt:
+            return self.max_idle
+        return max(0.0, min(self.max_idle, (_aware(nxt["run_at"]) - _now()).total_seconds()))
+
+    async def _claim(self) -> Optional[Dict[str, Any]]:
+        now = _now()
+        return await self.db[JOBS_COLLECTION].find_one_and_update(
+            {
+                "handler": {"$in": list(self._handlers)},
+                "$or": [
+                    {"status": "scheduled", "run_at": {"$lte": now}},
+                    {"status": "running", "lease_until": {"$lt": now}},  # processo morto
+                ],
+            },
+            {
+                "$set": {"status": "running", "locked_by": self.worker_id,
+                         "lease_until": now + timedelta(seconds=self.lease_seconds),
+                         "last_started_at": now, "updated_at": now},
+                "$inc": {"attempts": 1},
+            },
+            sort=[("run_at", 1)],
+            projection={"_id": 0},
+            return_document=ReturnDocument.AFTER,
+        )
+
+    async def _heartbeat(self, job_id: str):
+        while True:
+            await asyncio.sleep(self.lease_seconds / 3)
+            await self.db[JOBS_COLLECTION].update_one(
+                {"id": job_id, "locked_by": self.worker_id, "status": "running"},
+                {"$set": {"lease_until": _now() + timedelta(seconds=self.lease_seconds)}},
+            )
+
+    async def _execute(self, job: Dict[str, Any]):
+        handler = self._handlers[job["handler"]]
+        heartbeat = asyncio.create_task(self._heartbeat(job["id"]))
+        started = time.perf_counter()
+        try:
+            with observe_loop(job["handler"]):
+                result = await handler["fn"](job.get("payload") or {})
+            if isinstance(result, int) and not isinstance(result, bool) and result:
+                BACKGROUND_LOOP_ITEMS.inc(result, loop=job["handler"])
+            await self._finish(job, started, error=None)
+        except Exception as e:
+            logger.warning(f"[SCHEDULER] job {job['handler']} ({job['id']}) failed: {e}")
+            try:
+                await self._finish(job, started, error=e)
+            except Exception as e2:
+                logger.error(f"[SCHEDULER] could not record failure of {job['id']}: {e2}")
+        finally:
+            heartbeat.cancel()
+            self._running.pop(job["id"], None)
+            self._notify()
+
+    async def _finish(self, job: Dict[str, Any], started: float, error: Optional[Exception]):
+        now = _now()
+        update: Dict[str, Any] = {
+            "locked_by": None, "lease_until": None, "last_finished_at": now, "updated_at": now,
+            "last_duration_ms": round((time.perf_counter() - started) * 1000, 2),
+        }
+        inc: Dict[str, int] = {}
+        recurring = job.get("kind") in ("interval", "cron")
+        attempts = job.get("attempts", 1)
+        if error is None:
+            self.executed += 1
+            update["last_error"] = None
+            if recurring:
+                update.update(status="scheduled", attempts=0, run_at=next_regular_run(job, now))
+            else:
+                update.update(status="completed",
+                              expire_at=now + timedelta(seconds=SCHEDULER_COMPLETED_RETENTION_SECONDS))
+        else:
+            update["last_error"] = str(error)[:1000]
+            base = self._handlers[job["handler"]]["retry_base"]
+            if attempts < job.get("max_attempts", 5):
+                self.retried += 1
+                delay = min(SCHEDULER_RETRY_MAX_SECONDS, base * (2 ** (attempts - 1)))
+                update.update(status="scheduled", run_at=now + timedelta(seconds=delay))
+            else:
+                self.failed += 1
+                inc["failures"] = 1
+                if recurring:
+                    update.update(status="scheduled", attempts=0, run_at=next_regular_run(job, now))
+                else:
+                    update.update(status="failed")
+        change: Dict[str, Any] = {"$set": update}
+        if inc:
+            change["$inc"] = inc
+        # solo se il lease è ancora nostro (altrimenti il job è già stato ripreso altrove)
+        await self.db[JOBS_COLLECTION].update_one({"id": job["id"], "locked_by": self.worker_id}, change)
+
+    # ---- vista admin ----
+
+    async def summary(self) -> Dict[str, Any]:
+        now = _now()
+        counts = {s: 0 for s in ("scheduled", "running", "completed", "failed")}
+        async for row in self.db[JOBS_COLLECTION].aggregate([{"$group": {"_id": "$status", "n": {"$sum": 1}}}]):
+            counts[row["_id"]] = row["n"]
+        due = await self.db[JOBS_COLLECTION].count_documents({"status": "scheduled", "run_at": {"$lte": now}})
+        return {
+            "enabled": SCHEDULER_ENABLED,
+            "worker_id": self.worker_id,
+            "running_here": sorted(self._running),
+            "registered_handlers": sorted(self._handlers),
+            "concurrency": self.concurrency,
+            "counts": {**counts, "due": due},
+            "executed": self.executed,
+            "retried": self.retried,
+            "failed": self.failed,
+        }
+
+    async def list_jobs(self, view: str = "due", limit: int = 100) -> List[Dict[str, Any]]:
+        """view: due | scheduled | running | failed | completed | recurring."""
+        now = _now()
+        queries = {
+            "due": {"status": "scheduled", "run_at": {"$lte": now}},
+            "scheduled": {"status": "scheduled"},
+            "running": {"status": "running"},
+            "failed": {"$or": [{"status": "failed"}, {"kind": {"$ne": "once"}, "last_error": {"$ne": None}}]},
+            "completed": {"status": "completed"},
+            "recurring": {"kind": {"$in": ["interval", "cron"]}},
+        }
+        if view not in queries:
+            raise ValueError(f"vista non valida: {view}")
+        sort = [("last_finished_at", -1)] if view in ("failed", "completed") else [("run_at", 1)]
+        cursor = self.db[JOBS_COLLECTION].find(queries[view], {"_id": 0}).sort(sort).limit(limit)
+        return [job async for job in cursor]
+
+
+job_scheduler = JobScheduler(db)
@@ -15,6 +15,8 @@ from models import *  # noqa: F401,F403
 SECRET_KEY = os.environ.get("SECRET_KEY", "your-secret-key-here-change-in-production")
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 1440  # 24 hours
+# Token di breve durata per EventSource (routes/events.py): non valgono per le altre API
+STREAM_TOKEN_SCOPE = "events"
 
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 security = HTTPBearer()
@@ -46,7 +48,7 @@ async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(s
         token = credentials.credentials
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
         username: str = payload.get("sub")
-        if username is None:
+        if username is None or payload.get("scope") == STREAM_TOKEN_SCOPE:
             raise credentials_exception
     except JWTError:
         raise credentials_exception
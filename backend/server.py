@@ -5,7 +5,9 @@ from fastapi.exceptions import RequestValidationError
 from dotenv import load_dotenv
 from starlette.middleware.cors import CORSMiddleware
 from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo.errors import BulkWriteError
 import os
+import hmac
 import logging
 from pathlib import Path
 from pydantic import BaseModel, Field, EmailStr, ValidationError, model_validator
@@ -18,10 +20,7 @@ from enum import Enum
 import smtplib
 import re
 # Email imports temporarily disabled
-import openpyxl
-from openpyxl.styles import Font, PatternFill, Alignment, Border, Side
 import tempfile
-from emergentintegrations.llm.chat import LlmChat, UserMessage
 import asyncio
 import aiofiles
 # import magic  # Temporaneamente commentato per risolvere problema libmagic
@@ -29,11 +28,6 @@ import httpx
 from typing import BinaryIO
 import io
 # Email imports removed - not used in current implementation
-from twilio.rest import Client
-from twilio.twiml.voice_response import VoiceResponse, Dial, Say, Record, Connect, Stream
-from twilio.request_validator import RequestValidator
-import pandas as pd
-import numpy as np
 # import aioredis  # Temporarily disabled due to version conflict
 import json
 from typing import Union
@@ -54,7 +48,20 @@ from security import (
 )
 
 from models import *  # noqa: F401,F403
-from audit import log_client_action
+from audit import log_client_action, audit_sink
+from document_cache import nextcloud_document_response, get_document_cache
+from slow_queries import slow_query_recorder, list_slow_queries, summarize_slow_queries
+import tag_counts
+import cliente_rollups
+import call_queue
+import call_center_stats
+import conversation_summaries
+import data_retention
+from workflow_stats import read_node_stats, backfill_node_stats, ensure_node_stats
+from workflow_triggers import WorkflowTriggerRegistry, WorkflowDispatchQueue, ensure_trigger_index
+from fast_response import FAST_LIST_RESPONSES, FastJSONResponse, model_projection
+from lazy_imports import lazy_attr, start_warm_up, warmup_status, stats as lazy_import_stats
+from metrics import MetricsMiddleware, registry as metrics_registry
 from services import (
     ARUBA_DRIVE_API_KEY, ARUBA_DRIVE_CLIENT_ID, ARUBA_DRIVE_CLIENT_SECRET, ARUBA_DRIVE_BASE_URL,
     UPLOAD_DIR, MAX_FILE_SIZE, ALLOWED_FILE_TYPES, EMERGENT_LLM_KEY,
@@ -65,7 +72,7 @@ from services import (
     aruba_service, chatbot_service, twilio_service, call_center_service, acd_service,
     whatsapp_service, lead_qualification_bot,
     validate_uploaded_file, save_temporary_file, create_document_record,
-    NextcloudClient,
+    NextcloudClient, close_webdav_session, spool_upload_to_disk, UploadTooLargeError,
 )
 from helpers import (
     ITALIAN_PROVINCES, PROVINCE_TO_CODE, normalize_province_name, provincia_matches,
@@ -78,8 +85,17 @@ from helpers import (
 from notifications import (
     SMTP_HOST, SMTP_PORT, SMTP_USER, SMTP_PASSWORD, SMTP_FROM_EMAIL, SMTP_FROM_NAME,
     send_email_notification, notify_agent_new_lead, send_lead_reminder_email,
-    check_and_send_lead_reminders, start_reminder_scheduler,
+    check_and_send_lead_reminders, run_lead_reminders_job,
 )
+from scheduler import SchedulerIndexError, job_scheduler
+from llm_gateway import llm_gateway
+
+# TwiML (twilio) caricato al primo webhook di chiamata: vedi lazy_imports.py
+VoiceResponse = lazy_attr("twilio.twiml.voice_response", "VoiceResponse")
+Dial = lazy_attr("twilio.twiml.voice_response", "Dial")
+
+# (unit_id, trigger_subtype) -> workflow V2 da avviare sugli eventi lead: vedi workflow_triggers.py
+workflow_trigger_registry = WorkflowTriggerRegistry(db)
 
 
 
@@ -179,6 +195,98 @@ async def trigger_lead_reminders(current_user: User = Depends(get_current_user))
         "result": result
     }
 
+@api_router.get("/admin/audit-sink/metrics")
+async def get_audit_sink_metrics(current_user: User = Depends(get_current_user)):
+    """Metriche del buffer di audit (entry in coda, lag, flush falliti) - Admin only"""
+    if current_user.role != UserRole.ADMIN:
+        raise HTTPException(status_code=403, detail="Solo gli amministratori possono eseguire questa operazione")
+    return audit_sink.metrics()
+
+@api_router.get("/admin/document-cache/stats")
+async def get_document_cache_stats(current_user: User = Depends(get_current_user)):
+    """Statistiche della cache locale dei documenti Nextcloud (hit/miss, byte occupati) - Admin only"""
+    if current_user.role != UserRole.ADMIN:
+        raise HTTPException(status_code=403, detail="Solo gli amministratori possono eseguire questa operazione")
+    return get_document_cache().stats()
+
+@api_router.get("/admin/chat-sessions/stats")
+async def get_chat_session_stats(current_user: User = Depends(get_current_user)):
+    """Cache delle sessioni ChatBot (sessioni/byte in memoria, hit/miss, eviction) - Admin only"""
+    if current_user.role != UserRole.ADMIN:
+        raise HTTPException(status_code=403, detail="Solo gli amministratori possono eseguire questa operazione")
+    return chatbot_service.sessions.stats()
+
+@api_router.get("/admin/llm-gateway")
+async def get_llm_gateway_stats(current_user: User = Depends(get_current_user)):
+    """Chiamate LLM in corso/in attesa e contatori per esito del gateway - Admin only"""
+    if current_user.role != UserRole.ADMIN:
+        raise HTTPException(status_code=403, detail="Solo gli amministratori possono eseguire questa operazione")
+    return llm_gateway.stats()
+
+@api_router.get("/admin/slow-queries")
+async def get_slow_queries(
+    collection: Optional[str] = None,
+    flag: Optional[str] = Query(None, description="COLLSCAN o HIGH_EXAMINED_RATIO"),
+    limit: int = Query(100, ge=1, le=1000),
+    current_user: User = Depends(get_current_user)
+):
+    """Query MongoDB lente catturate (forma del filtro redatta, piano se campionato) - Admin only"""
+    if current_user.role != UserRole.ADMIN:
+        raise HTTPException(status_code=403, detail="Solo gli amministratori possono eseguire questa operazione")
+    return {
+        "recorder": slow_query_recorder.stats(),
+        "queries": await list_slow_queries(db, collection=collection, flag=flag, limit=limit),
+    }
+
+@api_router.get("/admin/slow-queries/summary")
+async def get_slow_queries_summary(
+    limit: int = Query(50, ge=1, le=500),
+    current_user: User = Depends(get_current_user)
+):
+    """Query lente raggruppate per forma, ordinate per tempo totale - Admin only"""
+    if current_user.role != UserRole.ADMIN:
+        raise HTTPException(status_code=403, detail="Solo gli amministratori possono eseguire questa operazione")
+    return await summarize_slow_queries(db, limit=limit)
+
+@api_router.get("/admin/scheduler/jobs")
+async def get_scheduler_jobs(
+    view: str = Query("due", description="due | scheduled | running | failed | completed | recurring"),
+    limit: int = Query(100, ge=1, le=1000),
+    current_user: User = Depends(get_current_user)
+):
+    """Job dello scheduler persistente: riepilogo + job della vista richiesta - Admin only"""
+    if current_user.role != UserRole.ADMIN:
+        raise HTTPException(status_code=403, detail="Solo gli amministratori possono eseguire questa operazione")
+    try:
+        jobs = await job_scheduler.list_jobs(view, limit=limit)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"summary": await job_scheduler.summary(), "jobs": jobs}
+
+@api_router.post("/admin/scheduler/jobs/{job_id}/retry")
+async def retry_scheduler_job(job_id: str, current_user: User = Depends(get_current_user)):
+    """Rimette in esecuzione subito un job fallito o in attesa - Admin only"""
+    if current_user.role != UserRole.ADMIN:
+        raise HTTPException(status_code=403, detail="Solo gli amministratori possono eseguire questa operazione")
+    if not await job_scheduler.retry_now(job_id):
+        raise HTTPException(status_code=404, detail="Job non trovato o in esecuzione")
+    return {"success": True}
+
+@api_router.get("/admin/data-retention")
+async def get_data_retention(current_user: User = Depends(get_current_user)):
+    """Policy di retention/archivio e avanzamento per collection (vedi data_retention.py) - Admin only"""
+    if current_user.role != UserRole.ADMIN:
+        raise HTTPException(status_code=403, detail="Solo gli amministratori possono eseguire questa operazione")
+    return {"policies": await data_retention.retention_overview(db)}
+
+@api_router.post("/admin/data-retention/run")
+async def run_data_retention(current_user: User = Depends(get_current_user)):
+    """Avvia subito un run di retention in background sullo scheduler - Admin only"""
+    if current_user.role != UserRole.ADMIN:
+        raise HTTPException(status_code=403, detail="Solo gli amministratori possono eseguire questa operazione")
+    job_id = await job_scheduler.schedule_once("data_retention", key="data_retention_manual")
+    return {"success": True, "job_id": job_id}
+
 # Admin endpoint to test email sending
 @api_router.post("/admin/test-email")
 async def test_email_sending(
@@ -216,13 +324,16 @@ async def test_email_sending(
 @api_router.get("/leads/{lead_id}/notifications")
 async def get_lead_notifications(
     lead_id: str,
+    include_archive: bool = False,
     current_user: User = Depends(get_current_user)
 ):
-    """Get notification history for a lead"""
-    notifications = await db.lead_notifications.find(
-        {"lead_id": lead_id},
-        {"_id": 0}
-    ).sort("sent_at", -1).to_list(50)
+    """Get notification history for a lead.
+
+    `include_archive`: completa con le notifiche spostate in `lead_notifications_archive` (vedi data_retention.py)"""
+    notifications = await data_retention.find_with_archive(
+        db, "lead_notifications", {"lead_id": lead_id}, "sent_at", 50, include_archive=include_archive,
+        projection={"_id": 0},
+    )
     
     return {
         "success": True,
@@ -1743,6 +1854,7 @@ async def delete_lead_tag(tag_id: str, current_user: User = Depends(get_current_
     await db.leads.update_many({"tags": tag["name"]}, {"$pull": {"tags": tag["name"]}})
     await db.clienti.update_many({"tags": tag["name"]}, {"$pull": {"tags": tag["name"]}})
     await db.lead_tags.delete_one({"id": tag_id})
+    await tag_counts.recount(db, [tag["name"]])
     return {"success": True}
 
 
@@ -1757,32 +1869,8 @@ async def get_lead_tags_usage(current_user: User = Depends(get_current_user)):
         raise HTTPException(status_code=403, detail="Solo admin")
     # Lista tag formali
     tags_meta = await db.lead_tags.find({}, {"_id": 0}).to_list(length=None)
-    meta_by_name = {t["name"]: t for t in tags_meta}
-    # Aggrega da lead e clienti
-    pipeline = [
-        {"$unwind": {"path": "$tags", "preserveNullAndEmptyArrays": False}},
-        {"$group": {"_id": "$tags", "count": {"$sum": 1}}},
-    ]
-    leads_counts = {x["_id"]: x["count"] async for x in db.leads.aggregate(pipeline)}
-    clienti_counts = {x["_id"]: x["count"] async for x in db.clienti.aggregate(pipeline)}
-    all_names = set(meta_by_name.keys()) | set(leads_counts.keys()) | set(clienti_counts.keys())
-    out = []
-    for name in sorted(all_names):
-        meta = meta_by_name.get(name, {})
-        lc = int(leads_counts.get(name, 0))
-        cc = int(clienti_counts.get(name, 0))
-        out.append({
-            "id": meta.get("id"),
-            "name": name,
-            "label": meta.get("label") or name,
-            "color": meta.get("color") or "#64748b",
-            "description": meta.get("description"),
-            "lead_count": lc,
-            "cliente_count": cc,
-            "total_count": lc + cc,
-            "is_orphan": name not in meta_by_name,  # usato ma non definito formalmente
-        })
-    return out
+    # NEW (ott 2026): contatori materializzati in lead_tag_counts (vedi tag_counts.py)
+    return tag_counts.usage_rows(tags_meta, await tag_counts.read_counts(db))
 
 
 @api_router.patch("/lead-tags/{tag_id}")
@@ -1815,6 +1903,7 @@ async def update_lead_tag(tag_id: str, payload: Dict[str, Any] = Body(...), curr
         new = update_doc["name"]
         await db.leads.update_many({"tags": old}, [{"$set": {"tags": {"$map": {"input": "$tags", "as": "t", "in": {"$cond": [{"$eq": ["$$t", old]}, new, "$$t"]}}}}}])
         await db.clienti.update_many({"tags": old}, [{"$set": {"tags": {"$map": {"input": "$tags", "as": "t", "in": {"$cond": [{"$eq": ["$$t", old]}, new, "$$t"]}}}}}])
+        await tag_counts.recount(db, [old, new])
     refreshed = await db.lead_tags.find_one({"id": tag_id}, {"_id": 0})
     return refreshed
 
@@ -1843,6 +1932,7 @@ async def merge_lead_tags(payload: Dict[str, Any] = Body(...), current_user: Use
     await db.clienti.update_many({"tags": src_name}, {"$pull": {"tags": src_name}})
     # Rimuovi il tag sorgente
     await db.lead_tags.delete_one({"id": source_id})
+    await tag_counts.recount(db, [src_name, tgt_name])
     return {"success": True, "merged_from": src_name, "merged_into": tgt_name}
 
 
@@ -1858,12 +1948,7 @@ async def cleanup_orphan_tags(current_user: User = Depends(get_current_user)):
     if current_user.role != UserRole.ADMIN:
         raise HTTPException(status_code=403, detail="Solo admin")
     existing = {t["name"] for t in await db.lead_tags.find({}, {"_id": 0, "name": 1}).to_list(length=None)}
-    pipeline = [{"$unwind": "$tags"}, {"$group": {"_id": "$tags"}}]
-    used = set()
-    async for x in db.leads.aggregate(pipeline):
-        used.add(x["_id"])
-    async for x in db.clienti.aggregate(pipeline):
-        used.add(x["_id"])
+    used = set(await tag_counts.read_counts(db))
     orphans = sorted(used - existing - {None, ""})
     created = []
     skipped = []
@@ -1903,45 +1988,45 @@ async def add_lead_tag(lead_id: str, payload: Dict[str, Any] = Body(...), curren
     res = await db.leads.update_one({"id": lead_id}, {"$addToSet": {"tags": tag_name}})
     if res.matched_count == 0:
         raise HTTPException(status_code=404, detail="Lead non trovato")
+    if res.modified_count:
+        await tag_counts.adjust(db, tag_name, "lead", +1)
     return {"success": True, "tag": tag_name}
 
 
 @api_router.delete("/leads/{lead_id}/tags/{tag_name}")
 async def remove_lead_tag_endpoint(lead_id: str, tag_name: str, current_user: User = Depends(get_current_user)):
-    await db.leads.update_one({"id": lead_id}, {"$pull": {"tags": tag_name}})
+    res = await db.leads.update_one({"id": lead_id}, {"$pull": {"tags": tag_name}})
+    if res.modified_count:
+        await tag_counts.adjust(db, tag_name, "lead", -1)
     return {"success": True}
 
 
 # === STATISTICHE PER NODO (FASE B) ===
 
 @api_router.get("/workflows/{workflow_id}/node-stats")
-async def get_workflow_node_stats(workflow_id: str, current_user: User = Depends(get_current_user)):
-    """Conta quante esecuzioni sono passate per ogni nodo (legge da workflow_executions_v2.history)."""
+async def get_workflow_node_stats(
+    workflow_id: str,
+    days: Optional[int] = Query(None, ge=1, le=3650, description="Solo gli ultimi N giorni"),
+    current_user: User = Depends(get_current_user),
+):
+    """Conta quante esecuzioni sono passate per ogni nodo.
+
+    NEW (ott 2026): legge i contatori giornalieri di `workflow_node_stats` mantenuti
+    dall'executor V2 invece di fare `$unwind` sulla history di tutte le esecuzioni.
+    """
     if current_user.role != UserRole.ADMIN:
         raise HTTPException(status_code=403, detail="Solo admin")
-    pipeline = [
-        {"$match": {"workflow_id": workflow_id}},
-        {"$unwind": "$history"},
-        {"$group": {"_id": "$history.node_id", "count": {"$sum": 1}}},
-    ]
-    counts: Dict[str, int] = {}
-    async for d in db.workflow_executions_v2.aggregate(pipeline):
-        counts[d["_id"]] = d["count"]
-    # Aggiungo anche conteggio per branch (utile per timeout vs reply)
-    branch_pipeline = [
-        {"$match": {"workflow_id": workflow_id}},
-        {"$unwind": "$history"},
-        {"$match": {"history.result.branch": {"$exists": True}}},
-        {"$group": {"_id": {"node": "$history.node_id", "branch": "$history.result.branch"}, "count": {"$sum": 1}}},
-    ]
-    branches: Dict[str, Dict[str, int]] = {}
-    async for d in db.workflow_executions_v2.aggregate(branch_pipeline):
-        nid = d["_id"]["node"]
-        br = d["_id"]["branch"]
-        branches.setdefault(nid, {})[br] = d["count"]
-    total = await db.workflow_executions_v2.count_documents({"workflow_id": workflow_id})
+    stats = await read_node_stats(db, workflow_id, days=days)
     waiting = await db.workflow_executions_v2.count_documents({"workflow_id": workflow_id, "status": "waiting"})
-    return {"workflow_id": workflow_id, "total_executions": total, "waiting": waiting, "node_counts": counts, "branch_counts": branches}
+    return {"workflow_id": workflow_id, "waiting": waiting, **stats}
+
+
+@api_router.post("/admin/workflow-node-stats/backfill")
+async def backfill_workflow_node_stats(workflow_id: Optional[str] = None, current_user: User = Depends(get_current_user)):
+    """Semina i contatori per nodo dalle esecuzioni non ancora conteggiate (idempotente)."""
+    if current_user.role != UserRole.ADMIN:
+        raise HTTPException(status_code=403, detail="Solo gli amministratori possono eseguire questa operazione")
+    return await backfill_node_stats(db, workflow_id=workflow_id)
 
 
 # === TEST MODE simulator (FASE B) ===
@@ -1998,7 +2083,10 @@ async def get_workflows(    skip: int = Query(0, ge=0),
         elif folder_id:
             query["folder_id"] = folder_id
 
-        workflows = await db.workflows.find(query, {"_id": 0}).skip(skip).limit(limit).to_list(length=None)
+        projection = model_projection(Workflow)
+        workflows = await db.workflows.find(query, projection.projection).skip(skip).limit(limit).to_list(length=None)
+        if FAST_LIST_RESPONSES:
+            return FastJSONResponse(projection.rows(workflows))
         return workflows
         
     except Exception as e:
@@ -2038,6 +2126,7 @@ async def create_workflow(
         
         workflow = Workflow(**workflow_data)
         await db.workflows.insert_one(workflow.dict())
+        await workflow_trigger_registry.sync(workflow.id)
         return workflow
         
     except Exception as e:
@@ -2084,6 +2173,7 @@ async def duplicate_workflow(workflow_id: str, current_user: User = Depends(get_
     new_doc["updated_at"] = datetime.now(timezone.utc)
     new_doc["is_published"] = False
     await db.workflows.insert_one(new_doc)
+    await workflow_trigger_registry.sync(new_doc["id"])
     saved = await db.workflows.find_one({"id": new_doc["id"]}, {"_id": 0})
     return Workflow(**saved)
 
@@ -2135,6 +2225,7 @@ async def restore_workflow_version(workflow_id: str, version_id: str, current_us
     update["updated_at"] = datetime.now(timezone.utc)
     update["is_published"] = False  # il ripristino torna in bozza
     await db.workflows.update_one({"id": workflow_id}, {"$set": update})
+    await workflow_trigger_registry.sync(workflow_id)
     saved = await db.workflows.find_one({"id": workflow_id}, {"_id": 0})
     return Workflow(**saved)
 
@@ -2212,6 +2303,8 @@ async def update_workflow(
             {"id": workflow_id},
             {"$set": update_data}
         )
+        # nodi / is_active / unit possono essere cambiati: aggiorna l'indice dei trigger
+        await workflow_trigger_registry.sync(workflow_id)
         
         updated_workflow = await db.workflows.find_one({"id": workflow_id})
 
@@ -2261,6 +2354,7 @@ async def delete_workflow(
         
         # Delete workflow and related data
         await db.workflows.delete_one({"id": workflow_id})
+        await workflow_trigger_registry.sync(workflow_id)
         await db.workflow_nodes.delete_many({"workflow_id": workflow_id})
         await db.node_connections.delete_many({"workflow_id": workflow_id})
         
@@ -2948,6 +3042,7 @@ async def copy_workflow_to_unit(
         )
         
         await db.workflows.insert_one(new_workflow.dict())
+        await workflow_trigger_registry.sync(new_workflow.id)
         
         # Copy workflow nodes
         source_nodes = await db.workflow_nodes.find({"workflow_id": workflow_id}).to_list(length=None)
@@ -3020,7 +3115,7 @@ async def create_agent(agent_data: AgentCreate, current_user: User = Depends(get
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
     
-    agent = AgentCallCenter(**agent_data.dict())
+    agent = AgentCallCenter(**agent_data.dict(), unit_id=user.get("unit_id"))
     await db.agent_call_center.insert_one(agent.dict())
     
     return agent
@@ -3232,13 +3327,12 @@ async def handle_call_status(call_sid: str, request: Request):
         
         # Handle call completion
         if call_status in ["completed", "failed", "busy", "no-answer", "canceled"]:
+            # chiuso mentre era ancora in coda: non va più assegnato
+            await call_queue.remove(db, call_sid)
             call = await call_center_service.get_call(call_sid)
             if call and call.agent_id:
-                # Release agent
-                await call_center_service.update_agent_status(call.agent_id, AgentStatus.AVAILABLE)
-                
-                # Process next call in queue
-                await acd_service.process_queue(call.unit_id)
+                # Release agent: torna disponibile e riceve la prossima chiamata in coda
+                await call_center_service.release_agent(call.agent_id)
         
         return {"status": "ok"}
         
@@ -3292,69 +3386,12 @@ async def get_call_center_dashboard(
     unit_id: Optional[str] = None,
     current_user: User = Depends(get_current_user)
 ):
-    """Get call center dashboard metrics"""
+    """Get call center dashboard metrics (una sola aggregazione, cache condivisa: vedi call_center_stats.py)"""
     if current_user.role != "admin":
         raise HTTPException(status_code=403, detail="Admin access required")
     
     try:
-        current_time = datetime.now(timezone.utc)
-        
-        # Active calls count
-        active_calls = await db.calls.count_documents({
-            "status": {"$in": ["queued", "ringing", "in-progress"]}
-        })
-        
-        # Available agents count
-        available_agents = await db.agent_call_center.count_documents({
-            "status": "available"
-        })
-        
-        # Today's metrics
-        today_start = current_time.replace(hour=0, minute=0, second=0, microsecond=0)
-        
-        calls_today = await db.calls.count_documents({
-            "created_at": {"$gte": today_start}
-        })
-        
-        answered_today = await db.calls.count_documents({
-            "created_at": {"$gte": today_start},
-            "status": "completed"
-        })
-        
-        abandoned_today = await db.calls.count_documents({
-            "created_at": {"$gte": today_start},
-            "status": "abandoned"
-        })
-        
-        # Average wait time calculation (simplified)
-        avg_wait_pipeline = [
-            {"$match": {
-                "created_at": {"$gte": today_start},
-                "answered_at": {"$ne": None}
-            }},
-            {"$addFields": {
-                "wait_time": {"$subtract": ["$answered_at", "$created_at"]}
-            }},
-            {"$group": {
-                "_id": None,
-                "avg_wait_time": {"$avg": "$wait_time"}
-            }}
-        ]
-        
-        wait_time_result = await db.calls.aggregate(avg_wait_pipeline).to_list(length=None)
-        avg_wait_time = wait_time_result[0]["avg_wait_time"] / 1000 if wait_time_result else 0  # Convert to seconds
-        
-        return {
-            "timestamp": current_time.isoformat(),
-            "active_calls": active_calls,
-            "available_agents": available_agents,
-            "calls_today": calls_today,
-            "answered_today": answered_today,
-            "abandoned_today": abandoned_today,
-            "answer_rate": (answered_today / calls_today * 100) if calls_today > 0 else 0,
-            "abandonment_rate": (abandoned_today / calls_today * 100) if calls_today > 0 else 0,
-            "avg_wait_time": round(avg_wait_time, 2)
-        }
+        return await call_center_stats.get_dashboard(db, unit_id)
         
     except Exception as e:
         logging.error(f"Dashboard error: {str(e)}")
@@ -4987,6 +5024,8 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+# Latenza per route e richieste in corso (esposte su /api/metrics)
+app.add_middleware(MetricsMiddleware)
 
 # Configure logging
 logging.basicConfig(
@@ -5506,12 +5545,79 @@ async def startup_event():
         else:
             logging.info("ℹ️ Default commesse already exist")
         
-        # Start lead reminder scheduler
-        asyncio.create_task(start_reminder_scheduler())
-        logging.info("✅ Lead reminder scheduler started")
+        # Start buffered audit-log writer (clienti_logs / lead_history)
+        audit_sink.start()
+        logging.info("✅ Audit sink started")
+
+        # Coda ACD persistente + indice disponibilità agenti (unit_id denormalizzato)
+        asyncio.create_task(call_queue.ensure_call_queue_indexes(db))
+
+        # Cattura query lente + explain campionato (capped collection `slow_queries`)
+        await slow_query_recorder.start(db)
+
+        # Contatori per nodo dei workflow V2: indice + backfill una tantum dalla history
+        asyncio.create_task(ensure_node_stats(db))
+
+        # Indice dei trigger workflow: campo `trigger_subtypes` sui workflow salvati prima
+        asyncio.create_task(ensure_trigger_index(db))
+
+        # Lavoro a tempo sullo scheduler persistente (scheduled_jobs): reminder lead orari,
+        # riconciliazione contatori tag, ricostruzione rollup clienti, riepiloghi conversazioni
+        # WhatsApp, retention/archivio dei log, timeout qualificazione, job di import clienti orfani.
+        # Prima l'indice unico su `key`: con più worker gli upsert concorrenti duplicherebbero i job
+        await job_scheduler.ensure_indexes()
+        job_scheduler.register("lead_reminders", run_lead_reminders_job)
+        job_scheduler.register("tag_counts_reconcile", lambda payload: tag_counts.reconcile_job(db))
+        job_scheduler.register("clienti_rollups_rebuild", lambda payload: cliente_rollups.rebuild_job(db))
+        job_scheduler.register("conversation_summaries_rebuild",
+                               lambda payload: conversation_summaries.rebuild_job(db))
+        job_scheduler.register("data_retention", lambda payload: data_retention.retention_job(db, job_scheduler))
+        job_scheduler.register("qualification_timeout", lead_qualification_bot.run_timeout_job)
+        job_scheduler.register("clienti_import_jobs_reaper", lambda payload: fail_stale_import_jobs())
+        job_scheduler.register("call_queue_dispatch", lambda payload: call_center_service.dispatch_queue(None))
+        job_scheduler.register("qualification_legacy_tasks",
+                               lambda payload: lead_qualification_bot.process_scheduled_tasks())
+        await job_scheduler.schedule_recurring("lead_reminders", "lead_reminders", cron="0 * * * *")
+        await job_scheduler.schedule_recurring(
+            "tag_counts_reconcile", "tag_counts_reconcile",
+            interval_seconds=tag_counts.TAG_COUNTS_RECONCILE_INTERVAL_SECONDS,
+        )
+        await job_scheduler.schedule_recurring(
+            "clienti_rollups_rebuild", "clienti_rollups_rebuild",
+            interval_seconds=cliente_rollups.CLIENTI_ROLLUP_RECONCILE_INTERVAL_SECONDS,
+        )
+        await job_scheduler.schedule_recurring(
+            "conversation_summaries_rebuild", "conversation_summaries_rebuild",
+            interval_seconds=conversation_summaries.CONVERSATION_SUMMARIES_RECONCILE_INTERVAL_SECONDS,
+        )
+        await job_scheduler.schedule_recurring(
+            "data_retention", "data_retention",
+            interval_seconds=data_retention.DATA_RETENTION_INTERVAL_SECONDS,
+        )
+        await job_scheduler.schedule_recurring(
+            "clienti_import_jobs_reaper", "clienti_import_jobs_reaper",
+            interval_seconds=IMPORT_JOB_REAPER_INTERVAL_SECONDS,
+        )
+        # rete di sicurezza della coda ACD: chiamate in attesa con agenti liberi sfuggiti agli eventi
+        await job_scheduler.schedule_recurring(
+            "call_queue_dispatch", "call_queue_dispatch",
+            interval_seconds=call_queue.CALL_QUEUE_SWEEP_INTERVAL_SECONDS,
+        )
+        # vecchie righe `scheduled_tasks`: eseguite se scadute, altrimenti passate allo scheduler
+        await job_scheduler.schedule_once("qualification_legacy_tasks", key="qualification_legacy_tasks")
+        job_scheduler.start()
+        logging.info("✅ Job scheduler started")
+
+        # Pre-carica in background gli SDK opzionali (pandas, twilio, openai, playwright...):
+        # l'app è già pronta, /api/health non li aspetta
+        start_warm_up()
         
         logging.info("✅ Startup event completed successfully")
         
+    except SchedulerIndexError as e:
+        # job duplicati tra worker (reminder inviati due volte): meglio non partire
+        logging.critical(f"❌ Job scheduler: {e}")
+        raise
     except Exception as e:
         # Log error but don't fail startup - allows service to start even if DB seeding fails
         logging.error(f"⚠️ Startup event failed: {e}")
@@ -7239,9 +7345,51 @@ async def delete_document_metadata(
         logging.error(f"Error deleting document {document_id}: {e}")
         raise HTTPException(status_code=500, detail=f"Errore nella cancellazione: {str(e)}")
 
+async def _nextcloud_client_for_entity(entity: dict, document: dict):
+    """Costruisce il NextcloudClient dalla config Aruba Drive della commessa dell'entità.
+    Ritorna (client, nome file su cloud)."""
+    # Get commessa config
+    commessa_id = entity.get("commessa_id")
+    if not commessa_id:
+        raise HTTPException(status_code=500, detail="Commessa non trovata per questo documento")
+    
+    commessa = await db.commesse.find_one({"id": commessa_id})
+    if not commessa or not commessa.get("aruba_drive_config", {}).get("enabled"):
+        raise HTTPException(status_code=500, detail="Configurazione Nextcloud non disponibile")
+    
+    aruba_config = commessa["aruba_drive_config"]
+    
+    # Initialize Nextcloud client
+    base_url = aruba_config.get("url", "https://vkbu5u.arubadrive.com")
+    username = aruba_config.get("username", "crm")
+    password = aruba_config.get("password", "Casilina25")
+    
+    # Get folder name
+    if aruba_config.get("root_folder_path"):
+        folder_name = aruba_config["root_folder_path"].strip('/')
+    else:
+        folder_name = commessa.get('nome', 'Documenti')
+    
+    nextcloud = NextcloudClient(
+        base_url=base_url,
+        username=username,
+        password=password,
+        folder_path=folder_name
+    )
+    
+    # Extract filename from cloud_path (format: /folder/filename)
+    cloud_path = document.get("cloud_path", "")
+    if cloud_path:
+        filename_from_cloud = cloud_path.split('/')[-1]
+    else:
+        filename_from_cloud = document.get("filename", "documento")
+    
+    return nextcloud, filename_from_cloud
+
 @api_router.get("/documents/download/{document_id}")
 async def download_document_by_id(
     document_id: str,
+    request: Request,
     current_user: User = Depends(get_current_user)
 ):
     """Download document by ID from local storage or Nextcloud."""
@@ -7269,55 +7417,15 @@ async def download_document_by_id(
             if not entity:
                 raise HTTPException(status_code=404, detail="Entità associata non trovata")
             
-            # Get commessa config
-            commessa_id = entity.get("commessa_id")
-            if not commessa_id:
-                raise HTTPException(status_code=500, detail="Commessa non trovata per questo documento")
-            
-            commessa = await db.commesse.find_one({"id": commessa_id})
-            if not commessa or not commessa.get("aruba_drive_config", {}).get("enabled"):
-                raise HTTPException(status_code=500, detail="Configurazione Nextcloud non disponibile")
-            
-            aruba_config = commessa["aruba_drive_config"]
-            
-            # Initialize Nextcloud client
-            base_url = aruba_config.get("url", "https://vkbu5u.arubadrive.com")
-            username = aruba_config.get("username", "crm")
-            password = aruba_config.get("password", "Casilina25")
-            
-            # Get folder name
-            if aruba_config.get("root_folder_path"):
-                folder_name = aruba_config["root_folder_path"].strip('/')
-            else:
-                folder_name = commessa.get('nome', 'Documenti')
-            
-            nextcloud = NextcloudClient(
-                base_url=base_url,
-                username=username,
-                password=password,
-                folder_path=folder_name
-            )
-            
-            # Extract filename from cloud_path (format: /folder/filename)
-            cloud_path = document.get("cloud_path", "")
-            if cloud_path:
-                filename_from_cloud = cloud_path.split('/')[-1]
-            else:
-                filename_from_cloud = document.get("filename", "documento")
-            
-            # Download file from Nextcloud
-            success, content = await nextcloud.download_file(filename_from_cloud)
+            nextcloud, filename_from_cloud = await _nextcloud_client_for_entity(entity, document)
             
-            if not success or not content:
-                raise HTTPException(status_code=404, detail="File non trovato su Nextcloud")
-            
-            # Return file as streaming response
-            return Response(
-                content=content,
+            # Stream dal WebDAV (Range / If-None-Match, cache LRU su disco)
+            return await nextcloud_document_response(
+                nextcloud,
+                filename_from_cloud,
+                request,
                 media_type=document.get("file_type", "application/octet-stream"),
-                headers={
-                    "Content-Disposition": f'attachment; filename="{document.get("filename", "documento")}"'
-                }
+                content_disposition=f'attachment; filename="{document.get("filename", "documento")}"',
             )
         else:
             # Local storage
@@ -7354,6 +7462,7 @@ async def download_document_by_id(
 @api_router.get("/documents/{document_id}/download")
 async def download_document(
     document_id: str,
+    request: Request,
     current_user: User = Depends(get_current_user)
 ):
     """Download document with role-based authorization"""
@@ -7419,55 +7528,15 @@ async def download_document(
             if not entity:
                 raise HTTPException(status_code=404, detail="Entità associata non trovata")
             
-            # Get commessa config
-            commessa_id = entity.get("commessa_id")
-            if not commessa_id:
-                raise HTTPException(status_code=500, detail="Commessa non trovata per questo documento")
-            
-            commessa = await db.commesse.find_one({"id": commessa_id})
-            if not commessa or not commessa.get("aruba_drive_config", {}).get("enabled"):
-                raise HTTPException(status_code=500, detail="Configurazione Nextcloud non disponibile")
-            
-            aruba_config = commessa["aruba_drive_config"]
-            
-            # Initialize Nextcloud client
-            base_url = aruba_config.get("url", "https://vkbu5u.arubadrive.com")
-            username = aruba_config.get("username", "crm")
-            password = aruba_config.get("password", "Casilina25")
-            
-            # Get folder name
-            if aruba_config.get("root_folder_path"):
-                folder_name = aruba_config["root_folder_path"].strip('/')
-            else:
-                folder_name = commessa.get('nome', 'Documenti')
-            
-            nextcloud = NextcloudClient(
-                base_url=base_url,
-                username=username,
-                password=password,
-                folder_path=folder_name
-            )
-            
-            # Extract filename from cloud_path (format: /folder/filename)
-            cloud_path = document.get("cloud_path", "")
-            if cloud_path:
-                filename_from_cloud = cloud_path.split('/')[-1]
-            else:
-                filename_from_cloud = document.get("filename", "documento")
-            
-            # Download file from Nextcloud
-            success, content = await nextcloud.download_file(filename_from_cloud)
-            
-            if not success or not content:
-                raise HTTPException(status_code=404, detail="File non trovato su Nextcloud")
+            nextcloud, filename_from_cloud = await _nextcloud_client_for_entity(entity, document)
             
-            # Return file as streaming response
-            return Response(
-                content=content,
+            # Stream dal WebDAV (Range / If-None-Match, cache LRU su disco)
+            return await nextcloud_document_response(
+                nextcloud,
+                filename_from_cloud,
+                request,
                 media_type=document.get("file_type", "application/octet-stream"),
-                headers={
-                    "Content-Disposition": f'attachment; filename="{document.get("filename", "documento")}"'
-                }
+                content_disposition=f'attachment; filename="{document.get("filename", "documento")}"',
             )
         else:
             # Local storage
@@ -7490,6 +7559,7 @@ async def download_document(
 @api_router.get("/documents/{document_id}/view")
 async def view_document(
     document_id: str,
+    request: Request,
     current_user: User = Depends(get_current_user)
 ):
     """View document inline in browser with role-based authorization"""
@@ -7566,55 +7636,15 @@ async def view_document(
             if not entity:
                 raise HTTPException(status_code=404, detail="Entità associata non trovata")
             
-            # Get commessa config
-            commessa_id = entity.get("commessa_id")
-            if not commessa_id:
-                raise HTTPException(status_code=500, detail="Commessa non trovata per questo documento")
-            
-            commessa = await db.commesse.find_one({"id": commessa_id})
-            if not commessa or not commessa.get("aruba_drive_config", {}).get("enabled"):
-                raise HTTPException(status_code=500, detail="Configurazione Nextcloud non disponibile")
-            
-            aruba_config = commessa["aruba_drive_config"]
-            
-            # Initialize Nextcloud client
-            base_url = aruba_config.get("url", "https://vkbu5u.arubadrive.com")
-            username = aruba_config.get("username", "crm")
-            password = aruba_config.get("password", "Casilina25")
-            
-            # Get folder name
-            if aruba_config.get("root_folder_path"):
-                folder_name = aruba_config["root_folder_path"].strip('/')
-            else:
-                folder_name = commessa.get('nome', 'Documenti')
-            
-            nextcloud = NextcloudClient(
-                base_url=base_url,
-                username=username,
-                password=password,
-                folder_path=folder_name
-            )
-            
-            # Extract filename from cloud_path (format: /folder/filename)
-            cloud_path = document.get("cloud_path", "")
-            if cloud_path:
-                filename_from_cloud = cloud_path.split('/')[-1]
-            else:
-                filename_from_cloud = document.get("filename", "documento")
-            
-            # Download file from Nextcloud
-            success, content = await nextcloud.download_file(filename_from_cloud)
-            
-            if not success or not content:
-                raise HTTPException(status_code=404, detail="File non trovato su Nextcloud")
+            nextcloud, filename_from_cloud = await _nextcloud_client_for_entity(entity, document)
             
-            # Return file for inline viewing
-            return Response(
-                content=content,
+            # Stream dal WebDAV (Range / If-None-Match, cache LRU su disco)
+            return await nextcloud_document_response(
+                nextcloud,
+                filename_from_cloud,
+                request,
                 media_type=document.get("file_type", "application/pdf"),
-                headers={
-                    "Content-Disposition": f'inline; filename="{document.get("filename", "documento.pdf")}"'
-                }
+                content_disposition=f'inline; filename="{document.get("filename", "documento.pdf")}"',
             )
         else:
             # Local storage
@@ -7649,6 +7679,67 @@ async def view_document(
         logging.error(f"Error viewing document {document_id}: {e}")
         raise HTTPException(status_code=500, detail=f"Errore nella visualizzazione: {str(e)}")
 
+# NEW (ott 2026): upload multiplo concorrente. I file vengono copiati su disco a blocchi
+# (aiofiles) in parallelo, limitati da un semaforo; i metadati vengono inseriti con un solo
+# insert_many e la replica su Aruba Drive gira in background come job interrogabile.
+MULTI_UPLOAD_MAX_FILE_BYTES = 100 * 1024 * 1024  # 100MB per file
+MULTI_UPLOAD_CONCURRENCY = int(os.environ.get("MULTI_UPLOAD_CONCURRENCY", "4"))
+
+
+async def _persist_multi_upload_file(file: UploadFile, documents_dir: Path, semaphore: asyncio.Semaphore) -> dict:
+    """Salva un singolo file dell'upload multiplo su disco; ritorna l'esito per-file."""
+    if not file.filename:
+        return {"filename": "unknown", "success": False, "error": "Nome file non valido"}
+    async with semaphore:
+        try:
+            file_path, file_size = await spool_upload_to_disk(
+                file, directory=str(documents_dir), prefix="", max_bytes=MULTI_UPLOAD_MAX_FILE_BYTES,
+            )
+        except UploadTooLargeError as e:
+            return {"filename": file.filename, "success": False, "error": str(e)}
+        except Exception as file_error:
+            logger.error(f"Error uploading individual file {file.filename}: {file_error}")
+            return {"filename": file.filename, "success": False, "error": str(file_error)}
+    return {
+        "filename": file.filename,
+        "success": True,
+        "file_path": file_path,
+        "file_size": file_size,
+        "file_type": file.content_type,
+    }
+
+
+async def _run_document_replication_job(job_id: str, entity_type: str, entity_id: str, results: List[dict]):
+    """Replica su Aruba Drive i documenti appena caricati, aggiornando lo stato su `document_upload_jobs`.
+
+    L'automazione carica tutti i file in un'unica selezione (set_input_files): l'esito è
+    uno solo per l'intero batch, quindi lo stato è a livello di job e non per file.
+    """
+    await db.document_upload_jobs.update_one(
+        {"id": job_id},
+        {"$set": {"status": "running", "started_at": datetime.now(timezone.utc)}},
+    )
+    try:
+        replicated = await create_aruba_drive_folder_and_upload(entity_type, entity_id, results)
+        await db.document_upload_jobs.update_one(
+            {"id": job_id},
+            {"$set": {
+                "status": "completed" if replicated else "failed",
+                "completed_at": datetime.now(timezone.utc),
+            }},
+        )
+    except Exception as e:
+        logger.error(f"❌ Document replication job {job_id} failed: {e}")
+        await db.document_upload_jobs.update_one(
+            {"id": job_id},
+            {"$set": {
+                "status": "failed",
+                "error": str(e),
+                "completed_at": datetime.now(timezone.utc),
+            }},
+        )
+
+
 @api_router.post("/documents/upload/multiple")
 async def upload_multiple_documents(
     entity_type: str = Form(...),
@@ -7664,81 +7755,78 @@ async def upload_multiple_documents(
         documents_dir = Path("documents")
         documents_dir.mkdir(exist_ok=True)
         
-        results = []
-        successful_uploads = 0
-        failed_uploads = 0
+        semaphore = asyncio.Semaphore(MULTI_UPLOAD_CONCURRENCY)
+        results = list(await asyncio.gather(
+            *(_persist_multi_upload_file(file, documents_dir, semaphore) for file in files)
+        ))
         
-        for file in files:
-            try:
-                # Basic file validation
-                if not file.filename:
-                    results.append({
-                        "filename": "unknown",
-                        "success": False,
-                        "error": "Nome file non valido"
-                    })
-                    failed_uploads += 1
-                    continue
-                
-                # File size check (100MB limit per file)
-                content = await file.read()
-                if len(content) > 100 * 1024 * 1024:  # 100MB
-                    results.append({
-                        "filename": file.filename,
-                        "success": False,
-                        "error": "File troppo grande (max 100MB)"
-                    })
-                    failed_uploads += 1
-                    continue
-                
-                # Generate unique filename
-                file_extension = Path(file.filename).suffix
-                unique_filename = f"{uuid.uuid4()}{file_extension}"
-                file_path = documents_dir / unique_filename
-                
-                # Save file
-                with open(file_path, "wb") as f:
-                    f.write(content)
-                
-                # Save document metadata
-                document_data = {
-                    "id": str(uuid.uuid4()),
-                    "entity_type": entity_type,
-                    "entity_id": entity_id,
-                    "filename": file.filename,
-                    "file_path": str(file_path),
-                    "file_size": len(content),
-                    "file_type": file.content_type,
-                    "created_by": current_user.id,
-                    "created_at": datetime.now(timezone.utc)
-                }
-                
-                await db.documents.insert_one(document_data)
-                
-                results.append({
-                    "filename": file.filename,
-                    "success": True,
-                    "document_id": document_data["id"],
-                    "file_size": len(content)
-                })
-                successful_uploads += 1
-                
-                # Reset file position for next operation
-                await file.seek(0)
-                
-            except Exception as file_error:
-                logger.error(f"Error uploading individual file {file.filename}: {file_error}")
-                results.append({
-                    "filename": file.filename,
-                    "success": False,
-                    "error": str(file_error)
-                })
-                failed_uploads += 1
+        # Save document metadata (un solo insert_many per tutti i file salvati)
+        documents = []
+        document_results = []
+        for result in results:
+            if not result["success"]:
                 continue
+            document_data = {
+                "id": str(uuid.uuid4()),
+                "entity_type": entity_type,
+                "entity_id": entity_id,
+                "filename": result["filename"],
+                "file_path": result.pop("file_path"),
+                "file_size": result["file_size"],
+                "file_type": result.pop("file_type"),
+                "created_by": current_user.id,
+                "created_at": datetime.now(timezone.utc)
+            }
+            documents.append(document_data)
+            document_results.append(result)
+            result["document_id"] = document_data["id"]
+        
+        if documents:
+            failed_indexes = {}
+            try:
+                await db.documents.insert_many(documents, ordered=False)
+            except BulkWriteError as bwe:
+                failed_indexes = {err["index"]: err.get("errmsg", "Errore salvataggio") for err in bwe.details.get("writeErrors", [])}
+            except Exception as e:
+                failed_indexes = {i: str(e) for i in range(len(documents))}
+            for index, errmsg in failed_indexes.items():
+                result = document_results[index]
+                result.pop("document_id", None)
+                result.update({"success": False, "error": errmsg})
+                try:
+                    os.remove(documents[index]["file_path"])
+                except OSError:
+                    pass
+        
+        for result in results:
+            result.pop("file_path", None)
+            result.pop("file_type", None)
+        successful = [r for r in results if r["success"]]
+        successful_uploads = len(successful)
+        failed_uploads = len(results) - successful_uploads
         
-        # TODO: Integrate with Aruba Drive when credentials are available
+        # Replica cloud in background: la risposta non attende il trasferimento su Aruba Drive
+        replication_job_id = None
         if successful_uploads > 0:
-            await create_aruba_drive_folder_and_upload(entity_type, entity_id, results)
+            replication_job_id = str(uuid.uuid4())
+            await db.document_upload_jobs.insert_one({
+                "id": replication_job_id,
+                "entity_type": entity_type,
+                "entity_id": entity_id,
+                "status": "pending",
+                # documenti inclusi nella replica; l'esito è in `status` (unico per il batch)
+                "files": [{"document_id": r["document_id"], "filename": r["filename"]} for r in successful],
+                "created_by": current_user.id,
+                "created_at": datetime.now(timezone.utc),
+            })
+            saved_ids = {r["document_id"] for r in successful}
+            replication_files = [
+                {"success": True, "document_id": d["id"], "filename": d["filename"], "file_path": d["file_path"]}
+                for d in documents if d["id"] in saved_ids
+            ]
+            asyncio.create_task(_run_document_replication_job(
+                replication_job_id, entity_type, entity_id, replication_files
+            ))
         
         return {
             "success": True,
@@ -7746,7 +7834,8 @@ async def upload_multiple_documents(
             "total_files": len(files),
             "successful_uploads": successful_uploads,
             "failed_uploads": failed_uploads,
-            "results": results
+            "results": results,
+            "replication_job_id": replication_job_id,
         }
         
     except HTTPException:
@@ -7755,9 +7844,20 @@ async def upload_multiple_documents(
         logger.error(f"Error in multiple upload: {e}")
         raise HTTPException(status_code=500, detail=f"Errore nell'upload multiplo: {str(e)}")
 
+
+@api_router.get("/documents/upload/jobs/{job_id}")
+async def get_document_upload_job(job_id: str, current_user: User = Depends(get_current_user)):
+    """Stato della replica cloud di un upload multiplo (unico per tutto il batch)."""
+    job = await db.document_upload_jobs.find_one({"id": job_id}, {"_id": 0})
+    if not job:
+        raise HTTPException(status_code=404, detail="Job non trovato")
+    if current_user.role != UserRole.ADMIN and job.get("created_by") != current_user.id:
+        raise HTTPException(status_code=403, detail="Accesso negato")
+    return job
+
 # Import per Aruba Drive integration
-from playwright.async_api import async_playwright
-from jinja2 import Template
+async_playwright = lazy_attr("playwright.async_api", "async_playwright")
+Template = lazy_attr("jinja2", "Template")
 import base64
 import os
 from pathlib import Path
@@ -9719,6 +9819,7 @@ async def import_workflow_template(
     
     # Insert workflow
     await db.workflows.insert_one(workflow)
+    await workflow_trigger_registry.sync(workflow["id"])
     
     # Remove _id from workflow before returning (not serializable)
     workflow.pop("_id", None)
@@ -9751,10 +9852,41 @@ async def health_check():
         "status": "ok",
         "service": "nureal-crm-backend",
         "database": db_status,
+        # Integrazioni opzionali ancora in caricamento non rendono il servizio "not ready"
+        "integrations": warmup_status(),
         "timestamp": datetime.now(timezone.utc).isoformat()
     }
 
 
+@api_router.get("/admin/lazy-imports")
+async def get_lazy_import_stats(current_user: User = Depends(get_current_user)):
+    """Stato dei moduli caricati in modo lazy e ms spesi al primo import (cold-start)."""
+    if current_user.role != UserRole.ADMIN:
+        raise HTTPException(status_code=403, detail="Solo gli amministratori possono eseguire questa operazione")
+    return lazy_import_stats()
+
+
+# NEW (ott 2026): metriche in formato testo Prometheus (route HTTP, comandi MongoDB,
+# loop in background, chiamate Spoki). Lo scrape presenta come Bearer METRICS_TOKEN
+# oppure il JWT di un amministratore; METRICS_PUBLIC=true rende l'endpoint aperto
+# (solo se raggiungibile esclusivamente dalla rete interna del Prometheus).
+METRICS_TOKEN = os.environ.get("METRICS_TOKEN", "")
+METRICS_PUBLIC = os.environ.get("METRICS_PUBLIC", "false").lower() in ("1", "true", "yes")
+
+
+@app.get("/api/metrics")
+async def prometheus_metrics(request: Request):
+    if not METRICS_PUBLIC:
+        scheme, _, value = (request.headers.get("authorization") or "").partition(" ")
+        if scheme.lower() != "bearer" or not value:
+            raise HTTPException(status_code=401, detail="Not authenticated", headers={"WWW-Authenticate": "Bearer"})
+        if not (METRICS_TOKEN and hmac.compare_digest(value, METRICS_TOKEN)):
+            current_user = await get_current_user(HTTPAuthorizationCredentials(scheme="Bearer", credentials=value))
+            if current_user.role != UserRole.ADMIN:
+                raise HTTPException(status_code=403, detail="Solo gli amministratori possono eseguire questa operazione")
+    return Response(content=metrics_registry.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+
 # --- Route modulari estratte in /routes (refactoring fase 2 - giugno 2026) ---
 from routes.leads_cestino import router as leads_cestino_router  # Cestino Lead (recycle bin)
 from routes.units import router as units_router  # Gestione Units lead
@@ -9777,11 +9909,14 @@ from routes.leads import router as leads_router  # CRUD Lead + webhook ricezione
 from routes.documents import router as documents_router  # Upload e gestione documenti
 from routes.analytics import router as analytics_router  # Analytics agenti/supervisor/referenti, export Excel lead, pivot
 from routes.clienti import router as clienti_router  # CRUD Clienti, filtri, export, import massivo
+from routes.clienti import fail_stale_import_jobs, IMPORT_JOB_REAPER_INTERVAL_SECONDS
+from routes.events import router as events_router  # Canale SSE (conversazioni, lock, lead assegnati, dashboard)
 api_router.include_router(users_auth_router)
 api_router.include_router(leads_router)
 api_router.include_router(documents_router)
 api_router.include_router(analytics_router)
 api_router.include_router(clienti_router)
+api_router.include_router(events_router)
 
 # Include the router in the main app (MUST be after all endpoints are defined)
 # --- Spoki / Chatbot / Calendar routes (modulari) ---
@@ -9791,6 +9926,11 @@ try:
     from workflow_executor import WorkflowExecutorV2
     workflow_executor_v2 = WorkflowExecutorV2(
         db, spoki_service=_spoki_singleton, chatbot_module=_spoki_chatbot, calendar_module=_spoki_chatbot,
+        scheduler=job_scheduler,
+    )
+    # Timeout dei nodi di attesa: un job "workflow_timeout" per sospensione (niente scan al minuto)
+    job_scheduler.register(
+        WorkflowExecutorV2.TIMEOUT_JOB, lambda payload: workflow_executor_v2.resume_timeout(payload["execution_id"]),
     )
     _spoki_router, _calendar_router = build_spoki_routers(db, get_current_user, UserRole)
     # Inietta executor V2 nel router per permettere alle route Spoki di chiamare resume_on_reply
@@ -9800,37 +9940,42 @@ try:
     # NOTE: il messaggio di benvenuto NON parte più automaticamente alla creazione lead:
     # viene inviato dal workflow tramite il nodo "Spoki: Invia Template".
 
+    # Avvii dei workflow sugli eventi lead: coda limitata + worker fissi (no task illimitati)
+    workflow_dispatch_queue = WorkflowDispatchQueue(workflow_executor_v2.start)
+
     async def trigger_workflows_for_lead(lead_dict, trigger_subtype="lead_created"):
-        """Trova tutti i workflow attivi della Unit con un trigger del subtype indicato e avvia V2."""
+        """Trova i workflow attivi della Unit con un trigger del subtype indicato (indice
+        `workflow_trigger_registry`) e ne accoda l'avvio V2."""
         try:
             unit_id = lead_dict.get("commessa_id") or lead_dict.get("unit_id")
-            wf_query = {"is_active": True}
-            if unit_id:
-                wf_query["unit_id"] = unit_id
-            async for wf in db.workflows.find(wf_query, {"_id": 0, "id": 1, "nodes": 1}):
-                has_trigger = any(
-                    (n.get("data") or {}).get("nodeType") == "triggers" and
-                    (n.get("data") or {}).get("nodeSubtype") == trigger_subtype
-                    for n in (wf.get("nodes") or [])
-                )
-                if has_trigger:
-                    asyncio.create_task(workflow_executor_v2.start(wf["id"], {"lead_id": lead_dict.get("id"), "lead": lead_dict}))
+            for wf_id in await workflow_trigger_registry.lookup(unit_id, trigger_subtype):
+                await workflow_dispatch_queue.submit(wf_id, {"lead_id": lead_dict.get("id"), "lead": lead_dict})
         except Exception as e:
             logging.warning(f"[WF-V2] trigger_workflows_for_lead error: {e}")
 
-    async def _wf_v2_timeout_loop():
-        while True:
-            try:
-                await asyncio.sleep(60)
-                n = await workflow_executor_v2.process_timeouts()
-                if n:
-                    logging.info(f"[WF-V2] processed {n} timeouts")
-            except Exception as _e:
-                logging.warning(f"[WF-V2] timeout loop: {_e}")
+    async def _migrate_wf_v2_timeouts():
+        try:
+            n = await workflow_executor_v2.schedule_waiting_timeouts()
+            if n:
+                logging.info(f"[WF-V2] scheduled {n} timeout jobs for waiting executions")
+        except Exception as _e:
+            logging.warning(f"[WF-V2] timeout jobs migration: {_e}")
 
     @app.on_event("startup")
-    async def _start_wf_v2_timeout():
-        asyncio.create_task(_wf_v2_timeout_loop())
+    async def _start_wf_v2_dispatch():
+        asyncio.create_task(_migrate_wf_v2_timeouts())
+        workflow_dispatch_queue.start()
+
+    @app.on_event("shutdown")
+    async def _stop_wf_v2_dispatch():
+        await workflow_dispatch_queue.stop()
+
+    @api_router.get("/admin/workflow-dispatch")
+    async def get_workflow_dispatch_stats(current_user: User = Depends(get_current_user)):
+        """Profondità/throughput della coda di avvio workflow e stato dell'indice dei trigger."""
+        if current_user.role != UserRole.ADMIN:
+            raise HTTPException(status_code=403, detail="Solo gli amministratori possono eseguire questa operazione")
+        return {"queue": workflow_dispatch_queue.stats(), "registry": workflow_trigger_registry.stats()}
 
     logging.info("✅ Spoki/Chatbot/Calendar + WorkflowExecutorV2 mounted")
 except Exception as _spoki_err:
@@ -9842,4 +9987,9 @@ app.include_router(api_router)
 
 @app.on_event("shutdown")
 async def shutdown_db_client():
+    # Scrive le entry di audit ancora in buffer prima di chiudere la connessione
+    await audit_sink.drain()
+    await job_scheduler.stop()
+    await slow_query_recorder.stop()
+    await close_webdav_session()
     client.close()
\ No newline at end of file
@@ -11,24 +11,35 @@ import json
 import logging
 import os
 import re
+import time
 import uuid
 from datetime import datetime, timezone, timedelta
 from typing import List, Optional, Dict, Any
+from urllib.parse import quote
 
 import aiofiles
 import aiohttp
 import httpx
 from fastapi import HTTPException
-from emergentintegrations.llm.chat import LlmChat, UserMessage
-from twilio.rest import Client
-from twilio.twiml.voice_response import VoiceResponse, Dial, Say, Record, Connect, Stream
-from twilio.request_validator import RequestValidator
+from pymongo import ReturnDocument
 
+import call_queue
+from chat_session_cache import CHAT_SESSION_HISTORY_MESSAGES, ChatSessionCache, ChatSessionEntry
+from events import publish_call_center
 from helpers import provincia_matches
+from lazy_imports import lazy_attr, lazy_singleton
+from scheduler import job_scheduler
 
 from database import db
 from models import *  # noqa: F401,F403
 
+# SDK pesanti (litellm, twilio) caricati al primo uso: vedi lazy_imports.py
+LlmChat = lazy_attr("emergentintegrations.llm.chat", "LlmChat")
+UserMessage = lazy_attr("emergentintegrations.llm.chat", "UserMessage")
+Client = lazy_attr("twilio.rest", "Client")
+RequestValidator = lazy_attr("twilio.request_validator", "RequestValidator")
+VoiceResponse = lazy_attr("twilio.twiml.voice_response", "VoiceResponse")
+
 # Aruba Drive Configuration
 ARUBA_DRIVE_API_KEY = os.environ.get("ARUBA_DRIVE_API_KEY", "")
 ARUBA_DRIVE_CLIENT_ID = os.environ.get("ARUBA_DRIVE_CLIENT_ID", "")
@@ -295,6 +306,46 @@ async def save_temporary_file(file) -> str:
     
     return temp_path
 
+UPLOAD_SPOOL_CHUNK_SIZE = 1024 * 1024  # 1MB
+
+
+class UploadTooLargeError(ValueError):
+    """Il file caricato supera il limite di dimensione consentito."""
+
+
+async def spool_upload_to_disk(
+    file,
+    chunk_size: int = UPLOAD_SPOOL_CHUNK_SIZE,
+    directory: Optional[str] = None,
+    prefix: str = "spool_",
+    max_bytes: Optional[int] = None,
+) -> tuple[str, int]:
+    """Copia l'UploadFile su disco a blocchi di dimensione fissa, senza tenerlo tutto in memoria.
+
+    Ritorna (path su disco, dimensione in byte). Il chiamante deve rimuovere il file se temporaneo.
+    Con `max_bytes` la copia si interrompe appena il limite viene superato (UploadTooLargeError)
+    invece di leggere tutto il file.
+    """
+    directory = directory or UPLOAD_DIR
+    file_extension = os.path.splitext(file.filename)[1] if file.filename else '.bin'
+    temp_path = os.path.join(directory, f"{prefix}{uuid.uuid4()}{file_extension}")
+    size = 0
+    try:
+        async with aiofiles.open(temp_path, "wb") as temp_file:
+            while True:
+                chunk = await file.read(chunk_size)
+                if not chunk:
+                    break
+                size += len(chunk)
+                if max_bytes is not None and size > max_bytes:
+                    raise UploadTooLargeError(f"File troppo grande (max {max_bytes // (1024 * 1024)}MB)")
+                await temp_file.write(chunk)
+    except Exception:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+    return temp_path, size
+
 async def create_document_record(document_type: DocumentType, entity_id: str, file, aruba_response: Dict[str, Any], uploaded_by: str) -> Document:
     """Create database record for uploaded document"""
     # Reset file to get accurate size
@@ -336,18 +387,31 @@ aruba_service = ArubadriveService()
 
 # ChatBot Service
 class ChatBotService:
-    def __init__(self):
+    def __init__(self, sessions: Optional[ChatSessionCache] = None):
         self.api_key = EMERGENT_LLM_KEY
-        self.active_chats = {}  # session_id -> LlmChat instance
-    
-    async def get_or_create_chat(self, session_id: str, unit_id: str) -> LlmChat:
-        """Get existing chat or create new one for session"""
-        if session_id not in self.active_chats:
-            # Get unit info for context
-            unit = await db.units.find_one({"id": unit_id})
-            unit_name = unit["name"] if unit else "CRM Unit"
-            
-            system_message = f"""Sei un assistente AI per il sistema CRM di {unit_name}. 
+        # session_id -> ChatSessionEntry (LlmChat), LRU/TTL limitata: vedi chat_session_cache.py
+        self.sessions = sessions if sessions is not None else ChatSessionCache()
+
+    async def _load_history(self, session_id: str) -> List[Dict[str, str]]:
+        """Ultimi CHAT_SESSION_HISTORY_MESSAGES messaggi salvati della sessione (cronologici)."""
+        messages = await db.chat_messages.find(
+            {"session_id": session_id}, {"_id": 0, "message": 1, "message_type": 1}
+        ).sort("created_at", -1).limit(CHAT_SESSION_HISTORY_MESSAGES).to_list(length=None)
+        messages.reverse()
+        return [{"role": m.get("message_type", "user"), "content": m.get("message", "")} for m in messages]
+
+    async def get_session(self, session_id: str, unit_id: str) -> ChatSessionEntry:
+        """Sessione in cache o, dopo un'eviction/riavvio, nuova chat con la storia da
+        `chat_messages` da re-iniettare al primo messaggio."""
+        session = self.sessions.get(session_id)
+        if session is not None:
+            return session
+
+        # Get unit info for context
+        unit = await db.units.find_one({"id": unit_id})
+        unit_name = unit["name"] if unit else "CRM Unit"
+
+        system_message = f"""Sei un assistente AI per il sistema CRM di {unit_name}. 
             Il tuo ruolo è aiutare gli agenti e referenti con:
             - Analisi dei lead e suggerimenti per il follow-up
             - Strategie di comunicazione con i clienti  
@@ -356,26 +420,38 @@ class ChatBotService:
             
             Rispoudi sempre in italiano e mantieni un tono professionale ma amichevole.
             Concentrati su consigli pratici e azionabili per migliorare le performance di vendita."""
-            
-            chat = LlmChat(
-                api_key=self.api_key,
-                session_id=session_id,
-                system_message=system_message
-            ).with_model("openai", "gpt-4o-mini")
-            
-            self.active_chats[session_id] = chat
-        
-        return self.active_chats[session_id]
-    
+
+        chat = LlmChat(
+            api_key=self.api_key,
+            session_id=session_id,
+            system_message=system_message
+        ).with_model("openai", "gpt-4o-mini")
+
+        history = await self._load_history(session_id)
+        size = len(system_message) + sum(len(m["content"]) for m in history)
+        session = ChatSessionEntry(chat, unit_id, size=size, pending_history=history)
+        self.sessions.put(session_id, session)
+        return session
+
+    async def get_or_create_chat(self, session_id: str, unit_id: str) -> LlmChat:
+        """Get existing chat or create new one for session"""
+        return (await self.get_session(session_id, unit_id)).chat
+
     async def send_message(self, session_id: str, unit_id: str, message: str, user_id: str) -> str:
         """Send message to ChatBot and get response"""
         try:
-            chat = await self.get_or_create_chat(session_id, unit_id)
-            
-            user_message = UserMessage(text=message)
-            response = await chat.send_message(user_message)
-            
-            # Save user message to database
+            session = await self.get_session(session_id, unit_id)
+
+            text = message
+            if session.pending_history:
+                # Sessione ricostruita: la storia salvata viene passata inline (come spoki_chatbot)
+                summary = "\n".join(f"{m['role'].upper()}: {m['content']}" for m in session.pending_history)
+                text = f"Storia conversazione recente:\n{summary}\n\nNuovo messaggio:\n{message}"
+            response = await session.chat.send_message(UserMessage(text=text))
+            session.pending_history = []
+            self.sessions.add_bytes(session_id, len(text) + len(response or ""))
+
+            # Save user message and assistant response to database
             user_msg = ChatMessage(
                 unit_id=unit_id,
                 session_id=session_id,
@@ -383,9 +459,6 @@ class ChatBotService:
                 message=message,
                 message_type="user"
             )
-            await db.chat_messages.insert_one(user_msg.dict())
-            
-            # Save assistant response to database
             assistant_msg = ChatMessage(
                 unit_id=unit_id,
                 session_id=session_id,
@@ -393,14 +466,14 @@ class ChatBotService:
                 message=response,
                 message_type="assistant"
             )
-            await db.chat_messages.insert_one(assistant_msg.dict())
-            
+            await db.chat_messages.insert_many([user_msg.dict(), assistant_msg.dict()])
+
             return response
-            
+
         except Exception as e:
             logging.error(f"ChatBot error: {e}")
             return "Mi dispiace, ho riscontrato un errore. Riprova tra poco."
-    
+
     async def get_chat_history(self, session_id: str, limit: int = 50) -> List[ChatMessage]:
         """Get chat history for session"""
         messages = await db.chat_messages.find({
@@ -474,7 +547,8 @@ class TwilioService:
             raise HTTPException(status_code=500, detail="Twilio not configured")
         
         try:
-            call = self.client.calls(call_sid).update(**kwargs)
+            # client REST sincrono: fuori dall'event loop
+            call = await asyncio.to_thread(self.client.calls(call_sid).update, **kwargs)
             return {
                 "call_sid": call.sid,
                 "status": call.status
@@ -490,12 +564,14 @@ class TwilioService:
         return self.request_validator.validate(url, post_vars, signature)
 
 class CallCenterService:
-    """Service for managing call center operations"""
+    """Service for managing call center operations.
+
+    Stato solo su Mongo (niente cache nel processo): chiamate in `calls`, agenti in
+    `agent_call_center`, coda in `call_queue` (vedi call_queue.py), così il call center
+    può girare su più worker."""
     
     def __init__(self):
         self.twilio_service = TwilioService()
-        self.active_calls = {}  # In-memory cache for active calls
-        self.agent_status = {}  # Agent availability cache
     
     async def create_call(self, call_data: CallCreate) -> Call:
         """Create new call record"""
@@ -504,9 +580,7 @@ class CallCenterService:
         
         # Insert into database
         await db.calls.insert_one(call.dict())
-        
-        # Add to active calls cache
-        self.active_calls[call.call_sid] = call
+        publish_call_center(call.unit_id, call_sid=call.call_sid, status=call.status)
         
         return call
     
@@ -524,36 +598,23 @@ class CallCenterService:
             if hasattr(Call, key):
                 update_data[key] = value
         
-        # Update database
-        result = await db.calls.update_one(
+        call_doc = await db.calls.find_one_and_update(
             {"call_sid": call_sid},
-            {"$set": update_data}
+            {"$set": update_data},
+            projection={"_id": 0},
+            return_document=ReturnDocument.AFTER,
         )
-        
-        if result.modified_count > 0:
-            # Update cache
-            if call_sid in self.active_calls:
-                for key, value in update_data.items():
-                    setattr(self.active_calls[call_sid], key, value)
-            
-            # Get updated call
-            call_doc = await db.calls.find_one({"call_sid": call_sid})
-            return Call(**call_doc) if call_doc else None
-        
-        return None
+        if call_doc:
+            publish_call_center(call_doc.get("unit_id"), call_sid=call_sid, status=call_doc.get("status"))
+        return Call(**call_doc) if call_doc else None
     
     async def get_call(self, call_sid: str) -> Optional[Call]:
         """Get call by SID"""
-        # Check cache first
-        if call_sid in self.active_calls:
-            return self.active_calls[call_sid]
-        
-        # Query database
         call_doc = await db.calls.find_one({"call_sid": call_sid})
         return Call(**call_doc) if call_doc else None
     
-    async def assign_agent_to_call(self, call_sid: str, agent_id: str) -> bool:
-        """Assign agent to call"""
+    async def assign_agent_to_call(self, call_sid: str, agent_id: str, reserved: bool = False) -> bool:
+        """Assign agent to call. `reserved`: agente già prenotato da call_queue.reserve_agent."""
         update_result = await db.calls.update_one(
             {"call_sid": call_sid},
             {
@@ -567,39 +628,83 @@ class CallCenterService:
         )
         
         if update_result.modified_count > 0:
-            # Update agent status
-            await self.update_agent_status(agent_id, AgentStatus.BUSY)
+            if not reserved:
+                now = datetime.now(timezone.utc)
+                await db.agent_call_center.update_one(
+                    {"user_id": agent_id},
+                    {"$set": {"status": AgentStatus.BUSY, "last_activity": now, "updated_at": now},
+                     "$inc": {"calls_in_progress": 1}},
+                )
             return True
         
         return False
     
     async def update_agent_status(self, agent_id: str, status: AgentStatus):
-        """Update agent status"""
-        await db.agent_call_center.update_one(
+        """Update agent status. Un agente che torna disponibile riceve subito le chiamate in coda."""
+        now = datetime.now(timezone.utc)
+        agent = await db.agent_call_center.find_one_and_update(
             {"user_id": agent_id},
             {
                 "$set": {
                     "status": status,
-                    "last_activity": datetime.now(timezone.utc),
-                    "updated_at": datetime.now(timezone.utc)
+                    "last_activity": now,
+                    "updated_at": now
                 }
-            }
+            },
+            projection={"_id": 0, "unit_id": 1},
+        )
+        if agent is not None:
+            publish_call_center(agent.get("unit_id"), agent_id=agent_id, agent_status=status)
+        if agent is not None and status == AgentStatus.AVAILABLE:
+            await self.dispatch_queue(agent.get("unit_id"))
+    
+    async def release_agent(self, agent_id: str):
+        """Fine chiamata: libera uno slot dell'agente e lo rimette disponibile (-> dispatch)."""
+        now = datetime.now(timezone.utc)
+        agent = await db.agent_call_center.find_one_and_update(
+            {"user_id": agent_id},
+            [{"$set": {
+                "status": AgentStatus.AVAILABLE.value,
+                "calls_in_progress": {"$max": [0, {"$subtract": [{"$ifNull": ["$calls_in_progress", 0]}, 1]}]},
+                "last_activity": now,
+                "updated_at": now,
+            }}],
+            projection={"_id": 0, "unit_id": 1},
         )
+        if agent is not None:
+            publish_call_center(agent.get("unit_id"), agent_id=agent_id, agent_status=AgentStatus.AVAILABLE)
+            await self.dispatch_queue(agent.get("unit_id"))
+    
+    async def dispatch_queue(self, unit_id: Optional[str]) -> List[tuple]:
+        """Assegna le chiamate in coda della Unit agli agenti disponibili (atomico, multi-worker)."""
+        async def assign(call_sid: str, agent: Dict[str, Any]):
+            await self.assign_agent_to_call(call_sid, agent["user_id"], reserved=True)
+            publish_call_center(agent.get("unit_id"), call_sid=call_sid, agent_id=agent["user_id"],
+                                status=CallStatus.IN_PROGRESS)
+            await self.redirect_call_to_agent(call_sid, agent)
         
-        # Update cache
-        self.agent_status[agent_id] = {
-            "status": status,
-            "last_activity": datetime.now(timezone.utc)
-        }
+        return await call_queue.dispatch(db, unit_id, assign)
+    
+    async def redirect_call_to_agent(self, call_sid: str, agent: Dict[str, Any]) -> bool:
+        """Sposta la chiamata dalla musica di attesa all'interno dell'agente (TwiML <Dial>).
+
+        Senza Twilio configurato o senza `extension` sull'agente la chiamata resta solo
+        assegnata (l'agente la vede dalla dashboard/SSE) e ritorna False."""
+        extension = agent.get("extension")
+        if not self.twilio_service.client or not extension:
+            logging.warning(f"[ACD] call {call_sid} assigned to {agent['user_id']} without redirect "
+                            f"({'no extension' if self.twilio_service.client else 'Twilio not configured'})")
+            return False
+        response = VoiceResponse()
+        response.dial(extension)
+        await self.twilio_service.update_call(call_sid, twiml=str(response))
+        return True
     
     async def get_available_agents(self, unit_id: str = None) -> List[AgentCallCenter]:
         """Get available agents"""
         query = {"status": AgentStatus.AVAILABLE}
         if unit_id:
-            # Get users from this unit
-            unit_users = await db.users.find({"unit_id": unit_id}).to_list(length=None)
-            user_ids = [user["id"] for user in unit_users]
-            query["user_id"] = {"$in": user_ids}
+            query["unit_id"] = unit_id
         
         agents = await db.agent_call_center.find(query).to_list(length=None)
         return [AgentCallCenter(**agent) for agent in agents]
@@ -610,38 +715,30 @@ class CallCenterService:
         unit_id: str = None
     ) -> Optional[AgentCallCenter]:
         """Find best available agent based on skills and load"""
-        available_agents = await self.get_available_agents(unit_id)
-        
-        if not available_agents:
-            return None
-        
-        # Filter by skills if specified
+        query = {"status": AgentStatus.AVAILABLE}
+        if unit_id:
+            query["unit_id"] = unit_id
         if skills_required:
-            qualified_agents = []
-            for agent in available_agents:
-                if all(skill in agent.skills for skill in skills_required):
-                    qualified_agents.append(agent)
-            available_agents = qualified_agents
-        
-        if not available_agents:
-            return None
+            query["skills"] = {"$all": list(skills_required)}
         
         # Select agent with lowest current load (simple algorithm)
-        return min(available_agents, key=lambda a: a.calls_in_progress)
+        agent = await db.agent_call_center.find_one(query, sort=[("calls_in_progress", 1)])
+        return AgentCallCenter(**agent) if agent else None
 
 class ACDService:
-    """Automatic Call Distribution service"""
+    """Automatic Call Distribution service (coda persistente: vedi call_queue.py)"""
     
     def __init__(self):
         self.call_center_service = CallCenterService()
-        self.call_queues = {}  # Queue management
     
     async def route_incoming_call(
         self,
         call_sid: str,
         from_number: str,
         to_number: str,
-        unit_id: str = None
+        unit_id: str = None,
+        priority: int = 1,
+        skills_required: List[str] = None
     ) -> Dict[str, Any]:
         """Route incoming call to available agent"""
         
@@ -650,45 +747,33 @@ class ACDService:
             direction=CallDirection.INBOUND,
             from_number=from_number,
             to_number=to_number,
-            unit_id=unit_id or "default"
+            unit_id=unit_id or "default",
+            priority=priority
         )
         call_data.call_sid = call_sid
-        call = await self.call_center_service.create_call(call_data)
+        await self.call_center_service.create_call(call_data)
         
-        # Find available agent
-        agent = await self.call_center_service.find_best_agent(unit_id=unit_id)
+        # Sempre in coda e poi dispatch: le chiamate già in attesa (o più prioritarie)
+        # vengono servite prima di quella appena arrivata
+        await self.queue_call(call_sid, unit_id, priority=priority, skills_required=skills_required)
+        assigned = dict(await self.call_center_service.dispatch_queue(unit_id))
         
-        if agent:
-            # Assign call to agent
-            await self.call_center_service.assign_agent_to_call(call_sid, agent.user_id)
-            
+        if call_sid in assigned:
             return {
                 "action": "connect_agent",
-                "agent_id": agent.user_id,
+                "agent_id": assigned[call_sid],
                 "call_sid": call_sid
             }
         else:
-            # Queue the call
-            await self.queue_call(call_sid, unit_id)
-            
             return {
                 "action": "queue_call",
                 "message": "All agents are busy. Please hold.",
                 "call_sid": call_sid
             }
     
-    async def queue_call(self, call_sid: str, unit_id: str):
+    async def queue_call(self, call_sid: str, unit_id: str, priority: int = 1, skills_required: List[str] = None):
         """Add call to queue"""
-        queue_name = f"queue_{unit_id}"
-        
-        if queue_name not in self.call_queues:
-            self.call_queues[queue_name] = []
-        
-        self.call_queues[queue_name].append({
-            "call_sid": call_sid,
-            "queued_at": datetime.now(timezone.utc),
-            "unit_id": unit_id
-        })
+        await call_queue.enqueue(db, call_sid, unit_id, priority=priority, skills_required=skills_required)
         
         # Update call status
         await self.call_center_service.update_call_status(
@@ -697,30 +782,9 @@ class ACDService:
             queue_time=datetime.now(timezone.utc)
         )
     
-    async def process_queue(self, unit_id: str = None):
-        """Process queued calls when agents become available"""
-        queue_name = f"queue_{unit_id}" if unit_id else "queue_default"
-        
-        if queue_name not in self.call_queues or not self.call_queues[queue_name]:
-            return
-        
-        # Get next call in queue (FIFO)
-        queued_call = self.call_queues[queue_name].pop(0)
-        call_sid = queued_call["call_sid"]
-        
-        # Find available agent
-        agent = await self.call_center_service.find_best_agent(unit_id=unit_id)
-        
-        if agent:
-            # Assign agent to call
-            await self.call_center_service.assign_agent_to_call(call_sid, agent.user_id)
-            
-            # TODO: Redirect call to agent using Twilio API
-            return True
-        else:
-            # Put back in queue
-            self.call_queues[queue_name].insert(0, queued_call)
-            return False
+    async def process_queue(self, unit_id: str = None) -> bool:
+        """Process queued calls when agents become available (normalmente invocato dagli eventi)"""
+        return bool(await self.call_center_service.dispatch_queue(unit_id))
 
 # WhatsApp Business API Service
 class WhatsAppService:
@@ -1126,9 +1190,10 @@ class WhatsAppService:
             return []
 
 # Initialize Call Center services
-twilio_service = TwilioService()
-call_center_service = CallCenterService()
-acd_service = ACDService()
+# Creati al primo uso: ogni istanza costruisce un client Twilio REST
+twilio_service = lazy_singleton(TwilioService, "twilio_service")
+call_center_service = lazy_singleton(CallCenterService, "call_center_service")
+acd_service = lazy_singleton(ACDService, "acd_service")
 
 # Automated Lead Qualification System (FASE 4)
 class LeadQualificationBot:
@@ -1621,65 +1686,57 @@ Grazie e a presto!"""
             logging.error(f"Error logging bot message for lead {lead_id}: {e}")
     
     async def schedule_timeout_check(self, lead_id: str):
-        """Schedule timeout check for lead (simplified implementation)"""
+        """Pianifica il controllo di timeout a 12 ore (job "qualification_timeout" dello scheduler)"""
         try:
-            # In production, this would use a task queue like Celery or APScheduler
-            # For now, we'll create a scheduled task record
-            timeout_task = {
-                "id": str(uuid.uuid4()),
-                "lead_id": lead_id,
-                "task_type": "qualification_timeout",
-                "scheduled_at": datetime.now(timezone.utc) + timedelta(hours=12),
-                "status": "scheduled",
-                "created_at": datetime.now(timezone.utc)
-            }
-            
-            await db.scheduled_tasks.insert_one(timeout_task)
-            
+            await job_scheduler.schedule_once(
+                "qualification_timeout",
+                datetime.now(timezone.utc) + timedelta(hours=12),
+                {"lead_id": lead_id},
+                key=f"qualification_timeout:{lead_id}",
+            )
         except Exception as e:
             logging.error(f"Error scheduling timeout check for lead {lead_id}: {e}")
-    
+
+    async def run_timeout_job(self, payload: Dict[str, Any]) -> int:
+        """Handler del job "qualification_timeout": gestisce il timeout se la
+        qualificazione è ancora attiva. Gli errori risalgono allo scheduler (retry)."""
+        lead_id = payload["lead_id"]
+        qualification = await db.lead_qualifications.find_one({"lead_id": lead_id, "status": "active"})
+        if not qualification:
+            return 0
+        await self.handle_qualification_timeout(lead_id)
+        return 1
+
     async def process_scheduled_tasks(self):
-        """Process scheduled qualification timeout tasks"""
+        """Svuota la vecchia collection `scheduled_tasks`: i timeout già scaduti vengono
+        eseguiti subito, gli altri passano allo scheduler (stesso run_at)."""
         try:
-            # Find tasks that should be executed
             current_time = datetime.now(timezone.utc)
-            tasks = await db.scheduled_tasks.find({
+            processed_count = 0
+            async for task in db.scheduled_tasks.find({
                 "task_type": "qualification_timeout",
                 "status": "scheduled",
-                "scheduled_at": {"$lte": current_time}
-            }).to_list(length=100)
-            
-            processed_count = 0
-            
-            for task in tasks:
+            }):
                 try:
-                    lead_id = task["lead_id"]
-                    
-                    # Check if qualification is still active
-                    qualification = await db.lead_qualifications.find_one({
-                        "lead_id": lead_id,
-                        "status": "active"
-                    })
-                    
-                    if qualification:
-                        await self.handle_qualification_timeout(lead_id)
-                        processed_count += 1
-                    
-                    # Mark task as completed
+                    scheduled_at = task["scheduled_at"]
+                    if scheduled_at.tzinfo is None:
+                        scheduled_at = scheduled_at.replace(tzinfo=timezone.utc)
+                    if scheduled_at <= current_time:
+                        processed_count += await self.run_timeout_job({"lead_id": task["lead_id"]})
+                        status = "completed"
+                    else:
+                        await job_scheduler.schedule_once(
+                            "qualification_timeout", scheduled_at, {"lead_id": task["lead_id"]},
+                            key=f"qualification_timeout:{task['lead_id']}",
+                        )
+                        status = "migrated"
                     await db.scheduled_tasks.update_one(
                         {"id": task["id"]},
-                        {
-                            "$set": {
-                                "status": "completed",
-                                "processed_at": current_time
-                            }
-                        }
+                        {"$set": {"status": status, "processed_at": current_time}}
                     )
-                    
+
                 except Exception as e:
                     logging.error(f"Error processing timeout task {task['id']}: {e}")
-                    # Mark task as failed
                     await db.scheduled_tasks.update_one(
                         {"id": task["id"]},
                         {
@@ -1690,12 +1747,12 @@ Grazie e a presto!"""
                             }
                         }
                     )
-            
+
             if processed_count > 0:
                 logging.info(f"Processed {processed_count} qualification timeout tasks")
-                
+
             return processed_count
-            
+
         except Exception as e:
             logging.error(f"Error processing scheduled tasks: {e}")
             return 0
@@ -1710,6 +1767,55 @@ lead_qualification_bot = LeadQualificationBot()
 
 
 # Client WebDAV Nextcloud / Aruba Drive (spostato da server.py - fase 3)
+
+# NEW (ott 2026): sessione aiohttp condivisa (connection pooling + keep-alive) per tutte le
+# chiamate WebDAV, invece di una ClientSession nuova per ogni upload/download.
+NEXTCLOUD_POOL_LIMIT = int(os.environ.get("NEXTCLOUD_POOL_LIMIT", "20"))
+# Cache dell'esistenza delle cartelle: evita PROPFIND/MKCOL ad ogni upload
+NEXTCLOUD_FOLDER_CACHE_TTL = int(os.environ.get("NEXTCLOUD_FOLDER_CACHE_TTL", "3600"))
+# Sopra questa soglia si usa l'upload a chunk di Nextcloud (dav/uploads) invece di un singolo PUT
+NEXTCLOUD_CHUNKED_THRESHOLD = int(os.environ.get("NEXTCLOUD_CHUNKED_THRESHOLD", str(10 * 1024 * 1024)))
+NEXTCLOUD_CHUNK_SIZE = int(os.environ.get("NEXTCLOUD_CHUNK_SIZE", str(5 * 1024 * 1024)))
+
+_webdav_session: Optional[aiohttp.ClientSession] = None
+_webdav_folder_cache: Dict[str, float] = {}
+
+
+def get_webdav_session() -> aiohttp.ClientSession:
+    """Ritorna la sessione WebDAV condivisa, creandola al primo utilizzo."""
+    global _webdav_session
+    if _webdav_session is None or _webdav_session.closed:
+        _webdav_session = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(limit=NEXTCLOUD_POOL_LIMIT, keepalive_timeout=60),
+            timeout=aiohttp.ClientTimeout(total=None, sock_connect=15, sock_read=120),
+        )
+    return _webdav_session
+
+
+async def close_webdav_session():
+    """Chiude la sessione WebDAV condivisa (shutdown)."""
+    global _webdav_session
+    if _webdav_session is not None and not _webdav_session.closed:
+        await _webdav_session.close()
+    _webdav_session = None
+
+
+async def _iter_file_chunks(path: str, chunk_size: int, offset: int = 0, length: Optional[int] = None):
+    """Legge un file locale a blocchi (body streaming per aiohttp)."""
+    remaining = length
+    async with aiofiles.open(path, "rb") as f:
+        if offset:
+            await f.seek(offset)
+        while remaining is None or remaining > 0:
+            to_read = chunk_size if remaining is None else min(chunk_size, remaining)
+            chunk = await f.read(to_read)
+            if not chunk:
+                break
+            if remaining is not None:
+                remaining -= len(chunk)
+            yield chunk
+
+
 class NextcloudClient:
     """
     Nextcloud WebDAV client for document management.
@@ -1746,8 +1852,23 @@ class NextcloudClient:
         logging.info(f"🌐 Nextcloud client initialized: {self.base_url}")
         logging.info(f"📁 Target folder: /{self.folder_path}/")
     
-    async def ensure_folder_exists(self, session: aiohttp.ClientSession):
-        """Create folder if doesn't exist"""
+    def _folder_cache_key(self) -> str:
+        return f"{self.username}@{self.webdav_base}/{self.folder_path}"
+
+    def invalidate_folder_cache(self):
+        _webdav_folder_cache.pop(self._folder_cache_key(), None)
+
+    async def ensure_folder_exists(self, session: Optional[aiohttp.ClientSession] = None):
+        """Create folder if doesn't exist (result cached for NEXTCLOUD_FOLDER_CACHE_TTL seconds)"""
+        cache_key = self._folder_cache_key()
+        if _webdav_folder_cache.get(cache_key, 0) > time.monotonic():
+            return True
+        exists = await self._ensure_folder_exists(session or get_webdav_session())
+        if exists:
+            _webdav_folder_cache[cache_key] = time.monotonic() + NEXTCLOUD_FOLDER_CACHE_TTL
+        return exists
+
+    async def _ensure_folder_exists(self, session: aiohttp.ClientSession):
         folder_url = f"{self.webdav_base}/{self.folder_path}"
         
         try:
@@ -1816,62 +1937,165 @@ class NextcloudClient:
             (success: bool, path: str)
         """
         try:
-            async with aiohttp.ClientSession() as session:
-                # Ensure folder exists
-                await self.ensure_folder_exists(session)
-                
-                # Upload file (PUT)
-                file_url = f"{self.webdav_base}/{self.folder_path}/{filename}"
-                
-                logging.info(f"📤 Uploading to: {file_url}")
-                
-                # Merge headers
-                upload_headers = {**self.headers, 'Content-Type': 'application/octet-stream'}
-                
-                async with session.put(
-                    file_url,
-                    data=file_content,
-                    auth=self.auth,
-                    headers=upload_headers
-                ) as resp:
-                    if resp.status in [201, 204]:  # Created or No Content
-                        path = f"/{self.folder_path}/{filename}"
-                        logging.info(f"✅ Upload successful: {path}")
-                        return True, path
-                    else:
-                        error = await resp.text()
-                        logging.error(f"❌ Upload failed ({resp.status}): {error}")
-                        return False, ""
-                        
+            return await self._put_file(lambda: file_content, len(file_content), filename)
         except Exception as e:
             logging.error(f"❌ Upload exception: {e}")
             return False, ""
-    
+
+    async def upload_path(self, local_path: str, filename: str, size: Optional[int] = None) -> tuple[bool, str]:
+        """
+        Upload a file already spooled on disk, streaming it to WebDAV without loading it in memory.
+        Files above NEXTCLOUD_CHUNKED_THRESHOLD use Nextcloud chunked upload (with fallback to a
+        single streaming PUT if the server does not support it).
+
+        Returns:
+            (success: bool, path: str)
+        """
+        if size is None:
+            size = os.path.getsize(local_path)
+        try:
+            if size > NEXTCLOUD_CHUNKED_THRESHOLD:
+                success, path = await self._chunked_upload(local_path, size, filename)
+                if success:
+                    return success, path
+                logging.warning("⚠️ Chunked upload not available, falling back to single streaming PUT")
+            return await self._put_file(
+                lambda: _iter_file_chunks(local_path, NEXTCLOUD_CHUNK_SIZE), size, filename
+            )
+        except Exception as e:
+            logging.error(f"❌ Upload exception: {e}")
+            return False, ""
+
+    async def _put_file(self, body_factory, size: int, filename: str) -> tuple[bool, str]:
+        """Single PUT on the pooled session. `body_factory` rebuilds the body for the retry."""
+        session = get_webdav_session()
+        await self.ensure_folder_exists(session)
+
+        # Upload file (PUT)
+        file_url = f"{self.webdav_base}/{self.folder_path}/{filename}"
+        logging.info(f"📤 Uploading to: {file_url}")
+
+        # Merge headers (Content-Length esplicito: niente transfer-encoding chunked)
+        upload_headers = {**self.headers, 'Content-Type': 'application/octet-stream', 'Content-Length': str(size)}
+
+        for attempt in range(2):
+            async with session.put(file_url, data=body_factory(), auth=self.auth, headers=upload_headers) as resp:
+                if resp.status in [201, 204]:  # Created or No Content
+                    path = f"/{self.folder_path}/{filename}"
+                    logging.info(f"✅ Upload successful: {path}")
+                    return True, path
+                error = await resp.text()
+                if attempt == 0 and resp.status in [404, 409]:
+                    # Cartella rimossa lato cloud dopo essere stata messa in cache: ricrea e riprova
+                    self.invalidate_folder_cache()
+                    await self.ensure_folder_exists(session)
+                    continue
+                logging.error(f"❌ Upload failed ({resp.status}): {error}")
+                return False, ""
+        return False, ""
+
+    async def _chunked_upload(self, local_path: str, size: int, filename: str) -> tuple[bool, str]:
+        """Nextcloud chunked upload v2: MKCOL upload dir → PUT chunks → MOVE .file on destination."""
+        session = get_webdav_session()
+        await self.ensure_folder_exists(session)
+
+        dav_root = f"{self.base_url}/remote.php/dav"
+        upload_dir = f"{dav_root}/uploads/{quote(self.username)}/{uuid.uuid4().hex}"
+        destination = f"{dav_root}/files/{quote(self.username)}/{quote(self.folder_path)}/{quote(filename)}"
+        dav_headers = {**self.headers, 'Destination': destination, 'OC-Total-Length': str(size)}
+
+        async with session.request('MKCOL', upload_dir, auth=self.auth, headers=dav_headers) as resp:
+            if resp.status != 201:
+                logging.info(f"ℹ️ Chunked upload MKCOL returned {resp.status}")
+                return False, ""
+
+        try:
+            chunk_number = 0
+            for offset in range(0, size, NEXTCLOUD_CHUNK_SIZE):
+                chunk_number += 1
+                length = min(NEXTCLOUD_CHUNK_SIZE, size - offset)
+                async with session.put(
+                    f"{upload_dir}/{chunk_number:05d}",
+                    data=_iter_file_chunks(local_path, 256 * 1024, offset=offset, length=length),
+                    auth=self.auth,
+                    headers={**dav_headers, 'Content-Length': str(length)},
+                ) as resp:
+                    if resp.status not in [201, 204]:
+                        logging.error(f"❌ Chunk {chunk_number} failed ({resp.status})")
+                        raise RuntimeError(f"chunk {chunk_number} upload failed: {resp.status}")
+
+            async with session.request('MOVE', f"{upload_dir}/.file", auth=self.auth, headers=dav_headers) as resp:
+                if resp.status in [201, 204]:
+                    path = f"/{self.folder_path}/{filename}"
+                    logging.info(f"✅ Chunked upload successful: {path} ({chunk_number} chunks)")
+                    return True, path
+                logging.error(f"❌ Chunked upload MOVE failed ({resp.status})")
+                raise RuntimeError(f"chunked upload assembly failed: {resp.status}")
+        except Exception:
+            # Best effort: rimuovi i chunk parziali
+            try:
+                async with session.delete(upload_dir, auth=self.auth, headers=self.headers):
+                    pass
+            except Exception:
+                pass
+            raise
+    
+    def file_url(self, filename: str) -> str:
+        return f"{self.webdav_base}/{self.folder_path}/{filename}"
+
     async def download_file(self, filename: str) -> tuple[bool, bytes]:
         """
-        Download file from Nextcloud
+        Download file from Nextcloud (whole content in memory; for documents served to
+        the browser use `stat_file` + `open_file_stream`)
         
         Returns:
             (success: bool, content: bytes)
         """
         try:
-            async with aiohttp.ClientSession() as session:
-                file_url = f"{self.webdav_base}/{self.folder_path}/{filename}"
-                
-                logging.info(f"📥 Downloading from: {file_url}")
-                
-                async with session.get(file_url, auth=self.auth, headers=self.headers) as resp:
-                    if resp.status == 200:
-                        content = await resp.read()
-                        logging.info(f"✅ Download successful: {len(content)} bytes")
-                        return True, content
-                    else:
-                        logging.error(f"❌ Download failed: {resp.status}")
-                        return False, b""
-                        
+            session = get_webdav_session()
+            file_url = self.file_url(filename)
+
+            logging.info(f"📥 Downloading from: {file_url}")
+
+            async with session.get(file_url, auth=self.auth, headers=self.headers) as resp:
+                if resp.status == 200:
+                    content = await resp.read()
+                    logging.info(f"✅ Download successful: {len(content)} bytes")
+                    return True, content
+                else:
+                    logging.error(f"❌ Download failed: {resp.status}")
+                    return False, b""
+
         except Exception as e:
             logging.error(f"❌ Download exception: {e}")
             return False, b""
+
+    async def stat_file(self, filename: str) -> Optional[Dict[str, Any]]:
+        """
+        HEAD on the file: returns {etag, size, content_type} or None if not found.
+        """
+        session = get_webdav_session()
+        async with session.head(self.file_url(filename), auth=self.auth, headers=self.headers) as resp:
+            if resp.status != 200:
+                logging.error(f"❌ Stat failed ({resp.status}): {filename}")
+                return None
+            size = resp.headers.get("Content-Length")
+            return {
+                "etag": resp.headers.get("ETag"),
+                "size": int(size) if size and size.isdigit() else None,
+                "content_type": resp.headers.get("Content-Type"),
+            }
+
+    async def open_file_stream(self, filename: str, range_header: Optional[str] = None) -> aiohttp.ClientResponse:
+        """
+        GET on the pooled session without reading the body: the caller iterates
+        `resp.content.iter_chunked(...)` and must call `resp.release()` when done.
+        """
+        headers = dict(self.headers)
+        if range_header:
+            headers["Range"] = range_header
+        session = get_webdav_session()
+        return await session.get(self.file_url(filename), auth=self.auth, headers=headers)
     
     async def list_files(self) -> list[dict]:
         """
@@ -0,0 +1,341 @@
+"""Cattura delle query MongoDB lente con campionamento di `explain` (NEW ott 2026).
+
+`SlowQueryRecorder` è un CommandListener PyMongo registrato sul client Motor condiviso
+(`database.py`). Ogni comando oltre `SLOW_QUERY_THRESHOLD_MS` viene registrato con la
+*forma* del filtro (nomi dei campi e operatori, valori sostituiti da "?"), così nella
+collection non finiscono dati dei clienti. Per una frazione campionata delle letture
+(`find`/`aggregate`/`count`/`distinct`) un worker in background esegue
+`explain("executionStats")` e segnala COLLSCAN e rapporti documenti esaminati/ritornati
+elevati. I risultati vanno nella capped collection `slow_queries`, consultabile da
+`GET /api/admin/slow-queries` (elenco) e `/api/admin/slow-queries/summary` (per forma).
+
+I listener vengono invocati dai thread di Motor: il passaggio al worker avviene con
+`loop.call_soon_threadsafe` su una coda limitata; se la coda è piena il record viene
+scartato (e contato) invece di rallentare le query.
+"""
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import random
+import threading
+import uuid
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional, Tuple
+
+from pymongo import monitoring
+
+SLOW_QUERY_CAPTURE_ENABLED = os.environ.get("SLOW_QUERY_CAPTURE_ENABLED", "true").lower() == "true"
+SLOW_QUERY_THRESHOLD_MS = float(os.environ.get("SLOW_QUERY_THRESHOLD_MS", "250"))
+SLOW_QUERY_EXPLAIN_SAMPLE_RATE = float(os.environ.get("SLOW_QUERY_EXPLAIN_SAMPLE_RATE", "0.1"))
+# docsExamined / nReturned oltre questa soglia (con almeno SLOW_QUERY_MIN_EXAMINED documenti
+# esaminati) indica un indice mancante o poco selettivo
+SLOW_QUERY_EXAMINED_RATIO = float(os.environ.get("SLOW_QUERY_EXAMINED_RATIO", "100"))
+SLOW_QUERY_MIN_EXAMINED = int(os.environ.get("SLOW_QUERY_MIN_EXAMINED", "1000"))
+SLOW_QUERY_COLLECTION = "slow_queries"
+SLOW_QUERY_CAPPED_BYTES = int(os.environ.get("SLOW_QUERY_CAPPED_BYTES", str(64 * 1024 * 1024)))
+SLOW_QUERY_QUEUE_SIZE = 1000
+
+EXPLAINABLE_COMMANDS = frozenset({"find", "aggregate", "count", "distinct"})
+CAPTURED_COMMANDS = EXPLAINABLE_COMMANDS | {"update", "delete", "findAndModify"}
+# Campi del comando originale da riportare nell'explain (niente lsid/txnNumber/$clusterTime)
+_EXPLAIN_FIELDS = {
+    "find": ("find", "filter", "projection", "sort", "skip", "limit", "hint", "collation"),
+    "aggregate": ("aggregate", "pipeline", "hint", "collation"),
+    "count": ("count", "query", "skip", "limit", "hint", "collation"),
+    "distinct": ("distinct", "key", "query", "collation"),
+}
+
+
+def redact_shape(value: Any) -> Any:
+    """Forma di un filtro/pipeline: conserva chiavi e operatori, sostituisce i valori con "?".
+
+    Le liste di scalari (es. `$in`) collassano in ["?"], così filtri con liste di lunghezza
+    diversa hanno la stessa forma.
+    """
+    if isinstance(value, dict):
+        return {str(k): redact_shape(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        items = [redact_shape(v) for v in value]
+        if all(i == "?" for i in items):
+            return ["?"] if items else []
+        return items
+    return "?"
+
+
+def _command_filter(command_name: str, command) -> Any:
+    if command_name == "find":
+        return command.get("filter") or {}
+    if command_name == "aggregate":
+        return command.get("pipeline") or []
+    if command_name in ("count", "distinct", "findAndModify"):
+        return command.get("query") or {}
+    if command_name == "update":
+        updates = command.get("updates") or [{}]
+        return updates[0].get("q") or {}
+    if command_name == "delete":
+        deletes = command.get("deletes") or [{}]
+        return deletes[0].get("q") or {}
+    return {}
+
+
+def shape_hash(collection: str, op: str, shape: Any, sort_shape: Any = None) -> str:
+    payload = json.dumps([collection, op, shape, sort_shape], sort_keys=True, default=str)
+    return hashlib.sha1(payload.encode("utf-8")).hexdigest()[:16]
+
+
+def _walk(node: Any):
+    if isinstance(node, dict):
+        yield node
+        for v in node.values():
+            yield from _walk(v)
+    elif isinstance(node, list):
+        for v in node:
+            yield from _walk(v)
+
+
+def analyze_explain(explain: Dict[str, Any]) -> Dict[str, Any]:
+    """Riassume un output di explain(executionStats): stage, indici usati, documenti esaminati."""
+    stages: List[str] = []
+    index_names: List[str] = []
+    execution_stats = None
+    for node in _walk(explain):
+        stage = node.get("stage")
+        if isinstance(stage, str) and stage not in stages:
+            stages.append(stage)
+        index_name = node.get("indexName")
+        if isinstance(index_name, str) and index_name not in index_names:
+            index_names.append(index_name)
+        if execution_stats is None and isinstance(node.get("executionStats"), dict):
+            execution_stats = node["executionStats"]
+
+    stats = execution_stats or {}
+    docs_examined = int(stats.get("totalDocsExamined", 0) or 0)
+    keys_examined = int(stats.get("totalKeysExamined", 0) or 0)
+    n_returned = int(stats.get("nReturned", 0) or 0)
+    ratio = docs_examined / max(n_returned, 1)
+
+    flags = []
+    if "COLLSCAN" in stages:
+        flags.append("COLLSCAN")
+    if docs_examined >= SLOW_QUERY_MIN_EXAMINED and ratio >= SLOW_QUERY_EXAMINED_RATIO:
+        flags.append("HIGH_EXAMINED_RATIO")
+    return {
+        "stages": stages,
+        "index_names": index_names,
+        "docs_examined": docs_examined,
+        "keys_examined": keys_examined,
+        "n_returned": n_returned,
+        "examined_ratio": round(ratio, 2),
+        "execution_time_ms": stats.get("executionTimeMillis"),
+        "flags": flags,
+    }
+
+
+class SlowQueryRecorder(monitoring.CommandListener):
+    """Listener PyMongo che registra i comandi lenti e ne campiona l'explain."""
+
+    def __init__(
+        self,
+        threshold_ms: float = SLOW_QUERY_THRESHOLD_MS,
+        sample_rate: float = SLOW_QUERY_EXPLAIN_SAMPLE_RATE,
+        enabled: bool = SLOW_QUERY_CAPTURE_ENABLED,
+    ):
+        self.threshold_ms = threshold_ms
+        self.sample_rate = sample_rate
+        self.enabled = enabled
+        self.db = None
+        self._pending: Dict[Tuple, Tuple[str, str, str, Any]] = {}
+        self._pending_lock = threading.Lock()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._queue: Optional[asyncio.Queue] = None
+        self._worker: Optional[asyncio.Task] = None
+        self.captured = 0
+        self.explained = 0
+        self.dropped = 0
+
+    # ---- ciclo di vita ----
+
+    async def start(self, database):
+        """Crea la capped collection (se serve) e avvia il worker. Da chiamare allo startup."""
+        if not self.enabled or self._worker is not None:
+            return
+        self.db = database
+        try:
+            if SLOW_QUERY_COLLECTION not in await database.list_collection_names():
+                await database.create_collection(SLOW_QUERY_COLLECTION, capped=True, size=SLOW_QUERY_CAPPED_BYTES)
+        except Exception as e:
+            logging.warning(f"[SLOW-QUERY] could not create capped collection: {e}")
+        self._loop = asyncio.get_running_loop()
+        self._queue = asyncio.Queue(maxsize=SLOW_QUERY_QUEUE_SIZE)
+        self._worker = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._worker is not None:
+            self._worker.cancel()
+            try:
+                await self._worker
+            except (asyncio.CancelledError, Exception):
+                pass
+            self._worker = None
+
+    # ---- CommandListener (thread di Motor) ----
+
+    @staticmethod
+    def _event_key(event) -> Tuple:
+        return (event.request_id, event.connection_id, getattr(event, "operation_id", None))
+
+    def started(self, event):
+        if not self.enabled or self._queue is None or event.command_name not in CAPTURED_COMMANDS:
+            return
+        collection = event.command.get(event.command_name)
+        if not isinstance(collection, str) or collection == SLOW_QUERY_COLLECTION:
+            return
+        with self._pending_lock:
+            self._pending[self._event_key(event)] = (event.database_name, collection, event.command_name, event.command)
+
+    def succeeded(self, event):
+        self._finish(event, failed=False)
+
+    def failed(self, event):
+        self._finish(event, failed=True)
+
+    def _finish(self, event, failed: bool):
+        if self._queue is None:
+            return
+        with self._pending_lock:
+            pending = self._pending.pop(self._event_key(event), None)
+        if pending is None:
+            return
+        duration_ms = event.duration_micros / 1000
+        if duration_ms < self.threshold_ms:
+            return
+        database_name, collection, op, command = pending
+        record = self._build_record(database_name, collection, op, command, duration_ms, failed)
+        explain_command = None
+        if op in EXPLAINABLE_COMMANDS and not failed and random.random() < self.sample_rate:
+            explain_command = {k: command[k] for k in _EXPLAIN_FIELDS[op] if k in command}
+            if op == "aggregate":
+                if any(("$out" in s or "$merge" in s) for s in explain_command.get("pipeline", []) if isinstance(s, dict)):
+                    explain_command = None
+                else:
+                    explain_command["cursor"] = {}
+        try:
+            self._loop.call_soon_threadsafe(self._enqueue, record, database_name, explain_command)
+        except RuntimeError:
+            # Event loop chiuso (shutdown)
+            pass
+
+    def _enqueue(self, record, database_name, explain_command):
+        try:
+            self._queue.put_nowait((record, database_name, explain_command))
+            self.captured += 1
+        except asyncio.QueueFull:
+            self.dropped += 1
+
+    @staticmethod
+    def _build_record(database_name, collection, op, command, duration_ms, failed) -> Dict[str, Any]:
+        shape = redact_shape(_command_filter(op, command))
+        sort_shape = redact_shape(command.get("sort")) if op == "find" and command.get("sort") else None
+        return {
+            "id": str(uuid.uuid4()),
+            "ts": datetime.now(timezone.utc),
+            "database": database_name,
+            "collection": collection,
+            "op": op,
+            "duration_ms": round(duration_ms, 2),
+            "failed": failed,
+            "shape": json.dumps(shape, sort_keys=True),
+            "sort": json.dumps(sort_shape, sort_keys=True) if sort_shape else None,
+            "shape_hash": shape_hash(collection, op, shape, sort_shape),
+            "explained": False,
+            "plan": None,
+            "flags": [],
+        }
+
+    # ---- worker (event loop) ----
+
+    async def _run(self):
+        while True:
+            record, database_name, explain_command = await self._queue.get()
+            try:
+                if explain_command is not None:
+                    await self._explain(record, database_name, explain_command)
+                await self.db[SLOW_QUERY_COLLECTION].insert_one(record)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logging.warning(f"[SLOW-QUERY] could not record slow query: {e}")
+
+    async def _explain(self, record, database_name, explain_command):
+        try:
+            explain = await self.db.client[database_name].command(
+                {"explain": explain_command, "verbosity": "executionStats"}
+            )
+        except Exception as e:
+            record["explain_error"] = str(e)
+            return
+        plan = analyze_explain(explain)
+        record.update({"explained": True, "plan": plan, "flags": plan["flags"]})
+        self.explained += 1
+        if plan["flags"]:
+            logging.warning(
+                f"[SLOW-QUERY] {record['collection']}.{record['op']} {record['duration_ms']}ms "
+                f"{','.join(plan['flags'])} shape={record['shape']}"
+            )
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "enabled": self.enabled,
+            "threshold_ms": self.threshold_ms,
+            "sample_rate": self.sample_rate,
+            "captured": self.captured,
+            "explained": self.explained,
+            "dropped": self.dropped,
+            "queued": self._queue.qsize() if self._queue is not None else 0,
+        }
+
+
+slow_query_recorder = SlowQueryRecorder()
+
+
+async def list_slow_queries(database, collection: Optional[str] = None, flag: Optional[str] = None,
+                            limit: int = 100) -> List[Dict[str, Any]]:
+    query: Dict[str, Any] = {}
+    if collection:
+        query["collection"] = collection
+    if flag:
+        query["flags"] = flag
+    cursor = database[SLOW_QUERY_COLLECTION].find(query, {"_id": 0}).sort("$natural", -1).limit(limit)
+    return await cursor.to_list(length=limit)
+
+
+async def summarize_slow_queries(database, limit: int = 50) -> List[Dict[str, Any]]:
+    """Aggrega i record per forma di query: occorrenze, durata media/massima, flag visti."""
+    pipeline = [
+        {"$group": {
+            "_id": "$shape_hash",
+            "collection": {"$first": "$collection"},
+            "op": {"$first": "$op"},
+            "shape": {"$first": "$shape"},
+            "sort": {"$first": "$sort"},
+            "count": {"$sum": 1},
+            "avg_duration_ms": {"$avg": "$duration_ms"},
+            "max_duration_ms": {"$max": "$duration_ms"},
+            "flags": {"$addToSet": "$flags"},
+            "last_seen": {"$max": "$ts"},
+        }},
+        {"$addFields": {
+            "flags": {"$reduce": {"input": "$flags", "initialValue": [], "in": {"$setUnion": ["$$value", "$$this"]}}},
+            "total_duration_ms": {"$multiply": ["$avg_duration_ms", "$count"]},
+        }},
+        {"$sort": {"total_duration_ms": -1}},
+        {"$limit": limit},
+    ]
+    rows = await database[SLOW_QUERY_COLLECTION].aggregate(pipeline).to_list(length=limit)
+    for row in rows:
+        row["shape_hash"] = row.pop("_id")
+        row["avg_duration_ms"] = round(row["avg_duration_ms"], 2)
+        row["total_duration_ms"] = round(row["total_duration_ms"], 2)
+    return rows
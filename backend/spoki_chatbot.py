@@ -9,6 +9,10 @@ Architettura:
 - Memoria persistente per lead in collection `lead_chatbot_sessions`.
 
 Il bot lavora in ITALIANO. Modello: gpt-4o-mini via emergentintegrations + EMERGENT_LLM_KEY.
+
+NEW (ott 2026): tutte le chiamate al modello (chatbot interno e Assistant OpenAI) passano
+da `llm_gateway` (limiti di concorrenza per Unit/globali, scadenze, client condivisi,
+richieste duplicate coalescenti): vedi llm_gateway.py.
 """
 from __future__ import annotations
 
@@ -20,8 +24,12 @@ import uuid
 from datetime import datetime, timezone, timedelta, date as date_type, time
 from typing import Optional, List, Dict, Any, Tuple
 
-from emergentintegrations.llm.chat import LlmChat, UserMessage
-from openai import AsyncOpenAI
+from lazy_imports import lazy_attr
+from llm_gateway import LlmGatewayError, llm_gateway, request_key
+
+# SDK LLM caricati al primo uso (cold-start): vedi lazy_imports.py
+LlmChat = lazy_attr("emergentintegrations.llm.chat", "LlmChat")
+UserMessage = lazy_attr("emergentintegrations.llm.chat", "UserMessage")
 
 logger = logging.getLogger(__name__)
 
@@ -30,9 +38,9 @@ logger = logging.getLogger(__name__)
 # OPENAI ASSISTANTS (bot dell'utente su platform.openai.com)
 # =====================================================
 
-def _openai_client() -> Optional[AsyncOpenAI]:
-    key = os.environ.get("OPENAI_API_KEY", "")
-    return AsyncOpenAI(api_key=key) if key else None
+def _openai_client():
+    """Client AsyncOpenAI condiviso (uno per API key) dal gateway."""
+    return llm_gateway.openai_client(os.environ.get("OPENAI_API_KEY", ""))
 
 
 async def list_openai_assistants() -> List[Dict[str, Any]]:
@@ -45,7 +53,8 @@ async def list_openai_assistants() -> List[Dict[str, Any]]:
 
 
 async def assistant_generate_reply(
-    assistant_id: str, user_message: str, thread_id: Optional[str] = None
+    assistant_id: str, user_message: str, thread_id: Optional[str] = None,
+    unit_id: Optional[str] = None, lead_id: Optional[str] = None,
 ) -> Dict[str, Any]:
     """Genera risposta tramite Assistant OpenAI (threads/runs). Ritorna dict compatibile
     con chatbot_generate_reply + chiave extra `thread_id` da persistere in sessione."""
@@ -65,9 +74,8 @@ async def assistant_generate_reply(
         user_msg = await client.beta.threads.messages.create(
             thread_id=tid, role="user", content=user_message,
         )
-        run = await client.beta.threads.runs.create_and_poll(
-            thread_id=tid, assistant_id=assistant_id,
-        )
+        run = await client.beta.threads.runs.create(thread_id=tid, assistant_id=assistant_id)
+        run = await llm_gateway.poll_assistant_run(client, tid, run)
         if run.status != "completed":
             raise RuntimeError(f"Assistant run status={run.status} ({getattr(run, 'last_error', None)})")
         msgs = await client.beta.threads.messages.list(thread_id=tid, order="asc", after=user_msg.id)
@@ -80,13 +88,17 @@ async def assistant_generate_reply(
         return {"reply": reply, "thread_id": tid}
 
     try:
-        res = await _run(thread_id)
+        res = await llm_gateway.call(
+            lambda: _run(thread_id), unit_id=unit_id, backend="assistant",
+            key=request_key("assistant", thread_id or lead_id, user_message),
+        )
     except Exception as e:
-        if thread_id:
+        # coda piena / scadenza: un thread nuovo non aiuterebbe
+        if thread_id and not isinstance(e, LlmGatewayError):
             # thread scaduto/invalido: riprova con thread nuovo
             logger.warning(f"Assistant thread {thread_id} fallito ({e}), retry con thread nuovo")
             try:
-                res = await _run(None)
+                res = await llm_gateway.call(lambda: _run(None), unit_id=unit_id, backend="assistant")
             except Exception as e2:
                 logger.exception("Assistant retry fallito")
                 return {
@@ -119,14 +131,19 @@ async def generate_unit_reply(
     history: List[Dict[str, str]],
     system_prompt: Optional[str] = None,
     next_free_slot_hint: Optional[str] = None,
+    unit_id: Optional[str] = None,
 ) -> Dict[str, Any]:
     """Entry-point unificato: usa l'Assistant OpenAI della Unit se configurato,
-    altrimenti il chatbot interno gpt-4o-mini. Persiste openai_thread_id in sessione."""
+    altrimenti il chatbot interno gpt-4o-mini. Persiste openai_thread_id in sessione.
+    `unit_id` (default: quello di `unit_cfg`) è lo scope dei limiti di concorrenza."""
+    unit_id = unit_id or (unit_cfg or {}).get("unit_id")
     assistant_id = (unit_cfg or {}).get("openai_assistant_id")
     if assistant_id and os.environ.get("OPENAI_API_KEY"):
         session = await db.lead_chatbot_sessions.find_one({"lead_id": lead_id}, {"_id": 0, "openai_thread_id": 1})
         thread_id = (session or {}).get("openai_thread_id")
-        res = await assistant_generate_reply(assistant_id, user_message, thread_id)
+        res = await assistant_generate_reply(
+            assistant_id, user_message, thread_id, unit_id=unit_id, lead_id=lead_id,
+        )
         new_tid = res.get("thread_id")
         if new_tid and new_tid != thread_id:
             await db.lead_chatbot_sessions.update_one(
@@ -138,6 +155,7 @@ async def generate_unit_reply(
     return await chatbot_generate_reply(
         lead_id=lead_id, user_message=user_message, history=history,
         system_prompt=system_prompt, next_free_slot_hint=next_free_slot_hint,
+        unit_id=unit_id,
     )
 
 
@@ -200,6 +218,7 @@ async def chatbot_generate_reply(
     history: List[Dict[str, str]],
     system_prompt: Optional[str] = None,
     next_free_slot_hint: Optional[str] = None,
+    unit_id: Optional[str] = None,
 ) -> Dict[str, Any]:
     """Genera la prossima risposta del bot. Ritorna dict con reply/intent/score/etc."""
     api_key = os.environ.get("EMERGENT_LLM_KEY", "")
@@ -235,7 +254,10 @@ async def chatbot_generate_reply(
         user_payload = user_message
 
     try:
-        raw = await chat.send_message(UserMessage(text=user_payload))
+        raw = await llm_gateway.call(
+            lambda: chat.send_message(UserMessage(text=user_payload)), unit_id=unit_id, backend="chatbot",
+            key=request_key("chatbot", lead_id, user_message),
+        )
     except Exception as e:
         logger.exception("chatbot LLM error")
         return {
@@ -23,9 +23,13 @@ from datetime import datetime, timezone, time, timedelta, date as date_type
 from typing import Optional, List, Dict, Any
 from enum import Enum
 
+import time as time_module
+
 import httpx
 from pydantic import BaseModel, Field
 
+from metrics import SPOKI_REQUESTS, SPOKI_LATENCY
+
 logger = logging.getLogger(__name__)
 
 SPOKI_BASE_URL = "https://api.spoki.com/api/1"
@@ -194,8 +198,16 @@ class SpokiService:
             raise RuntimeError("API key Spoki non configurata per questa Unit (Amministrazione → WhatsApp Spoki)")
         url = f"{self.base_url}{path}"
         timeout = kwargs.pop("timeout", 15.0)
-        async with httpx.AsyncClient(timeout=timeout) as client:
-            res = await client.request(method, url, headers=self._headers(), **kwargs)
+        started = time_module.perf_counter()
+        try:
+            async with httpx.AsyncClient(timeout=timeout) as client:
+                res = await client.request(method, url, headers=self._headers(), **kwargs)
+        except Exception:
+            SPOKI_REQUESTS.inc(method=method, path=path, outcome="error")
+            raise
+        finally:
+            SPOKI_LATENCY.observe(time_module.perf_counter() - started, method=method, path=path)
+        SPOKI_REQUESTS.inc(method=method, path=path, outcome="ok" if res.status_code < 400 else str(res.status_code))
         if res.status_code == 401:
             raise RuntimeError(
                 "Spoki API: 401 Unauthorized — la API key di questa Unit non è riconosciuta da Spoki. "
@@ -18,6 +18,10 @@ from typing import Optional, List, Dict, Any
 
 from fastapi import APIRouter, HTTPException, Depends, Request, Body
 
+import conversation_summaries
+from data_retention import find_with_archive
+from events import publish_conversation
+
 from spoki_module import (
     SpokiService, UnitSpokiConfig, UnitSpokiConfigUpdate, SpokiPairingStatus,
     UnitCalendarConfig, WorkingHourSlot, Appointment, AppointmentStatus,
@@ -123,6 +127,7 @@ def build_spoki_routers(db, get_current_user, UserRole):
             out["error"] = str(e)[:500]
             logger.exception(f"send_welcome_for_lead error: {e}")
         await db.spoki_messages.insert_one(out)
+        await conversation_summaries.record_message(db, out)
         return out
 
     async def _bot_handle_inbound(lead: Dict[str, Any], user_message: str) -> bool:
@@ -154,7 +159,7 @@ def build_spoki_routers(db, get_current_user, UserRole):
 
         reply = await generate_unit_reply(
             db, lead_id, cfg, user_message, history,
-            system_prompt=sys_prompt, next_free_slot_hint=next_slot_hint,
+            system_prompt=sys_prompt, next_free_slot_hint=next_slot_hint, unit_id=unit_id,
         )
         bot_text = (reply.get("reply") or "").strip() or "Grazie!"
         history.append({"role": "assistant", "content": bot_text, "ts": datetime.now(timezone.utc).isoformat()})
@@ -219,6 +224,11 @@ def build_spoki_routers(db, get_current_user, UserRole):
             out["status"] = "failed"
             out["error"] = str(e)[:500]
         await db.spoki_messages.insert_one(out)
+        await conversation_summaries.record_message(db, out)
+        publish_conversation(
+            unit_id, lead_id, "conversation.message", direction="outbound", sender="bot",
+            body=bot_text[:200], created_at=out.get("created_at"),
+        )
         return True
 
     # ====================================
@@ -563,8 +573,13 @@ def build_spoki_routers(db, get_current_user, UserRole):
                     spoki_message_id=spoki_msg_id, status="received", sender="lead",
                 ).dict()
                 await db.spoki_messages.insert_one(log)
+                await conversation_summaries.record_message(db, log)
                 processed += 1
                 if lead:
+                    publish_conversation(
+                        unit_id, lead["id"], "conversation.message", direction="inbound", sender="lead",
+                        body=body_txt[:200], created_at=log.get("created_at"),
+                    )
                     handled = False
                     try:
                         handled = bool(await _bot_handle_inbound(lead, body_txt))
@@ -576,6 +591,8 @@ def build_spoki_routers(db, get_current_user, UserRole):
                         await db.spoki_messages.update_one(
                             {"id": log["id"]}, {"$set": {"needs_attention": True}}
                         )
+                        await conversation_summaries.flag_unhandled(db, lead["id"])
+                        publish_conversation(unit_id, lead["id"], "conversation.unhandled", message_id=log["id"])
                     # Resume workflows V2 in attesa (ramo 'reply')
                     try:
                         wf_v2 = getattr(router, "workflow_executor_v2", None)
@@ -594,23 +611,27 @@ def build_spoki_routers(db, get_current_user, UserRole):
             return int(ch) if ch.isdigit() else ch
         return {"status": "ok"}
 
+    def _visible_unit_ids(user) -> Optional[List[str]]:
+        """Unit visibili come in `_user_can_see_unit`, per filtrare nella query (None = tutte)."""
+        if user.role == UserRole.ADMIN:
+            return None
+        unit_ids = set(getattr(user, "commesse_autorizzate", None) or [])
+        if user.role == UserRole.SUPER_REFERENTE and getattr(user, "unit_id", None):
+            unit_ids.add(user.unit_id)
+        return sorted(unit_ids)
+
     @router.get("/conversations")
-    async def list_all_conversations(current_user=Depends(get_current_user), limit: int = 200):
-        """Lista tutte le conversazioni WhatsApp (una per lead), ordinate per ultimo messaggio."""
-        pipeline = [
-            {"$match": {"lead_id": {"$ne": None}}},
-            {"$sort": {"created_at": -1}},
-            {"$group": {
-                "_id": "$lead_id",
-                "last_message": {"$first": "$$ROOT"},
-                "messages_count": {"$sum": 1},
-                "unhandled_count": {"$sum": {"$cond": [{"$eq": ["$needs_attention", True]}, 1, 0]}},
-            }},
-            {"$sort": {"last_message.created_at": -1}},
-            {"$limit": limit},
-        ]
-        groups = await db.spoki_messages.aggregate(pipeline).to_list(length=limit)
-        lead_ids = [g["_id"] for g in groups]
+    async def list_all_conversations(current_user=Depends(get_current_user), limit: int = 200, page: int = 1):
+        """Lista le conversazioni WhatsApp (una per lead), ordinate per ultimo messaggio.
+        NEW (ott 2026): lettura paginata di `conversation_summaries` (vedi conversation_summaries.py)."""
+        limit = max(1, min(limit, 500))
+        page = max(1, page)
+        summaries = await conversation_summaries.list_summaries(
+            db, _visible_unit_ids(current_user), skip=(page - 1) * limit, limit=limit + 1,
+        )
+        has_more = len(summaries) > limit
+        summaries = summaries[:limit]
+        lead_ids = [s["lead_id"] for s in summaries]
         leads = {l["id"]: l async for l in db.leads.find(
             {"id": {"$in": lead_ids}},
             {"_id": 0, "id": 1, "nome": 1, "cognome": 1, "telefono": 1, "commessa_id": 1},
@@ -619,27 +640,25 @@ def build_spoki_routers(db, get_current_user, UserRole):
             {"lead_id": {"$in": lead_ids}},
             {"_id": 0, "lead_id": 1, "status": 1, "bot_paused": 1, "activated_by_workflow": 1, "qualification_score": 1},
         )}
-        unit_ids = list({(leads.get(lid) or {}).get("commessa_id") for lid in lead_ids if leads.get(lid)})
+        unit_ids = {s.get("unit_id") for s in summaries if s.get("unit_id")}
         unit_names = {c["id"]: c.get("nome") async for c in db.commesse.find(
-            {"id": {"$in": [u for u in unit_ids if u]}}, {"_id": 0, "id": 1, "nome": 1},
+            {"id": {"$in": list(unit_ids)}}, {"_id": 0, "id": 1, "nome": 1},
         )}
         out = []
-        for g in groups:
-            lead = leads.get(g["_id"])
+        for summary in summaries:
+            lead = leads.get(summary["lead_id"])
             if not lead:
                 continue
-            unit_id = lead.get("commessa_id") or ""
-            if not await _user_can_see_unit(current_user, unit_id):
-                continue
-            lm = g["last_message"]
+            unit_id = summary.get("unit_id") or ""
+            lm = summary.get("last_message") or {}
             out.append({
                 "lead_id": lead["id"],
                 "lead_name": f"{lead.get('nome') or ''} {lead.get('cognome') or ''}".strip() or lead.get("telefono") or lead["id"],
                 "phone": lead.get("telefono"),
                 "unit_id": unit_id,
                 "unit_label": unit_names.get(unit_id),
-                "messages_count": g["messages_count"],
-                "unhandled_count": g.get("unhandled_count") or 0,
+                "messages_count": summary.get("messages_count") or 0,
+                "unhandled_count": summary.get("unhandled_count") or 0,
                 "last_message": {
                     "body": lm.get("body") or (f"[Template: {lm.get('template_name')}]" if lm.get("template_name") else ""),
                     "direction": lm.get("direction"),
@@ -649,20 +668,12 @@ def build_spoki_routers(db, get_current_user, UserRole):
                 },
                 "session": sessions.get(lead["id"]),
             })
-        return {"conversations": out}
+        return {"conversations": out, "page": page, "limit": limit, "has_more": has_more}
 
     @router.get("/conversations/unhandled-count")
     async def conversations_unhandled_count(current_user=Depends(get_current_user)):
         """Numero di lead con messaggi WhatsApp non gestiti (bot in pausa/non attivato)."""
-        pipeline = [
-            {"$match": {"needs_attention": True, "lead_id": {"$ne": None}}},
-            {"$group": {"_id": "$unit_id", "leads": {"$addToSet": "$lead_id"}}},
-        ]
-        total = 0
-        async for g in db.spoki_messages.aggregate(pipeline):
-            if await _user_can_see_unit(current_user, g["_id"] or ""):
-                total += len(g["leads"])
-        return {"count": total}
+        return {"count": await conversation_summaries.count_unhandled(db, _visible_unit_ids(current_user))}
 
     @router.post("/conversations/{lead_id}/mark-read")
     async def mark_conversation_read(lead_id: str, current_user=Depends(get_current_user)):
@@ -676,6 +687,9 @@ def build_spoki_routers(db, get_current_user, UserRole):
             {"lead_id": lead_id, "needs_attention": True},
             {"$set": {"needs_attention": False}},
         )
+        await conversation_summaries.clear_unhandled(db, lead_id)
+        if res.modified_count:
+            publish_conversation(lead.get("commessa_id"), lead_id, "conversation.read", cleared=res.modified_count)
         return {"success": True, "cleared": res.modified_count}
 
     @router.post("/conversations/{lead_id}/toggle-bot")
@@ -713,7 +727,10 @@ def build_spoki_routers(db, get_current_user, UserRole):
             raise HTTPException(status_code=404, detail="Lead non trovato")
         if not await _user_can_see_unit(current_user, lead.get("commessa_id") or ""):
             raise HTTPException(status_code=403, detail="Accesso negato")
-        msgs = await db.spoki_messages.find({"lead_id": lead_id}, {"_id": 0}).sort("created_at", 1).to_list(length=1000)
+        # ultimi 1000 messaggi, completati da `spoki_messages_archive` (retention), in ordine cronologico
+        msgs = await find_with_archive(db, "spoki_messages", {"lead_id": lead_id}, "created_at", 1000,
+                                       include_archive=True, projection={"_id": 0})
+        msgs.reverse()
         session = await db.lead_chatbot_sessions.find_one({"lead_id": lead_id}, {"_id": 0})
         return {"lead_id": lead_id, "messages": msgs, "chatbot_session": session}
 
@@ -748,6 +765,11 @@ def build_spoki_routers(db, get_current_user, UserRole):
             out["status"] = "failed"
             out["error"] = str(e)[:500]
         await db.spoki_messages.insert_one(out)
+        await conversation_summaries.record_message(db, out)
+        publish_conversation(
+            lead.get("commessa_id"), lead_id, "conversation.message", direction="outbound", sender="admin",
+            body=text[:200], created_at=out.get("created_at"),
+        )
         return out
 
     # ====================================
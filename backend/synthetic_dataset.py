@@ -0,0 +1,481 @@
+#!/usr/bin/env python3
+"""
+Generatore di dataset sintetici a scala produzione per il Nureal CRM (NEW ott 2026).
+
+A differenza di `seed_database.py` (solo utente admin) crea una struttura completa e
+volumi realistici: units, commesse, servizi, tipologie contratto, sub agenzie, utenti di
+ogni `UserRole`, lead con custom fields e messaggi Spoki, clienti con dati aggiuntivi,
+storico note e log di audit. Serve come base per `benchmark_endpoints.py`.
+
+Il dataset è deterministico (stesso `--seed` → stessi documenti, id compresi) e viene
+generato a batch, quindi anche i preset con milioni di documenti non vengono mai tenuti
+interamente in memoria.
+
+Uso:
+    cd /app/backend
+    python synthetic_dataset.py --db-name crm_bench --scale small --drop
+    python synthetic_dataset.py --db-name crm_bench --scale large --leads 5000000
+
+Per sicurezza lo script rifiuta di scrivere sul database configurato in DB_NAME (.env)
+senza `--force`.
+"""
+
+import argparse
+import asyncio
+import os
+import random
+import sys
+import time
+import uuid
+from dataclasses import dataclass, asdict, replace
+from datetime import datetime, timezone, timedelta
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Tuple
+
+from dotenv import load_dotenv
+from motor.motor_asyncio import AsyncIOMotorClient
+from passlib.context import CryptContext
+
+ROOT_DIR = Path(__file__).parent
+load_dotenv(ROOT_DIR / '.env')
+
+from models import UserRole, ClienteStatus, Tecnologia, ModalitaPagamento  # noqa: E402
+from helpers import ITALIAN_PROVINCES, PROVINCE_TO_CODE  # noqa: E402
+
+BENCH_PASSWORD = "bench123"
+BENCH_EMAIL_DOMAIN = "bench-crm.it"
+
+NOMI = ["Mario", "Luigi", "Giulia", "Francesca", "Marco", "Anna", "Paolo", "Chiara", "Luca", "Sara",
+        "Giuseppe", "Elena", "Andrea", "Valentina", "Alessandro", "Martina", "Davide", "Laura", "Simone", "Federica"]
+COGNOMI = ["Rossi", "Russo", "Ferrari", "Esposito", "Bianchi", "Romano", "Colombo", "Ricci", "Marino", "Greco",
+           "Bruno", "Gallo", "Conti", "De Luca", "Mancini", "Costa", "Giordano", "Rizzo", "Lombardi", "Moretti"]
+CAMPAGNE = ["Fibra Casa", "Energia Verde", "Mobile Smart", "Business Pro", "Telepass Family"]
+COMMESSE_NOMI = ["Fastweb", "Telepass", "Vodafone", "Enel", "Iliad", "WindTre", "Sorgenia", "Edison", "TIM", "Plenitude"]
+SERVIZI_NOMI = ["TLS", "Agent", "Negozi", "Presidi", "Domestico", "Business"]
+TIPOLOGIE_NOMI = ["Energia", "Telefonia", "Mobile", "Ho Mobile", "Telepass"]
+LEAD_STATUSES = ["Nuovo", "Da contattare", "Non risponde", "Richiamare", "Interessato", "Non interessato", "Contratto"]
+TIPOLOGIE_ABITAZIONE = ["appartamento", "villa", "ufficio", "negozio"]
+SPOKI_INBOUND = ["Buongiorno, vorrei informazioni", "Sì, mi richiami pure", "Non sono interessato",
+                 "Che costi ha l'offerta?", "Ok grazie"]
+
+# Distribuzione degli utenti per ruolo (pesi relativi): agenti e operatori sono la maggioranza
+ROLE_WEIGHTS = {
+    UserRole.ADMIN: 1,
+    UserRole.SUPERVISOR: 2,
+    UserRole.SUPER_REFERENTE: 1,
+    UserRole.REFERENTE: 6,
+    UserRole.AGENTE: 40,
+    UserRole.RESPONSABILE_COMMESSA: 2,
+    UserRole.BACKOFFICE_COMMESSA: 4,
+    UserRole.RESPONSABILE_SUB_AGENZIA: 4,
+    UserRole.BACKOFFICE_SUB_AGENZIA: 6,
+    UserRole.AGENTE_SPECIALIZZATO: 15,
+    UserRole.OPERATORE: 10,
+    UserRole.RESPONSABILE_STORE: 1,
+    UserRole.STORE_ASSIST: 3,
+    UserRole.RESPONSABILE_PRESIDI: 1,
+    UserRole.PROMOTER_PRESIDI: 3,
+    UserRole.AREA_MANAGER: 1,
+}
+SUB_AGENZIA_ROLES = {
+    UserRole.RESPONSABILE_SUB_AGENZIA, UserRole.BACKOFFICE_SUB_AGENZIA, UserRole.AGENTE_SPECIALIZZATO,
+    UserRole.OPERATORE, UserRole.RESPONSABILE_STORE, UserRole.STORE_ASSIST,
+    UserRole.RESPONSABILE_PRESIDI, UserRole.PROMOTER_PRESIDI,
+}
+COMMESSA_ROLES = {UserRole.RESPONSABILE_COMMESSA, UserRole.BACKOFFICE_COMMESSA, UserRole.AREA_MANAGER}
+
+
+@dataclass(frozen=True)
+class DatasetSpec:
+    units: int
+    commesse: int
+    servizi_per_commessa: int
+    sub_agenzie: int
+    users: int
+    leads: int
+    clienti: int
+    custom_fields_per_commessa: int = 8
+    notes_per_cliente: float = 1.5
+    logs_per_cliente: float = 3.0
+    messages_per_lead: float = 2.0
+    days: int = 365
+
+
+SCALES = {
+    "tiny": DatasetSpec(units=2, commesse=2, servizi_per_commessa=2, sub_agenzie=4, users=60, leads=500, clienti=500),
+    "small": DatasetSpec(units=4, commesse=3, servizi_per_commessa=3, sub_agenzie=12, users=400,
+                         leads=20_000, clienti=20_000),
+    "medium": DatasetSpec(units=10, commesse=6, servizi_per_commessa=4, sub_agenzie=40, users=2_000,
+                          leads=500_000, clienti=500_000),
+    "large": DatasetSpec(units=25, commesse=10, servizi_per_commessa=5, sub_agenzie=120, users=6_000,
+                         leads=2_000_000, clienti=2_000_000),
+}
+
+
+class SyntheticDataset:
+    """Costruisce i documenti del dataset in modo deterministico a partire da `seed`."""
+
+    def __init__(self, spec: DatasetSpec, seed: int = 42, now: datetime = None):
+        self.spec = spec
+        self.seed = seed
+        self.rng = random.Random(seed)
+        self.now = now or datetime(2026, 10, 1, tzinfo=timezone.utc)
+        self._password_hash = None
+        self.structure: Dict[str, List[Dict[str, Any]]] = {}
+
+    # ---- helpers ----
+
+    def _uuid(self, rng: random.Random = None) -> str:
+        return str(uuid.UUID(int=(rng or self.rng).getrandbits(128), version=4))
+
+    def _past(self, rng: random.Random) -> datetime:
+        return self.now - timedelta(seconds=rng.randint(0, self.spec.days * 86400))
+
+    def _count(self, rng: random.Random, mean: float) -> int:
+        """Numero intero con media `mean` (parte intera + Bernoulli sul resto)."""
+        base = int(mean)
+        return base + (1 if rng.random() < mean - base else 0)
+
+    def _hash(self) -> str:
+        # bcrypt è lento: un solo hash condiviso da tutti gli utenti sintetici
+        if self._password_hash is None:
+            self._password_hash = CryptContext(schemes=["bcrypt"], deprecated="auto").hash(BENCH_PASSWORD)
+        return self._password_hash
+
+    # ---- struttura (piccola, tenuta in memoria) ----
+
+    def build_structure(self) -> Dict[str, List[Dict[str, Any]]]:
+        spec, rng = self.spec, self.rng
+        created = self.now - timedelta(days=spec.days + 30)
+
+        commesse = [{
+            "id": self._uuid(), "nome": COMMESSE_NOMI[i % len(COMMESSE_NOMI)] + ("" if i < len(COMMESSE_NOMI) else f" {i}"),
+            "descrizione": "Commessa sintetica", "entity_type": "both", "has_whatsapp": True, "has_ai": i % 2 == 0,
+            "has_call_center": i % 3 == 0, "document_management": "disabled", "is_active": True, "created_at": created,
+        } for i in range(spec.commesse)]
+
+        servizi, tipologie = [], []
+        for c in commesse:
+            for j in range(spec.servizi_per_commessa):
+                servizio = {"id": self._uuid(), "commessa_id": c["id"], "nome": SERVIZI_NOMI[j % len(SERVIZI_NOMI)],
+                            "descrizione": None, "is_active": True, "created_at": created}
+                servizi.append(servizio)
+                for k in range(2):
+                    tipologie.append({
+                        "id": self._uuid(), "nome": TIPOLOGIE_NOMI[(j + k) % len(TIPOLOGIE_NOMI)],
+                        "servizio_id": servizio["id"], "is_active": True, "created_at": created, "created_by": "bench",
+                    })
+
+        units = [{
+            "id": self._uuid(), "nome": f"Unit {i + 1}",
+            "commesse_autorizzate": [commesse[i % len(commesse)]["id"]],
+            "commessa_id": commesse[i % len(commesse)]["id"],
+            "campagne_autorizzate": rng.sample(CAMPAGNE, 2), "auto_assign_enabled": True,
+            "is_active": True, "created_at": created,
+        } for i in range(spec.units)]
+
+        lead_statuses = [{
+            "id": self._uuid(), "nome": nome, "unit_id": None, "ordine": i, "colore": "#3b82f6",
+            "is_active": True, "created_at": created,
+        } for i, nome in enumerate(LEAD_STATUSES)]
+
+        custom_fields = []
+        for c in commesse:
+            c_tipologie = [t for t in tipologie if any(s["id"] == t["servizio_id"] and s["commessa_id"] == c["id"]
+                                                       for s in servizi)]
+            for n in range(spec.custom_fields_per_commessa):
+                field_type = ("text", "number", "select", "checkbox", "date")[n % 5]
+                custom_fields.append({
+                    "id": self._uuid(), "commessa_id": c["id"],
+                    "tipologia_contratto_id": c_tipologie[n % len(c_tipologie)]["id"],
+                    "name": f"campo_{n}", "label": f"Campo {n}", "field_type": field_type,
+                    "options": ["A", "B", "C"] if field_type == "select" else [],
+                    "required": False, "order": n, "is_active": True, "created_at": created,
+                })
+
+        users = self._build_users(units, commesse, servizi, created)
+        sub_agenzie = self._build_sub_agenzie(commesse, servizi, users, created)
+
+        self.structure = {
+            "commesse": commesse, "servizi": servizi, "tipologie_contratto": tipologie, "units": units,
+            "lead_statuses": lead_statuses, "cliente_custom_fields": custom_fields,
+            "users": users, "sub_agenzie": sub_agenzie,
+        }
+        return self.structure
+
+    def _build_users(self, units, commesse, servizi, created) -> List[Dict[str, Any]]:
+        spec, rng = self.spec, self.rng
+        roles = list(ROLE_WEIGHTS)
+        # Almeno un utente per ruolo, il resto secondo i pesi
+        assigned = roles + rng.choices(roles, weights=[ROLE_WEIGHTS[r] for r in roles], k=max(0, spec.users - len(roles)))
+        users = []
+        for i, role in enumerate(assigned):
+            username = "admin" if i == 0 else f"{role.value}_{i}"
+            users.append({
+                "id": self._uuid(), "username": username, "email": f"{username}@{BENCH_EMAIL_DOMAIN}",
+                "password_hash": self._hash(), "role": role.value, "is_active": True,
+                "unit_id": None, "sub_agenzia_id": None, "referente_id": None, "provinces": [],
+                "unit_autorizzate": [], "referenti_autorizzati": [], "commesse_autorizzate": [],
+                "servizi_autorizzati": [], "sub_agenzie_autorizzate": [],
+                "can_view_analytics": role.value.startswith("responsabile") or role in (UserRole.ADMIN, UserRole.SUPERVISOR),
+                "entity_management": "both", "password_change_required": False,
+                "password_last_changed": self.now, "created_at": created, "timezone": "Europe/Rome",
+            })
+        referenti = [u for u in users if u["role"] == UserRole.REFERENTE.value]
+        for u in users:
+            role = UserRole(u["role"])
+            unit = rng.choice(units)
+            if role in (UserRole.SUPERVISOR, UserRole.REFERENTE, UserRole.AGENTE):
+                u["unit_id"] = unit["id"]
+            if role == UserRole.AGENTE:
+                u["unit_autorizzate"] = [unit["id"]]
+                u["provinces"] = rng.sample(ITALIAN_PROVINCES, 3)
+                u["referente_id"] = rng.choice(referenti)["id"] if referenti else None
+            if role == UserRole.SUPER_REFERENTE:
+                u["referenti_autorizzati"] = [r["id"] for r in rng.sample(referenti, min(3, len(referenti)))]
+            if role in COMMESSA_ROLES or role in SUB_AGENZIA_ROLES:
+                commessa = rng.choice(commesse)
+                u["commesse_autorizzate"] = [commessa["id"]]
+                u["servizi_autorizzati"] = [s["id"] for s in servizi if s["commessa_id"] == commessa["id"]]
+        return users
+
+    def _build_sub_agenzie(self, commesse, servizi, users, created) -> List[Dict[str, Any]]:
+        rng = self.rng
+        responsabili = [u for u in users if u["role"] == UserRole.RESPONSABILE_SUB_AGENZIA.value] or users[:1]
+        sub_agenzie = []
+        for i in range(self.spec.sub_agenzie):
+            c_ids = [c["id"] for c in rng.sample(commesse, min(2, len(commesse)))]
+            sub_agenzie.append({
+                "id": self._uuid(), "nome": f"Sub Agenzia {i + 1}", "descrizione": None,
+                "responsabile_id": responsabili[i % len(responsabili)]["id"],
+                "commesse_autorizzate": c_ids,
+                "servizi_autorizzati": [s["id"] for s in servizi if s["commessa_id"] in c_ids],
+                "can_change_status": i % 4 == 0, "hidden_tipologie_for_bo_commessa": [],
+                "is_active": True, "created_by": "bench", "created_at": created,
+            })
+        for u in users:
+            if UserRole(u["role"]) in SUB_AGENZIA_ROLES:
+                sa = rng.choice(sub_agenzie)
+                u["sub_agenzia_id"] = sa["id"]
+                u["sub_agenzie_autorizzate"] = [sa["id"]]
+                u["commesse_autorizzate"] = sa["commesse_autorizzate"]
+        return sub_agenzie
+
+    # ---- volumi (generati a batch) ----
+
+    def iter_leads(self, batch_size: int) -> Iterator[Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]]:
+        """Batch di (lead, spoki_messages). Richiede build_structure()."""
+        s = self.structure
+        rng = random.Random(f"{self.seed}-leads")
+        agents_by_unit: Dict[str, List[str]] = {}
+        for u in s["users"]:
+            if u["role"] == UserRole.AGENTE.value and u["unit_id"]:
+                agents_by_unit.setdefault(u["unit_id"], []).append(u["id"])
+        statuses = [st["nome"] for st in s["lead_statuses"]]
+        leads, messages = [], []
+        for i in range(self.spec.leads):
+            unit = rng.choice(s["units"])
+            created_at = self._past(rng)
+            nome, cognome = rng.choice(NOMI), rng.choice(COGNOMI)
+            telefono = f"+39 3{i:09d}"
+            agents = agents_by_unit.get(unit["id"])
+            assigned = bool(agents) and rng.random() < 0.7
+            esito = rng.choice(statuses)
+            lead = {
+                "id": self._uuid(rng), "lead_id": f"L{i:07d}", "nome": nome, "cognome": cognome,
+                "telefono": telefono, "email": f"{nome}.{cognome}.{i}@example.it".lower().replace(" ", ""),
+                "provincia": rng.choice(ITALIAN_PROVINCES), "tipologia_abitazione": rng.choice(TIPOLOGIE_ABITAZIONE),
+                "campagna": rng.choice(unit["campagne_autorizzate"]), "gruppo": unit["nome"],
+                "unit_id": unit["id"], "commessa_id": unit["commessa_id"], "status": esito, "esito": esito,
+                "privacy_consent": True, "marketing_consent": rng.random() < 0.6,
+                "assigned_agent_id": rng.choice(agents) if assigned else None,
+                "esito_at_assignment": "Nuovo" if assigned else None,
+                "note": None,
+                "custom_fields": {"budget": rng.randint(20, 200), "fonte": rng.choice(["facebook", "google", "sito"])},
+                "documents": [], "created_at": created_at,
+                "assigned_at": created_at + timedelta(minutes=rng.randint(1, 600)) if assigned else None,
+            }
+            leads.append(lead)
+            for m in range(self._count(rng, self.spec.messages_per_lead)):
+                inbound = m % 2 == 1
+                messages.append({
+                    "id": self._uuid(rng), "unit_id": unit["commessa_id"], "lead_id": lead["id"], "cliente_id": None,
+                    "direction": "inbound" if inbound else "outbound", "phone_number": telefono,
+                    "body": rng.choice(SPOKI_INBOUND) if inbound else None,
+                    "template_name": None if inbound else "benvenuto", "template_variables": None,
+                    "spoki_message_id": None, "status": "received" if inbound else "sent", "error": None,
+                    "sender": "lead" if inbound else "system",
+                    "created_at": created_at + timedelta(minutes=5 * (m + 1)),
+                })
+            if len(leads) >= batch_size:
+                yield leads, messages
+                leads, messages = [], []
+        if leads:
+            yield leads, messages
+
+    def iter_clienti(self, batch_size: int) -> Iterator[Tuple[List[Dict], List[Dict], List[Dict]]]:
+        """Batch di (clienti, cliente_note_history, clienti_logs). Richiede build_structure()."""
+        s = self.structure
+        rng = random.Random(f"{self.seed}-clienti")
+        servizi_by_commessa: Dict[str, List[Dict]] = {}
+        for sv in s["servizi"]:
+            servizi_by_commessa.setdefault(sv["commessa_id"], []).append(sv)
+        tipologie_by_servizio: Dict[str, List[Dict]] = {}
+        for t in s["tipologie_contratto"]:
+            tipologie_by_servizio.setdefault(t["servizio_id"], []).append(t)
+        fields_by_commessa: Dict[str, List[Dict]] = {}
+        for f in s["cliente_custom_fields"]:
+            fields_by_commessa.setdefault(f["commessa_id"], []).append(f)
+        creators_by_sa: Dict[str, List[Dict]] = {}
+        for u in s["users"]:
+            if u.get("sub_agenzia_id"):
+                creators_by_sa.setdefault(u["sub_agenzia_id"], []).append(u)
+        fallback_creator = s["users"][0]
+        statuses = [st.value for st in ClienteStatus]
+        province_codes = sorted(set(PROVINCE_TO_CODE.values()))
+
+        clienti, notes, logs = [], [], []
+        for i in range(self.spec.clienti):
+            sa = rng.choice(s["sub_agenzie"])
+            commessa_id = rng.choice(sa["commesse_autorizzate"])
+            servizio = rng.choice(servizi_by_commessa[commessa_id])
+            tipologia = rng.choice(tipologie_by_servizio[servizio["id"]])
+            creator = rng.choice(creators_by_sa.get(sa["id"]) or [fallback_creator])
+            created_at = self._past(rng)
+            nome, cognome = rng.choice(NOMI), rng.choice(COGNOMI)
+            business = rng.random() < 0.2
+            dati_aggiuntivi = {}
+            for f in fields_by_commessa.get(commessa_id, []):
+                if f["tipologia_contratto_id"] != tipologia["id"] or rng.random() < 0.3:
+                    continue
+                dati_aggiuntivi[f["name"]] = {
+                    "text": f"val-{rng.randint(1, 999)}", "number": rng.randint(1, 5000),
+                    "select": rng.choice(f["options"] or ["A"]), "checkbox": rng.random() < 0.5,
+                    "date": (created_at - timedelta(days=rng.randint(0, 90))).strftime("%Y-%m-%d"),
+                }[f["field_type"]]
+            passed_pv = rng.random() < 0.1
+            cliente = {
+                "id": self._uuid(rng), "cliente_id": f"C{i:07d}", "nome": nome, "cognome": cognome,
+                "ragione_sociale": f"{cognome} S.r.l." if business else None,
+                "email": f"{nome}.{cognome}.{i}@cliente.it".lower().replace(" ", ""),
+                "telefono": f"3{(i * 7919) % 10**9:09d}", "codice_fiscale": f"{cognome[:3].upper()}{nome[:3].upper()}{i:010d}",
+                "provincia": rng.choice(province_codes), "comune_residenza": rng.choice(ITALIAN_PROVINCES),
+                "cap": f"{rng.randint(10, 98)}{rng.randint(100, 999)}", "indirizzo": f"Via Roma {rng.randint(1, 200)}",
+                "tecnologia": rng.choice(list(Tecnologia)).value if rng.random() < 0.5 else None,
+                "modalita_pagamento": rng.choice(list(ModalitaPagamento)).value,
+                "convergenza": rng.random() < 0.15, "convergenza_items": [], "mobile_items": [],
+                "commessa_id": commessa_id, "sub_agenzia_id": sa["id"], "servizio_id": servizio["id"],
+                "tipologia_contratto": tipologia["nome"], "tipologia_contratto_id": tipologia["id"],
+                "segmento": "business" if business else "privato",
+                "status": rng.choice(statuses), "passed_to_post_vendita": passed_pv,
+                "post_vendita_status": "da_lavorare" if passed_pv else None,
+                "post_vendita_stage": "lavorazione" if passed_pv else None,
+                "dati_aggiuntivi": dati_aggiuntivi, "created_by": creator["id"], "assigned_to": None,
+                "created_at": created_at, "updated_at": created_at, "is_deleted": False,
+            }
+            clienti.append(cliente)
+            for n in range(self._count(rng, self.spec.notes_per_cliente)):
+                notes.append({
+                    "id": self._uuid(rng), "cliente_id": cliente["id"], "tipo": "cliente" if n % 2 == 0 else "backoffice",
+                    "content": f"Nota {n + 1}: richiamato il cliente", "created_at": created_at + timedelta(hours=n + 1),
+                    "created_by_id": creator["id"], "created_by_username": creator["username"],
+                })
+            for n in range(self._count(rng, self.spec.logs_per_cliente)):
+                action = "created" if n == 0 else "status_changed"
+                logs.append({
+                    "id": self._uuid(rng), "cliente_id": cliente["id"], "action": action,
+                    "description": "Cliente creato" if n == 0 else "Status aggiornato",
+                    "user_id": creator["id"], "user_name": creator["username"], "user_role": creator["role"],
+                    "old_value": None if n == 0 else rng.choice(statuses),
+                    "new_value": None if n == 0 else cliente["status"],
+                    "metadata": {}, "timestamp": created_at + timedelta(hours=n), "ip_address": None,
+                })
+            if len(clienti) >= batch_size:
+                yield clienti, notes, logs
+                clienti, notes, logs = [], [], []
+        if clienti:
+            yield clienti, notes, logs
+
+
+DATASET_COLLECTIONS = [
+    "commesse", "servizi", "tipologie_contratto", "units", "lead_statuses", "cliente_custom_fields", "users",
+    "sub_agenzie", "leads", "spoki_messages", "clienti", "cliente_note_history", "clienti_logs",
+]
+
+
+async def write_dataset(db, dataset: SyntheticDataset, batch_size: int = 5000, drop: bool = False) -> Dict[str, int]:
+    """Scrive il dataset su `db` con insert_many non ordinati; ritorna i conteggi per collection."""
+    if drop:
+        for name in DATASET_COLLECTIONS:
+            await db[name].drop()
+    counts: Dict[str, int] = {}
+
+    async def insert(name: str, docs: List[Dict[str, Any]]):
+        if docs:
+            await db[name].insert_many(docs, ordered=False)
+            counts[name] = counts.get(name, 0) + len(docs)
+
+    for name, docs in dataset.build_structure().items():
+        await insert(name, docs)
+    print(f"✅ Struttura: {', '.join(f'{k}={len(v)}' for k, v in dataset.structure.items())}")
+
+    started = time.perf_counter()
+    for leads, messages in dataset.iter_leads(batch_size):
+        await insert("leads", leads)
+        await insert("spoki_messages", messages)
+        print(f"   leads {counts['leads']:,}/{dataset.spec.leads:,}", end="\r", flush=True)
+    print(f"\n✅ Leads: {counts.get('leads', 0):,} ({time.perf_counter() - started:.1f}s)")
+
+    started = time.perf_counter()
+    for clienti, notes, logs in dataset.iter_clienti(batch_size):
+        await insert("clienti", clienti)
+        await insert("cliente_note_history", notes)
+        await insert("clienti_logs", logs)
+        print(f"   clienti {counts['clienti']:,}/{dataset.spec.clienti:,}", end="\r", flush=True)
+    print(f"\n✅ Clienti: {counts.get('clienti', 0):,} ({time.perf_counter() - started:.1f}s)")
+
+    await db.bench_metadata.replace_one(
+        {"id": "synthetic_dataset"},
+        {"id": "synthetic_dataset", "seed": dataset.seed, "spec": asdict(dataset.spec), "counts": counts,
+         "generated_at": datetime.now(timezone.utc)},
+        upsert=True,
+    )
+    return counts
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Genera un dataset sintetico a scala produzione per benchmark.")
+    parser.add_argument("--mongo-url", default=os.environ.get("MONGO_URL", "mongodb://localhost:27017"))
+    parser.add_argument("--db-name", required=True, help="Database di destinazione (es. crm_bench)")
+    parser.add_argument("--scale", choices=sorted(SCALES), default="small")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--batch-size", type=int, default=5000)
+    parser.add_argument("--drop", action="store_true", help="Svuota le collection del dataset prima di scrivere")
+    parser.add_argument("--force", action="store_true", help="Consenti la scrittura sul DB_NAME configurato in .env")
+    for field in ("units", "commesse", "sub_agenzie", "users", "leads", "clienti"):
+        parser.add_argument(f"--{field.replace('_', '-')}", type=int, default=None, help=f"Override di {field}")
+    return parser.parse_args(argv)
+
+
+async def main(argv=None):
+    args = parse_args(argv)
+    if args.db_name == os.environ.get("DB_NAME") and not args.force:
+        print(f"❌ {args.db_name} è il database configurato in .env: usare un DB dedicato o --force")
+        sys.exit(1)
+    overrides = {k: getattr(args, k) for k in ("units", "commesse", "sub_agenzie", "users", "leads", "clienti")
+                 if getattr(args, k) is not None}
+    spec = replace(SCALES[args.scale], **overrides)
+    print(f"🌱 Dataset sintetico '{args.scale}' (seed {args.seed}) → {args.db_name}")
+    print(f"   {asdict(spec)}")
+    client = AsyncIOMotorClient(args.mongo_url)
+    try:
+        counts = await write_dataset(client[args.db_name], SyntheticDataset(spec, seed=args.seed),
+                                     batch_size=args.batch_size, drop=args.drop)
+        print(f"🎉 Completato: {counts}")
+        print(f"   Login: admin / {BENCH_PASSWORD}")
+    finally:
+        client.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,136 @@
+"""Contatori materializzati di utilizzo dei tag lead/clienti (NEW ott 2026).
+
+`GET /lead-tags/usage` e `cleanup-orphans` facevano `$unwind`/`$group` su tutta
+`leads` e `clienti` a ogni richiesta. Ora la collection `lead_tag_counts`
+
+    { name, lead_count, cliente_count, updated_at }
+
+è mantenuta in modo incrementale:
+
+- aggiunta/rimozione su un singolo documento (`add_lead_tag`, `remove_lead_tag_endpoint`,
+  nodi tag di `WorkflowExecutorV2`): `adjust()` solo se l'update ha davvero modificato
+  il documento (`$addToSet`/`$pull` idempotenti non devono contare due volte);
+- operazioni massive (delete, rename, merge): `recount()` dei soli tag coinvolti con
+  `count_documents` sull'indice multikey `tags`;
+- `reconcile()` periodico (job `tag_counts_reconcile` dello scheduler) ricalcola tutto con
+  l'aggregazione completa e corregge eventuali derive (lead cancellati, import).
+"""
+import logging
+import os
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterable, List
+
+logger = logging.getLogger(__name__)
+
+TAG_COUNTS_COLLECTION = "lead_tag_counts"
+TAG_COUNTS_MARKER_ID = "lead_tag_counts_v1"
+TAG_COUNTS_RECONCILE_INTERVAL_SECONDS = int(os.environ.get("TAG_COUNTS_RECONCILE_INTERVAL_SECONDS", str(6 * 3600)))
+
+# entity -> (collection sorgente, campo contatore)
+_ENTITIES = {"lead": ("leads", "lead_count"), "cliente": ("clienti", "cliente_count")}
+
+
+async def adjust(db, name: str, entity: str, delta: int):
+    """Incrementa/decrementa il contatore di un tag per 'lead' o 'cliente'."""
+    if not name or not delta:
+        return
+    _, field = _ENTITIES[entity]
+    await db[TAG_COUNTS_COLLECTION].update_one(
+        {"name": name},
+        {"$inc": {field: delta}, "$set": {"updated_at": datetime.now(timezone.utc)}},
+        upsert=True,
+    )
+
+
+async def recount(db, names: Iterable[str]):
+    """Ricalcola esattamente i contatori dei tag indicati (dopo update_many)."""
+    for name in {n for n in names if n}:
+        counts = {}
+        for source, field in _ENTITIES.values():
+            counts[field] = await db[source].count_documents({"tags": name})
+        if any(counts.values()):
+            await db[TAG_COUNTS_COLLECTION].update_one(
+                {"name": name}, {"$set": {**counts, "updated_at": datetime.now(timezone.utc)}}, upsert=True,
+            )
+        else:
+            await db[TAG_COUNTS_COLLECTION].delete_one({"name": name})
+
+
+async def read_counts(db) -> Dict[str, Dict[str, int]]:
+    """name -> {lead_count, cliente_count} dei tag in uso."""
+    out = {}
+    async for doc in db[TAG_COUNTS_COLLECTION].find({}, {"_id": 0, "name": 1, "lead_count": 1, "cliente_count": 1}):
+        lc, cc = int(doc.get("lead_count") or 0), int(doc.get("cliente_count") or 0)
+        if lc > 0 or cc > 0:
+            out[doc["name"]] = {"lead_count": lc, "cliente_count": cc}
+    return out
+
+
+async def reconcile(db) -> int:
+    """Ricalcolo completo dall'aggregazione su leads/clienti; ritorna i contatori corretti."""
+    pipeline = [
+        {"$unwind": {"path": "$tags", "preserveNullAndEmptyArrays": False}},
+        {"$group": {"_id": "$tags", "count": {"$sum": 1}}},
+    ]
+    actual: Dict[str, Dict[str, int]] = {}
+    for source, field in _ENTITIES.values():
+        async for x in db[source].aggregate(pipeline, allowDiskUse=True):
+            if x["_id"]:
+                actual.setdefault(x["_id"], {"lead_count": 0, "cliente_count": 0})[field] = x["count"]
+    current = await read_counts(db)
+    fixed = 0
+    now = datetime.now(timezone.utc)
+    for name, counts in actual.items():
+        if current.get(name) != counts:
+            await db[TAG_COUNTS_COLLECTION].update_one(
+                {"name": name}, {"$set": {**counts, "updated_at": now}}, upsert=True,
+            )
+            fixed += 1
+    stale = [name for name in current if name not in actual]
+    if stale:
+        await db[TAG_COUNTS_COLLECTION].delete_many({"name": {"$in": stale}})
+        fixed += len(stale)
+    await db.system_migrations.update_one(
+        {"id": TAG_COUNTS_MARKER_ID},
+        {"$set": {"last_reconciled_at": now, "tags": len(actual), "fixed": fixed}},
+        upsert=True,
+    )
+    return fixed
+
+
+async def ensure_tag_indexes(db):
+    await db[TAG_COUNTS_COLLECTION].create_index("name", unique=True)
+    for source, _ in _ENTITIES.values():
+        await db[source].create_index("tags")
+
+
+async def reconcile_job(db) -> int:
+    """Job "tag_counts_reconcile" dello scheduler (scheduler.py), ricorrente ogni
+    `TAG_COUNTS_RECONCILE_INTERVAL_SECONDS` e alla prima pianificazione subito."""
+    await ensure_tag_indexes(db)
+    fixed = await reconcile(db)
+    if fixed:
+        logger.info(f"[TAG-COUNTS] reconcile: {fixed} contatori corretti")
+    return fixed
+
+
+def usage_rows(meta: List[Dict[str, Any]], counts: Dict[str, Dict[str, int]]) -> List[Dict[str, Any]]:
+    """Righe di /lead-tags/usage: tag formali + orfani (in uso ma non in lead_tags)."""
+    meta_by_name = {t["name"]: t for t in meta}
+    out = []
+    for name in sorted(set(meta_by_name) | set(counts)):
+        m = meta_by_name.get(name, {})
+        c = counts.get(name, {})
+        lc, cc = c.get("lead_count", 0), c.get("cliente_count", 0)
+        out.append({
+            "id": m.get("id"),
+            "name": name,
+            "label": m.get("label") or name,
+            "color": m.get("color") or "#64748b",
+            "description": m.get("description"),
+            "lead_count": lc,
+            "cliente_count": cc,
+            "total_count": lc + cc,
+            "is_orphan": name not in meta_by_name,  # usato ma non definito formalmente
+        })
+    return out
@@ -0,0 +1,570 @@
+"""Shared test helpers: an in-memory stand-in for the motor database.
+
+`FakeDB` / `FakeCollection` implement the part of the motor API the backend modules
+use (find/find_one/count_documents with sort/skip/limit/projection, insert/update/
+delete, find_one_and_update, bulk_write, unique indexes and update pipelines with the
+aggregation expressions the code writes). Every call is logged in `collection.calls`
+so tests can assert on query shapes and round trips.
+
+Aggregation pipelines are NOT emulated: `aggregate` returns `aggregate_results`
+(or fails), and tests only check the pipeline they were given. The pipelines
+themselves ($facet, $merge, $unionWith, $dateTrunc, update pipelines) run against a
+real mongod in test_mongo_integration.py (`-m mongo`, MONGO_TEST_URL).
+
+Unit tests import the helpers with `from conftest import FakeDB`.
+"""
+import copy
+import re
+from datetime import datetime, timezone
+from types import SimpleNamespace
+from typing import Any, Dict, Iterable, List, Optional
+
+from bson import ObjectId
+from pymongo.errors import BulkWriteError, DuplicateKeyError
+
+MISSING = object()
+
+
+def pytest_configure(config):
+    config.addinivalue_line("markers", "mongo: needs a real MongoDB (MONGO_TEST_URL)")
+
+
+# ---- query matching ----
+
+def get_path(doc: Any, path: str) -> Any:
+    """Valore del campo puntato (`a.b.0.c`); MISSING se assente."""
+    value = doc
+    for part in path.split("."):
+        if isinstance(value, dict):
+            value = value.get(part, MISSING)
+        elif isinstance(value, list) and part.isdigit():
+            index = int(part)
+            value = value[index] if index < len(value) else MISSING
+        else:
+            return MISSING
+        if value is MISSING:
+            return MISSING
+    return value
+
+
+def set_path(doc: Dict[str, Any], path: str, value: Any):
+    *parents, leaf = path.split(".")
+    for part in parents:
+        doc = doc.setdefault(part, {})
+    doc[leaf] = value
+
+
+def unset_path(doc: Dict[str, Any], path: str):
+    *parents, leaf = path.split(".")
+    for part in parents:
+        doc = doc.get(part)
+        if not isinstance(doc, dict):
+            return
+    doc.pop(leaf, None)
+
+
+def _norm(value: Any) -> Any:
+    # MongoDB salva le date in UTC senza fuso: confronta aware e naive sullo stesso piano
+    if isinstance(value, datetime) and value.tzinfo is not None:
+        return value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+
+def _eq(value: Any, expected: Any) -> bool:
+    if value is MISSING:
+        return expected is None
+    if isinstance(value, list) and not isinstance(expected, list):
+        return any(_norm(v) == _norm(expected) for v in value)
+    return _norm(value) == _norm(expected)
+
+
+def _compare(value: Any, op: str, arg: Any) -> bool:
+    if isinstance(value, list):
+        return any(_compare(v, op, arg) for v in value)
+    if value is MISSING or value is None or arg is None:
+        return False
+    a, b = _norm(value), _norm(arg)
+    try:
+        return {"$gt": a > b, "$gte": a >= b, "$lt": a < b, "$lte": a <= b}[op]
+    except TypeError:
+        return False
+
+
+def match_value(value: Any, cond: Any) -> bool:
+    if not (isinstance(cond, dict) and cond and all(k.startswith("$") for k in cond)):
+        if isinstance(cond, re.Pattern):
+            return isinstance(value, str) and bool(cond.search(value))
+        return _eq(value, cond)
+    for op, arg in cond.items():
+        if op == "$eq":
+            ok = _eq(value, arg)
+        elif op == "$ne":
+            ok = not _eq(value, arg)
+        elif op == "$in":
+            ok = any(match_value(value, a) for a in arg)
+        elif op == "$nin":
+            ok = not any(match_value(value, a) for a in arg)
+        elif op in ("$gt", "$gte", "$lt", "$lte"):
+            ok = _compare(value, op, arg)
+        elif op == "$exists":
+            ok = (value is not MISSING) == bool(arg)
+        elif op == "$all":
+            ok = isinstance(value, list) and all(a in value for a in arg)
+        elif op == "$size":
+            ok = isinstance(value, list) and len(value) == arg
+        elif op == "$elemMatch":
+            ok = isinstance(value, list) and any(
+                matches(v, arg) if isinstance(v, dict) else match_value(v, arg) for v in value)
+        elif op == "$not":
+            ok = not match_value(value, arg)
+        elif op == "$regex":
+            flags = re.IGNORECASE if "i" in cond.get("$options", "") else 0
+            ok = isinstance(value, str) and re.search(arg, value, flags) is not None
+        elif op == "$options":
+            continue
+        else:
+            raise NotImplementedError(f"FakeCollection: operatore di query {op}")
+        if not ok:
+            return False
+    return True
+
+
+def matches(doc: Dict[str, Any], query: Optional[Dict[str, Any]]) -> bool:
+    for key, cond in (query or {}).items():
+        if key == "$or":
+            ok = any(matches(doc, sub) for sub in cond)
+        elif key == "$and":
+            ok = all(matches(doc, sub) for sub in cond)
+        elif key == "$nor":
+            ok = not any(matches(doc, sub) for sub in cond)
+        else:
+            ok = match_value(get_path(doc, key), cond)
+        if not ok:
+            return False
+    return True
+
+
+# ---- aggregation expressions (update pipelines) ----
+
+def eval_expr(expr: Any, doc: Dict[str, Any]) -> Any:
+    if isinstance(expr, str) and expr.startswith("$"):
+        if expr == "$$ROOT":
+            return doc
+        value = get_path(doc, expr[1:])
+        return None if value is MISSING else value
+    if isinstance(expr, list):
+        return [eval_expr(e, doc) for e in expr]
+    if not isinstance(expr, dict):
+        return expr
+    if len(expr) != 1 or not next(iter(expr)).startswith("$"):
+        return {k: eval_expr(v, doc) for k, v in expr.items()}
+    op, arg = next(iter(expr.items()))
+    if op == "$literal":
+        return arg
+    if op == "$cond":
+        if isinstance(arg, dict):
+            arg = [arg["if"], arg["then"], arg["else"]]
+        return eval_expr(arg[1], doc) if eval_expr(arg[0], doc) else eval_expr(arg[2], doc)
+    if op == "$ifNull":
+        for e in arg:
+            value = eval_expr(e, doc)
+            if value is not None:
+                return value
+        return None
+    args = [eval_expr(a, doc) for a in (arg if isinstance(arg, list) else [arg])]
+    if op in ("$eq", "$ne"):
+        equal = _norm(args[0]) == _norm(args[1])
+        return equal if op == "$eq" else not equal
+    if op in ("$gt", "$gte", "$lt", "$lte"):
+        return _compare(args[0], op, args[1])
+    if op in ("$max", "$min"):
+        values = [_norm(v) for v in (args[0] if len(args) == 1 and isinstance(args[0], list) else args)
+                  if v is not None]
+        return (max if op == "$max" else min)(values, default=None)
+    if op == "$add":
+        return None if any(v is None for v in args) else sum(args[1:], args[0])
+    if op == "$subtract":
+        return None if None in args else args[0] - args[1]
+    if op == "$multiply":
+        out = 1
+        for v in args:
+            out *= v
+        return out
+    if op == "$and":
+        return all(args)
+    if op == "$or":
+        return any(args)
+    if op == "$not":
+        return not args[0]
+    if op == "$in":
+        return args[0] in args[1]
+    if op == "$size":
+        return len(args[0])
+    raise NotImplementedError(f"FakeCollection: espressione {op}")
+
+
+# ---- updates ----
+
+def _seed_from_query(query: Dict[str, Any]) -> Dict[str, Any]:
+    doc: Dict[str, Any] = {}
+    for key, cond in query.items():
+        if key.startswith("$"):
+            continue
+        if isinstance(cond, dict) and any(k.startswith("$") for k in cond):
+            if "$eq" in cond:
+                set_path(doc, key, copy.deepcopy(cond["$eq"]))
+            continue
+        set_path(doc, key, copy.deepcopy(cond))
+    return doc
+
+
+def apply_update(doc: Dict[str, Any], update: Any, inserting: bool = False):
+    if isinstance(update, list):
+        for stage in update:
+            (op, spec), = stage.items()
+            if op in ("$set", "$addFields"):
+                snapshot = copy.deepcopy(doc)  # le espressioni vedono il documento prima dello stage
+                for path, expr in spec.items():
+                    set_path(doc, path, copy.deepcopy(eval_expr(expr, snapshot)))
+            elif op == "$unset":
+                for path in [spec] if isinstance(spec, str) else spec:
+                    unset_path(doc, path)
+            else:
+                raise NotImplementedError(f"FakeCollection: stage di update {op}")
+        return
+    for op, spec in update.items():
+        if op == "$setOnInsert" and not inserting:
+            continue
+        for path, arg in spec.items():
+            current = get_path(doc, path)
+            if op in ("$set", "$setOnInsert"):
+                set_path(doc, path, copy.deepcopy(arg))
+            elif op == "$unset":
+                unset_path(doc, path)
+            elif op == "$inc":
+                set_path(doc, path, (0 if current is MISSING else current) + arg)
+            elif op in ("$max", "$min"):
+                if current is MISSING or (_norm(arg) > _norm(current) if op == "$max" else _norm(arg) < _norm(current)):
+                    set_path(doc, path, arg)
+            elif op in ("$addToSet", "$push"):
+                items = arg["$each"] if isinstance(arg, dict) and "$each" in arg else [arg]
+                target = [] if current is MISSING else current
+                for item in items:
+                    if op == "$push" or item not in target:
+                        target.append(copy.deepcopy(item))
+                if isinstance(arg, dict) and "$slice" in arg:
+                    target[:] = target[arg["$slice"]:] if arg["$slice"] < 0 else target[:arg["$slice"]]
+                set_path(doc, path, target)
+            elif op == "$pull":
+                if current is not MISSING:
+                    set_path(doc, path, [
+                        v for v in current
+                        if not (matches(v, arg) if isinstance(arg, dict) and isinstance(v, dict)
+                                else match_value(v, arg))
+                    ])
+            else:
+                raise NotImplementedError(f"FakeCollection: operatore di update {op}")
+
+
+def apply_projection(doc: Dict[str, Any], projection: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    doc = copy.deepcopy(doc)
+    if not projection:
+        return doc
+    include = {k for k, v in projection.items() if v and k != "_id"}
+    if include:
+        out: Dict[str, Any] = {}
+        for path in include:
+            value = get_path(doc, path)
+            if value is not MISSING:
+                set_path(out, path, value)
+        if projection.get("_id", 1) and "_id" in doc:
+            out["_id"] = doc["_id"]
+        return out
+    for path, flag in projection.items():
+        if not flag:
+            unset_path(doc, path)
+    return doc
+
+
+# ---- cursor / collection / database ----
+
+def _sort_key(value: Any):
+    value = None if value is MISSING else _norm(value)
+    return (value is not None, value)
+
+
+class FakeCursor:
+    def __init__(self, docs: List[Dict[str, Any]], projection: Optional[Dict[str, Any]] = None):
+        self._docs = docs
+        self._projection = projection
+        self._skip = 0
+        self._limit = 0
+
+    def sort(self, key, direction: int = 1):
+        keys = key if isinstance(key, list) else [(key, direction)]
+        for field, way in reversed(keys):
+            self._docs.sort(key=lambda d: _sort_key(get_path(d, field)), reverse=way == -1)
+        return self
+
+    def skip(self, n: int):
+        self._skip = n
+        return self
+
+    def limit(self, n: int):
+        self._limit = n
+        return self
+
+    def _results(self) -> List[Dict[str, Any]]:
+        docs = self._docs[self._skip:]
+        if self._limit:
+            docs = docs[:self._limit]
+        return [apply_projection(d, self._projection) for d in docs]
+
+    async def to_list(self, length: Optional[int] = None) -> List[Dict[str, Any]]:
+        docs = self._results()
+        return docs if length is None else docs[:length]
+
+    def __aiter__(self):
+        self._it = iter(self._results())
+        return self
+
+    async def __anext__(self):
+        try:
+            return next(self._it)
+        except StopIteration:
+            raise StopAsyncIteration
+
+
+def _result(**counts) -> SimpleNamespace:
+    base = dict(matched_count=0, modified_count=0, upserted_id=None, deleted_count=0,
+                inserted_count=0, upserted_count=0, inserted_id=None, inserted_ids=[])
+    base.update(counts)
+    return SimpleNamespace(**base, acknowledged=True)
+
+
+class FakeCollection:
+    def __init__(self, docs: Optional[List[Dict[str, Any]]] = None, name: str = "",
+                 aggregate_results: Optional[Iterable[Dict[str, Any]]] = None):
+        self.name = name
+        self.docs = docs if docs is not None else []
+        self.aggregate_results = aggregate_results
+        self.calls: List[tuple] = []
+        self.indexes: List[Any] = []
+        self._unique: List[List[str]] = [["_id"]]  # indice _id implicito
+
+    def calls_to(self, method: str) -> List[tuple]:
+        return [c[1:] for c in self.calls if c[0] == method]
+
+    # -- letture --
+
+    def _select(self, query, sort=None) -> List[Dict[str, Any]]:
+        docs = [d for d in self.docs if matches(d, query)]
+        if sort:
+            cursor = FakeCursor(docs).sort(sort)
+            docs = cursor._docs
+        return docs
+
+    def find(self, filter=None, projection=None, sort=None, skip=0, limit=0):
+        self.calls.append(("find", filter or {}, projection))
+        cursor = FakeCursor(self._select(filter), projection)
+        if sort:
+            cursor.sort(sort)
+        return cursor.skip(skip).limit(limit)
+
+    async def find_one(self, filter=None, projection=None, sort=None):
+        self.calls.append(("find_one", filter or {}, projection))
+        docs = self._select(filter, sort)
+        return apply_projection(docs[0], projection) if docs else None
+
+    async def count_documents(self, filter, **kwargs):
+        self.calls.append(("count_documents", filter))
+        return len(self._select(filter))
+
+    async def distinct(self, key, filter=None):
+        self.calls.append(("distinct", key, filter or {}))
+        out = []
+        for d in self._select(filter):
+            value = get_path(d, key)
+            for v in value if isinstance(value, list) else [value]:
+                if v is not MISSING and v not in out:
+                    out.append(v)
+        return out
+
+    def aggregate(self, pipeline, **kwargs):
+        self.calls.append(("aggregate", pipeline))
+        if self.aggregate_results is None:
+            raise NotImplementedError("FakeCollection non esegue pipeline: vedi test_mongo_integration.py")
+        return FakeCursor([dict(r) for r in self.aggregate_results])
+
+    # -- scritture --
+
+    def _check_unique(self, doc, skip=None):
+        for fields in self._unique:
+            key = [_norm(get_path(doc, f)) for f in fields]
+            if all(k is MISSING for k in key):
+                continue
+            for other in self.docs:
+                if other is not skip and [_norm(get_path(other, f)) for f in fields] == key:
+                    raise DuplicateKeyError(f"E11000 duplicate key {dict(zip(fields, key))}", 11000)
+
+    def _insert(self, doc):
+        doc.setdefault("_id", ObjectId())  # come motor, l'_id viene aggiunto al dict passato
+        stored = copy.deepcopy(doc)
+        self._check_unique(stored)
+        self.docs.append(stored)
+        return doc["_id"]
+
+    async def insert_one(self, document, **kwargs):
+        self.calls.append(("insert_one", document))
+        return _result(inserted_id=self._insert(document), inserted_count=1)
+
+    async def insert_many(self, documents, ordered=True, **kwargs):
+        documents = list(documents)
+        self.calls.append(("insert_many", documents))
+        ids, errors = [], []
+        for index, doc in enumerate(documents):
+            try:
+                ids.append(self._insert(doc))
+            except DuplicateKeyError as e:
+                errors.append({"index": index, "code": 11000, "errmsg": str(e)})
+                if ordered:
+                    break
+        if errors:
+            raise BulkWriteError({"writeErrors": errors, "nInserted": len(ids)})
+        return _result(inserted_ids=ids, inserted_count=len(ids))
+
+    def _update(self, filter, update, upsert, many):
+        targets = self._select(filter)
+        if not many:
+            targets = targets[:1]
+        if not targets:
+            if not upsert:
+                return _result()
+            doc = _seed_from_query(filter)
+            apply_update(doc, update, inserting=True)
+            return _result(upserted_id=self._insert(doc), upserted_count=1)
+        modified = 0
+        for doc in targets:
+            before = copy.deepcopy(doc)
+            apply_update(doc, update)
+            if doc != before:
+                try:
+                    self._check_unique(doc, skip=doc)
+                except DuplicateKeyError:
+                    doc.clear()
+                    doc.update(before)
+                    raise
+                modified += 1
+        return _result(matched_count=len(targets), modified_count=modified)
+
+    async def update_one(self, filter, update, upsert=False, **kwargs):
+        self.calls.append(("update_one", filter, update))
+        return self._update(filter, update, upsert, many=False)
+
+    async def update_many(self, filter, update, upsert=False, **kwargs):
+        self.calls.append(("update_many", filter, update))
+        return self._update(filter, update, upsert, many=True)
+
+    async def replace_one(self, filter, replacement, upsert=False, **kwargs):
+        self.calls.append(("replace_one", filter, replacement))
+        targets = self._select(filter)[:1]
+        if not targets:
+            if not upsert:
+                return _result()
+            return _result(upserted_id=self._insert(dict(replacement)), upserted_count=1)
+        keep_id = targets[0].get("_id")
+        targets[0].clear()
+        targets[0].update(copy.deepcopy(replacement), _id=keep_id)
+        return _result(matched_count=1, modified_count=1)
+
+    async def find_one_and_update(self, filter, update, projection=None, sort=None, upsert=False,
+                                  return_document=False, **kwargs):
+        self.calls.append(("find_one_and_update", filter, update))
+        targets = self._select(filter, sort)[:1]
+        if not targets:
+            if not upsert:
+                return None
+            doc = _seed_from_query(filter)
+            apply_update(doc, update, inserting=True)
+            self._insert(doc)
+            return apply_projection(doc, projection) if return_document else None
+        before = copy.deepcopy(targets[0])
+        apply_update(targets[0], update)
+        # pymongo.ReturnDocument.AFTER è True, BEFORE è False
+        return apply_projection(targets[0] if return_document else before, projection)
+
+    async def delete_one(self, filter, **kwargs):
+        self.calls.append(("delete_one", filter))
+        targets = self._select(filter)[:1]
+        self.docs[:] = [d for d in self.docs if not any(d is t for t in targets)]
+        return _result(deleted_count=len(targets))
+
+    async def delete_many(self, filter, **kwargs):
+        self.calls.append(("delete_many", filter))
+        before = len(self.docs)
+        self.docs[:] = [d for d in self.docs if not matches(d, filter)]
+        return _result(deleted_count=before - len(self.docs))
+
+    async def bulk_write(self, requests, ordered=True, **kwargs):
+        requests = list(requests)
+        self.calls.append(("bulk_write", requests))
+        totals = dict(inserted_count=0, matched_count=0, modified_count=0, upserted_count=0, deleted_count=0)
+        errors = []
+        for index, op in enumerate(requests):
+            kind = type(op).__name__
+            try:
+                if kind == "InsertOne":
+                    self._insert(op._doc)
+                    totals["inserted_count"] += 1
+                    continue
+                if kind in ("UpdateOne", "UpdateMany"):
+                    res = self._update(op._filter, op._doc, op._upsert, many=kind == "UpdateMany")
+                elif kind == "DeleteOne":
+                    res = await self.delete_one(op._filter)
+                elif kind == "DeleteMany":
+                    res = await self.delete_many(op._filter)
+                elif kind == "ReplaceOne":
+                    res = await self.replace_one(op._filter, op._doc, upsert=op._upsert)
+                else:
+                    raise NotImplementedError(f"FakeCollection: bulk {kind}")
+            except DuplicateKeyError as e:
+                errors.append({"index": index, "code": 11000, "errmsg": str(e)})
+                if ordered:
+                    break
+                continue
+            for key in ("matched_count", "modified_count", "upserted_count", "deleted_count"):
+                totals[key] += getattr(res, key)
+        if errors:
+            raise BulkWriteError({"writeErrors": errors, **{f"n{k}": v for k, v in totals.items()}})
+        return _result(**totals)
+
+    async def create_index(self, keys, unique=False, **kwargs):
+        fields = [keys] if isinstance(keys, str) else [k for k, _ in keys]
+        self.indexes.append(keys)
+        if unique:
+            self._unique.append(fields)
+        return "_".join(fields)
+
+
+class FakeDB:
+    """`db.<nome>` e `db["<nome>"]` creano la collection al primo accesso;
+    FakeDB(leads=[...]) la precarica con quei documenti (la lista resta condivisa)."""
+
+    def __init__(self, **collections: Any):
+        self.collections: Dict[str, FakeCollection] = {}
+        for name, value in collections.items():
+            self.collections[name] = value if isinstance(value, FakeCollection) else FakeCollection(value, name)
+            self.collections[name].name = name
+
+    def __getitem__(self, name: str) -> FakeCollection:
+        if name not in self.collections:
+            self.collections[name] = FakeCollection(name=name)
+        return self.collections[name]
+
+    def __getattr__(self, name: str) -> FakeCollection:
+        if name.startswith("_"):
+            raise AttributeError(name)
+        return self[name]
+
+    async def list_collection_names(self) -> List[str]:
+        return list(self.collections)
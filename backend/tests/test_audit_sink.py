@@ -0,0 +1,152 @@
+"""Unit tests for the buffered audit-log writer (audit.AuditSink).
+
+Verifies:
+  - entries are buffered while the flusher runs and written with one insert_many
+  - size threshold triggers a flush
+  - durable=True writes before returning
+  - drain() flushes everything pending on shutdown
+  - metrics expose pending counts and lag
+  - entries not written by a failed flush are retried once, then counted as dropped
+"""
+import asyncio
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+from audit import AuditSink  # noqa: E402
+from conftest import FakeCollection, FakeDB  # noqa: E402
+from pymongo.errors import OperationFailure  # noqa: E402
+
+
+def _batches(fake, name):
+    return [[d["id"] for d in docs] for (docs,) in fake[name].calls_to("insert_many")]
+
+
+def _run(coro):
+    return asyncio.run(coro)
+
+
+def test_entries_buffered_then_flushed_in_one_batch():
+    async def scenario():
+        fake = FakeDB()
+        sink = AuditSink(fake, batch_size=100, flush_interval=60)
+        sink.start()
+        for i in range(5):
+            await sink.write("clienti_logs", {"id": str(i)})
+        assert sink.pending("clienti_logs") == 5
+        assert _batches(fake, "clienti_logs") == []
+        await sink.flush()
+        assert _batches(fake, "clienti_logs") == [["0", "1", "2", "3", "4"]]
+        await sink.drain()
+
+    _run(scenario())
+
+
+def test_size_threshold_triggers_flush():
+    async def scenario():
+        fake = FakeDB()
+        sink = AuditSink(fake, batch_size=3, flush_interval=60)
+        sink.start()
+        for i in range(7):
+            await sink.write("lead_history", {"id": str(i)})
+        assert [len(b) for b in _batches(fake, "lead_history")] == [3, 3]
+        assert sink.pending("lead_history") == 1
+        await sink.drain()
+        assert len(fake["lead_history"].docs) == 7
+
+    _run(scenario())
+
+
+def test_durable_write_is_persisted_before_return():
+    async def scenario():
+        fake = FakeDB()
+        sink = AuditSink(fake, batch_size=100, flush_interval=60)
+        sink.start()
+        await sink.write("clienti_logs", {"id": "a"})
+        await sink.write("clienti_logs", {"id": "b"}, durable=True)
+        assert _batches(fake, "clienti_logs") == [["a", "b"]]
+        assert sink.pending() == 0
+        await sink.drain()
+
+    _run(scenario())
+
+
+def test_without_running_flusher_writes_inline():
+    async def scenario():
+        fake = FakeDB()
+        sink = AuditSink(fake, batch_size=100, flush_interval=60)
+        await sink.write("clienti_logs", {"id": "x", "_id": "mongo"})
+        assert _batches(fake, "clienti_logs") == [["x"]]
+        assert fake["clienti_logs"].docs[0]["_id"] != "mongo"
+
+    _run(scenario())
+
+
+def test_metrics_report_pending_and_lag():
+    async def scenario():
+        fake = FakeDB()
+        sink = AuditSink(fake, batch_size=100, flush_interval=60)
+        sink.start()
+        await sink.write("clienti_logs", {"id": "1"})
+        await asyncio.sleep(0.01)
+        m = sink.metrics()
+        assert m["running"] is True
+        assert m["pending_total"] == 1
+        assert m["collections"]["clienti_logs"]["current_lag_ms"] > 0
+        await sink.drain()
+        m = sink.metrics()
+        assert m["running"] is False
+        assert m["collections"]["clienti_logs"]["written"] == 1
+        assert m["collections"]["clienti_logs"]["current_lag_ms"] == 0.0
+
+    _run(scenario())
+
+
+class FlakyCollection(FakeCollection):
+    """insert_many fallisce le prime `failures` volte con un errore senza details."""
+
+    def __init__(self, failures):
+        super().__init__()
+        self.failures = failures
+
+    async def insert_many(self, documents, ordered=True, **kwargs):
+        if self.failures:
+            self.failures -= 1
+            raise OperationFailure("not primary", 10107, None)
+        return await super().insert_many(documents, ordered=ordered, **kwargs)
+
+
+def test_failed_flush_requeues_entries_for_one_retry():
+    async def scenario():
+        fake = FakeDB(clienti_logs=FlakyCollection(failures=1))
+        sink = AuditSink(fake, batch_size=100, flush_interval=60)
+        sink.start()
+        await sink.write("clienti_logs", {"id": "a"})
+        await sink.write("clienti_logs", {"id": "b"})
+        assert await sink.flush() == 0
+        assert sink.pending("clienti_logs") == 2
+        await sink.write("clienti_logs", {"id": "c"})
+        assert await sink.flush() == 3
+        assert [d["id"] for d in fake["clienti_logs"].docs] == ["a", "b", "c"]
+        stats = sink.metrics()["collections"]["clienti_logs"]
+        assert stats["dropped"] == 0
+        assert stats["failed_flushes"] == 1
+        await sink.drain()
+
+    _run(scenario())
+
+
+def test_entries_dropped_after_second_failure():
+    async def scenario():
+        fake = FakeDB(clienti_logs=FlakyCollection(failures=2))
+        sink = AuditSink(fake, batch_size=100, flush_interval=60)
+        sink.start()
+        await sink.write("clienti_logs", {"id": "a"})
+        await sink.flush()
+        await sink.flush()
+        assert sink.pending("clienti_logs") == 0
+        assert fake["clienti_logs"].docs == []
+        assert sink.metrics()["collections"]["clienti_logs"]["dropped"] == 1
+        await sink.drain()
+
+    _run(scenario())
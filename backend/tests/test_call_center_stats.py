@@ -0,0 +1,74 @@
+"""Unit tests for the call-center dashboard (call_center_stats.py).
+
+Verifies:
+  - the dashboard is one aggregate on `calls` ($unionWith agents + $facet), scoped
+    to the Unit when given, and the facet output maps to the endpoint's fields
+  - concurrent viewers share a single computation and the result is reused for the TTL
+"""
+import asyncio
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+import call_center_stats  # noqa: E402
+import lead_analytics  # noqa: E402
+from conftest import FakeCollection, FakeDB  # noqa: E402
+
+
+class _Calls(FakeCollection):
+    """`aggregate` restituisce l'output del $facet dopo `delay` (per sovrapporre le richieste)."""
+
+    def __init__(self, facets, delay=0.0):
+        super().__init__(aggregate_results=[facets])
+        self.delay = delay
+
+    async def aggregate(self, pipeline, **kwargs):
+        self.calls.append(("aggregate", pipeline))
+        await asyncio.sleep(self.delay)
+        for row in self.aggregate_results:
+            yield row
+
+
+FACETS = {
+    "active": [{"n": 3}],
+    "agents": [{"n": 2}],
+    "today": [{"calls": 8, "answered": 6, "abandoned": 1, "avg_wait_ms": 12345.0}],
+}
+
+
+def test_dashboard_is_a_single_facet_pipeline():
+    lead_analytics._analytics_cache.clear()
+    calls = _Calls(FACETS)
+
+    out = asyncio.run(call_center_stats.compute_dashboard(FakeDB(calls=calls), "u1"))
+
+    [(pipeline,)] = calls.calls_to("aggregate")
+    stages = [next(iter(stage)) for stage in pipeline]
+    assert stages == ["$match", "$project", "$unionWith", "$facet"]
+    assert pipeline[0]["$match"]["unit_id"] == "u1"
+    assert pipeline[2]["$unionWith"]["pipeline"][0]["$match"] == {"unit_id": "u1", "status": "available"}
+    assert out["active_calls"] == 3 and out["available_agents"] == 2
+    assert (out["calls_today"], out["answered_today"], out["abandoned_today"]) == (8, 6, 1)
+    assert out["answer_rate"] == 75.0 and out["abandonment_rate"] == 12.5
+    assert out["avg_wait_time"] == 12.35
+
+    empty = asyncio.run(call_center_stats.compute_dashboard(FakeDB(calls=_Calls({"active": [], "agents": [], "today": []}))))
+    assert empty["active_calls"] == 0 and empty["calls_today"] == 0 and empty["answer_rate"] == 0
+
+
+def test_concurrent_viewers_share_one_computation(monkeypatch):
+    lead_analytics._analytics_cache.clear()
+    monkeypatch.setattr(call_center_stats, "CALL_CENTER_DASHBOARD_TTL_SECONDS", 60)
+    calls = _Calls(FACETS, delay=0.05)
+    db = FakeDB(calls=calls)
+
+    async def scenario():
+        burst = await asyncio.gather(*[call_center_stats.get_dashboard(db, "u1") for _ in range(10)])
+        again = await call_center_stats.get_dashboard(db, "u1")
+        return burst, again
+
+    burst, again = asyncio.run(scenario())
+
+    assert len(calls.calls_to("aggregate")) == 1
+    assert all(r is burst[0] for r in burst) and again is burst[0]
+    assert lead_analytics._analytics_inflight == {}
@@ -0,0 +1,153 @@
+"""Unit tests for the persistent ACD queue (call_queue.py, services.ACDService).
+
+Verifies:
+  - queued calls are served by priority, then by wait time, and an agent is never
+    reserved twice (atomic claim + reservation)
+  - a claimed call with no matching agent goes back to waiting with its original age and
+    does not block lower-priority calls that an available agent can take
+  - an agent becoming available dispatches the queue without a manual process_queue
+  - route_incoming_call serves calls already waiting before the new one
+  - an agent freed while the call was claimed elsewhere is picked up by the retry after release
+  - a dispatched call is redirected to the agent's extension through Twilio
+"""
+import asyncio
+import sys
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from types import SimpleNamespace
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+import call_queue  # noqa: E402
+import services  # noqa: E402
+from models import AgentStatus  # noqa: E402
+from conftest import FakeDB  # noqa: E402
+
+
+def _agent(uid, unit="u1", status="available", skills=(), load=0):
+    return {"user_id": uid, "unit_id": unit, "status": status, "skills": list(skills), "calls_in_progress": load}
+
+
+def _queued(db, sid, priority, minutes_ago, unit="u1", skills=()):
+    db[call_queue.CALL_QUEUE_COLLECTION].docs.append({
+        "id": sid, "call_sid": sid, "unit_id": unit, "priority": priority, "skills_required": list(skills),
+        "queued_at": datetime.now(timezone.utc) - timedelta(minutes=minutes_ago), "status": "waiting",
+    })
+
+
+def test_dispatch_orders_by_priority_then_wait_and_reserves_once():
+    db = FakeDB(agent_call_center=[_agent("a1", load=1), _agent("a2"), _agent("a3", unit="u2")])
+    _queued(db, "old-normal", 1, 10)
+    _queued(db, "new-urgent", 3, 1)
+    _queued(db, "newer-normal", 1, 2)
+    assigned = []
+
+    async def assign(call_sid, agent):
+        assigned.append((call_sid, agent["user_id"]))
+
+    out = asyncio.run(call_queue.dispatch(db, "u1", assign))
+
+    # a2 (meno carico) prende l'urgente, a1 la normale più vecchia; a3 è di un'altra Unit
+    assert out == assigned == [("new-urgent", "a2"), ("old-normal", "a1")]
+    status = {d["call_sid"]: d["status"] for d in db[call_queue.CALL_QUEUE_COLLECTION].docs}
+    assert status == {"old-normal": "dispatched", "new-urgent": "dispatched", "newer-normal": "waiting"}
+    assert all(a["status"] == "busy" for a in db.agent_call_center.docs[:2])
+    assert db.agent_call_center.docs[2]["status"] == "available"
+
+
+def test_unmatched_call_is_released_with_original_age():
+    db = FakeDB(agent_call_center=[_agent("a1", skills=["italian"])])
+    _queued(db, "needs-english", 1, 5, skills=["english"])
+    queued_at = db[call_queue.CALL_QUEUE_COLLECTION].docs[0]["queued_at"]
+
+    out = asyncio.run(call_queue.dispatch(db, "u1", None))
+
+    entry = db[call_queue.CALL_QUEUE_COLLECTION].docs[0]
+    assert out == []
+    assert entry["status"] == "waiting" and entry["claimed_by"] is None and entry["queued_at"] == queued_at
+    assert db.agent_call_center.docs[0]["status"] == "available"
+
+
+def test_unmatched_head_call_does_not_block_the_queue():
+    db = FakeDB(agent_call_center=[_agent("a1", skills=["italian"])])
+    _queued(db, "urgent-english", 3, 5, skills=["english"])
+    _queued(db, "normal-italian", 1, 2, skills=["italian"])
+
+    out = asyncio.run(call_queue.dispatch(db, "u1", lambda sid, agent: asyncio.sleep(0)))
+
+    assert out == [("normal-italian", "a1")]
+    status = {d["call_sid"]: d["status"] for d in db[call_queue.CALL_QUEUE_COLLECTION].docs}
+    assert status == {"urgent-english": "waiting", "normal-italian": "dispatched"}
+
+
+def test_agent_available_event_dispatches_and_incoming_call_waits_its_turn(monkeypatch):
+    db = FakeDB(agent_call_center=[_agent("a1", status="offline")])
+    monkeypatch.setattr(services, "db", db)
+    _queued(db, "waiting-call", 1, 3)
+    db.calls.docs.append({"call_sid": "waiting-call", "status": "queued"})
+    acd = services.ACDService()
+
+    async def scenario():
+        routed = await acd.route_incoming_call("new-call", "+39000", "+39111", unit_id="u1")
+        await acd.call_center_service.update_agent_status("a1", AgentStatus.AVAILABLE)
+        return routed
+
+    routed = asyncio.run(scenario())
+
+    assert routed["action"] == "queue_call"
+    call = next(c for c in db.calls.docs if c["call_sid"] == "waiting-call")
+    assert call["agent_id"] == "a1" and call["status"] == "in-progress"
+    assert db.agent_call_center.docs[0]["calls_in_progress"] == 1
+    assert {d["call_sid"]: d["status"] for d in db[call_queue.CALL_QUEUE_COLLECTION].docs}["new-call"] == "waiting"
+
+    asyncio.run(acd.call_center_service.release_agent("a1"))
+    new_call = next(c for c in db.calls.docs if c["call_sid"] == "new-call")
+    assert new_call["agent_id"] == "a1"
+    assert db.agent_call_center.docs[0]["calls_in_progress"] == 1
+
+
+def test_agent_freed_during_claim_is_picked_up_by_retry(monkeypatch):
+    db = FakeDB(agent_call_center=[_agent("a1", status="busy", load=1)])
+    _queued(db, "c1", 1, 1)
+    real_reserve = call_queue.reserve_agent
+    attempts = []
+
+    async def racing_reserve(database, unit_id, skills_required=None, **kwargs):
+        attempts.append(unit_id)
+        if len(attempts) == 1:
+            # release_agent su un altro worker: c1 è reclamata, il suo dispatch non trova nulla
+            db.agent_call_center.docs[0].update(status="available", calls_in_progress=0)
+            return None
+        return await real_reserve(database, unit_id, skills_required, **kwargs)
+
+    monkeypatch.setattr(call_queue, "reserve_agent", racing_reserve)
+
+    async def assign(call_sid, agent):
+        return None
+
+    out = asyncio.run(call_queue.dispatch(db, None, assign))
+
+    assert out == [("c1", "a1")] and len(attempts) == 2
+    assert db[call_queue.CALL_QUEUE_COLLECTION].docs[0]["status"] == "dispatched"
+
+
+def test_dispatched_call_is_redirected_to_agent_extension(monkeypatch):
+    db = FakeDB(agent_call_center=[{**_agent("a1"), "extension": "+390612345"}])
+    monkeypatch.setattr(services, "db", db)
+    _queued(db, "c1", 1, 1)
+    db.calls.docs.append({"call_sid": "c1", "status": "queued"})
+    updates = []
+
+    class _Call:
+        def __init__(self, sid):
+            self.sid, self.status = sid, "in-progress"
+
+        def update(self, **kwargs):
+            updates.append((self.sid, kwargs))
+            return self
+
+    svc = services.CallCenterService()
+    svc.twilio_service.client = SimpleNamespace(calls=_Call)
+
+    assert asyncio.run(svc.dispatch_queue("u1")) == [("c1", "a1")]
+    assert len(updates) == 1 and updates[0][0] == "c1"
+    assert "<Dial>+390612345</Dial>" in updates[0][1]["twiml"]
@@ -0,0 +1,102 @@
+"""Unit tests for the bounded ChatBot session cache (chat_session_cache.py, services.ChatBotService).
+
+Verifies:
+  - least recently used sessions are evicted by count and by estimated bytes,
+    idle sessions expire after the TTL; each eviction reason is counted
+  - after a miss the session is rebuilt from the last messages in chat_messages and
+    that history is passed to the first LLM call only
+  - user and assistant messages are saved with a single insert_many
+"""
+import asyncio
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+import chat_session_cache  # noqa: E402
+import services  # noqa: E402
+from chat_session_cache import ChatSessionCache, ChatSessionEntry  # noqa: E402
+from conftest import FakeDB  # noqa: E402
+
+
+class _Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_lru_eviction_by_entries_bytes_and_ttl(monkeypatch):
+    clock = _Clock()
+    monkeypatch.setattr(chat_session_cache.time, "monotonic", clock)
+    cache = ChatSessionCache(max_entries=2, ttl_seconds=60, max_bytes=100)
+
+    cache.put("a", ChatSessionEntry("chat-a", "u1", size=10))
+    cache.put("b", ChatSessionEntry("chat-b", "u1", size=10))
+    assert cache.get("a").chat == "chat-a"  # "b" diventa la meno usata
+    cache.put("c", ChatSessionEntry("chat-c", "u1", size=10))
+    assert "b" not in cache and "a" in cache
+
+    cache.add_bytes("a", 85)  # 95 + 10 > 100: esce "c" (meno recente), "a" resta
+    assert "c" not in cache and "a" in cache
+    assert cache.stats()["bytes"] == 95
+
+    clock.now += 61
+    assert cache.get("a") is None
+    assert cache.stats()["evictions"] == {"entries": 1, "ttl": 1, "bytes": 1}
+    assert cache.stats()["entries"] == 0 and cache.stats()["bytes"] == 0
+
+
+class _FakeChat:
+    created = []
+
+    def __init__(self, api_key, session_id, system_message):
+        self.sent = []
+        _FakeChat.created.append(self)
+
+    def with_model(self, provider, model):
+        return self
+
+    async def send_message(self, message):
+        self.sent.append(message.text)
+        return f"risposta {len(self.sent)}"
+
+
+class _UserMessage:
+    def __init__(self, text):
+        self.text = text
+
+
+def test_send_message_rehydrates_once_and_batches_inserts(monkeypatch):
+    history = [
+        {"session_id": "s1", "message": "ciao", "message_type": "user", "created_at": 1},
+        {"session_id": "s1", "message": "buongiorno!", "message_type": "assistant", "created_at": 2},
+        {"session_id": "s2", "message": "altro", "message_type": "user", "created_at": 3},
+    ]
+    fake = FakeDB(chat_messages=history, units=[{"id": "u1", "name": "Unit 1"}])
+    monkeypatch.setattr(services, "db", fake)
+    monkeypatch.setattr(services, "LlmChat", _FakeChat)
+    monkeypatch.setattr(services, "UserMessage", _UserMessage)
+    monkeypatch.setattr(services, "CHAT_SESSION_HISTORY_MESSAGES", 2)
+    _FakeChat.created = []
+    bot = services.ChatBotService(ChatSessionCache(max_entries=10, ttl_seconds=0, max_bytes=10**6))
+
+    async def scenario():
+        first = await bot.send_message("s1", "u1", "quali lead richiamo?", "agent-1")
+        second = await bot.send_message("s1", "u1", "e domani?", "agent-1")
+        return first, second
+
+    first, second = asyncio.run(scenario())
+
+    assert (first, second) == ("risposta 1", "risposta 2")
+    chat = _FakeChat.created[0]
+    assert len(_FakeChat.created) == 1
+    assert chat.sent[0].startswith("Storia conversazione recente:\nUSER: ciao\nASSISTANT: buongiorno!")
+    assert chat.sent[0].endswith("quali lead richiamo?")
+    assert chat.sent[1] == "e domani?"
+    assert len(fake.chat_messages.calls_to("insert_many")) == 2 and not fake.chat_messages.calls_to("insert_one")
+    saved = [(d["message_type"], d["message"]) for d in fake.chat_messages.docs[3:]]
+    assert saved == [("user", "quali lead richiamo?"), ("assistant", "risposta 1"),
+                     ("user", "e domani?"), ("assistant", "risposta 2")]
+    stats = bot.sessions.stats()
+    assert (stats["misses"], stats["hits"], stats["rehydrated"]) == (1, 1, 1)
@@ -0,0 +1,70 @@
+"""Unit tests for daily cliente rollups per sub agenzia (cliente_rollups.py).
+
+Verifies:
+  - days are Europe/Rome midnights, including the 23-hour DST day
+  - refresh_bucket() recomputes one (sub agenzia, day) bucket with an indexed match,
+    upserts the new combinations and drops the ones that disappeared
+  - read_sub_agenzie_rollups() folds the $facet output into per-sub-agenzia breakdowns
+"""
+import asyncio
+import sys
+from datetime import datetime
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+import cliente_rollups  # noqa: E402
+from conftest import FakeCollection, FakeDB  # noqa: E402
+
+
+def test_rome_days_across_dst():
+    day = cliente_rollups.day_start(datetime(2026, 3, 29, 12, 0))
+    assert day == datetime(2026, 3, 28, 23, 0)  # mezzanotte CET
+    assert cliente_rollups._next_day(day) == datetime(2026, 3, 29, 22, 0)  # mezzanotte CEST
+    assert cliente_rollups.day_label(day) == "2026-03-29"
+    assert cliente_rollups.day_start("2026-08-15T22:30:00+00:00") == datetime(2026, 8, 15, 22, 0)
+    assert cliente_rollups.day_start(None) is None
+
+
+def test_refresh_bucket_upserts_and_drops_stale_rows():
+    day = datetime(2026, 10, 1, 22, 0)
+    row = {"_id": {"sub_agenzia_id": "sa1", "day": day, "commessa_id": "c1", "servizio_id": None,
+                   "status": "attivo", "tipologia_contratto": "Energia", "assigned": "u1"}, "count": 3}
+    stale = {"key": "old", "sub_agenzia_id": "sa1", "day": day, "status": "da_lavorare", "count": 3}
+    other_day = {"key": "other", "sub_agenzia_id": "sa1", "day": datetime(2026, 10, 2, 22, 0), "count": 1}
+    db = FakeDB(clienti=FakeCollection(aggregate_results=[row]),
+                **{cliente_rollups.ROLLUP_COLLECTION: [stale, other_day]})
+    rollups = db[cliente_rollups.ROLLUP_COLLECTION]
+
+    assert asyncio.run(cliente_rollups.refresh_bucket(db, "sa1", day)) == 1
+
+    [(pipeline,)] = db.clienti.calls_to("aggregate")
+    match = pipeline[0]["$match"]
+    assert match["sub_agenzia_id"] == "sa1"
+    assert match["$or"][0] == {"created_at": {"$gte": day, "$lt": datetime(2026, 10, 2, 22, 0)}}
+    keys = {d["key"] for d in rollups.docs}
+    assert "old" not in keys and "other" in keys
+    new = next(d for d in rollups.docs if d["key"] not in ("other",))
+    assert new["status"] == "attivo" and new["count"] == 3 and new["assigned"] == "u1"
+
+
+def test_read_rollups_folds_facets():
+    d1, d2 = datetime(2026, 9, 30, 22, 0), datetime(2026, 10, 1, 22, 0)
+    facets = {
+        "status": [{"_id": {"sa": "sa1", "v": "attivo"}, "count": 4}, {"_id": {"sa": "sa1", "v": "ko"}, "count": 1}],
+        "tipologia": [{"_id": {"sa": "sa1", "v": "Energia"}, "count": 5}],
+        "assigned": [{"_id": {"sa": "sa1", "v": "u1"}, "count": 5}],
+        "days": [{"_id": {"sa": "sa1", "v": d1}, "count": 2}, {"_id": {"sa": "sa1", "v": d2}, "count": 3}],
+    }
+    db = FakeDB(**{cliente_rollups.ROLLUP_COLLECTION: FakeCollection(aggregate_results=[facets])})
+
+    out = asyncio.run(cliente_rollups.read_sub_agenzie_rollups(
+        db, ["sa1", "sa2"], day_from=d1, day_to=d2, commessa_ids=["c1"]))
+
+    [(pipeline,)] = db[cliente_rollups.ROLLUP_COLLECTION].calls_to("aggregate")
+    assert pipeline[0]["$match"] == {
+        "sub_agenzia_id": {"$in": ["sa1", "sa2"]}, "day": {"$gte": d1, "$lte": d2}, "commessa_id": {"$in": ["c1"]},
+    }
+    assert out["sa1"]["total"] == 5
+    assert out["sa1"]["status"] == {"attivo": 4, "ko": 1}
+    assert out["sa1"]["days"] == {"2026-10-01": 2, "2026-10-02": 3}
+    assert out["sa2"] == {"total": 0, "status": {}, "tipologia": {}, "assigned": {}, "days": {}}
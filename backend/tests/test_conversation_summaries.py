@@ -0,0 +1,100 @@
+"""Unit tests for the WhatsApp inbox summaries (conversation_summaries.py, spoki_routes).
+
+Verifies:
+  - each logged message upserts the lead's summary: count, last message (an older
+    message arriving late does not replace it), texts starting with "$" kept verbatim
+  - unhandled flags increment and mark-read clears the summary counter
+  - the inbox reads summaries sorted/paginated with the user's Unit scope in the query,
+    and the unhandled count is a single count on summaries
+  - a lead's thread includes messages moved to the archive, in chronological order
+"""
+import asyncio
+import sys
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from types import SimpleNamespace
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+import conversation_summaries  # noqa: E402
+from models import UserRole  # noqa: E402
+from spoki_routes import build_spoki_routers  # noqa: E402
+from conftest import FakeCollection, FakeDB  # noqa: E402
+
+T0 = datetime(2026, 10, 1, 9, 0, tzinfo=timezone.utc)
+
+
+def _msg(lead_id, minutes, body, unit="u1", sender="lead"):
+    return {"id": f"m-{lead_id}-{minutes}", "lead_id": lead_id, "unit_id": unit, "body": body,
+            "direction": "inbound" if sender == "lead" else "outbound", "sender": sender,
+            "status": "received", "created_at": T0 + timedelta(minutes=minutes)}
+
+
+def test_record_message_keeps_latest_and_counts():
+    db = FakeDB()
+
+    async def scenario():
+        await conversation_summaries.record_message(db, _msg("l1", 0, "ciao"))
+        await conversation_summaries.record_message(db, _msg("l1", 5, "$set costa troppo", sender="bot"))
+        await conversation_summaries.record_message(db, _msg("l1", 2, "arrivato in ritardo"))
+        await conversation_summaries.flag_unhandled(db, "l1")
+        await conversation_summaries.flag_unhandled(db, "l1")
+        await conversation_summaries.record_message(db, {"lead_id": None, "body": "cliente"})
+
+    asyncio.run(scenario())
+    [summary] = db.conversation_summaries.docs
+    assert summary["messages_count"] == 3 and summary["unhandled_count"] == 2
+    assert summary["last_message"]["body"] == "$set costa troppo" and summary["last_message"]["sender"] == "bot"
+    assert summary["last_message_at"] == (T0 + timedelta(minutes=5)).replace(tzinfo=None)  # come la restituisce Mongo
+
+    asyncio.run(conversation_summaries.clear_unhandled(db, "l1"))
+    assert summary["unhandled_count"] == 0
+
+
+def _endpoint(router, path, method="GET"):
+    return next(r.endpoint for r in router.routes if r.path == path and method in r.methods)
+
+
+def test_inbox_reads_scoped_summaries():
+    summaries = FakeCollection([
+        {"lead_id": f"l{i}", "unit_id": unit, "last_message_at": T0 + timedelta(minutes=i),
+         "last_message": {"body": f"msg {i}", "direction": "inbound"}, "messages_count": i + 1,
+         "unhandled_count": 1 if i % 2 else 0}
+        for i, unit in enumerate(["u1", "u2", "u1", "u3", "u1"])
+    ])
+    leads = FakeCollection([{"id": f"l{i}", "nome": f"Lead{i}", "commessa_id": "x"} for i in range(5)])
+    db = FakeDB(conversation_summaries=summaries, leads=leads,
+                 commesse=FakeCollection([{"id": "u1", "nome": "Unit Uno"}]))
+    router, _ = build_spoki_routers(db, lambda: None, UserRole)
+    inbox = _endpoint(router, "/spoki/conversations")
+    unhandled = _endpoint(router, "/spoki/conversations/unhandled-count")
+    referente = SimpleNamespace(role=UserRole.SUPER_REFERENTE, unit_id="u1", commesse_autorizzate=["u3"])
+    admin = SimpleNamespace(role=UserRole.ADMIN, unit_id=None, commesse_autorizzate=[])
+
+    page1 = asyncio.run(inbox(current_user=referente, limit=2, page=1))
+    page2 = asyncio.run(inbox(current_user=referente, limit=2, page=2))
+
+    assert summaries.calls_to("find")[0][0] == {"unit_id": {"$in": ["u1", "u3"]}}
+    assert [c["lead_id"] for c in page1["conversations"]] == ["l4", "l3"] and page1["has_more"]
+    assert [c["lead_id"] for c in page2["conversations"]] == ["l2", "l0"] and not page2["has_more"]
+    assert page1["conversations"][0]["unit_label"] == "Unit Uno"
+    assert page1["conversations"][1]["unhandled_count"] == 1
+
+    assert asyncio.run(unhandled(current_user=referente)) == {"count": 1}
+    assert asyncio.run(unhandled(current_user=admin)) == {"count": 2}
+    assert summaries.calls_to("count_documents")[-1] == ({"unhandled_count": {"$gt": 0}},)
+
+
+def test_lead_thread_includes_archived_messages_in_order():
+    db = FakeDB(
+        leads=[{"id": "l1", "commessa_id": "u1"}],
+        spoki_messages=[_msg("l1", 10, "ultimo"), _msg("l1", 5, "recente"), _msg("l2", 7, "altro lead")],
+        spoki_messages_archive=[_msg("l1", 1, "vecchio")],
+    )
+    router, _ = build_spoki_routers(db, lambda: None, UserRole)
+    thread = _endpoint(router, "/spoki/conversations/{lead_id}")
+    admin = SimpleNamespace(role=UserRole.ADMIN, unit_id=None, commesse_autorizzate=[])
+
+    out = asyncio.run(thread("l1", current_user=admin))
+
+    assert [(m["body"], m.get("archived", False)) for m in out["messages"]] == [
+        ("vecchio", True), ("recente", False), ("ultimo", False)]
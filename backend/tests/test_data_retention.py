@@ -0,0 +1,120 @@
+"""Unit tests for the data lifecycle subsystem (data_retention.py).
+
+Verifies:
+  - archive policies move documents past retention to `<collection>_archive` in
+    batches, oldest first, tracking progress; recent and excluded documents stay
+  - a run interrupted between archive insert and delete is completed idempotently
+  - delete policies drop old documents; RETENTION_DAYS_<COLLECTION>=0 disables a policy
+  - history reads fall through to the archive only when asked
+  - a run stopped at the batch cap schedules its continuation
+"""
+import asyncio
+import sys
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from types import SimpleNamespace
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+import data_retention  # noqa: E402
+from data_retention import RetentionPolicy  # noqa: E402
+from conftest import FakeDB  # noqa: E402
+
+NOW = datetime(2026, 10, 19, 12, 0, tzinfo=timezone.utc)
+
+
+def _logs(db, days_ago, **extra):
+    for i, days in enumerate(days_ago):
+        db["clienti_logs"].docs.append({"_id": f"o{days}-{i}", "id": f"log-{days}", "cliente_id": "c1",
+                                        "timestamp": NOW - timedelta(days=days), **extra})
+
+
+POLICY = RetentionPolicy("clienti_logs", "timestamp", 30, "archive")
+
+
+def test_archive_moves_old_documents_in_batches_with_progress():
+    db = FakeDB()
+    _logs(db, [400, 90, 45, 31, 10, 1])
+
+    result = asyncio.run(data_retention.apply_policy(db, POLICY, now=NOW, batch_size=2, max_batches=10, pause=0))
+
+    assert result == {"collection": "clienti_logs", "action": "archive", "processed": 4, "batches": 2, "done": True}
+    assert [d["id"] for d in db["clienti_logs"].docs] == ["log-10", "log-1"]
+    assert [d["id"] for d in db["clienti_logs_archive"].docs] == ["log-400", "log-90", "log-45", "log-31"]
+    [status] = db[data_retention.RETENTION_STATUS_COLLECTION].docs
+    assert status["state"] == "idle" and status["processed_total"] == 4 and status["batches_last_run"] == 2
+
+
+def test_interrupted_move_completes_and_extra_filter_is_respected():
+    db = FakeDB()
+    _logs(db, [100, 60])
+    db["clienti_logs_archive"].docs.append(dict(db["clienti_logs"].docs[0]))  # insert riuscito, delete no
+    db["workflow_executions_v2"].docs.extend([
+        {"_id": 1, "status": "done", "updated_at": NOW - timedelta(days=400)},
+        {"_id": 2, "status": "waiting", "updated_at": NOW - timedelta(days=400)},
+    ])
+    wf = RetentionPolicy("workflow_executions_v2", "updated_at", 180, "archive",
+                         extra_filter={"status": {"$nin": ["running", "waiting"]}})
+
+    asyncio.run(data_retention.run_retention(db, [POLICY, wf], now=NOW, pause=0))
+
+    assert db["clienti_logs"].docs == [] and len(db["clienti_logs_archive"].docs) == 2
+    assert [d["_id"] for d in db["workflow_executions_v2"].docs] == [2]
+
+
+def test_delete_policy_and_env_override(monkeypatch):
+    db = FakeDB()
+    db["lead_whatsapp_validations"].docs.extend([
+        {"_id": 1, "created_at": NOW - timedelta(days=200)}, {"_id": 2, "created_at": NOW - timedelta(days=5)},
+    ])
+    monkeypatch.setenv("RETENTION_DAYS_CHAT_MESSAGES", "0")
+    monkeypatch.setenv("RETENTION_DAYS_LEAD_WHATSAPP_VALIDATIONS", "180")
+    policies = {p.collection: p for p in data_retention.load_policies()}
+    assert not policies["chat_messages"].enabled
+    # storico visibile all'utente: mai cancellato
+    assert policies["lead_notifications"].action == "archive"
+
+    asyncio.run(data_retention.apply_policy(db, policies["lead_whatsapp_validations"], now=NOW, pause=0))
+
+    assert [d["_id"] for d in db["lead_whatsapp_validations"].docs] == [2]
+    assert db["lead_whatsapp_validations_archive"].docs == []
+
+
+def test_history_reads_fall_through_to_archive_when_asked():
+    db = FakeDB()
+    _logs(db, [400, 200, 3, 1])
+    asyncio.run(data_retention.apply_policy(db, POLICY, now=NOW, pause=0))
+
+    hot = asyncio.run(data_retention.find_with_archive(db, "clienti_logs", {"cliente_id": "c1"}, "timestamp", 3))
+    full = asyncio.run(data_retention.find_with_archive(
+        db, "clienti_logs", {"cliente_id": "c1"}, "timestamp", 3, include_archive=True, projection={"_id": 0}))
+
+    assert [d["id"] for d in hot] == ["log-1", "log-3"]
+    assert [(d["id"], d.get("archived", False)) for d in full] == [("log-1", False), ("log-3", False), ("log-200", True)]
+
+
+def test_job_schedules_continuation_when_batch_cap_is_hit(monkeypatch):
+    db = FakeDB()
+    _logs(db, [100, 90, 80])
+    scheduled = []
+
+    async def schedule_once(handler, run_at=None, key=None, **kwargs):
+        scheduled.append((handler, key))
+
+    monkeypatch.setattr(data_retention, "load_policies", lambda: [POLICY])
+    monkeypatch.setattr(data_retention, "DATA_RETENTION_BATCH_SIZE", 1)
+    monkeypatch.setattr(data_retention, "DATA_RETENTION_MAX_BATCHES", 2)
+    monkeypatch.setattr(data_retention, "DATA_RETENTION_BATCH_PAUSE_SECONDS", 0)
+
+    results = asyncio.run(data_retention.retention_job(db, SimpleNamespace(schedule_once=schedule_once)))
+
+    assert results[0]["processed"] == 2 and not results[0]["done"]
+    assert scheduled == [("data_retention", "data_retention_continue")]
+    assert db["clienti_logs"].indexes == ["timestamp"]
+
+
+@pytest.mark.parametrize("policy", data_retention.DEFAULT_POLICIES, ids=lambda p: p.collection)
+def test_default_policies_are_well_formed(policy):
+    assert policy.action in ("archive", "delete") and policy.days > 0
+    assert (policy.archive_index is not None) == (policy.action == "archive")
@@ -0,0 +1,70 @@
+"""Unit tests for batched name resolution in helpers.detect_client_changes.
+
+Verifies:
+  - ids are resolved with one $in query per collection (no per-value find_one)
+  - shared cache avoids repeated lookups
+  - short segmento tipo strings are not looked up
+"""
+import asyncio
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+import helpers  # noqa: E402
+from conftest import FakeDB  # noqa: E402
+
+
+def _lookups(fake):
+    """Collection interrogate, una voce per query; find_one per singolo id non ammesso."""
+    assert all(not coll.calls_to("find_one") for coll in fake.collections.values())
+    return sorted(name for name, coll in fake.collections.items() for _ in coll.calls_to("find"))
+
+
+SA_OLD = "11111111-1111-1111-1111-111111111111"
+SA_NEW = "22222222-2222-2222-2222-222222222222"
+COMM = "33333333-3333-3333-3333-333333333333"
+USR = "44444444-4444-4444-4444-444444444444"
+
+
+@pytest.fixture
+def fake_db(monkeypatch):
+    fake = FakeDB(
+        sub_agenzie=[{"id": SA_OLD, "nome": "Roma Nord"}, {"id": SA_NEW, "nome": "Roma Sud"}],
+        commesse=[{"id": COMM, "nome": "Fastweb"}],
+        users=[{"id": USR, "username": "mario"}],
+    )
+    monkeypatch.setattr(helpers, "db", fake)
+    helpers._entity_name_cache.clear()
+    return fake
+
+
+def test_single_in_query_per_collection(fake_db):
+    old = {"sub_agenzia_id": SA_OLD, "commessa_id": None, "assigned_to": None, "segmento": "privato"}
+    update = {"sub_agenzia_id": SA_NEW, "commessa_id": COMM, "assigned_to": USR, "segmento": "business"}
+    changes = asyncio.run(helpers.detect_client_changes(old, update))
+
+    by_field = {c["field"]: c for c in changes}
+    assert by_field["sub_agenzia_id"]["old_value"] == "Roma Nord"
+    assert by_field["sub_agenzia_id"]["new_value"] == "Roma Sud"
+    assert by_field["commessa_id"]["new_value"] == "Fastweb"
+    assert by_field["assigned_to"]["new_value"] == "mario"
+    assert by_field["segmento"]["new_value"] == "Business"
+    assert _lookups(fake_db) == ["commesse", "sub_agenzie", "users"]
+
+
+def test_cache_avoids_repeated_lookups(fake_db):
+    old = {"sub_agenzia_id": SA_OLD}
+    update = {"sub_agenzia_id": SA_NEW}
+    asyncio.run(helpers.detect_client_changes(old, update))
+    asyncio.run(helpers.detect_client_changes(old, update))
+    assert _lookups(fake_db) == ["sub_agenzie"]
+
+
+def test_unknown_id_falls_back_to_raw_value(fake_db):
+    missing = "99999999-9999-9999-9999-999999999999"
+    changes = asyncio.run(helpers.detect_client_changes({"commessa_id": COMM}, {"commessa_id": missing}))
+    assert changes[0]["old_value"] == "Fastweb"
+    assert changes[0]["new_value"] == missing
+
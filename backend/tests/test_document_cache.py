@@ -0,0 +1,150 @@
+"""Unit tests for the streaming document proxy and on-disk LRU cache (document_cache.py).
+
+Verifies:
+  - first view streams from WebDAV and populates the cache, second view is a cache hit
+  - If-None-Match with the current ETag returns 304 without downloading
+  - Range requests return 206 with the right bytes (cached and uncached)
+  - a changed ETag misses the cache
+  - the cache evicts least-recently-used blobs past max_bytes
+"""
+import asyncio
+import os
+import sys
+from pathlib import Path
+
+import pytest
+from fastapi import HTTPException
+from starlette.requests import Request
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+import document_cache  # noqa: E402
+
+
+class _Content:
+    def __init__(self, data):
+        self.data = data
+
+    async def iter_chunked(self, n):
+        for i in range(0, len(self.data), n):
+            yield self.data[i:i + n]
+
+
+class _Resp:
+    def __init__(self, status, data, headers=None):
+        self.status = status
+        self.content = _Content(data)
+        self.headers = headers or {}
+        self.released = False
+
+    def release(self):
+        self.released = True
+
+
+class _FakeNextcloud:
+    def __init__(self, data, etag='"v1"'):
+        self.data = data
+        self.etag = etag
+        self.gets = []
+
+    def file_url(self, filename):
+        return f"http://dav/remote.php/webdav/Fastweb/{filename}"
+
+    async def stat_file(self, filename):
+        return {"etag": self.etag, "size": len(self.data), "content_type": "application/pdf"}
+
+    async def open_file_stream(self, filename, range_header=None):
+        self.gets.append(range_header)
+        if range_header:
+            start, end = (int(x) for x in range_header.split("=")[1].split("-"))
+            return _Resp(206, self.data[start:end + 1], {
+                "Content-Range": f"bytes {start}-{end}/{len(self.data)}",
+                "Content-Length": str(end - start + 1),
+            })
+        return _Resp(200, self.data)
+
+
+def _request(headers=None):
+    raw = [(k.lower().encode(), v.encode()) for k, v in (headers or {}).items()]
+    return Request({"type": "http", "method": "GET", "path": "/", "headers": raw, "query_string": b""})
+
+
+async def _serve(nextcloud, headers=None):
+    resp = await document_cache.nextcloud_document_response(
+        nextcloud, "contratto.pdf", _request(headers), "application/pdf", 'inline; filename="contratto.pdf"',
+    )
+    body = b""
+    if hasattr(resp, "body_iterator"):
+        async for chunk in resp.body_iterator:
+            body += chunk
+    return resp, body
+
+
+@pytest.fixture
+def cache(tmp_path, monkeypatch):
+    c = document_cache.DocumentBlobCache(str(tmp_path / "cache"), max_bytes=10_000)
+    monkeypatch.setattr(document_cache, "_document_cache", c)
+    return c
+
+
+def test_miss_then_hit(cache):
+    data = os.urandom(3000)
+    nc = _FakeNextcloud(data)
+    resp, body = asyncio.run(_serve(nc))
+    assert resp.status_code == 200 and body == data
+    assert resp.headers["etag"] == '"v1"'
+    assert cache.stats()["entries"] == 1
+
+    resp, body = asyncio.run(_serve(nc))
+    assert body == data
+    assert nc.gets == [None]
+    assert cache.hits == 1
+
+
+def test_if_none_match_returns_304(cache):
+    nc = _FakeNextcloud(b"pdf")
+    resp, body = asyncio.run(_serve(nc, {"If-None-Match": '"v1"'}))
+    assert resp.status_code == 304
+    assert nc.gets == []
+
+
+def test_range_uncached_and_cached(cache):
+    data = bytes(range(256)) * 10
+    nc = _FakeNextcloud(data)
+    resp, body = asyncio.run(_serve(nc, {"Range": "bytes=100-199"}))
+    assert resp.status_code == 206 and body == data[100:200]
+    assert nc.gets == ["bytes=100-199"]
+    assert cache.stats()["entries"] == 0  # partial responses are not cached
+
+    asyncio.run(_serve(nc))  # full download populates the cache
+    resp, body = asyncio.run(_serve(nc, {"Range": "bytes=-10"}))
+    assert resp.status_code == 206 and body == data[-10:]
+    assert resp.headers["content-range"] == f"bytes {len(data) - 10}-{len(data) - 1}/{len(data)}"
+    assert len(nc.gets) == 2
+
+
+def test_unsatisfiable_range():
+    with pytest.raises(HTTPException) as exc:
+        document_cache.parse_range_header("bytes=500-", 100)
+    assert exc.value.status_code == 416
+    assert document_cache.parse_range_header("bytes=0-1,5-6", 100) is None
+
+
+def test_changed_etag_misses(cache):
+    nc = _FakeNextcloud(b"a" * 100)
+    asyncio.run(_serve(nc))
+    nc.etag = '"v2"'
+    asyncio.run(_serve(nc))
+    assert nc.gets == [None, None]
+
+
+def test_lru_eviction(tmp_path):
+    c = document_cache.DocumentBlobCache(str(tmp_path / "lru"), max_bytes=250)
+    for name in ("a", "b", "c"):
+        tmp = c.temp_path()
+        Path(tmp).write_bytes(b"x" * 100)
+        c.commit(name, "e", tmp)
+        if name == "b":
+            assert c.get("a", "e")  # touch a → b becomes LRU
+    assert c.get("b", "e") is None
+    assert c.get("a", "e") and c.get("c", "e")
+    assert c.stats()["evictions"] == 1
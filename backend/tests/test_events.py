@@ -0,0 +1,193 @@
+"""Unit tests for the SSE event bus (events.py, routes/events.py).
+
+Verifies:
+  - events reach only subscribers of their topics, once each (unit vs all-units)
+  - a slow subscriber's queue stays bounded and degrades to a single `resync`
+  - requested topics are narrowed to what the user may see
+  - cliente lock acquire/release publish lock events
+  - the stream endpoint emits `ready`, then the published events, and unsubscribes;
+    a response whose body is never iterated leaves no subscription behind
+  - `?token=` accepts only short-lived stream tokens, which the other APIs reject
+  - the fan-out benchmark delivers every event without resyncs
+"""
+import asyncio
+import sys
+from datetime import timedelta
+from pathlib import Path
+from types import SimpleNamespace
+
+import pytest
+from fastapi import HTTPException
+from fastapi.security import HTTPAuthorizationCredentials
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+import benchmark_events  # noqa: E402
+import security  # noqa: E402
+import events  # noqa: E402
+from events import EventBus, conversation_topic  # noqa: E402
+from models import UserRole  # noqa: E402
+from routes import cliente_lock  # noqa: E402
+from routes import events as events_routes  # noqa: E402
+from conftest import FakeDB  # noqa: E402
+
+
+def _drain(sub):
+    out = []
+    while not sub.queue.empty():
+        out.append(sub.queue.get_nowait())
+    return out
+
+
+def test_publish_routes_by_topic_once_per_subscriber():
+    async def scenario():
+        bus = EventBus()
+        u1 = bus.subscribe([conversation_topic("u1"), events.LOCKS_TOPIC])
+        u2 = bus.subscribe([conversation_topic("u2")])
+        admin = bus.subscribe([events.ALL_CONVERSATIONS_TOPIC, conversation_topic("u1")])
+        n = bus.publish((conversation_topic("u1"), events.ALL_CONVERSATIONS_TOPIC), "conversation.message", {"lead_id": "l1"})
+        bus.publish((events.LOCKS_TOPIC,), "lock.released", {"cliente_id": "c1"})
+        bus.unsubscribe(u2)
+        return n, [[e["type"] for e in _drain(s)] for s in (u1, u2, admin)], bus.stats()
+
+    n, received, stats = asyncio.run(scenario())
+    assert n == 2
+    assert received == [["conversation.message", "lock.released"], [], ["conversation.message"]]
+    assert stats["subscribers"] == 2 and conversation_topic("u2") not in stats["topics"]
+
+
+def test_slow_subscriber_gets_resync_instead_of_unbounded_queue():
+    async def scenario():
+        bus = EventBus(queue_size=3)
+        slow = bus.subscribe([events.LOCKS_TOPIC])
+        for i in range(10):
+            bus.publish((events.LOCKS_TOPIC,), "lock.acquired", {"i": i})
+        return slow, _drain(slow)
+
+    slow, received = asyncio.run(scenario())
+    assert slow.dropped >= 1
+    assert len(received) <= 3 and received[0]["type"] == "resync"
+
+
+def _user(role, **kw):
+    return SimpleNamespace(id=kw.pop("id", "me"), role=role, unit_id=kw.pop("unit_id", None),
+                           commesse_autorizzate=kw.pop("commesse", []))
+
+
+def test_topics_are_narrowed_to_visible_scope():
+    everything = list(events_routes.STREAM_TOPICS)
+    admin = events_routes.resolve_topics(_user(UserRole.ADMIN), everything)
+    assert admin == {events.ALL_CONVERSATIONS_TOPIC, events.LOCKS_TOPIC, "leads:user:me", events.DASHBOARD_TOPIC}
+
+    sr = events_routes.resolve_topics(_user(UserRole.SUPER_REFERENTE, unit_id="u1", commesse=["u2"]), everything)
+    assert sr == {conversation_topic("u1"), conversation_topic("u2"), events.LOCKS_TOPIC, "leads:user:me"}
+
+    agente = events_routes.resolve_topics(_user(UserRole.AGENTE, unit_id="u1"), ["conversations", "leads", "dashboard"])
+    assert agente == {"leads:user:me"}
+
+
+class _Locks:
+    def __init__(self):
+        self.doc = None
+
+    async def find_one(self, query, projection=None):
+        return dict(self.doc) if self.doc else None
+
+    async def update_one(self, query, update, upsert=False):
+        self.doc = {**(self.doc or {}), **update["$set"]}
+
+    async def delete_one(self, query):
+        existed, self.doc = self.doc is not None, None
+        return SimpleNamespace(deleted_count=int(existed))
+
+
+class _Clienti:
+    async def find_one(self, query, projection=None):
+        return {"id": query["id"]}
+
+
+def test_lock_acquire_and_release_publish(monkeypatch):
+    monkeypatch.setattr(cliente_lock, "db", SimpleNamespace(cliente_locks=_Locks(), clienti=_Clienti()))
+    monkeypatch.setattr(events, "event_bus", EventBus())
+    user = SimpleNamespace(id="u-1", username="mario", role=UserRole.AGENTE)
+
+    async def scenario():
+        sub = events.event_bus.subscribe([events.LOCKS_TOPIC])
+        await cliente_lock.acquire_cliente_lock("c1", current_user=user)
+        await cliente_lock.acquire_cliente_lock("c1", current_user=user)  # refresh: nessun evento
+        await cliente_lock.release_cliente_lock("c1", current_user=user)
+        return _drain(sub)
+
+    received = asyncio.run(scenario())
+    assert [e["type"] for e in received] == ["lock.acquired", "lock.released"]
+    assert received[0]["data"]["username"] == "mario" and received[1]["data"] == {"cliente_id": "c1"}
+
+
+class _Request:
+    def __init__(self, polls):
+        self.polls = polls
+
+    async def is_disconnected(self):
+        self.polls -= 1
+        return self.polls < 0
+
+
+def test_stream_emits_ready_then_events(monkeypatch):
+    bus = EventBus()
+    monkeypatch.setattr(events_routes, "event_bus", bus)
+    monkeypatch.setattr(events_routes, "SSE_HEARTBEAT_SECONDS", 0.01)
+    user = _user(UserRole.ADMIN)
+
+    async def scenario():
+        resp = await events_routes.events_stream(_Request(polls=2), topics="locks", current_user=user)
+        chunks = resp.body_iterator
+        first = await chunks.__anext__()
+        bus.publish((events.LOCKS_TOPIC,), "lock.released", {"cliente_id": "c1"})
+        rest = [chunk async for chunk in chunks]
+        return resp, first, rest
+
+    resp, first, rest = asyncio.run(scenario())
+    assert resp.media_type == "text/event-stream"
+    assert first.startswith(b"id: 0\nevent: ready\n") and b"cliente_locks" in first
+    assert rest[0].startswith(b"id: 1\nevent: lock.released\ndata: ") and rest[0].endswith(b"\n\n")
+    assert rest[1] == b": keepalive\n\n"
+    assert bus.stats()["subscribers"] == 0
+
+
+def test_stream_never_iterated_does_not_subscribe(monkeypatch):
+    bus = EventBus()
+    monkeypatch.setattr(events_routes, "event_bus", bus)
+    user = _user(UserRole.ADMIN)
+
+    async def scenario():
+        # client disconnesso prima che Starlette inizi a inviare il body
+        await events_routes.events_stream(_Request(polls=0), topics="locks", current_user=user)
+        return bus.stats()
+
+    assert asyncio.run(scenario())["subscribers"] == 0
+
+
+def test_query_token_must_be_a_stream_token(monkeypatch):
+    fake = FakeDB(users=[{"id": "u-1", "username": "mario", "email": "mario@example.com",
+                          "password_hash": "x", "role": "admin"}])
+    monkeypatch.setattr(events_routes, "db", fake)
+    monkeypatch.setattr(security, "db", fake)
+    user = SimpleNamespace(username="mario")
+    session_jwt = security.create_access_token({"sub": "mario"}, expires_delta=timedelta(minutes=5))
+
+    async def scenario():
+        stream_token = (await events_routes.create_events_stream_token(current_user=user))["token"]
+        via_query = await events_routes.get_stream_user(SimpleNamespace(headers={}), token=stream_token)
+        with pytest.raises(HTTPException) as session_in_query:
+            await events_routes.get_stream_user(SimpleNamespace(headers={}), token=session_jwt)
+        with pytest.raises(HTTPException) as stream_as_api:
+            await security.get_current_user(HTTPAuthorizationCredentials(scheme="Bearer", credentials=stream_token))
+        return via_query, session_in_query.value, stream_as_api.value
+
+    via_query, session_in_query, stream_as_api = asyncio.run(scenario())
+    assert via_query.id == "u-1"
+    assert session_in_query.status_code == 401 and stream_as_api.status_code == 401
+
+
+def test_fanout_benchmark_small_run():
+    result = asyncio.run(benchmark_events.run(subscribers=60, events=200, units=3))
+    assert result["resyncs"] == 0 and result["deliveries"] > 200
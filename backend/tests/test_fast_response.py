@@ -0,0 +1,78 @@
+"""Unit tests for the fast list serialization path (fast_response.py).
+
+Verifies:
+  - projection rows serialize to the same JSON as the validated Pydantic path
+    (defaults filled, extra fields dropped, "" -> None enum fixup, UTC datetimes as "Z")
+  - the Mongo projection covers exactly the model fields and hides _id
+  - model_construct path and the stdlib fallback encoder
+  - the micro-benchmark reports identical output for both paths
+"""
+import json
+import sys
+from datetime import datetime, timezone
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+import fast_response  # noqa: E402
+from fastapi.encoders import jsonable_encoder  # noqa: E402
+from models import Cliente, User, Workflow  # noqa: E402
+
+
+def _cliente_doc(**extra):
+    return {
+        "id": "c1", "cliente_id": "abc12345", "nome": "Mario", "cognome": "Rossi",
+        "email": "mario@example.it", "telefono": "3331234567", "codice_fiscale": "RSSMRA80A01H501U",
+        "commessa_id": "com1", "sub_agenzia_id": "sa1", "created_by": "u1",
+        "tecnologia": "", "modalita_pagamento": "iban",
+        "created_at": datetime(2026, 10, 1, 8, 30, 15, 123000, tzinfo=timezone.utc),
+        "updated_at": datetime(2026, 10, 2, 9, 0),  # naive, come lo restituisce motor
+        "legacy_migrated_at": datetime(2026, 1, 1),  # campo non del modello
+        **extra,
+    }
+
+
+def _validated_json(model, doc):
+    return json.loads(json.dumps(jsonable_encoder(model(**dict(doc)))))
+
+
+def test_rows_match_validated_output():
+    projection = fast_response.model_projection(Cliente)
+    doc = _cliente_doc()
+    fast = json.loads(fast_response.dumps(projection.row(dict(doc))))
+    assert fast == _validated_json(Cliente, doc)
+    assert list(fast) == list(Cliente.model_fields)
+    assert fast["tecnologia"] is None and fast["convergenza_items"] == []
+    assert fast["created_at"] == "2026-10-01T08:30:15.123000Z"
+    assert "legacy_migrated_at" not in fast
+
+    user_doc = {"id": "u1", "username": "admin", "email": "admin@example.it", "password_hash": "h",
+                "role": "admin", "created_at": datetime(2026, 1, 1, tzinfo=timezone.utc)}
+    assert json.loads(fast_response.dumps(fast_response.model_projection(User).row(dict(user_doc)))) == \
+        _validated_json(User, user_doc)
+
+
+def test_projection_and_construct():
+    projection = fast_response.model_projection(Workflow)
+    assert projection is fast_response.model_projection(Workflow)
+    assert projection.projection["_id"] == 0
+    assert set(projection.projection) - {"_id"} == set(Workflow.model_fields)
+
+    wf = projection.construct({"id": "w1", "name": "Benvenuto", "unit_id": "u1", "created_by": "a"})
+    assert isinstance(wf, Workflow) and wf.is_active is True and wf.nodes is None
+
+
+def test_fast_json_response_and_stdlib_fallback(monkeypatch):
+    content = {"when": datetime(2026, 10, 1, tzinfo=timezone.utc), "tags": {"a"}, 1: "x"}
+    body = fast_response.FastJSONResponse(content).body
+    assert json.loads(body) == {"when": "2026-10-01T00:00:00Z", "tags": ["a"], "1": "x"}
+
+    monkeypatch.setattr(fast_response, "orjson", None)
+    assert json.loads(fast_response.dumps(content)) == json.loads(body)
+
+
+def test_benchmark_paths_agree():
+    import benchmark_serialization
+
+    report = benchmark_serialization.run("leads", rows=20, iterations=2)
+    assert report["same_output"] is True
+    assert set(report["paths"]) == {"validated", "fast"}
@@ -0,0 +1,119 @@
+"""Unit tests for the bulk clienti import pipeline (helpers.process_import_batch).
+
+Verifies:
+  - vectorized validation yields the same per-row messages as validate_cliente_data
+  - existing duplicates are pre-loaded with one query, in-file repeats are skipped
+  - valid rows are inserted with unordered insert_many in chunks
+  - progress callback is invoked with (processed, total)
+  - queued/running import jobs orphaned by a restart are closed as failed, live ones are kept
+"""
+import asyncio
+import sys
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+import pandas as pd
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+import helpers  # noqa: E402
+from conftest import FakeDB  # noqa: E402
+from models import ImportConfiguration, FieldMapping  # noqa: E402
+from routes import clienti as clienti_routes  # noqa: E402
+
+
+def _config(**overrides):
+    data = dict(
+        commessa_id="comm-1",
+        sub_agenzia_id="sa-1",
+        skip_header=False,
+        field_mappings=[
+            FieldMapping(csv_field="Nome", client_field="nome"),
+            FieldMapping(csv_field="Cognome", client_field="cognome"),
+            FieldMapping(csv_field="Telefono", client_field="telefono"),
+            FieldMapping(csv_field="Email", client_field="email"),
+            FieldMapping(csv_field="CF", client_field="codice_fiscale"),
+        ],
+    )
+    data.update(overrides)
+    return ImportConfiguration(**data)
+
+
+CSV = (
+    "Nome,Cognome,Telefono,Email,CF\n"
+    "Mario,Rossi,3331111111,mario@test.it,RSSMRA\n"
+    "Luigi,,3332222222,luigi@test.it,LGU\n"
+    "Anna,Bianchi,123,anna@test,BNC\n"
+    "Paolo,Verdi,3334444444,paolo@test.it,VRD\n"
+    "Paola,Verdi,3331111111,paola@test.it,VRD2\n"
+    "Gino,Neri,3335555555,gino@test.it,NRI\n"
+)
+
+
+@pytest.fixture
+def fake_db(monkeypatch):
+    fake = FakeDB(clienti=[{"telefono": "3334444444", "commessa_id": "comm-1", "sub_agenzia_id": "sa-1"}])
+    monkeypatch.setattr(helpers, "db", fake)
+    return fake
+
+
+def test_vectorized_validation_matches_row_validation():
+    config = _config()
+    rows = [
+        {"nome": "Mario", "cognome": "Rossi", "telefono": "3331111111", "email": "m@test.it"},
+        {"nome": "", "cognome": "", "telefono": "12", "email": "bad@nodot"},
+        {"nome": "A", "cognome": "B", "telefono": "", "email": ""},
+    ]
+    frame_errors = helpers.validate_cliente_frame(pd.DataFrame(rows), config).tolist()
+    row_errors = [helpers.validate_cliente_data(r, config)[1] for r in rows]
+    assert frame_errors == row_errors
+
+
+def test_bulk_import_skips_duplicates_and_inserts_in_chunks(fake_db, monkeypatch):
+    monkeypatch.setattr(helpers, "IMPORT_INSERT_CHUNK_SIZE", 1)
+    progress = []
+
+    async def on_progress(processed, total):
+        progress.append((processed, total))
+
+    result = asyncio.run(helpers.process_import_batch(
+        CSV.encode(), "clienti.csv", _config(), "user-1", progress_callback=on_progress,
+    ))
+
+    assert result.total_processed == 6
+    assert result.successful == 2
+    assert result.failed == 4
+    clienti = fake_db.clienti
+    assert len(clienti.calls_to("find")) == 1
+    assert not clienti.calls_to("find_one") and not clienti.calls_to("insert_one")
+    assert [len(docs) for (docs,) in clienti.calls_to("insert_many")] == [1, 1]
+    inserted = clienti.docs[1:]
+    assert [d["telefono"] for d in inserted] == ["3331111111", "3335555555"]
+    assert all(d["commessa_id"] == "comm-1" and d["created_by"] == "user-1" for d in inserted)
+    assert result.created_client_ids == [d["id"] for d in inserted]
+
+    errors = " | ".join(result.errors)
+    assert "Row 2: Cognome is required" in errors
+    assert "Row 3: Invalid phone format: 123; Invalid email format: anna@test" in errors
+    assert "Row 4: Duplicate phone number 3334444444" in errors
+    assert "Row 5: Duplicate phone number 3331111111" in errors
+    assert progress[-1] == (6, 6)
+
+
+def test_stale_import_jobs_are_failed(monkeypatch):
+    now = datetime(2026, 10, 19, 12, 0, tzinfo=timezone.utc)
+    old = now - timedelta(seconds=clienti_routes.IMPORT_JOB_STALE_SECONDS + 1)
+    fake = FakeDB(clienti_import_jobs=[
+        {"id": "orphan-running", "status": "running", "updated_at": old},
+        {"id": "orphan-queued", "status": "queued", "updated_at": old},
+        {"id": "live", "status": "running", "updated_at": now - timedelta(seconds=30)},
+        {"id": "done", "status": "completed", "updated_at": old},
+    ])
+    monkeypatch.setattr(clienti_routes, "db", fake)
+
+    assert asyncio.run(clienti_routes.fail_stale_import_jobs(now=now)) == 2
+
+    status = {j["id"]: j["status"] for j in fake.clienti_import_jobs.docs}
+    assert status == {"orphan-running": "failed", "orphan-queued": "failed", "live": "running", "done": "completed"}
+    orphan = next(j for j in fake.clienti_import_jobs.docs if j["id"] == "orphan-running")
+    assert orphan["finished_at"] == now and "riavvio" in orphan["error"]
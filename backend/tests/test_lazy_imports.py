@@ -0,0 +1,108 @@
+"""Unit tests for lazy subsystem loading (lazy_imports.py, profile_imports.py).
+
+Verifies:
+  - module/attribute proxies import nothing until first use and forward reads/writes
+  - lazy singletons are built once, on first attribute access
+  - warm_up() pre-loads registered modules in the background and records timings
+  - importing services/helpers no longer pulls pandas, openpyxl, twilio or the LLM SDKs
+  - the importtime parser finds the target's direct imports
+"""
+import asyncio
+import subprocess
+import sys
+import textwrap
+from pathlib import Path
+
+BACKEND_DIR = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(BACKEND_DIR))
+import lazy_imports  # noqa: E402
+import profile_imports  # noqa: E402
+
+
+def _fake_module(tmp_path, monkeypatch, name):
+    (tmp_path / f"{name}.py").write_text(textwrap.dedent("""
+        LOADED = True
+        api_key = None
+
+        class Client:
+            def __init__(self, token):
+                self.token = token
+    """))
+    monkeypatch.syspath_prepend(str(tmp_path))
+    monkeypatch.delitem(sys.modules, name, raising=False)
+
+
+def test_proxies_defer_import_until_first_use(tmp_path, monkeypatch):
+    _fake_module(tmp_path, monkeypatch, "lazy_fake_sdk")
+    mod = lazy_imports.lazy_import("lazy_fake_sdk", warm=False)
+    client_cls = lazy_imports.lazy_attr("lazy_fake_sdk", "Client", warm=False)
+    assert "lazy_fake_sdk" not in sys.modules
+    assert "not loaded" in repr(mod)
+
+    client = client_cls("t0k")
+    assert "lazy_fake_sdk" in sys.modules
+    assert client.token == "t0k" and isinstance(client, client_cls.resolve())
+    mod.api_key = "secret"
+    assert sys.modules["lazy_fake_sdk"].api_key == "secret" and mod.LOADED is True
+    assert "lazy_fake_sdk" in lazy_imports.stats()["load_ms"]
+
+
+def test_lazy_singleton_built_once():
+    built = []
+
+    class Service:
+        def __init__(self):
+            built.append(1)
+            self.calls = 0
+
+        def ping(self):
+            self.calls += 1
+            return self.calls
+
+    svc = lazy_imports.lazy_singleton(Service, "fake_service")
+    assert built == []
+    assert svc.ping() == 1 and svc.ping() == 2
+    svc.calls = 10
+    assert svc.ping() == 11 and built == [1]
+    assert "singleton:fake_service" in lazy_imports.stats()["load_ms"]
+
+
+def test_warm_up_loads_registered_modules(tmp_path, monkeypatch):
+    _fake_module(tmp_path, monkeypatch, "lazy_fake_warm")
+    lazy_imports.lazy_import("lazy_fake_warm")
+    lazy_imports.lazy_import("lazy_missing_optional_sdk")
+    assert "lazy_fake_warm" in lazy_imports.warmup_status()["pending"]
+
+    loaded = asyncio.run(lazy_imports.warm_up(delay=0))
+
+    assert "lazy_fake_warm" in loaded and "lazy_fake_warm" in sys.modules
+    status = lazy_imports.warmup_status()
+    assert status["state"] == "done" and "lazy_fake_warm" not in status["pending"]
+    assert "lazy_missing_optional_sdk" in status["errors"]
+
+
+def test_service_modules_import_without_heavy_sdks():
+    code = (
+        "import sys, services, helpers, workflow_executor, spoki_chatbot\n"
+        "heavy = ('pandas', 'openpyxl', 'twilio', 'openai', 'emergentintegrations', 'playwright')\n"
+        "print(','.join(m for m in heavy if m in sys.modules))\n"
+    )
+    proc = subprocess.run([sys.executable, "-c", code], cwd=BACKEND_DIR, capture_output=True, text=True)
+    assert proc.returncode == 0, proc.stderr
+    assert proc.stdout.strip() == ""
+
+
+def test_parse_importtime_direct_imports():
+    stderr = "\n".join([
+        "import time: self [us] | cumulative | imported package",
+        "import time:      1000 |       1000 | os",
+        "import time:       500 |        500 |     fastapi.params",
+        "import time:      4000 |       4500 |   fastapi",
+        "import time:      2000 |       2000 |   services",
+        "import time:     10000 |      16500 | server",
+    ])
+    rows = profile_imports.parse_importtime(stderr)
+    assert [r["depth"] for r in rows] == [0, 2, 1, 1, 0]
+    report = profile_imports.summarize_profile(rows, "server", top=5)
+    assert report["total_ms"] == 16.5
+    assert [r["module"] for r in report["top_direct_imports"]] == ["fastapi", "services"]
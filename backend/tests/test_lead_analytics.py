@@ -0,0 +1,119 @@
+"""Unit tests for single-pass supervisor/referente analytics (lead_analytics.py, routes.analytics).
+
+Verifies:
+  - supervisor analytics issue one aggregation on leads; unit stats only count leads
+    in the supervisor's units, per-agent/referente stats count all assigned leads
+  - empty / null / "Nuovo" esiti are merged into "Nuovo" and are not "contacted"
+  - referente analytics honour the super referente unit filter
+  - results are cached per key for the TTL
+"""
+import asyncio
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+import lead_analytics  # noqa: E402
+from routes import analytics  # noqa: E402
+from conftest import FakeCollection, FakeCursor, FakeDB, matches  # noqa: E402
+
+
+class _Leads(FakeCollection):
+    """`aggregate` applica $match e il $group per (agente, esito[, in_unit]) della pipeline
+    di lead_analytics (la pipeline vera gira in test_mongo_integration.py)."""
+
+    def aggregate(self, pipeline, **kwargs):
+        self.calls.append(("aggregate", pipeline))
+        match, group = pipeline[0]["$match"], pipeline[1]["$group"]["_id"]
+        counts = {}
+        for d in self.docs:
+            if not matches(d, match):
+                continue
+            key = (d.get("assigned_agent_id"), d.get("esito"))
+            if "in_unit" in group:
+                key += (d.get("unit_id") in group["in_unit"]["$in"][1],)
+            counts[key] = counts.get(key, 0) + 1
+        fields = ["agent", "esito", "in_unit"]
+        return FakeCursor([{"_id": dict(zip(fields, k)), "count": n} for k, n in counts.items()])
+
+
+def _db(users, leads):
+    return FakeDB(users=users, units=[{"id": "u1", "nome": "Unit 1"}], leads=_Leads(leads))
+
+
+def _user(uid, role, referente_id=None, unit_id="u1"):
+    return {"id": uid, "username": uid, "email": f"{uid}@x.it", "role": role,
+            "referente_id": referente_id, "unit_id": unit_id, "is_active": True}
+
+
+USERS = [_user("r1", "referente"), _user("a1", "agente", "r1"), _user("a2", "agente", "r1")]
+LEADS = [
+    {"unit_id": "u1", "assigned_agent_id": "a1", "esito": "Vendita"},
+    {"unit_id": "u1", "assigned_agent_id": "a1", "esito": None},
+    {"unit_id": "u1", "assigned_agent_id": "a1", "esito": ""},
+    {"unit_id": "u2", "assigned_agent_id": "a1", "esito": "Richiamare"},  # fuori Unit
+    {"unit_id": "u1", "assigned_agent_id": "a2", "esito": "Nuovo"},
+    {"unit_id": "u1", "assigned_agent_id": "r1", "esito": "Vendita"},
+    {"unit_id": "u1", "assigned_agent_id": None, "esito": None},
+    {"unit_id": "u1", "esito": "Vendita"},
+]
+
+
+@pytest.fixture(autouse=True)
+def _clear_cache():
+    lead_analytics.clear_cache()
+    yield
+    lead_analytics.clear_cache()
+
+
+def test_supervisor_analytics_single_aggregation(monkeypatch):
+    fake = _db(USERS, LEADS)
+    monkeypatch.setattr(analytics, "db", fake)
+
+    out = asyncio.run(analytics._compute_supervisor_unit_analytics(["u1"], {}))
+
+    assert len(fake.leads.calls_to("aggregate")) == 1 and not fake.leads.calls_to("count_documents")
+    assert out["stats"] == {
+        "total_leads": 7, "contacted_leads": 3, "unassigned_leads": 2, "contact_rate": 42.86,
+        "total_agents": 2, "total_referenti": 1, "total_units": 1,
+    }
+    a1 = next(a for a in out["agents"] if a["id"] == "a1")
+    assert a1["total_leads"] == 4 and a1["contacted_leads"] == 2 and a1["contact_rate"] == 50.0
+    assert a1["outcomes"] == {"Nuovo": 2, "Vendita": 1, "Richiamare": 1}
+    assert out["outcomes"] == {"Nuovo": 3, "Vendita": 1, "Richiamare": 1}
+    assert out["referenti"][0]["total_leads"] == 6
+    assert out["referenti"][0]["contacted_leads"] == 3
+    assert out["referenti"][0]["agents_count"] == 2
+
+
+def test_referente_analytics_unit_filter(monkeypatch):
+    fake = _db(USERS, LEADS)
+    monkeypatch.setattr(analytics, "db", fake)
+
+    full = asyncio.run(analytics._compute_referente_analytics("r1", None, {}))
+    unit = asyncio.run(analytics._compute_referente_analytics("r1", "u1", {}))
+
+    assert full["total_stats"] == {"total_leads": 5, "contacted_leads": 2, "contact_rate": 40.0}
+    assert unit["total_stats"]["total_leads"] == 4
+    assert full["outcomes"] == {"Nuovo": 3, "Vendita": 1, "Richiamare": 1}
+    assert [b["total_leads"] for b in unit["agent_breakdown"]] == [3, 1]
+    assert len(fake.leads.calls_to("aggregate")) == 2
+
+
+def test_cached_reuses_result_within_ttl():
+    calls = []
+
+    async def compute():
+        calls.append(1)
+        return {"n": len(calls)}
+
+    async def scenario():
+        first = await lead_analytics.cached(("k", 1), compute, ttl=60)
+        second = await lead_analytics.cached(("k", 1), compute, ttl=60)
+        other = await lead_analytics.cached(("k", 2), compute, ttl=60)
+        return first, second, other
+
+    first, second, other = asyncio.run(scenario())
+    assert first == second == {"n": 1}
+    assert other == {"n": 2}
@@ -0,0 +1,163 @@
+"""Unit tests for the LLM gateway (llm_gateway.py) and its use in spoki_chatbot.
+
+Verifies:
+  - per-unit and global concurrency caps hold under a burst of calls
+  - callers waiting longer than the queue timeout get LlmQueueTimeout
+  - identical in-flight requests share one model call
+  - calls past their deadline raise LlmDeadlineExceeded; assistant runs are polled
+    and cancelled on OpenAI when they outlive their timeout
+  - assistant replies go through a stub client without create_and_poll
+"""
+import asyncio
+import sys
+from pathlib import Path
+from types import SimpleNamespace
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+import spoki_chatbot  # noqa: E402
+from llm_gateway import LlmDeadlineExceeded, LlmGateway, LlmQueueTimeout, request_key  # noqa: E402
+
+
+class _Model:
+    """Modello finto: conta le chiamate concorrenti (totali e per Unit)."""
+
+    def __init__(self, delay=0.02):
+        self.delay = delay
+        self.calls = 0
+        self.active = {}
+        self.peak = {}
+        self.peak_total = 0
+
+    async def reply(self, unit, text):
+        self.calls += 1
+        self.active[unit] = self.active.get(unit, 0) + 1
+        self.peak[unit] = max(self.peak.get(unit, 0), self.active[unit])
+        self.peak_total = max(self.peak_total, sum(self.active.values()))
+        await asyncio.sleep(self.delay)
+        self.active[unit] -= 1
+        return f"ok:{text}"
+
+
+def test_concurrency_caps_per_unit_and_global():
+    gw = LlmGateway(global_concurrency=3, unit_concurrency=2, queue_timeout=5, call_timeout=5)
+    model = _Model()
+
+    async def scenario():
+        calls = [gw.call(lambda u=u, i=i: model.reply(u, i), unit_id=u)
+                 for u in ("u1", "u2", "u3") for i in range(5)]
+        return await asyncio.gather(*calls)
+
+    out = asyncio.run(scenario())
+    assert len(out) == 15 and model.calls == 15
+    assert max(model.peak.values()) == 2
+    assert model.peak_total == 3
+    assert gw.stats()["counts"]["ok"] == 15 and gw.in_flight == 0 and gw.waiting == 0
+
+
+def test_queue_timeout_and_deadline():
+    gw = LlmGateway(global_concurrency=1, unit_concurrency=1, queue_timeout=0.05, call_timeout=1)
+
+    async def slow():
+        await asyncio.sleep(0.3)
+        return "late"
+
+    async def scenario():
+        first = asyncio.ensure_future(gw.call(slow, unit_id="u1"))
+        await asyncio.sleep(0)
+        with pytest.raises(LlmQueueTimeout):
+            await gw.call(slow, unit_id="u1")
+        assert await first == "late"
+        with pytest.raises(LlmDeadlineExceeded):
+            await gw.call(slow, unit_id="u1", timeout=0.05)
+
+    asyncio.run(scenario())
+    assert gw.counts["queue_timeout"] == 1 and gw.counts["timeout"] == 1 and gw.counts["ok"] == 1
+    assert gw.in_flight == 0 and gw._global._value == 1
+
+
+def test_identical_requests_are_coalesced():
+    gw = LlmGateway()
+    model = _Model(delay=0.05)
+    key = request_key("chatbot", "lead-1", "sì, mi interessa")
+
+    async def scenario():
+        return await asyncio.gather(*[
+            gw.call(lambda: model.reply("u1", "x"), unit_id="u1", key=key) for _ in range(3)
+        ])
+
+    assert asyncio.run(scenario()) == ["ok:x"] * 3
+    assert model.calls == 1 and gw.counts["coalesced"] == 2
+    assert request_key("chatbot", None, "x") is None
+    assert request_key("chatbot", "lead-1", "x") != request_key("chatbot", "lead-2", "x")
+
+
+class _Runs:
+    def __init__(self, statuses):
+        self.statuses = list(statuses)
+        self.cancelled = []
+
+    async def create(self, thread_id, assistant_id):
+        return SimpleNamespace(id="run-1", status=self.statuses.pop(0))
+
+    async def retrieve(self, thread_id, run_id):
+        status = self.statuses.pop(0) if self.statuses else "in_progress"
+        usage = SimpleNamespace(prompt_tokens=120, completion_tokens=30) if status == "completed" else None
+        return SimpleNamespace(id=run_id, status=status, usage=usage)
+
+    async def cancel(self, thread_id, run_id):
+        self.cancelled.append(run_id)
+
+    async def create_and_poll(self, **kwargs):  # pragma: no cover - non deve essere usato
+        raise AssertionError("create_and_poll should not be called")
+
+
+class _StubOpenAI:
+    """Stub del server Assistant: thread, messaggi e run con stati programmati."""
+
+    def __init__(self, statuses):
+        runs = _Runs(statuses)
+        self.runs = runs
+
+        async def create_thread():
+            return SimpleNamespace(id="thread-1")
+
+        async def create_message(thread_id, role, content):
+            return SimpleNamespace(id="msg-1")
+
+        async def list_messages(thread_id, order, after):
+            text = SimpleNamespace(type="text", text=SimpleNamespace(value="Certo, la richiamo domani."))
+            return SimpleNamespace(data=[SimpleNamespace(role="assistant", content=[text])])
+
+        self.beta = SimpleNamespace(threads=SimpleNamespace(
+            create=create_thread,
+            messages=SimpleNamespace(create=create_message, list=list_messages),
+            runs=runs,
+        ))
+
+
+def test_assistant_reply_polls_through_gateway(monkeypatch):
+    gw = LlmGateway()
+    stub = _StubOpenAI(["queued", "in_progress", "completed"])
+    monkeypatch.setattr(spoki_chatbot, "llm_gateway", gw)
+    monkeypatch.setattr(spoki_chatbot, "_openai_client", lambda: stub)
+    monkeypatch.setattr("llm_gateway.LLM_ASSISTANT_POLL_INTERVAL_SECONDS", 0)
+
+    out = asyncio.run(spoki_chatbot.assistant_generate_reply("asst-1", "ciao", None, unit_id="u1", lead_id="l1"))
+
+    assert out["reply"] == "Certo, la richiamo domani." and out["thread_id"] == "thread-1"
+    assert gw.counts["ok"] == 1
+
+
+def test_assistant_run_cancelled_after_timeout():
+    gw = LlmGateway()
+    stub = _StubOpenAI(["queued"])
+
+    async def scenario():
+        run = await stub.runs.create(thread_id="t", assistant_id="a")
+        await gw.poll_assistant_run(stub, "t", run, timeout=0.05, interval=0.01)
+
+    with pytest.raises(LlmDeadlineExceeded):
+        asyncio.run(scenario())
+    assert stub.runs.cancelled == ["run-1"]
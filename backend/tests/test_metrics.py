@@ -0,0 +1,100 @@
+"""Unit tests for the Prometheus instrumentation layer (metrics.py).
+
+Verifies:
+  - counters/histograms render valid Prometheus text with cumulative buckets
+  - MetricsMiddleware labels requests by route template, not concrete path
+  - MongoCommandMetrics records per-collection counts, durations and returned documents
+  - observe_loop records outcome and duration of background loop iterations
+"""
+import sys
+from pathlib import Path
+from types import SimpleNamespace
+
+import pytest
+from fastapi import FastAPI, HTTPException
+from fastapi.testclient import TestClient
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+import metrics  # noqa: E402
+
+
+def test_histogram_and_counter_rendering():
+    reg = metrics.MetricsRegistry()
+    c = reg.counter("t_total", "help", ("kind",))
+    h = reg.histogram("t_seconds", "help", ("kind",), buckets=(0.1, 1.0))
+    c.inc(kind="a")
+    c.inc(2, kind="a")
+    for v in (0.05, 0.5, 5):
+        h.observe(v, kind="a")
+    text = reg.render()
+    assert 't_total{kind="a"} 3' in text
+    assert 't_seconds_bucket{kind="a",le="0.1"} 1' in text
+    assert 't_seconds_bucket{kind="a",le="1.0"} 2' in text
+    assert 't_seconds_bucket{kind="a",le="+Inf"} 3' in text
+    assert 't_seconds_count{kind="a"} 3' in text
+    assert "# TYPE t_seconds histogram" in text
+
+
+def test_middleware_uses_route_template():
+    app = FastAPI()
+    app.add_middleware(metrics.MetricsMiddleware)
+
+    @app.get("/api/clienti/{cliente_id}")
+    async def get_cliente(cliente_id: str):
+        if cliente_id == "missing":
+            raise HTTPException(status_code=404)
+        return {"id": cliente_id}
+
+    route = "/api/clienti/{cliente_id}"
+    before_ok = metrics.HTTP_REQUESTS.value(method="GET", route=route, status="200")
+    before_404 = metrics.HTTP_REQUESTS.value(method="GET", route=route, status="404")
+    client = TestClient(app)
+    client.get("/api/clienti/abc")
+    client.get("/api/clienti/def")
+    client.get("/api/clienti/missing")
+    client.get("/nope")
+
+    assert metrics.HTTP_REQUESTS.value(method="GET", route=route, status="200") == before_ok + 2
+    assert metrics.HTTP_REQUESTS.value(method="GET", route=route, status="404") == before_404 + 1
+    assert metrics.HTTP_REQUESTS.value(method="GET", route="unmatched", status="404") >= 1
+    assert metrics.HTTP_IN_FLIGHT.value(method="GET") == 0
+
+
+def _event(name, command=None, reply=None, request_id=1):
+    return SimpleNamespace(
+        command_name=name, command=command or {}, reply=reply, request_id=request_id,
+        connection_id=("localhost", 27017), operation_id=request_id, duration_micros=1500,
+    )
+
+
+def test_mongo_listener_counts_per_collection():
+    listener = metrics.MongoCommandMetrics()
+    before = metrics.MONGO_COMMANDS.value(collection="clienti_t", op="find", outcome="ok")
+    docs_before = metrics.MONGO_DOCUMENTS.value(collection="clienti_t", op="getMore")
+
+    listener.started(_event("find", {"find": "clienti_t"}, request_id=10))
+    listener.succeeded(_event("find", reply={"cursor": {"firstBatch": [{}, {}]}}, request_id=10))
+    listener.started(_event("getMore", {"getMore": 1, "collection": "clienti_t"}, request_id=11))
+    listener.succeeded(_event("getMore", reply={"cursor": {"nextBatch": [{}] * 5}}, request_id=11))
+    listener.started(_event("insert", {"insert": "clienti_t"}, request_id=12))
+    listener.failed(_event("insert", request_id=12))
+    listener.started(_event("ping", {"ping": 1}, request_id=13))
+    listener.succeeded(_event("ping", reply={"ok": 1}, request_id=13))
+
+    assert metrics.MONGO_COMMANDS.value(collection="clienti_t", op="find", outcome="ok") == before + 1
+    assert metrics.MONGO_DOCUMENTS.value(collection="clienti_t", op="getMore") == docs_before + 5
+    assert metrics.MONGO_COMMANDS.value(collection="clienti_t", op="insert", outcome="error") >= 1
+    assert metrics.MONGO_COMMANDS.value(collection="-", op="ping", outcome="ok") == 0
+    assert listener._pending == {}
+
+
+def test_observe_loop_records_errors():
+    ok_before = metrics.BACKGROUND_LOOP_RUNS.value(loop="t_loop", outcome="ok")
+    with metrics.observe_loop("t_loop"):
+        pass
+    with pytest.raises(ValueError):
+        with metrics.observe_loop("t_loop"):
+            raise ValueError("boom")
+    assert metrics.BACKGROUND_LOOP_RUNS.value(loop="t_loop", outcome="ok") == ok_before + 1
+    assert metrics.BACKGROUND_LOOP_RUNS.value(loop="t_loop", outcome="error") >= 1
+    assert metrics.BACKGROUND_LOOP_DURATION.count(loop="t_loop") >= 2
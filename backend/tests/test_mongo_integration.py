@@ -0,0 +1,196 @@
+"""Integration tests against a real MongoDB for what the in-memory fake (conftest.py) cannot run.
+
+    MONGO_TEST_URL=mongodb://localhost:27017 python -m pytest -m mongo tests/test_mongo_integration.py
+
+Each test works in a throwaway database that is dropped afterwards; without
+MONGO_TEST_URL the module is skipped.
+
+Verifies:
+  - conversation_summaries: the record_message update pipeline ($literal, $cond, $max)
+    and rebuild() ($unionWith over the archive + $merge) agree
+  - call_center_stats: the $unionWith + $facet dashboard pipeline
+  - cliente_rollups: $dateTrunc buckets in Europe/Rome (legacy string dates included)
+    read back through the $facet reader
+  - tag_counts.reconcile ($unwind/$group) and lead_analytics.load_outcome_table ($in expression)
+  - CallCenterService.release_agent (find_one_and_update with an update pipeline) dispatching the queue
+  - data_retention archive moves with a real duplicate-key BulkWriteError
+"""
+import asyncio
+import os
+import sys
+import uuid
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+import call_center_stats  # noqa: E402
+import call_queue  # noqa: E402
+import cliente_rollups  # noqa: E402
+import conversation_summaries  # noqa: E402
+import data_retention  # noqa: E402
+import lead_analytics  # noqa: E402
+import services  # noqa: E402
+import tag_counts  # noqa: E402
+
+MONGO_TEST_URL = os.environ.get("MONGO_TEST_URL")
+
+pytestmark = [
+    pytest.mark.mongo,
+    pytest.mark.skipif(not MONGO_TEST_URL, reason="MONGO_TEST_URL non impostato"),
+]
+
+T0 = datetime(2026, 10, 1, 9, 0, tzinfo=timezone.utc)
+
+
+def _run(scenario):
+    from motor.motor_asyncio import AsyncIOMotorClient
+
+    async def main():
+        client = AsyncIOMotorClient(MONGO_TEST_URL)
+        name = f"crm_test_{uuid.uuid4().hex[:12]}"
+        try:
+            return await scenario(client[name])
+        finally:
+            await client.drop_database(name)
+            client.close()
+
+    return asyncio.run(main())
+
+
+def test_conversation_summaries_pipeline_update_and_rebuild():
+    def msg(minutes, body, sender="lead"):
+        return {"id": f"m{minutes}", "lead_id": "l1", "unit_id": "u1", "body": body, "sender": sender,
+                "direction": "inbound" if sender == "lead" else "outbound", "status": "received",
+                "created_at": T0 + timedelta(minutes=minutes)}
+
+    async def scenario(db):
+        await conversation_summaries.ensure_conversation_summary_indexes(db)
+        for m in (msg(0, "ciao"), msg(5, "$set costa troppo", "bot"), msg(2, "arrivato in ritardo")):
+            await db.spoki_messages.insert_one(m)
+            await conversation_summaries.record_message(db, m)
+        live = await db.conversation_summaries.find_one({"lead_id": "l1"}, {"_id": 0, "updated_at": 0})
+        # il messaggio più vecchio passa in archivio (data_retention): il conteggio resta completo
+        archived = await db.spoki_messages.find_one_and_delete({"id": "m0"})
+        await db.spoki_messages_archive.insert_one(archived)
+        assert await conversation_summaries.rebuild(db) == 1
+        rebuilt = await db.conversation_summaries.find_one({"lead_id": "l1"}, {"_id": 0, "updated_at": 0})
+        return live, rebuilt
+
+    live, rebuilt = _run(scenario)
+    assert live["messages_count"] == 3 and live["unhandled_count"] == 0
+    assert live["last_message"]["body"] == "$set costa troppo"
+    assert live["last_message_at"] == (T0 + timedelta(minutes=5)).replace(tzinfo=None)
+    assert rebuilt == live
+
+
+def test_call_center_dashboard_facet():
+    now = datetime.now(timezone.utc)
+
+    async def scenario(db):
+        await db.calls.insert_many([
+            {"call_sid": "c1", "unit_id": "u1", "status": "completed", "created_at": now,
+             "answered_at": now + timedelta(seconds=10)},
+            {"call_sid": "c2", "unit_id": "u1", "status": "abandoned", "created_at": now},
+            {"call_sid": "c3", "unit_id": "u1", "status": "queued", "created_at": now},
+            {"call_sid": "c4", "unit_id": "u1", "status": "in-progress", "created_at": now - timedelta(days=2)},
+            {"call_sid": "c5", "unit_id": "u2", "status": "completed", "created_at": now},
+        ])
+        await db.agent_call_center.insert_many([
+            {"user_id": "a1", "unit_id": "u1", "status": "available"},
+            {"user_id": "a2", "unit_id": "u1", "status": "busy"},
+            {"user_id": "a3", "unit_id": "u2", "status": "available"},
+        ])
+        return (await call_center_stats.compute_dashboard(db, "u1"),
+                await call_center_stats.compute_dashboard(db))
+
+    unit, everything = _run(scenario)
+    assert unit["active_calls"] == 2 and unit["available_agents"] == 1
+    assert (unit["calls_today"], unit["answered_today"], unit["abandoned_today"]) == (3, 1, 1)
+    assert unit["avg_wait_time"] == 10.0
+    assert everything["calls_today"] == 4 and everything["available_agents"] == 2
+
+
+def test_cliente_rollups_day_buckets_in_rome():
+    async def scenario(db):
+        await cliente_rollups.ensure_rollup_indexes(db)
+        await db.clienti.insert_many([
+            # 01/10 23:30 e 02/10 00:30 ora di Roma
+            {"id": "c1", "sub_agenzia_id": "sa1", "status": "attivo", "created_at": datetime(2026, 10, 1, 21, 30)},
+            {"id": "c2", "sub_agenzia_id": "sa1", "status": "ko", "created_at": datetime(2026, 10, 1, 22, 30)},
+            {"id": "c3", "sub_agenzia_id": "sa1", "status": "attivo", "created_at": "2026-10-01T10:00:00"},
+        ])
+        await cliente_rollups.rebuild(db)
+        before = await cliente_rollups.read_sub_agenzie_rollups(db, ["sa1"])
+        await db.clienti.update_one({"id": "c2"}, {"$set": {"status": "attivo"}})
+        await cliente_rollups.refresh_ids(db, ["c2"])
+        after = await cliente_rollups.read_sub_agenzie_rollups(db, ["sa1"])
+        return before, after
+
+    before, after = _run(scenario)
+    assert before["sa1"]["days"] == {"2026-10-01": 2, "2026-10-02": 1}
+    assert before["sa1"]["status"] == {"attivo": 2, "ko": 1}
+    assert after["sa1"]["status"] == {"attivo": 3} and after["sa1"]["total"] == 3
+
+
+def test_tag_reconcile_and_outcome_table_aggregations():
+    async def scenario(db):
+        await db.leads.insert_many([
+            {"id": "l1", "tags": ["a", "b"], "unit_id": "u1", "assigned_agent_id": "a1", "esito": "Vendita"},
+            {"id": "l2", "tags": ["b"], "unit_id": "u1", "assigned_agent_id": "a1", "esito": None},
+            {"id": "l3", "tags": [], "unit_id": "u2", "assigned_agent_id": "a1", "esito": "Richiamare"},
+        ])
+        await db.clienti.insert_many([{"id": "c1", "tags": ["b", "c"]}])
+        fixed = await tag_counts.reconcile(db)
+        table = await lead_analytics.load_outcome_table(db, {"assigned_agent_id": "a1"}, unit_ids=["u1"])
+        return fixed, await tag_counts.read_counts(db), table
+
+    fixed, counts, table = _run(scenario)
+    assert fixed == 3
+    assert counts == {"a": {"lead_count": 1, "cliente_count": 0}, "b": {"lead_count": 2, "cliente_count": 1},
+                      "c": {"lead_count": 0, "cliente_count": 1}}
+    assert table.summary(["a1"])["total_leads"] == 3
+    assert table.summary(["a1"], in_unit_only=True) == {
+        "total_leads": 2, "contacted_leads": 1, "contact_rate": 50.0, "outcomes": {"Vendita": 1, "Nuovo": 1},
+    }
+
+
+def test_release_agent_pipeline_dispatches_queue(monkeypatch):
+    async def scenario(db):
+        monkeypatch.setattr(services, "db", db)
+        await call_queue.ensure_call_queue_indexes(db)
+        await db.agent_call_center.insert_one(
+            {"user_id": "a1", "unit_id": "u1", "status": "busy", "calls_in_progress": 1})
+        await db.calls.insert_one({"call_sid": "c1", "unit_id": "u1", "status": "queued"})
+        await call_queue.enqueue(db, "c1", "u1")
+        await services.CallCenterService().release_agent("a1")
+        return (await db.agent_call_center.find_one({"user_id": "a1"}),
+                await db[call_queue.CALL_QUEUE_COLLECTION].find_one({"call_sid": "c1"}),
+                await db.calls.find_one({"call_sid": "c1"}))
+
+    agent, entry, call = _run(scenario)
+    assert entry["status"] == "dispatched" and entry["agent_id"] == "a1"
+    assert agent["status"] == "busy" and agent["calls_in_progress"] == 1
+    assert call["status"] == "in-progress" and call["agent_id"] == "a1"
+
+
+def test_retention_archive_move_survives_duplicate_keys():
+    now = datetime(2026, 10, 19, tzinfo=timezone.utc)
+    policy = data_retention.RetentionPolicy("clienti_logs", "timestamp", 30, "archive")
+
+    async def scenario(db):
+        await db.clienti_logs.insert_many([
+            {"id": f"log-{d}", "cliente_id": "c1", "timestamp": now - timedelta(days=d)} for d in (100, 60, 1)
+        ])
+        # run precedente interrotto tra insert in archivio e delete
+        await db.clienti_logs_archive.insert_one(await db.clienti_logs.find_one({"id": "log-100"}))
+        result = await data_retention.apply_policy(db, policy, now=now, batch_size=10, pause=0)
+        history = await data_retention.find_with_archive(
+            db, "clienti_logs", {"cliente_id": "c1"}, "timestamp", 10, include_archive=True, projection={"_id": 0})
+        return result, history
+
+    result, history = _run(scenario)
+    assert result["processed"] == 2 and result["done"] is True
+    assert [(h["id"], h.get("archived", False)) for h in history] == [
+        ("log-1", False), ("log-60", True), ("log-100", True)]
@@ -0,0 +1,191 @@
+"""Streaming/chunked Nextcloud upload against a local WebDAV stand-in server.
+
+Verifies:
+  - spool_upload_to_disk copies an upload in fixed-size chunks
+  - spool_upload_to_disk stops at max_bytes and leaves no partial file behind
+  - NextcloudClient.upload_path streams a small file with one PUT on the pooled session
+  - folder existence (PROPFIND/MKCOL) is cached across uploads
+  - large files go through Nextcloud chunked upload (MKCOL uploads dir, PUT chunks, MOVE)
+  - servers without chunked upload fall back to a single streaming PUT
+"""
+import asyncio
+import io
+import os
+import sys
+from pathlib import Path
+from urllib.parse import unquote
+
+import pytest
+from aiohttp import web
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+import services  # noqa: E402
+
+
+class WebDAVStandIn:
+    """Minimal in-memory WebDAV server (subset used by NextcloudClient)."""
+
+    def __init__(self, support_chunking=True):
+        self.support_chunking = support_chunking
+        self.folders = set()
+        self.files = {}
+        self.uploads = {}
+        self.requests = []
+
+    async def handle(self, request):
+        path = request.path
+        self.requests.append((request.method, path))
+        if request.method == "PROPFIND":
+            return web.Response(status=207 if path.rstrip("/") in self.folders else 404)
+        if request.method == "MKCOL":
+            if path.startswith("/remote.php/dav/uploads/"):
+                if not self.support_chunking:
+                    return web.Response(status=405)
+                self.uploads[path] = {}
+                return web.Response(status=201)
+            self.folders.add(path.rstrip("/"))
+            return web.Response(status=201)
+        if request.method == "PUT":
+            body = await request.read()
+            parent, name = path.rsplit("/", 1)
+            if parent in self.uploads:
+                self.uploads[parent][name] = body
+                return web.Response(status=201)
+            if parent not in self.folders:
+                return web.Response(status=409)
+            self.files[path] = body
+            return web.Response(status=201)
+        if request.method == "MOVE":
+            upload_dir = path.rsplit("/", 1)[0]
+            chunks = self.uploads.pop(upload_dir)
+            dest = unquote(request.headers["Destination"]).split("/remote.php/dav/files/crm", 1)[1]
+            self.files["/remote.php/webdav" + dest] = b"".join(chunks[k] for k in sorted(chunks))
+            return web.Response(status=201)
+        if request.method == "DELETE":
+            self.uploads.pop(path, None)
+            return web.Response(status=204)
+        return web.Response(status=405)
+
+
+async def _with_server(dav, scenario):
+    app = web.Application(client_max_size=1024 ** 3)
+    app.router.add_route("*", "/{tail:.*}", dav.handle)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+    try:
+        client = services.NextcloudClient(f"http://127.0.0.1:{port}", "crm", "secret", "Fastweb")
+        await scenario(client)
+    finally:
+        await services.close_webdav_session()
+        await runner.cleanup()
+
+
+@pytest.fixture(autouse=True)
+def _reset_cache():
+    services._webdav_folder_cache.clear()
+    yield
+    services._webdav_folder_cache.clear()
+
+
+def _write_tmp(tmp_path, size):
+    p = tmp_path / "doc.pdf"
+    p.write_bytes(os.urandom(size))
+    return str(p)
+
+
+def test_spool_upload_to_disk_in_chunks(tmp_path):
+    class _Upload:
+        filename = "scan.pdf"
+
+        def __init__(self, data):
+            self._buf = io.BytesIO(data)
+            self.read_sizes = []
+
+        async def read(self, n=-1):
+            self.read_sizes.append(n)
+            return self._buf.read(n)
+
+    data = os.urandom(2500)
+    upload = _Upload(data)
+    path, size = asyncio.run(services.spool_upload_to_disk(upload, chunk_size=1000, directory=str(tmp_path)))
+    assert Path(path).parent == tmp_path
+    assert size == 2500
+    assert Path(path).read_bytes() == data
+    assert upload.read_sizes == [1000, 1000, 1000, 1000]
+
+
+def test_spool_upload_to_disk_enforces_max_bytes(tmp_path):
+    class _Upload:
+        filename = "huge.pdf"
+
+        def __init__(self, size):
+            self._buf = io.BytesIO(b"x" * size)
+            self.reads = 0
+
+        async def read(self, n=-1):
+            self.reads += 1
+            return self._buf.read(n)
+
+    upload = _Upload(10_000)
+    with pytest.raises(services.UploadTooLargeError):
+        asyncio.run(services.spool_upload_to_disk(
+            upload, chunk_size=1000, directory=str(tmp_path), prefix="", max_bytes=2500,
+        ))
+    assert upload.reads == 3
+    assert list(tmp_path.iterdir()) == []
+
+    ok = _Upload(2000)
+    path, size = asyncio.run(services.spool_upload_to_disk(
+        ok, chunk_size=1000, directory=str(tmp_path), prefix="", max_bytes=2500,
+    ))
+    assert size == 2000 and Path(path).parent == tmp_path
+    assert not Path(path).name.startswith("spool_")
+
+
+def test_small_upload_single_put_and_folder_cache(tmp_path):
+    dav = WebDAVStandIn()
+    local = _write_tmp(tmp_path, 4096)
+
+    async def scenario(client):
+        ok, path = await client.upload_path(local, "a.pdf")
+        assert ok and path == "/Fastweb/a.pdf"
+        ok, _ = await client.upload_path(local, "b.pdf")
+        assert ok
+
+    asyncio.run(_with_server(dav, scenario))
+    assert dav.files["/remote.php/webdav/Fastweb/a.pdf"] == Path(local).read_bytes()
+    methods = [m for m, _ in dav.requests]
+    assert methods == ["PROPFIND", "MKCOL", "PUT", "PUT"]
+
+
+def test_large_upload_uses_chunked_protocol(tmp_path, monkeypatch):
+    monkeypatch.setattr(services, "NEXTCLOUD_CHUNKED_THRESHOLD", 1000)
+    monkeypatch.setattr(services, "NEXTCLOUD_CHUNK_SIZE", 1024)
+    dav = WebDAVStandIn()
+    local = _write_tmp(tmp_path, 5000)
+
+    async def scenario(client):
+        ok, path = await client.upload_path(local, "big scan.pdf")
+        assert ok and path == "/Fastweb/big scan.pdf"
+
+    asyncio.run(_with_server(dav, scenario))
+    assert dav.files["/remote.php/webdav/Fastweb/big scan.pdf"] == Path(local).read_bytes()
+    chunk_puts = [p for m, p in dav.requests if m == "PUT"]
+    assert len(chunk_puts) == 5
+    assert dav.requests[-1][0] == "MOVE"
+
+
+def test_chunked_unsupported_falls_back_to_streaming_put(tmp_path, monkeypatch):
+    monkeypatch.setattr(services, "NEXTCLOUD_CHUNKED_THRESHOLD", 1000)
+    dav = WebDAVStandIn(support_chunking=False)
+    local = _write_tmp(tmp_path, 5000)
+
+    async def scenario(client):
+        ok, _ = await client.upload_path(local, "big.pdf")
+        assert ok
+
+    asyncio.run(_with_server(dav, scenario))
+    assert dav.files["/remote.php/webdav/Fastweb/big.pdf"] == Path(local).read_bytes()
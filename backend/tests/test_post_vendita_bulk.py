@@ -0,0 +1,139 @@
+"""Unit tests for the post-vendita bulk apply path (routes.post_vendita._apply_pv_stage_bulk).
+
+Verifies:
+  - target clienti are read with one $in query and updated with one unordered bulk_write
+  - history entries are inserted with one insert_many, only when the PV status changed
+  - stage 'ko'/'attivato' rewrites cliente.status, 'lavorazione' leaves it untouched
+  - missing clienti are skipped, write errors are reported per cliente
+  - a failed chunk or history insert is reported and later chunks still apply; the
+    import record is always written
+"""
+import asyncio
+import sys
+from pathlib import Path
+from types import SimpleNamespace
+
+import pytest
+from pymongo.errors import BulkWriteError
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+from conftest import FakeCollection, FakeDB  # noqa: E402
+from routes import post_vendita  # noqa: E402
+
+
+class _Clienti(FakeCollection):
+    """Update dei clienti in `fail_ids` rifiutati come farebbe un validator lato server."""
+
+    def __init__(self, docs, fail_ids=()):
+        super().__init__(docs)
+        self.fail_ids = set(fail_ids)
+
+    async def bulk_write(self, requests, ordered=True, **kwargs):
+        assert ordered is False
+        ok = [op for op in requests if op._filter["id"] not in self.fail_ids]
+        await super().bulk_write(ok, ordered=ordered)
+        self.calls[-1] = ("bulk_write", list(requests))
+        write_errors = [
+            {"index": i, "errmsg": "boom"}
+            for i, op in enumerate(requests) if op._filter["id"] in self.fail_ids
+        ]
+        if write_errors:
+            raise BulkWriteError({"writeErrors": write_errors})
+
+
+def _pv_config(stage, label, **extra):
+    return {"value": "ko_operatore", "commessa_id": "comm-1", "is_active": True, "stage": stage,
+            "label": label, **extra}
+
+
+@pytest.fixture
+def fake_db(monkeypatch):
+    fake = FakeDB(
+        post_vendita_status_config=[_pv_config("ko", "KO Operatore", color="#f00")],
+        clienti=_Clienti([
+            {"id": "c1", "post_vendita_status": None},
+            {"id": "c2", "post_vendita_status": "ko_operatore", "post_vendita_stage": "ko",
+             "post_vendita_status_label": "KO Operatore"},
+            {"id": "c3", "post_vendita_status": "da_lavorare"},
+        ], fail_ids={"c3"}),
+    )
+    monkeypatch.setattr(post_vendita, "db", fake)
+    return fake
+
+
+def test_bulk_apply_batches_reads_writes_and_history(fake_db):
+    actor = SimpleNamespace(id="u1", username="bo")
+    updated, errors = asyncio.run(post_vendita._apply_pv_stage_bulk(
+        ["c1", "c2", "c3", "missing", "c1"], "ko_operatore", "comm-1", actor=actor,
+    ))
+
+    assert updated == {"c1", "c2"}
+    assert errors == [{"cliente_id": "c3", "error": "boom"}]
+    assert len(fake_db.clienti.calls_to("find")) == 1
+    assert len(fake_db.clienti.calls_to("bulk_write")) == 1
+
+    [(ops,)] = fake_db.clienti.calls_to("bulk_write")
+    assert [op._filter["id"] for op in ops] == ["c1", "c2", "c3"]
+    set_doc = ops[0]._doc["$set"]
+    assert set_doc["status"] == "ko"
+    assert set_doc["passed_to_post_vendita"] is True
+
+    # c2 unchanged → no history; c3 failed → no history
+    [(history,)] = fake_db.cliente_post_vendita_history.calls_to("insert_many")
+    assert [h["cliente_id"] for h in history] == ["c1"]
+    assert history[0]["previous_status"] is None
+    assert history[0]["created_by_username"] == "bo"
+
+
+def test_lavorazione_stage_keeps_anagrafica_status(fake_db):
+    fake_db.post_vendita_status_config.docs[:] = [{**_pv_config("lavorazione", "Da Lavorare"), "value": "da_lavorare"}]
+    asyncio.run(post_vendita._apply_pv_stage_bulk(["c1"], "da_lavorare"))
+    set_doc = fake_db.clienti.calls_to("bulk_write")[0][0][0]._doc["$set"]
+    assert "status" not in set_doc
+    assert set_doc["post_vendita_stage"] == "lavorazione"
+
+
+class _FlakyClienti(FakeCollection):
+    """bulk_write del chunk che contiene `down_id` fallisce per intero (es. timeout di rete)."""
+
+    def __init__(self, docs, down_id):
+        super().__init__(docs)
+        self.down_id = down_id
+
+    async def bulk_write(self, requests, ordered=True, **kwargs):
+        if any(op._filter["id"] == self.down_id for op in requests):
+            raise RuntimeError("network timeout")
+        return await super().bulk_write(requests, ordered=ordered)
+
+
+class _History(FakeCollection):
+    async def insert_many(self, docs, ordered=True, **kwargs):
+        if docs[0]["cliente_id"] == "c3":
+            raise BulkWriteError({"writeErrors": [{"index": 0, "errmsg": "history boom"}]})
+        return await super().insert_many(docs, ordered=ordered)
+
+
+def test_partial_failures_are_reported_and_import_is_recorded(monkeypatch):
+    fake = FakeDB(
+        post_vendita_status_config=[{**_pv_config("ko", "KO Operatore"), "order": 0}],
+        clienti=_FlakyClienti([{"id": f"c{i}", "post_vendita_status": None} for i in (1, 2, 3)], down_id="c1"),
+        cliente_post_vendita_history=_History(),
+    )
+    monkeypatch.setattr(post_vendita, "db", fake)
+    monkeypatch.setattr(post_vendita, "PV_BULK_CHUNK_SIZE", 1)
+    user = SimpleNamespace(id="u1", username="admin", role=post_vendita.UserRole.ADMIN)
+
+    out = asyncio.run(post_vendita.bulk_import_execute(
+        {"new_status": "KO Operatore", "commessa_id": "comm-1",
+         "auto_matched": [{"cliente_id": "c1"}, {"cliente_id": "c2"}], "manual_matched": [{"cliente_id": "c3"}]},
+        current_user=user,
+    ))
+
+    assert (out["auto_matched"], out["manual_matched"]) == (1, 1)
+    assert out["errors"] == [
+        {"cliente_id": "c1", "error": "network timeout"},
+        {"cliente_id": "c3", "error": "storico non salvato: history boom"},
+    ]
+    [record] = fake.post_vendita_imports.docs
+    assert record["id"] == out["import_id"] and record["errors"] == out["errors"]
+    assert [h["cliente_id"] for h in fake.cliente_post_vendita_history.docs] == ["c2"]
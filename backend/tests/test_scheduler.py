@@ -0,0 +1,152 @@
+"""Unit tests for the persistent job scheduler (scheduler.py).
+
+Verifies:
+  - cron expressions are evaluated in Europe/Rome, across the DST change
+  - schedule_recurring() keeps the already planned run_at, runs are claimed with a
+    lease and recurring jobs are rescheduled to their next occurrence
+  - failures retry with exponential backoff and one-shot jobs end up "failed"
+  - a job left "running" by a dead worker is reclaimed once its lease expires
+  - ensure_indexes builds the unique `key` index once and fails loudly when it cannot
+"""
+import asyncio
+import sys
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+import scheduler  # noqa: E402
+from scheduler import JobScheduler, SchedulerIndexError, next_cron_run, parse_cron  # noqa: E402
+from conftest import FakeCollection, FakeDB  # noqa: E402
+
+
+class _FakeDB(FakeDB):
+    @property
+    def jobs(self):
+        return self[scheduler.JOBS_COLLECTION]
+
+
+def _job(db, key):
+    return next(d for d in db.jobs.docs if d.get("key") == key)
+
+
+async def _drain(sched):
+    await sched.run_pending()
+    while sched._running:
+        await asyncio.gather(*sched._running.values())
+
+
+def test_cron_uses_rome_time_across_dst():
+    # 10:15 CEST -> prossima ora piena 11:00 CEST = 09:00Z
+    assert next_cron_run("0 * * * *", datetime(2026, 10, 19, 8, 15, tzinfo=timezone.utc)) == \
+        datetime(2026, 10, 19, 9, 0, tzinfo=timezone.utc)
+    # "ogni giorno alle 03:00" prima e dopo il ritorno all'ora solare (25 ottobre 2026)
+    after = datetime(2026, 10, 24, 2, 0, tzinfo=timezone.utc)
+    first = next_cron_run("0 3 * * *", after)
+    assert first == datetime(2026, 10, 25, 2, 0, tzinfo=timezone.utc)
+    assert next_cron_run("0 3 * * *", first) == datetime(2026, 10, 26, 2, 0, tzinfo=timezone.utc)
+    # lun-ven alle 9:30
+    assert next_cron_run("30 9 * * 1-5", datetime(2026, 10, 23, 8, 0, tzinfo=timezone.utc)) == \
+        datetime(2026, 10, 26, 8, 30, tzinfo=timezone.utc)
+    with pytest.raises(ValueError):
+        parse_cron("61 * * * *")
+
+
+def test_recurring_job_runs_once_and_is_rescheduled():
+    db = _FakeDB()
+    sched = JobScheduler(db, concurrency=2)
+    calls = []
+
+    async def handler(payload):
+        calls.append(payload)
+        return 3
+
+    sched.register("recount", handler)
+
+    async def scenario():
+        await sched.schedule_recurring("recount", "recount", interval_seconds=600, payload={"x": 1})
+        await _drain(sched)
+        await _drain(sched)  # non ancora scaduto: nessuna seconda esecuzione
+        # al riavvio la definizione si aggiorna ma il run_at pianificato resta
+        planned = _job(db, "recount")["run_at"]
+        await sched.schedule_recurring("recount", "recount", interval_seconds=900)
+        return planned
+
+    planned = asyncio.run(scenario())
+    job = _job(db, "recount")
+    assert calls == [{"x": 1}]
+    assert job["status"] == "scheduled" and job["attempts"] == 0 and job["locked_by"] is None
+    assert job["run_at"] == planned
+    assert timedelta(seconds=590) < planned - job["last_finished_at"] <= timedelta(seconds=600)
+    assert job["interval_seconds"] == 900
+    assert sched.executed == 1
+
+
+def test_failed_once_job_retries_with_backoff_then_fails():
+    db = _FakeDB()
+    sched = JobScheduler(db)
+
+    async def boom(payload):
+        raise RuntimeError("smtp down")
+
+    sched.register("send", boom, max_attempts=2, retry_base_seconds=30)
+
+    async def scenario():
+        await sched.schedule_once("send", key="send:1")
+        await _drain(sched)
+        first = dict(_job(db, "send:1"))
+        _job(db, "send:1")["run_at"] = scheduler._now()  # salta l'attesa del backoff
+        await _drain(sched)
+        return first
+
+    first = asyncio.run(scenario())
+    assert first["status"] == "scheduled" and first["attempts"] == 1
+    delay = first["run_at"] - first["last_finished_at"]
+    assert timedelta(seconds=29) < delay <= timedelta(seconds=30)
+    job = _job(db, "send:1")
+    assert job["status"] == "failed" and job["attempts"] == 2
+    assert job["last_error"] == "smtp down"
+    assert (sched.retried, sched.failed) == (1, 1)
+
+
+def test_expired_lease_is_reclaimed():
+    db = _FakeDB()
+    sched = JobScheduler(db)
+    done = []
+
+    async def handler(payload):
+        done.append(payload["id"])
+
+    sched.register("timeout", handler)
+    past = scheduler._now() - timedelta(minutes=10)
+    db.jobs.docs.append({
+        "id": "j1", "key": "timeout:1", "handler": "timeout", "kind": "once", "run_at": past,
+        "payload": {"id": "e1"}, "status": "running", "attempts": 1, "max_attempts": 5,
+        "locked_by": "dead-worker", "lease_until": past + timedelta(minutes=5),
+    })
+
+    asyncio.run(_drain(sched))
+
+    job = _job(db, "timeout:1")
+    assert done == ["e1"]
+    assert job["status"] == "completed" and job["attempts"] == 2
+    assert job["expire_at"] is not None
+
+
+def test_ensure_indexes_once_and_fails_loudly_on_duplicate_keys():
+    db = _FakeDB()
+    sched = JobScheduler(db)
+    asyncio.run(sched.ensure_indexes())
+    asyncio.run(sched.ensure_indexes())
+    assert db.jobs.indexes.count("key") == 1 and ["key"] in db.jobs._unique
+
+    class _DuplicatedKeys(FakeCollection):
+        async def create_index(self, keys, unique=False, **kwargs):
+            if keys == "key":
+                raise RuntimeError("E11000 duplicate key error")
+            return await super().create_index(keys, unique=unique, **kwargs)
+
+    broken = _FakeDB(**{scheduler.JOBS_COLLECTION: _DuplicatedKeys()})
+    with pytest.raises(SchedulerIndexError):
+        asyncio.run(JobScheduler(broken).ensure_indexes())
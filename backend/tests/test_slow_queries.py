@@ -0,0 +1,113 @@
+"""Unit tests for slow-query capture (slow_queries.py).
+
+Verifies:
+  - filter shapes keep field names/operators and redact values
+  - explain output is summarized with COLLSCAN / high examined-ratio flags
+  - commands over the threshold are recorded (from a driver thread) with a redacted shape,
+    sampled reads are explained in the background, fast commands are ignored
+"""
+import asyncio
+import json
+import sys
+from pathlib import Path
+from types import SimpleNamespace
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+import slow_queries  # noqa: E402
+from conftest import FakeDB  # noqa: E402
+
+
+def test_redact_shape_hides_values():
+    flt = {
+        "$or": [{"nome": {"$regex": "mario", "$options": "i"}}, {"telefono": "333"}],
+        "commessa_id": {"$in": ["a", "b", "c"]},
+        "is_deleted": {"$ne": True},
+    }
+    shape = slow_queries.redact_shape(flt)
+    assert shape == {
+        "$or": [{"nome": {"$regex": "?", "$options": "?"}}, {"telefono": "?"}],
+        "commessa_id": {"$in": ["?"]},
+        "is_deleted": {"$ne": "?"},
+    }
+    assert "mario" not in json.dumps(shape)
+    other = slow_queries.redact_shape({**flt, "commessa_id": {"$in": ["x"]}})
+    assert slow_queries.shape_hash("clienti", "find", shape) == slow_queries.shape_hash("clienti", "find", other)
+
+
+def test_analyze_explain_flags():
+    explain = {
+        "queryPlanner": {"winningPlan": {"stage": "PROJECTION_SIMPLE", "inputStage": {"stage": "COLLSCAN"}}},
+        "executionStats": {"nReturned": 5, "totalDocsExamined": 50000, "totalKeysExamined": 0,
+                           "executionTimeMillis": 420},
+    }
+    plan = slow_queries.analyze_explain(explain)
+    assert plan["flags"] == ["COLLSCAN", "HIGH_EXAMINED_RATIO"]
+    assert plan["examined_ratio"] == 10000
+    indexed = slow_queries.analyze_explain({
+        "queryPlanner": {"winningPlan": {"stage": "FETCH", "inputStage": {"stage": "IXSCAN", "indexName": "id_1"}}},
+        "executionStats": {"nReturned": 1, "totalDocsExamined": 1, "totalKeysExamined": 1},
+    })
+    assert indexed["flags"] == [] and indexed["index_names"] == ["id_1"]
+
+
+class _FakeDB(FakeDB):
+    """Con create_collection (capped) e il comando explain sul client."""
+
+    def __init__(self):
+        super().__init__()
+        self.created = []
+        self.explains = []
+        self.client = {"crm": SimpleNamespace(command=self._command)}
+
+    async def create_collection(self, name, **kwargs):
+        self.created.append((name, kwargs))
+        self[name]
+
+    async def _command(self, cmd):
+        self.explains.append(cmd)
+        return {"queryPlanner": {"winningPlan": {"stage": "COLLSCAN"}},
+                "executionStats": {"nReturned": 1, "totalDocsExamined": 10}}
+
+
+def _events(name, command, request_id, duration_ms):
+    common = dict(request_id=request_id, connection_id=("h", 1), operation_id=request_id, command_name=name)
+    return (
+        SimpleNamespace(command=command, database_name="crm", **common),
+        SimpleNamespace(duration_micros=int(duration_ms * 1000), reply={}, **common),
+    )
+
+
+def test_recorder_captures_and_explains_slow_commands():
+    fake = _FakeDB()
+    recorder = slow_queries.SlowQueryRecorder(threshold_ms=100, sample_rate=1.0, enabled=True)
+
+    async def scenario():
+        await recorder.start(fake)
+        slow_find = _events("find", {"find": "clienti", "filter": {"email": "a@b.it"}, "lsid": {"id": 1}}, 1, 300)
+        fast_find = _events("find", {"find": "clienti", "filter": {"id": "x"}}, 2, 5)
+        slow_update = _events("update", {"update": "leads", "updates": [{"q": {"id": "l1"}, "u": {}}]}, 3, 150)
+
+        def driver_thread():
+            for started, finished in (slow_find, fast_find, slow_update):
+                recorder.started(started)
+                recorder.succeeded(finished)
+
+        await asyncio.to_thread(driver_thread)
+        for _ in range(50):
+            if len(fake[slow_queries.SLOW_QUERY_COLLECTION].docs) == 2:
+                break
+            await asyncio.sleep(0.01)
+        await recorder.stop()
+
+    asyncio.run(scenario())
+
+    assert fake.created[0][0] == "slow_queries" and fake.created[0][1]["capped"] is True
+    find_rec, update_rec = fake[slow_queries.SLOW_QUERY_COLLECTION].docs
+    assert find_rec["collection"] == "clienti" and find_rec["op"] == "find"
+    assert json.loads(find_rec["shape"]) == {"email": "?"}
+    assert find_rec["explained"] is True and find_rec["flags"] == ["COLLSCAN"]
+    assert fake.explains == [{"explain": {"find": "clienti", "filter": {"email": "a@b.it"}},
+                              "verbosity": "executionStats"}]
+    assert update_rec["op"] == "update" and update_rec["explained"] is False
+    assert recorder.stats()["captured"] == 2
+    assert recorder._pending == {}
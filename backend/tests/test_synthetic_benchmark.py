@@ -0,0 +1,86 @@
+"""Unit tests for the synthetic dataset generator and benchmark report helpers.
+
+Verifies:
+  - the dataset is deterministic for a given seed and covers every UserRole
+  - leads/clienti are generated in batches with consistent foreign keys
+  - generated users and clienti validate against the application models
+  - percentile / baseline comparison used by benchmark_endpoints.py
+"""
+import sys
+from dataclasses import replace
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+import benchmark_endpoints  # noqa: E402
+import synthetic_dataset  # noqa: E402
+from models import Cliente, User, UserRole  # noqa: E402
+
+SPEC = replace(synthetic_dataset.SCALES["tiny"], leads=230, clienti=170)
+
+
+def _dataset(seed=7):
+    ds = synthetic_dataset.SyntheticDataset(SPEC, seed=seed)
+    ds._password_hash = "x"  # evita bcrypt nei test
+    ds.build_structure()
+    return ds
+
+
+def test_dataset_is_deterministic_and_covers_roles():
+    a, b = _dataset(), _dataset()
+    assert a.structure == b.structure
+    assert next(a.iter_leads(50)) == next(b.iter_leads(50))
+    roles = {u["role"] for u in a.structure["users"]}
+    assert roles == {r.value for r in UserRole}
+    assert len(a.structure["users"]) == SPEC.users
+    assert _dataset(seed=8).structure["commesse"][0]["id"] != a.structure["commesse"][0]["id"]
+
+
+def test_batches_and_foreign_keys():
+    ds = _dataset()
+    s = ds.structure
+    unit_ids = {u["id"] for u in s["units"]}
+    sa_by_id = {sa["id"]: sa for sa in s["sub_agenzie"]}
+    servizi = {sv["id"]: sv for sv in s["servizi"]}
+
+    lead_batches = list(ds.iter_leads(100))
+    assert [len(leads) for leads, _ in lead_batches] == [100, 100, 30]
+    leads = [l for batch, _ in lead_batches for l in batch]
+    messages = [m for _, batch in lead_batches for m in batch]
+    assert all(l["unit_id"] in unit_ids for l in leads)
+    assert len({l["telefono"] for l in leads}) == len(leads)
+    lead_ids = {l["id"] for l in leads}
+    assert messages and all(m["lead_id"] in lead_ids for m in messages)
+
+    clienti_batches = list(ds.iter_clienti(100))
+    clienti = [c for batch, _, _ in clienti_batches for c in batch]
+    assert len(clienti) == SPEC.clienti
+    for c in clienti:
+        sa = sa_by_id[c["sub_agenzia_id"]]
+        assert c["commessa_id"] in sa["commesse_autorizzate"]
+        assert servizi[c["servizio_id"]]["commessa_id"] == c["commessa_id"]
+    cliente_ids = {c["id"] for c in clienti}
+    logs = [l for _, _, batch in clienti_batches for l in batch]
+    assert logs and all(l["cliente_id"] in cliente_ids for l in logs)
+
+
+def test_documents_validate_against_models():
+    ds = _dataset()
+    for u in ds.structure["users"][:50]:
+        User(**u)
+    clienti, _, _ = next(ds.iter_clienti(50))
+    for c in clienti:
+        Cliente(**c)
+
+
+def test_percentile_and_regression_check():
+    values = [10, 20, 30, 40, 50]
+    assert benchmark_endpoints.percentile(values, 50) == 30
+    assert benchmark_endpoints.percentile(values, 95) == 48
+    assert benchmark_endpoints.percentile([], 99) == 0.0
+
+    base = {"endpoints": {"clienti": benchmark_endpoints.summarize([10, 12, 14], [5, 5, 5], [200] * 3)}}
+    same = {"endpoints": {"clienti": benchmark_endpoints.summarize([10, 12, 15], [5, 5, 5], [200] * 3)}}
+    worse = {"endpoints": {"clienti": benchmark_endpoints.summarize([30, 32, 40], [5, 9, 9], [200] * 3)}}
+    assert benchmark_endpoints.compare_baselines(same, base, 0.25) == []
+    regressions = benchmark_endpoints.compare_baselines(worse, base, 0.25)
+    assert len(regressions) == 2 and regressions[0].startswith("clienti: p95")
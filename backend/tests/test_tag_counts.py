@@ -0,0 +1,91 @@
+"""Unit tests for materialized lead/cliente tag counters (tag_counts.py).
+
+Verifies:
+  - workflow add_tag/remove_tag nodes adjust counters only when the lead really changed
+  - recount() after bulk operations and reconcile() against the full aggregation
+  - usage rows merge formal tags with orphan tags from the counters
+"""
+import asyncio
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+import tag_counts  # noqa: E402
+from conftest import FakeCollection, FakeCursor, FakeDB  # noqa: E402
+from workflow_executor import WorkflowExecutorV2  # noqa: E402
+
+
+class _Tagged(FakeCollection):
+    """`aggregate` restituisce il conteggio per tag che produce la pipeline di reconcile
+    (la pipeline vera gira in test_mongo_integration.py)."""
+
+    def aggregate(self, pipeline, **kwargs):
+        self.calls.append(("aggregate", pipeline))
+        counts = {}
+        for d in self.docs:
+            for t in d.get("tags") or []:
+                counts[t] = counts.get(t, 0) + 1
+        return FakeCursor([{"_id": k, "count": v} for k, v in counts.items()])
+
+
+def _db(**collections):
+    return FakeDB(leads=_Tagged(collections.pop("leads", [])), clienti=_Tagged(collections.pop("clienti", [])),
+                  **collections)
+
+
+def _counts(db):
+    return asyncio.run(tag_counts.read_counts(db))
+
+
+def test_workflow_tag_nodes_adjust_only_on_change():
+    db = _db(leads=[{"id": "l1", "tags": []}])
+    executor = WorkflowExecutorV2(db)
+    ex = {"context": {"lead": {"id": "l1"}}}
+    node = lambda sub: {"id": "n", "data": {"nodeType": "actions", "nodeSubtype": sub, "config": {"tag": "vip"}}}  # noqa: E731
+
+    async def scenario():
+        await executor._exec_node_v2(node("add_tag"), ex)
+        await executor._exec_node_v2(node("add_tag"), ex)  # già presente: nessun incremento
+        after_add = await tag_counts.read_counts(db)
+        await executor._exec_node_v2(node("remove_tag"), ex)
+        await executor._exec_node_v2(node("remove_tag"), ex)
+        return after_add, await tag_counts.read_counts(db)
+
+    after_add, after_remove = asyncio.run(scenario())
+    assert after_add == {"vip": {"lead_count": 1, "cliente_count": 0}}
+    assert after_remove == {}
+
+
+def test_recount_and_reconcile():
+    db = _db(
+        leads=[{"id": "l1", "tags": ["a", "b"]}, {"id": "l2", "tags": ["b"]}],
+        clienti=[{"id": "c1", "tags": ["b", "c"]}],
+        lead_tag_counts=[
+            {"name": "a", "lead_count": 5, "cliente_count": 0},  # deriva
+            {"name": "zombie", "lead_count": 2, "cliente_count": 0},  # non più usato
+        ],
+    )
+    asyncio.run(tag_counts.recount(db, ["b", "zombie"]))
+    assert _counts(db)["b"] == {"lead_count": 2, "cliente_count": 1}
+    assert "zombie" not in _counts(db)
+
+    fixed = asyncio.run(tag_counts.reconcile(db))
+    assert fixed == 2  # 'a' corretto, 'c' creato
+    assert _counts(db) == {
+        "a": {"lead_count": 1, "cliente_count": 0},
+        "b": {"lead_count": 2, "cliente_count": 1},
+        "c": {"lead_count": 0, "cliente_count": 1},
+    }
+    assert db.system_migrations.docs[0]["id"] == tag_counts.TAG_COUNTS_MARKER_ID
+    assert asyncio.run(tag_counts.reconcile(db)) == 0
+
+
+def test_usage_rows_include_orphans():
+    meta = [{"id": "t1", "name": "vip", "label": "VIP", "color": "#f00"}, {"id": "t2", "name": "unused"}]
+    rows = tag_counts.usage_rows(meta, {"vip": {"lead_count": 3, "cliente_count": 1},
+                                        "wf_tag": {"lead_count": 2, "cliente_count": 0}})
+    by_name = {r["name"]: r for r in rows}
+    assert [r["name"] for r in rows] == ["unused", "vip", "wf_tag"]
+    assert by_name["vip"]["total_count"] == 4 and by_name["vip"]["is_orphan"] is False
+    assert by_name["unused"]["total_count"] == 0
+    assert by_name["wf_tag"]["is_orphan"] is True and by_name["wf_tag"]["color"] == "#64748b"
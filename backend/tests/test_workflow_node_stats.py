@@ -0,0 +1,93 @@
+"""Unit tests for incrementally maintained workflow node counters (workflow_stats.py).
+
+Verifies:
+  - WorkflowExecutorV2 writes per-node / per-branch increments into daily buckets,
+    including the steps run after a wait_for_reply resume
+  - the backfill seeds counters from legacy executions exactly once and skips
+    executions already tracked by the executor
+  - node ids containing '.' or '$' survive the round trip through field names
+"""
+import asyncio
+import sys
+from datetime import datetime, timezone
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+import workflow_stats  # noqa: E402
+from conftest import FakeDB  # noqa: E402
+from workflow_executor import WorkflowExecutorV2  # noqa: E402
+
+
+def _workflow():
+    node = lambda nid, ntype, sub=None, cfg=None: {  # noqa: E731
+        "id": nid, "data": {"nodeType": ntype, "nodeSubtype": sub, "config": cfg or {}}}
+    return {
+        "id": "wf1",
+        "nodes": [
+            node("t1", "triggers", "lead_created"),
+            node("c.1", "conditions", "if_else", {"field": "lead.nome", "op": "equals", "value": "Mario"}),
+            node("w1", "delay", "wait_for_reply"),
+            node("c2", "conditions", "check_positive_response"),
+        ],
+        "edges": [
+            {"source": "t1", "target": "c.1"},
+            {"source": "c.1", "target": "w1", "sourceHandle": "yes"},
+            {"source": "w1", "target": "c2", "sourceHandle": "reply"},
+        ],
+    }
+
+
+def test_executor_emits_daily_counters():
+    db = FakeDB()
+    db.workflows.docs.append(_workflow())
+    executor = WorkflowExecutorV2(db)
+
+    async def scenario():
+        await executor.start("wf1", {"lead": {"id": "l1", "nome": "Mario"}})
+        await executor.start("wf1", {"lead": {"id": "l2", "nome": "Luigi"}})
+        await executor.resume_on_reply("l1", "sì certo")
+        return await workflow_stats.read_node_stats(db, "wf1")
+
+    stats = asyncio.run(scenario())
+
+    assert stats["total_executions"] == 2
+    # il ramo "no" senza edge dedicato ricade sul primo edge (w1)
+    assert stats["node_counts"] == {"t1": 2, "c.1": 2, "w1": 2, "c2": 1}
+    assert stats["branch_counts"] == {"c.1": {"yes": 1, "no": 1}, "c2": {"yes": 1}}
+    buckets = db.workflow_node_stats.docs
+    assert len(buckets) == 1 and buckets[0]["day"] == datetime.now(timezone.utc).strftime("%Y-%m-%d")
+    assert "c%2E1" in buckets[0]["nodes"]
+    assert all(ex["stats_tracked"] for ex in db.workflow_executions_v2.docs)
+
+
+def test_backfill_seeds_legacy_executions_once():
+    db = FakeDB()
+    db.workflow_executions_v2.docs.extend([
+        {"id": "e1", "workflow_id": "wf1", "created_at": datetime(2026, 9, 1, tzinfo=timezone.utc), "history": [
+            {"node_id": "t1", "result": {"success": True}, "ts": "2026-09-01T10:00:00+00:00"},
+            {"node_id": "c1", "result": {"branch": "no"}, "ts": "2026-09-02T10:00:00+00:00"},
+        ]},
+        {"id": "e2", "workflow_id": "wf1", "created_at": datetime(2026, 9, 2, tzinfo=timezone.utc), "history": [
+            {"node_id": "t1", "result": {}, "ts": "2026-09-02T11:00:00+00:00"},
+        ]},
+        {"id": "e3", "workflow_id": "wf1", "stats_tracked": True, "history": [{"node_id": "t1", "result": {}}]},
+    ])
+
+    async def scenario():
+        await workflow_stats.ensure_node_stats(db)
+        again = await workflow_stats.backfill_node_stats(db)
+        return again, await workflow_stats.read_node_stats(db, "wf1")
+
+    again, stats = asyncio.run(scenario())
+
+    assert again == {"executions": 0, "steps": 0}
+    assert stats == {"total_executions": 2, "node_counts": {"t1": 2, "c1": 1}, "branch_counts": {"c1": {"no": 1}}}
+    assert sorted(d["day"] for d in db.workflow_node_stats.docs) == ["2026-09-01", "2026-09-02"]
+    assert db.system_migrations.docs[0]["id"] == workflow_stats.BACKFILL_MARKER_ID
+
+
+def test_field_key_round_trip():
+    for raw in ("node.1", "$weird", "50%.x", "plain"):
+        encoded = workflow_stats._key(raw)
+        assert "." not in encoded and not encoded.startswith("$")
+        assert workflow_stats._unkey(encoded) == raw
@@ -0,0 +1,99 @@
+"""Unit tests for the workflow trigger index and bounded dispatch queue (workflow_triggers.py).
+
+Verifies:
+  - lookup() maps (unit_id, trigger_subtype) to active workflows without reading nodes,
+    and a lead without unit matches every unit (legacy query semantics)
+  - sync() follows saves, deactivation and deletion, persisting `trigger_subtypes`
+  - ensure_trigger_index() backfills workflows saved before the field existed
+  - the dispatch queue never runs more than `concurrency` starts at once and
+    applies backpressure when full
+"""
+import asyncio
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+from conftest import FakeDB  # noqa: E402
+from workflow_triggers import (  # noqa: E402
+    WorkflowDispatchQueue, WorkflowTriggerRegistry, ensure_trigger_index, extract_trigger_subtypes,
+)
+
+
+def _trigger(sub):
+    return {"id": f"t-{sub}", "data": {"nodeType": "triggers", "nodeSubtype": sub}}
+
+
+def _wf(wid, unit, subs, active=True):
+    nodes = [_trigger(s) for s in subs] + [{"id": "a", "data": {"nodeType": "actions", "nodeSubtype": "send_email"}}]
+    return {"id": wid, "unit_id": unit, "is_active": active, "nodes": nodes,
+            "trigger_subtypes": extract_trigger_subtypes(nodes)}
+
+
+def test_lookup_and_sync():
+    db = FakeDB(workflows=[
+        _wf("w1", "u1", ["lead_created"]),
+        _wf("w2", "u1", ["lead_created", "tag_added"]),
+        _wf("w3", "u2", ["lead_created"]),
+        _wf("w4", "u1", ["lead_created"], active=False),
+    ])
+    registry = WorkflowTriggerRegistry(db, ttl=3600)
+
+    async def scenario():
+        out = {"u1": await registry.lookup("u1", "lead_created"),
+               "tag": await registry.lookup("u1", "tag_added"),
+               "none": await registry.lookup(None, "lead_created")}
+        # attivazione di w4, rimozione del trigger da w2, cancellazione di w3
+        db.workflows.docs[3]["is_active"] = True
+        db.workflows.docs[1]["nodes"] = [_trigger("tag_added")]
+        del db.workflows.docs[2]
+        for wid in ("w4", "w2", "w3"):
+            await registry.sync(wid)
+        out["after"] = await registry.lookup("u1", "lead_created")
+        out["after_none"] = await registry.lookup(None, "lead_created")
+        return out
+
+    out = asyncio.run(scenario())
+    assert out["u1"] == ["w1", "w2"]
+    assert out["tag"] == ["w2"]
+    assert out["none"] == ["w1", "w2", "w3"]
+    assert out["after"] == ["w1", "w4"]
+    assert out["after_none"] == ["w1", "w4"]
+    assert db.workflows.docs[1]["trigger_subtypes"] == ["tag_added"]
+    # il caricamento non proietta mai i nodi
+    assert all("nodes" not in (p or {}) for _, p in db.workflows.calls_to("find"))
+    assert registry.reloads == 1
+
+
+def test_ensure_trigger_index_backfills_missing_field():
+    legacy = _wf("w1", "u1", ["lead_created"])
+    del legacy["trigger_subtypes"]
+    db = FakeDB(workflows=[legacy, _wf("w2", "u1", [])])
+    assert asyncio.run(ensure_trigger_index(db)) == 1
+    assert db.workflows.docs[0]["trigger_subtypes"] == ["lead_created"]
+
+
+def test_dispatch_queue_bounds_concurrency():
+    running, peak, done = 0, 0, []
+
+    async def run(workflow_id, payload):
+        nonlocal running, peak
+        running += 1
+        peak = max(peak, running)
+        await asyncio.sleep(0.01)
+        running -= 1
+        done.append(workflow_id)
+
+    async def scenario():
+        queue = WorkflowDispatchQueue(run, maxsize=3, concurrency=2)
+        queue.start()
+        for i in range(20):
+            await queue.submit(f"w{i}", {})
+        await queue.stop()
+        return queue.stats()
+
+    stats = asyncio.run(scenario())
+    assert peak == 2
+    assert sorted(done) == sorted(f"w{i}" for i in range(20))
+    assert stats["completed"] == 20 and stats["failed"] == 0
+    assert stats["max_depth"] <= 3 and stats["blocked"] > 0
+    assert stats["running"] is False
@@ -7,7 +7,12 @@ from datetime import datetime, timezone
 from typing import Dict, Any, Optional, List
 import logging
 from motor.motor_asyncio import AsyncIOMotorDatabase
-import openai
+from lazy_imports import lazy_import
+from workflow_stats import NodeStatsBatch
+import tag_counts
+import conversation_summaries
+
+openai = lazy_import("openai")  # SDK pesante: caricato al primo uso
 
 logger = logging.getLogger(__name__)
 
@@ -417,14 +422,23 @@ class WorkflowExecutorV2:
     Persistent state: collection `workflow_executions_v2` con documenti:
       { id, workflow_id, lead_id, status: running|waiting|done|failed,
         current_node_id, waiting_node_id, waiting_until (datetime), context,
-        history: [{node_id, result, ts}], created_at, updated_at }
+        history: [{node_id, result, ts}], stats_tracked, created_at, updated_at }
+
+    NEW (ott 2026): ogni run accumula i passaggi per nodo/ramo in un `NodeStatsBatch`
+    scritto in `workflow_node_stats` (vedi workflow_stats.py) al termine o alla sospensione.
+    Con uno `scheduler` (scheduler.JobScheduler) ogni sospensione con `waiting_until`
+    pianifica un job "workflow_timeout" preciso invece del polling ogni minuto.
     """
 
-    def __init__(self, db, spoki_service=None, chatbot_module=None, calendar_module=None):
+    TIMEOUT_JOB = "workflow_timeout"
+    TIMEOUT_MIGRATION_MARKER_ID = "workflow_timeout_jobs_v1"
+
+    def __init__(self, db, spoki_service=None, chatbot_module=None, calendar_module=None, scheduler=None):
         self.db = db
         self.spoki = spoki_service
         self.chatbot = chatbot_module  # spoki_chatbot module
         self.cal = calendar_module     # spoki_chatbot module (find_next_free_slot)
+        self.scheduler = scheduler
 
     async def start(self, workflow_id: str, trigger_data: Dict[str, Any]) -> Dict[str, Any]:
         wf = await self.db.workflows.find_one({"id": workflow_id}, {"_id": 0})
@@ -448,11 +462,14 @@ class WorkflowExecutorV2:
             "waiting_until": None,
             "context": {"trigger": trigger_data, "lead": trigger_data.get("lead") or {}},
             "history": [],
+            "stats_tracked": True,  # conteggiata in workflow_node_stats dall'executor
             "created_at": datetime.now(timezone.utc),
             "updated_at": datetime.now(timezone.utc),
         }
         await self.db.workflow_executions_v2.insert_one(exec_doc)
-        return await self._run_loop(exec_doc, nodes, edges)
+        stats = NodeStatsBatch(workflow_id)
+        stats.execution_started(exec_doc["created_at"])
+        return await self._run_loop(exec_doc, nodes, edges, stats=stats)
 
     async def resume_on_reply(self, lead_id: str, reply_text: str) -> List[Dict[str, Any]]:
         """Trova tutte le esecuzioni in attesa di risposta per il lead e le riprende sul ramo 'reply'."""
@@ -467,23 +484,58 @@ class WorkflowExecutorV2:
             results.append(res)
         return results
 
-    async def process_timeouts(self) -> int:
-        """Da chiamare ogni minuto: riprende esecuzioni il cui timeout è scaduto sul ramo 'timeout'."""
-        now = datetime.now(timezone.utc)
-        count = 0
-        async for ex in self.db.workflow_executions_v2.find({
-            "status": "waiting",
-            "waiting_until": {"$ne": None, "$lte": now},
-        }):
-            wf = await self.db.workflows.find_one({"id": ex["workflow_id"]}, {"_id": 0})
-            if not wf:
-                continue
-            ex.pop("_id", None)
-            await self._continue_from_waiting(ex, wf.get("nodes", []), wf.get("edges", []), branch="timeout")
-            count += 1
-        return count
+    @staticmethod
+    def _timeout_key(execution_id: str, waiting_until: datetime) -> str:
+        # una chiave per sospensione: il job che riprende l'esecuzione può pianificarne
+        # subito un'altra (nuovo nodo di attesa) mentre è ancora "running"
+        if waiting_until.tzinfo is None:
+            waiting_until = waiting_until.replace(tzinfo=timezone.utc)
+        return f"workflow_timeout:{execution_id}:{int(waiting_until.timestamp())}"
+
+    async def _schedule_timeout(self, execution_id: str, waiting_until: Optional[datetime]):
+        if self.scheduler is None or waiting_until is None:
+            return
+        try:
+            await self.scheduler.schedule_once(
+                self.TIMEOUT_JOB, waiting_until, {"execution_id": execution_id},
+                key=self._timeout_key(execution_id, waiting_until),
+            )
+        except Exception as e:
+            logger.warning(f"[WF-V2] timeout job for {execution_id} not scheduled: {e}")
+
+    async def resume_timeout(self, execution_id: str) -> bool:
+        """Job "workflow_timeout": riprende sul ramo 'timeout' se l'esecuzione è ancora in
+        attesa e il timeout è scaduto (una risposta arrivata prima l'ha già ripresa)."""
+        ex = await self.db.workflow_executions_v2.find_one({
+            "id": execution_id, "status": "waiting", "waiting_until": {"$ne": None, "$lte": datetime.now(timezone.utc)},
+        }, {"_id": 0})
+        if not ex:
+            return False
+        wf = await self.db.workflows.find_one({"id": ex["workflow_id"]}, {"_id": 0})
+        if not wf:
+            return False
+        await self._continue_from_waiting(ex, wf.get("nodes", []), wf.get("edges", []), branch="timeout")
+        return True
+
+    async def schedule_waiting_timeouts(self) -> int:
+        """Una tantum (marker in `system_migrations`): pianifica i job di timeout delle
+        esecuzioni sospese prima dello scheduler."""
+        if self.scheduler is None or await self.db.system_migrations.find_one({"id": self.TIMEOUT_MIGRATION_MARKER_ID}):
+            return 0
+        n = 0
+        async for ex in self.db.workflow_executions_v2.find(
+            {"status": "waiting", "waiting_until": {"$ne": None}}, {"_id": 0, "id": 1, "waiting_until": 1}
+        ):
+            await self._schedule_timeout(ex["id"], ex["waiting_until"])
+            n += 1
+        await self.db.system_migrations.insert_one({
+            "id": self.TIMEOUT_MIGRATION_MARKER_ID, "completed_at": datetime.now(timezone.utc), "scheduled": n,
+        })
+        return n
 
     async def _continue_from_waiting(self, ex: Dict, nodes: List[Dict], edges: List[Dict], branch: str) -> Dict:
+        if branch != "timeout" and ex.get("waiting_until") and self.scheduler is not None:
+            await self.scheduler.cancel(self._timeout_key(ex["id"], ex["waiting_until"]))
         wait_node_id = ex.get("waiting_node_id") or ex.get("current_node_id")
         next_id = self._next_node(wait_node_id, edges, branch=branch)
         ex["current_node_id"] = next_id
@@ -509,9 +561,20 @@ class WorkflowExecutorV2:
             return candidates[0]["target"]
         return None
 
-    async def _run_loop(self, ex: Dict, nodes: List[Dict], edges: List[Dict]) -> Dict:
+    async def _flush_stats(self, stats: Optional[NodeStatsBatch]):
+        if not stats:
+            return
+        try:
+            await stats.flush(self.db)
+        except Exception as e:
+            logger.warning(f"[WF-V2] node stats flush failed: {e}")
+
+    async def _run_loop(self, ex: Dict, nodes: List[Dict], edges: List[Dict], stats: Optional[NodeStatsBatch] = None) -> Dict:
         max_steps = 50
         steps = 0
+        # Le esecuzioni precedenti ai contatori vengono seminate dal backfill, non qui
+        if stats is None and ex.get("stats_tracked"):
+            stats = NodeStatsBatch(ex["workflow_id"])
         while ex["current_node_id"] and steps < max_steps:
             steps += 1
             node = next((n for n in nodes if n["id"] == ex["current_node_id"]), None)
@@ -522,6 +585,8 @@ class WorkflowExecutorV2:
             ex.setdefault("history", []).append({
                 "node_id": node["id"], "result": _safe_result(res), "ts": datetime.now(timezone.utc).isoformat(),
             })
+            if stats is not None:
+                stats.node(node["id"], _safe_result(res).get("branch"))
             if res.get("suspend"):
                 ex["status"] = "waiting"
                 ex["waiting_node_id"] = node["id"]
@@ -531,6 +596,8 @@ class WorkflowExecutorV2:
                     "context": ex["context"], "history": ex["history"][-30:],
                     "updated_at": datetime.now(timezone.utc),
                 }})
+                await self._flush_stats(stats)
+                await self._schedule_timeout(ex["id"], res.get("waiting_until"))
                 return {"success": True, "status": "waiting", "execution_id": ex["id"]}
             branch = res.get("branch")
             goto = res.get("goto_node_id")
@@ -549,6 +616,7 @@ class WorkflowExecutorV2:
         await self.db.workflow_executions_v2.update_one({"id": ex["id"]}, {"$set": {
             "status": ex["status"], "updated_at": datetime.now(timezone.utc),
         }})
+        await self._flush_stats(stats)
         return {"success": True, "status": ex["status"], "execution_id": ex["id"]}
 
     async def _exec_node_v2(self, node: Dict, ex: Dict) -> Dict[str, Any]:
@@ -693,7 +761,7 @@ class WorkflowExecutorV2:
                 reply = await self.chatbot.generate_unit_reply(
                     self.db, lead_id, unit_cfg, user_message, history,
                     system_prompt=(unit_cfg or {}).get("chatbot_system_prompt"),
-                    next_free_slot_hint=slot_hint,
+                    next_free_slot_hint=slot_hint, unit_id=unit_id,
                 )
                 bot_text = (reply.get("reply") or "").strip() or "Grazie!"
                 history.append({"role": "user", "content": user_message, "ts": datetime.now(timezone.utc).isoformat()})
@@ -717,6 +785,7 @@ class WorkflowExecutorV2:
                 await self.db.spoki_messages.update_many(
                     {"lead_id": lead_id, "needs_attention": True}, {"$set": {"needs_attention": False}}
                 )
+                await conversation_summaries.clear_unhandled(self.db, lead_id)
                 ctx["chatbot_last_reply"] = reply
                 # branch in base a intent: 'ready_to_book' → branch 'book', altrimenti continua
                 if reply.get("ready_to_book"):
@@ -744,13 +813,17 @@ class WorkflowExecutorV2:
             if sub == "add_tag":
                 tag = cfg.get("tag")
                 if tag and lead.get("id"):
-                    await self.db.leads.update_one({"id": lead["id"]}, {"$addToSet": {"tags": tag}})
+                    res = await self.db.leads.update_one({"id": lead["id"]}, {"$addToSet": {"tags": tag}})
+                    if res.modified_count:
+                        await tag_counts.adjust(self.db, tag, "lead", +1)
                 return {"success": True}
 
             if sub == "remove_tag":
                 tag = cfg.get("tag")
                 if tag and lead.get("id"):
-                    await self.db.leads.update_one({"id": lead["id"]}, {"$pull": {"tags": tag}})
+                    res = await self.db.leads.update_one({"id": lead["id"]}, {"$pull": {"tags": tag}})
+                    if res.modified_count:
+                        await tag_counts.adjust(self.db, tag, "lead", -1)
                 return {"success": True}
 
             if sub == "go_to":
@@ -788,14 +861,16 @@ class WorkflowExecutorV2:
         return False
 
     async def _log_spoki_msg(self, lead, direction, body=None, template_name=None, vars=None, status=None, sender="system", error=None, spoki_id=None):
-        await self.db.spoki_messages.insert_one({
+        msg = {
             "id": str(_uuid.uuid4()),
             "unit_id": lead.get("commessa_id"), "lead_id": lead.get("id"),
             "direction": direction, "phone_number": lead.get("telefono") or "",
             "body": body, "template_name": template_name, "template_variables": vars,
             "status": status, "sender": sender, "error": error,
             "spoki_message_id": spoki_id, "created_at": datetime.now(timezone.utc),
-        })
+        }
+        await self.db.spoki_messages.insert_one(msg)
+        await conversation_summaries.record_message(self.db, msg)
 
 
 def _safe_result(r):
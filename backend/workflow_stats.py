@@ -0,0 +1,144 @@
+"""Contatori incrementali di attraversamento nodi dei workflow V2 (NEW ott 2026).
+
+`GET /workflows/{id}/node-stats` faceva due `$unwind` su `history` di tutte le
+esecuzioni del workflow (più due count): costo che cresce per sempre con le esecuzioni,
+e comunque parziale perché `history` viene troncata alle ultime 30 entry.
+
+Ora `WorkflowExecutorV2` accumula i passaggi di un run in un `NodeStatsBatch` e li
+scrive con un solo `$inc` (upsert) nel bucket giornaliero del workflow:
+
+    workflow_node_stats: { workflow_id, day: "YYYY-MM-DD", executions: n,
+                           nodes: {<node>: n}, branches: {<node>: {<branch>: n}} }
+
+L'endpoint somma i bucket (O(giorni × nodi), indipendente dal numero di esecuzioni).
+Le esecuzioni nate prima dei contatori (senza `stats_tracked`) vengono seminate da
+`backfill_node_stats` a partire dalla loro `history`, una sola volta per esecuzione.
+"""
+import logging
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+NODE_STATS_COLLECTION = "workflow_node_stats"
+BACKFILL_MARKER_ID = "workflow_node_stats_v1"
+
+
+def _key(value: str) -> str:
+    """Node id / branch come nome di campo Mongo (niente '.' e '$' iniziale)."""
+    return str(value).replace("%", "%25").replace(".", "%2E").replace("$", "%24")
+
+
+def _unkey(value: str) -> str:
+    return value.replace("%24", "$").replace("%2E", ".").replace("%25", "%")
+
+
+def _day(ts: Any) -> str:
+    if isinstance(ts, datetime):
+        return ts.astimezone(timezone.utc).strftime("%Y-%m-%d") if ts.tzinfo else ts.strftime("%Y-%m-%d")
+    if isinstance(ts, str) and len(ts) >= 10:
+        return ts[:10]
+    return datetime.now(timezone.utc).strftime("%Y-%m-%d")
+
+
+class NodeStatsBatch:
+    """Incrementi raccolti durante un run dell'executor, scritti con un solo update per giorno."""
+
+    def __init__(self, workflow_id: str):
+        self.workflow_id = workflow_id
+        self._inc: Dict[str, Dict[str, int]] = {}
+
+    def _add(self, day: str, field: str, n: int = 1):
+        bucket = self._inc.setdefault(day, {})
+        bucket[field] = bucket.get(field, 0) + n
+
+    def execution_started(self, ts: Any = None):
+        self._add(_day(ts), "executions")
+
+    def node(self, node_id: str, branch: Optional[str] = None, ts: Any = None):
+        day = _day(ts)
+        self._add(day, f"nodes.{_key(node_id)}")
+        if branch:
+            self._add(day, f"branches.{_key(node_id)}.{_key(branch)}")
+
+    def __bool__(self):
+        return bool(self._inc)
+
+    async def flush(self, db):
+        pending, self._inc = self._inc, {}
+        for day, inc in pending.items():
+            await db[NODE_STATS_COLLECTION].update_one(
+                {"workflow_id": self.workflow_id, "day": day},
+                {"$inc": inc, "$set": {"updated_at": datetime.now(timezone.utc)}},
+                upsert=True,
+            )
+
+
+async def read_node_stats(db, workflow_id: str, days: Optional[int] = None) -> Dict[str, Any]:
+    """Somma i bucket giornalieri: {total_executions, node_counts, branch_counts}."""
+    query: Dict[str, Any] = {"workflow_id": workflow_id}
+    if days:
+        since = (datetime.now(timezone.utc) - timedelta(days=days - 1)).strftime("%Y-%m-%d")
+        query["day"] = {"$gte": since}
+    total = 0
+    counts: Dict[str, int] = {}
+    branches: Dict[str, Dict[str, int]] = {}
+    async for doc in db[NODE_STATS_COLLECTION].find(query, {"_id": 0, "executions": 1, "nodes": 1, "branches": 1}):
+        total += doc.get("executions", 0)
+        for nid, n in (doc.get("nodes") or {}).items():
+            counts[_unkey(nid)] = counts.get(_unkey(nid), 0) + n
+        for nid, per_branch in (doc.get("branches") or {}).items():
+            target = branches.setdefault(_unkey(nid), {})
+            for br, n in per_branch.items():
+                target[_unkey(br)] = target.get(_unkey(br), 0) + n
+    return {"total_executions": total, "node_counts": counts, "branch_counts": branches}
+
+
+def _batch_from_history(ex: Dict[str, Any]) -> NodeStatsBatch:
+    batch = NodeStatsBatch(ex["workflow_id"])
+    batch.execution_started(ex.get("created_at"))
+    for entry in ex.get("history") or []:
+        if entry.get("node_id"):
+            batch.node(entry["node_id"], (entry.get("result") or {}).get("branch"), entry.get("ts"))
+    return batch
+
+
+async def backfill_node_stats(db, workflow_id: Optional[str] = None) -> Dict[str, int]:
+    """Semina i contatori dalle esecuzioni non ancora conteggiate (idempotente per esecuzione)."""
+    query: Dict[str, Any] = {"stats_tracked": {"$ne": True}}
+    if workflow_id:
+        query["workflow_id"] = workflow_id
+    executions = 0
+    steps = 0
+    cursor = db.workflow_executions_v2.find(
+        query, {"_id": 0, "id": 1, "workflow_id": 1, "created_at": 1, "history": 1}
+    )
+    async for ex in cursor:
+        if not ex.get("workflow_id"):
+            continue
+        # Marca prima di contare: un'esecuzione ripresa in parallelo da ora in poi viene
+        # conteggiata dall'executor, non due volte
+        res = await db.workflow_executions_v2.update_one(
+            {"id": ex["id"], "stats_tracked": {"$ne": True}}, {"$set": {"stats_tracked": True}}
+        )
+        if not res.modified_count:
+            continue
+        await _batch_from_history(ex).flush(db)
+        executions += 1
+        steps += len(ex.get("history") or [])
+    return {"executions": executions, "steps": steps}
+
+
+async def ensure_node_stats(db):
+    """Startup: indice dei bucket + backfill una tantum (marker in `system_migrations`)."""
+    try:
+        await db[NODE_STATS_COLLECTION].create_index([("workflow_id", 1), ("day", 1)], unique=True)
+        if await db.system_migrations.find_one({"id": BACKFILL_MARKER_ID}):
+            return
+        result = await backfill_node_stats(db)
+        await db.system_migrations.insert_one({
+            "id": BACKFILL_MARKER_ID, "completed_at": datetime.now(timezone.utc), **result,
+        })
+        logger.info(f"✅ Workflow node stats backfill: {result['executions']} esecuzioni, {result['steps']} passaggi")
+    except Exception as e:
+        logger.warning(f"⚠️ Workflow node stats backfill failed: {e}")
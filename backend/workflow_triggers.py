@@ -0,0 +1,245 @@
+"""Indice dei trigger dei workflow V2 + coda di dispatch limitata (NEW ott 2026).
+
+`trigger_workflows_for_lead` leggeva, per ogni lead creato, tutti i workflow attivi
+della Unit con i loro `nodes` completi per cercare un nodo trigger del subtype
+richiesto, e lanciava un `asyncio.create_task` per ogni match: durante i picchi di
+lead (import, webhook) migliaia di esecuzioni concorrenti saturavano l'event loop.
+
+- `WorkflowTriggerRegistry`: mappa in memoria (unit_id, trigger_subtype) -> workflow id.
+  I subtype sono denormalizzati nel campo `trigger_subtypes` del workflow (indicizzato),
+  così il caricamento non deserializza mai i nodi. `sync()` va chiamato dopo ogni
+  scrittura di un workflow (salvataggio, attivazione, ripristino, cancellazione);
+  la mappa viene comunque ricaricata ogni `WORKFLOW_TRIGGER_REGISTRY_TTL_SECONDS`
+  per recepire modifiche fatte da altri processi.
+- `WorkflowDispatchQueue`: `asyncio.Queue` limitata consumata da un numero fisso di
+  worker. Quando la coda è piena `submit()` attende (backpressure) invece di creare
+  altri task: i produttori (creazione lead, webhook) attendono `submit()` inline, senza
+  `create_task`, così l'attesa rallenta chi genera i lead invece di accumulare task.
+"""
+import asyncio
+import logging
+import os
+import time
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Optional, Set, Tuple
+
+from metrics import BACKGROUND_LOOP_ITEMS, observe_loop
+
+logger = logging.getLogger(__name__)
+
+WORKFLOW_TRIGGER_REGISTRY_TTL_SECONDS = float(os.environ.get("WORKFLOW_TRIGGER_REGISTRY_TTL_SECONDS", "60"))
+WORKFLOW_DISPATCH_QUEUE_SIZE = int(os.environ.get("WORKFLOW_DISPATCH_QUEUE_SIZE", "1000"))
+WORKFLOW_DISPATCH_CONCURRENCY = int(os.environ.get("WORKFLOW_DISPATCH_CONCURRENCY", "8"))
+
+_TRIGGER_PROJECTION = {"_id": 0, "id": 1, "unit_id": 1, "is_active": 1, "trigger_subtypes": 1}
+
+
+def extract_trigger_subtypes(nodes: Optional[Iterable[Dict[str, Any]]]) -> List[str]:
+    """Subtype dei nodi trigger di un workflow V2 (ordinati, senza duplicati)."""
+    subtypes = set()
+    for n in nodes or []:
+        data = n.get("data") or {}
+        if data.get("nodeType") == "triggers" and data.get("nodeSubtype"):
+            subtypes.add(data["nodeSubtype"])
+    return sorted(subtypes)
+
+
+class WorkflowTriggerRegistry:
+    """(unit_id, trigger_subtype) -> id dei workflow attivi con quel trigger."""
+
+    def __init__(self, database, ttl: float = WORKFLOW_TRIGGER_REGISTRY_TTL_SECONDS):
+        self.db = database
+        self.ttl = ttl
+        # dict come insieme ordinato: a parità di trigger si avvia nell'ordine di caricamento
+        self._by_key: Dict[Tuple[Optional[str], str], Dict[str, None]] = {}
+        self._by_workflow: Dict[str, Set[Tuple[Optional[str], str]]] = {}
+        self._loaded_at: Optional[float] = None
+        self._lock = asyncio.Lock()
+        self.reloads = 0
+
+    # ---- mappa in memoria ----
+
+    def _drop(self, workflow_id: str):
+        for key in self._by_workflow.pop(workflow_id, ()):
+            ids = self._by_key.get(key)
+            if ids is not None:
+                ids.pop(workflow_id, None)
+                if not ids:
+                    del self._by_key[key]
+
+    def _put(self, wf: Dict[str, Any]):
+        self._drop(wf["id"])
+        if not wf.get("is_active"):
+            return
+        keys = {(wf.get("unit_id"), s) for s in wf.get("trigger_subtypes") or []}
+        for key in keys:
+            self._by_key.setdefault(key, {})[wf["id"]] = None
+        if keys:
+            self._by_workflow[wf["id"]] = keys
+
+    # ---- caricamento / aggiornamento ----
+
+    async def reload(self):
+        """Ricarica la mappa leggendo solo id, unit e `trigger_subtypes` dei workflow attivi."""
+        docs = [wf async for wf in self.db.workflows.find(
+            {"is_active": True, "trigger_subtypes.0": {"$exists": True}}, _TRIGGER_PROJECTION
+        )]
+        # swap sincrono: una lookup concorrente non vede mai una mappa a metà
+        self._by_key, self._by_workflow = {}, {}
+        for wf in docs:
+            self._put(wf)
+        self._loaded_at = time.monotonic()
+        self.reloads += 1
+
+    async def _ensure_fresh(self):
+        if self._loaded_at is not None and time.monotonic() - self._loaded_at < self.ttl:
+            return
+        async with self._lock:
+            # un solo reload anche con molti lead in arrivo nello stesso istante
+            if self._loaded_at is None or time.monotonic() - self._loaded_at >= self.ttl:
+                await self.reload()
+
+    async def sync(self, workflow_id: str):
+        """Da chiamare dopo ogni scrittura di un workflow: ricalcola `trigger_subtypes`
+        dai nodi e aggiorna la mappa (rimuove il workflow se cancellato o disattivato)."""
+        wf = await self.db.workflows.find_one(
+            {"id": workflow_id}, {"_id": 0, "id": 1, "unit_id": 1, "is_active": 1, "nodes": 1, "trigger_subtypes": 1}
+        )
+        if not wf:
+            self._drop(workflow_id)
+            return
+        subtypes = extract_trigger_subtypes(wf.get("nodes"))
+        if wf.get("trigger_subtypes") != subtypes:
+            await self.db.workflows.update_one({"id": workflow_id}, {"$set": {"trigger_subtypes": subtypes}})
+        wf["trigger_subtypes"] = subtypes
+        self._put(wf)
+
+    async def lookup(self, unit_id: Optional[str], trigger_subtype: str) -> List[str]:
+        """Workflow attivi da avviare. Senza unit (lead orfano) valgono tutte le Unit,
+        come la vecchia query senza filtro `unit_id`."""
+        await self._ensure_fresh()
+        if unit_id:
+            return list(self._by_key.get((unit_id, trigger_subtype), ()))
+        out: Dict[str, None] = {}
+        for (_, subtype), ids in self._by_key.items():
+            if subtype == trigger_subtype:
+                out.update(ids)
+        return list(out)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "workflows": len(self._by_workflow),
+            "keys": len(self._by_key),
+            "reloads": self.reloads,
+            "age_seconds": round(time.monotonic() - self._loaded_at, 1) if self._loaded_at is not None else None,
+            "ttl_seconds": self.ttl,
+        }
+
+
+async def ensure_trigger_index(db) -> int:
+    """Startup: indice su `trigger_subtypes` e backfill dei workflow salvati prima del campo."""
+    try:
+        await db.workflows.create_index([("trigger_subtypes", 1), ("unit_id", 1), ("is_active", 1)])
+        n = 0
+        async for wf in db.workflows.find({"trigger_subtypes": {"$exists": False}}, {"_id": 0, "id": 1, "nodes": 1}):
+            await db.workflows.update_one(
+                {"id": wf["id"]}, {"$set": {"trigger_subtypes": extract_trigger_subtypes(wf.get("nodes"))}}
+            )
+            n += 1
+        if n:
+            logger.info(f"✅ Workflow trigger index: {n} workflow aggiornati")
+        return n
+    except Exception as e:
+        logger.warning(f"⚠️ Workflow trigger index backfill failed: {e}")
+        return 0
+
+
+class WorkflowDispatchQueue:
+    """Coda limitata di avvii workflow consumata da `concurrency` worker."""
+
+    def __init__(
+        self,
+        run: Callable[[str, Dict[str, Any]], Awaitable[Any]],
+        maxsize: int = WORKFLOW_DISPATCH_QUEUE_SIZE,
+        concurrency: int = WORKFLOW_DISPATCH_CONCURRENCY,
+    ):
+        self.run = run
+        self.maxsize = max(1, maxsize)
+        self.concurrency = max(1, concurrency)
+        self._queue: Optional[asyncio.Queue] = None
+        self._workers: List[asyncio.Task] = []
+        self.enqueued = 0
+        self.completed = 0
+        self.failed = 0
+        self.blocked = 0  # submit che hanno dovuto attendere posto in coda
+        self.in_flight = 0
+        self.max_depth = 0
+
+    @property
+    def running(self) -> bool:
+        return any(not w.done() for w in self._workers)
+
+    def start(self):
+        """Avvia i worker (idempotente). Da chiamare allo startup."""
+        if self.running:
+            return
+        if self._queue is None:
+            self._queue = asyncio.Queue(maxsize=self.maxsize)
+        self._workers = [asyncio.create_task(self._worker()) for _ in range(self.concurrency)]
+
+    async def submit(self, workflow_id: str, payload: Dict[str, Any]):
+        """Accoda un avvio; con coda piena attende che un worker liberi posto."""
+        if not self.running:
+            self.start()
+        if self._queue.full():
+            self.blocked += 1
+        await self._queue.put((workflow_id, payload))
+        self.enqueued += 1
+        self.max_depth = max(self.max_depth, self._queue.qsize())
+
+    async def _worker(self):
+        while True:
+            workflow_id, payload = await self._queue.get()
+            self.in_flight += 1
+            try:
+                with observe_loop("workflow_dispatch"):
+                    await self.run(workflow_id, payload)
+                self.completed += 1
+                BACKGROUND_LOOP_ITEMS.inc(loop="workflow_dispatch")
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.failed += 1
+                logger.warning(f"[WF-V2] dispatch {workflow_id} failed: {e}")
+            finally:
+                self.in_flight -= 1
+                self._queue.task_done()
+
+    async def stop(self, timeout: float = 10.0):
+        """Shutdown: attende lo svuotamento della coda (entro `timeout`) e ferma i worker."""
+        if self._queue is not None and self.running:
+            try:
+                await asyncio.wait_for(self._queue.join(), timeout)
+            except asyncio.TimeoutError:
+                logger.warning(f"[WF-V2] dispatch queue stop: {self._queue.qsize()} avvii non eseguiti")
+        for w in self._workers:
+            w.cancel()
+        for w in self._workers:
+            try:
+                await w
+            except (asyncio.CancelledError, Exception):
+                pass
+        self._workers = []
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "running": self.running,
+            "concurrency": self.concurrency,
+            "maxsize": self.maxsize,
+            "depth": self._queue.qsize() if self._queue is not None else 0,
+            "in_flight": self.in_flight,
+            "max_depth": self.max_depth,
+            "enqueued": self.enqueued,
+            "completed": self.completed,
+            "failed": self.failed,
+            "blocked": self.blocked,
+        }
@@ -35,6 +35,7 @@ import { Textarea } from "./components/ui/textarea";
 import { Checkbox } from "./components/ui/checkbox";
 import { Switch } from "./components/ui/switch";
 import { useToast } from "./hooks/use-toast";
+import { useEventStream } from "./hooks/use-event-stream";
 import { Toaster } from "./components/ui/toaster";
 import ClienteCustomFieldsManager from "./components/ClienteCustomFieldsManager";
 import {
@@ -930,21 +931,33 @@ const Dashboard = () => {
   const { user, logout, setUser, showSessionWarning, timeLeft, extendSession, stopCountdown } = useAuth();
   const { toast } = useToast();
 
-  // 🔔 Polling contatore messaggi WhatsApp da gestire (sidebar "Conversazioni AI")
+  // 🔔 Contatore messaggi WhatsApp da gestire (sidebar "Conversazioni AI"): riletto sugli
+  // eventi SSE delle conversazioni; il polling lento resta solo come rete di sicurezza
+  // (il bus eventi è per worker backend)
+  const canSeeConversations = !!user && ["admin", "super_referente"].includes(user.role);
+  const fetchUnhandled = useCallback(async () => {
+    try {
+      const r = await axios.get(`${API}/spoki/conversations/unhandled-count`, {
+        headers: { Authorization: `Bearer ${localStorage.getItem("token")}` },
+      });
+      setUnhandledConvCount(r.data?.count || 0);
+    } catch (e) { /* silenzioso */ }
+  }, []);
+
   useEffect(() => {
-    if (!user || !["admin", "super_referente"].includes(user.role)) return;
-    const fetchUnhandled = async () => {
-      try {
-        const r = await axios.get(`${API}/spoki/conversations/unhandled-count`, {
-          headers: { Authorization: `Bearer ${localStorage.getItem("token")}` },
-        });
-        setUnhandledConvCount(r.data?.count || 0);
-      } catch (e) { /* silenzioso */ }
-    };
+    if (!canSeeConversations) return;
     fetchUnhandled();
-    const t = setInterval(fetchUnhandled, 30000);
+    const t = setInterval(fetchUnhandled, 5 * 60 * 1000);
     return () => clearInterval(t);
-  }, [user, activeTab]);
+  }, [canSeeConversations, activeTab, fetchUnhandled]);
+
+  useEventStream(["conversations"], {
+    ready: fetchUnhandled,
+    resync: fetchUnhandled,
+    "conversation.message": fetchUnhandled,
+    "conversation.unhandled": fetchUnhandled,
+    "conversation.read": fetchUnhandled,
+  }, canSeeConversations);
 
   // 🎯 MOBILE-FRIENDLY: Detect screen size (< 1024px = mobile/tablet)
   useEffect(() => {
@@ -1,7 +1,9 @@
-import React, { useEffect, useRef, useState, useCallback } from "react";
+import React, { useContext, useEffect, useRef, useState, useCallback } from "react";
 import { formatDateTimeIT } from "../lib/datetime";
 import axios from "axios";
 import { Lock, Unlock, AlertTriangle } from "lucide-react";
+import { useEventStream } from "../hooks/use-event-stream";
+import { AuthContext } from "../context/AuthContext";
 
 const BACKEND_URL = process.env.REACT_APP_BACKEND_URL;
 const API = `${BACKEND_URL}/api`;
@@ -214,10 +216,12 @@ export const ClienteLockedScreen = ({ lockStatus, isAdmin, onForceRelease, onClo
 
 /**
  * Hook per listare tutti i lock attivi. Usato nella lista Clienti per mostrare il badge 🔒.
- * Fa polling ogni 30 secondi.
+ * Applica gli eventi SSE `lock.acquired`/`lock.released`; rilegge tutto all'apertura dello
+ * stream, sui `resync` e con un polling lento di sicurezza (il bus eventi è per worker).
  */
 export const useActiveClienteLocks = () => {
   const [locksByClienteId, setLocksByClienteId] = useState({});
+  const currentUserId = useContext(AuthContext)?.user?.id;
 
   const fetchLocks = useCallback(async () => {
     try {
@@ -230,9 +234,23 @@ export const useActiveClienteLocks = () => {
     } catch (_) { /* ignore */ }
   }, []);
 
+  useEventStream(["locks"], {
+    ready: fetchLocks,
+    resync: fetchLocks,
+    "lock.acquired": (lock) => setLocksByClienteId((prev) => ({
+      ...prev,
+      [lock.cliente_id]: { ...lock, owned_by_me: lock.user_id === currentUserId },
+    })),
+    "lock.released": ({ cliente_id }) => setLocksByClienteId((prev) => {
+      const next = { ...prev };
+      delete next[cliente_id];
+      return next;
+    }),
+  });
+
   useEffect(() => {
     fetchLocks();
-    const id = setInterval(fetchLocks, 10000); // polling ogni 10s
+    const id = setInterval(fetchLocks, 60000); // rete di sicurezza, gli aggiornamenti arrivano via SSE
     const onFocus = () => fetchLocks();
     const onVisibility = () => {
       if (document.visibilityState === "visible") fetchLocks();
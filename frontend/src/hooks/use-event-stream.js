@@ -0,0 +1,80 @@
+import { useEffect, useRef } from "react";
+import axios from "axios";
+
+const API = `${process.env.REACT_APP_BACKEND_URL}/api`;
+
+// Riconnessione con backoff esponenziale (reset quando lo stream si riapre)
+const RECONNECT_MIN_MS = 1000;
+const RECONNECT_MAX_MS = 30000;
+
+/**
+ * Hook per il canale SSE `/api/events/stream` (vedi backend/routes/events.py).
+ * - Prima di ogni connessione chiede un token di stream di breve durata
+ *   (POST /events/token): il JWT di sessione non finisce mai in query string.
+ * - `handlers` è una mappa tipo evento -> callback(data), es. { "lock.released": fn }.
+ *   "ready" e "resync" arrivano come gli altri: lì si rilegge lo stato con le GET.
+ * - Su errore chiude la connessione e la riapre con un token nuovo (backoff).
+ *
+ * @param {string[]} topics - topic richiesti (conversations, locks, leads, dashboard)
+ * @param {Object<string, function>} handlers - callback per tipo di evento
+ * @param {boolean} enabled - se false non apre la connessione
+ */
+export const useEventStream = (topics, handlers, enabled = true) => {
+  const handlersRef = useRef(handlers);
+  handlersRef.current = handlers;
+  const topicsKey = topics.join(",");
+
+  useEffect(() => {
+    if (!enabled || typeof window.EventSource === "undefined") return undefined;
+    let source = null;
+    let timer = null;
+    let closed = false;
+    let delay = RECONNECT_MIN_MS;
+
+    const scheduleReconnect = () => {
+      if (closed) return;
+      timer = setTimeout(connect, delay);
+      delay = Math.min(delay * 2, RECONNECT_MAX_MS);
+    };
+
+    const connect = async () => {
+      let token;
+      try {
+        const res = await axios.post(`${API}/events/token`, {}, {
+          headers: { Authorization: `Bearer ${localStorage.getItem("token")}` },
+        });
+        token = res.data.token;
+      } catch (e) {
+        scheduleReconnect();
+        return;
+      }
+      if (closed) return;
+      source = new EventSource(
+        `${API}/events/stream?topics=${encodeURIComponent(topicsKey)}&token=${encodeURIComponent(token)}`
+      );
+      source.onopen = () => { delay = RECONNECT_MIN_MS; };
+      source.onerror = () => {
+        // il token di stream è già scaduto: EventSource non deve riprovare da solo
+        source.close();
+        source = null;
+        scheduleReconnect();
+      };
+      Object.keys(handlersRef.current).forEach((type) => {
+        source.addEventListener(type, (event) => {
+          const handler = handlersRef.current[type];
+          if (!handler) return;
+          let data = {};
+          try { data = JSON.parse(event.data); } catch (_) { /* evento senza payload */ }
+          handler(data);
+        });
+      });
+    };
+
+    connect();
+    return () => {
+      closed = true;
+      clearTimeout(timer);
+      if (source) source.close();
+    };
+  }, [topicsKey, enabled]);
+};
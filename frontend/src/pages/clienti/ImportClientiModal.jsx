@@ -174,6 +174,11 @@ import { AuthContext, useAuth, AuthProvider } from "../../context/AuthContext";
 
 // ImportClientiModal — estratto da ClienteModals.jsx (refactoring fase 2)
 
+// Polling del job di import: intervallo, tentativi massimi e scadenza complessiva
+const IMPORT_POLL_INTERVAL_MS = 1500;
+const IMPORT_POLL_MAX_ATTEMPTS = 1200;
+const IMPORT_POLL_TIMEOUT_MS = 30 * 60 * 1000;
+
 const ImportClientiModal = ({ isOpen, onClose, commesse, subAgenzie, selectedCommessa }) => {
   const [step, setStep] = useState(1); // 1: Upload, 2: Mapping, 3: Import
   const [file, setFile] = useState(null);
@@ -189,6 +194,7 @@ const ImportClientiModal = ({ isOpen, onClose, commesse, subAgenzie, selectedCom
   });
   const [importing, setImporting] = useState(false);
   const [importResult, setImportResult] = useState(null);
+  const [importProgress, setImportProgress] = useState(null);
   const { toast } = useToast();
 
   // Campo mappings disponibili
@@ -313,18 +319,48 @@ const ImportClientiModal = ({ isOpen, onClose, commesse, subAgenzie, selectedCom
       
       formData.append('config', JSON.stringify(importConfig));
       
-      const response = await axios.post(`${API}/clienti/import/execute`, formData, {
+      // L'import gira in background: si avvia il job e se ne legge il progresso
+      const startResponse = await axios.post(`${API}/clienti/import/jobs`, formData, {
         headers: {
           'Content-Type': 'multipart/form-data',
         },
       });
 
-      setImportResult(response.data);
+      const jobId = startResponse.data.job_id;
+      const deadline = Date.now() + IMPORT_POLL_TIMEOUT_MS;
+      let job = null;
+      for (let attempt = 0; attempt < IMPORT_POLL_MAX_ATTEMPTS && Date.now() < deadline; attempt++) {
+        await new Promise((resolve) => setTimeout(resolve, IMPORT_POLL_INTERVAL_MS));
+        const jobResponse = await axios.get(`${API}/clienti/import/jobs/${jobId}`);
+        job = jobResponse.data;
+        setImportProgress({ processed: job.processed || 0, total: job.total_rows || 0 });
+        if (job.status === "completed" || job.status === "failed") break;
+      }
+
+      if (!job || (job.status !== "completed" && job.status !== "failed")) {
+        toast({
+          title: "Importazione ancora in corso",
+          description: `L'import prosegue sul server: controlla più tardi l'esito del job ${jobId}`,
+          variant: "destructive",
+        });
+        return;
+      }
+
+      if (job.status === "failed") {
+        toast({
+          title: "Errore importazione",
+          description: job.error || "Errore durante l'importazione",
+          variant: "destructive",
+        });
+        return;
+      }
+
+      setImportResult(job.result);
       setStep(3);
       
       toast({
         title: "Importazione completata",
-        description: `${response.data.successful} clienti importati con successo`,
+        description: `${job.result.successful} clienti importati con successo`,
       });
       
     } catch (error) {
@@ -336,6 +372,7 @@ const ImportClientiModal = ({ isOpen, onClose, commesse, subAgenzie, selectedCom
       });
     } finally {
       setImporting(false);
+      setImportProgress(null);
     }
   };
 
@@ -586,7 +623,9 @@ const ImportClientiModal = ({ isOpen, onClose, commesse, subAgenzie, selectedCom
                 {importing ? (
                   <div className="animate-spin rounded-full h-4 w-4 border-b-2 border-white mr-2"></div>
                 ) : null}
-                Avvia Importazione
+                {importing && importProgress?.total
+                  ? `Importazione ${importProgress.processed}/${importProgress.total}`
+                  : "Avvia Importazione"}
               </Button>
             </DialogFooter>
           </div>